@@ -7,6 +7,7 @@ from .models import (
     PersonalDocente, Administrador, AsistenciaDiaria,
     ConfiguracionInstitucion, Semestre, FranjaHoraria, DiaEspecial, VersionDocumento
 )
+from .utils.resumen import actualizar_resumenes
 
 # --- CONFIGURACIÓN DE ADMINS ---
 
@@ -94,6 +95,22 @@ class DocumentoAdmin(admin.ModelAdmin):
     readonly_fields = ('fecha_subida',)
     inlines = [VersionDocumentoInline]
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not VersionDocumento:
+            return super().save_formset(request, form, formset, change)
+        # Las versiones nuevas del inline se numeran con una sola reserva y se insertan juntas
+        versiones = formset.save(commit=False)
+        for version in formset.deleted_objects:
+            version.delete()
+        for version in versiones:
+            if version.pk:
+                version.save()
+        nuevas = VersionDocumento.crear_en_lote(form.instance, [v for v in versiones if v.pk is None])
+        formset.save_m2m()
+        if nuevas:
+            # bulk_create no emite señales: el feed del docente se recalcula aparte
+            actualizar_resumenes([form.instance.docente_id])
+
 @admin.register(VersionDocumento)
 class VersionDocumentoAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'fecha_version')
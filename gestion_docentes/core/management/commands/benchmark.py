@@ -0,0 +1,244 @@
+import base64
+import json
+import math
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, time as hora, timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core.models import Asistencia, Curso, Docente
+from core.utils import referencia, tareas
+from core.utils.exports import construir_reporte_pdf
+from core.utils.horarios import invalidar_horarios
+from core.utils.ocupacion import DIAS_SEMANA, indice_semestre, invalidar_indices
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide tiempo y número de consultas de las vistas críticas (kiosco, reporte, exportaciones y '
+        'auto-asignación) sobre los datos actuales y guarda el resultado en JSON. Cada repetición se '
+        'deshace al terminar, así que la base de datos no cambia. Pensado para correr sobre los datos '
+        'de generate_load_dataset y comparar entre commits con --comparar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--calentamiento', type=int, default=1, help='Repeticiones previas que no se miden.')
+        parser.add_argument('--escenario', action='append', help='Solo los escenarios indicados (se puede repetir).')
+        parser.add_argument('--dias-reporte', type=int, default=7, help='Días del periodo del reporte y las exportaciones.')
+        parser.add_argument('--salida', default='benchmark.json', help='Archivo JSON con los resultados.')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para mostrar la diferencia.')
+
+    def handle(self, *args, **opciones):
+        semestre = referencia.semestre_activo()
+        if not semestre:
+            raise CommandError('No hay un semestre activo; genere datos con generate_load_dataset.')
+
+        # El kiosco depende del día: se mide en el último día hábil del semestre hasta hoy, a media mañana
+        fecha = min(timezone.localdate(), semestre.fecha_fin)
+        while fecha.weekday() >= 5:
+            fecha -= timedelta(days=1)
+        self.ahora = timezone.make_aware(datetime.combine(fecha, hora(10, 0)))
+        self.semestre = semestre
+        self.periodo = {
+            'fecha_inicio': max(semestre.fecha_inicio, fecha - timedelta(days=opciones['dias_reporte'] - 1)).isoformat(),
+            'fecha_fin': fecha.isoformat(),
+        }
+
+        escenarios = {
+            'get_teacher_info': self.get_teacher_info,
+            'mark_attendance_kiosk': self.mark_attendance_kiosk,
+            'reporte_asistencia': self.reporte_asistencia,
+            'exportar_excel': self.exportar_excel,
+            'exportar_pdf': self.exportar_pdf,
+            'api_auto_asignar': self.api_auto_asignar,
+        }
+        elegidos = opciones['escenario'] or list(escenarios)
+        desconocidos = set(elegidos) - set(escenarios)
+        if desconocidos:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}.')
+
+        resultados = {}
+        # Las tareas en segundo plano no forman parte del tiempo de respuesta y no verían
+        # los datos de una transacción que se deshace: se encolan sin ejecutarse
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                mock.patch.object(tareas, 'encolar', lambda *a, clave=None, **k: tareas.Tarea(clave=clave)), \
+                mock.patch('django.utils.timezone.now', lambda: self.ahora):
+            with transaction.atomic():
+                self.preparar()
+                # Índice cargado, como en un servidor que ya atendió el planificador
+                with indice_semestre(self.semestre.id):
+                    pass
+                for nombre in elegidos:
+                    resultados[nombre] = self.medir(escenarios[nombre], opciones['repeticiones'], opciones['calentamiento'])
+                    self.mostrar(nombre, resultados[nombre])
+                transaction.set_rollback(True)
+        self.restaurar_caches()
+
+        informe = {
+            'commit': self._commit(),
+            'ejecutado': timezone.localtime().isoformat(),
+            'motor': connection.vendor,
+            'fecha_simulada': self.ahora.isoformat(),
+            'periodo_reporte': self.periodo,
+            'datos': {
+                'docentes': Docente.objects.count(),
+                'cursos': Curso.objects.filter(semestre=semestre).count(),
+                'asistencias': Asistencia.objects.count(),
+            },
+            'escenarios': resultados,
+        }
+        with open(opciones['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {opciones["salida"]}.'))
+
+        if opciones['comparar']:
+            self.comparar(opciones['comparar'], resultados)
+
+    # --- Preparación ---
+
+    def preparar(self):
+        self.cliente = Client()
+        admin = Docente.objects.create_superuser(username='benchmark_admin', password=None, dni='BENCH001', email='')
+        self.cliente.force_login(admin)
+
+        # Docentes con clases el día simulado, en orden estable para que las corridas sean comparables
+        cursos = (
+            Curso.objects.filter(semestre=self.semestre, dia=DIAS_SEMANA[self.ahora.weekday()], docente__isnull=False)
+            .order_by('pk').values_list('pk', 'docente__id_qr')[:50]
+        )
+        self.cursos_hoy = [(curso_id, str(qr)) for curso_id, qr in cursos]
+        if not self.cursos_hoy:
+            raise CommandError('Ningún curso del semestre activo se dicta el día simulado.')
+
+        foto = BytesIO()
+        Image.new('RGB', (320, 240), (120, 140, 160)).save(foto, 'JPEG', quality=80)
+        self.foto = 'data:image/jpeg;base64,' + base64.b64encode(foto.getvalue()).decode()
+
+        pendientes = (
+            Curso.objects.filter(semestre=self.semestre, dia__isnull=True).values('especialidad_id')
+            .annotate(total=Count('pk')).order_by('-total', 'especialidad_id').first()
+        )
+        self.especialidad_pendiente = pendientes['especialidad_id'] if pendientes else None
+        self.iteracion = 0
+
+    def restaurar_caches(self):
+        # Las señales de lo que se deshizo ya actualizaron las cachés en memoria
+        invalidar_indices()
+        invalidar_horarios()
+
+    # --- Escenarios: cada uno devuelve el código HTTP de la respuesta ---
+
+    def _siguiente_curso(self):
+        self.iteracion += 1
+        return self.cursos_hoy[self.iteracion % len(self.cursos_hoy)]
+
+    def get_teacher_info(self):
+        _, qr = self._siguiente_curso()
+        respuesta = self.cliente.post(reverse('api_get_teacher_info'), json.dumps({'qrId': qr}), content_type='application/json')
+        return respuesta.status_code
+
+    def mark_attendance_kiosk(self):
+        curso_id, qr = self._siguiente_curso()
+        datos = {'qrId': qr, 'actionType': 'course_entry', 'courseId': curso_id, 'photoBase64': self.foto}
+        respuesta = self.cliente.post(reverse('api_mark_attendance'), json.dumps(datos), content_type='application/json')
+        return respuesta.status_code
+
+    def reporte_asistencia(self):
+        return self.cliente.get(reverse('reporte_asistencia'), self.periodo).status_code
+
+    def exportar_excel(self):
+        respuesta = self.cliente.get(reverse('exportar_excel'), self.periodo)
+        b''.join(respuesta.streaming_content)
+        return respuesta.status_code
+
+    def exportar_pdf(self):
+        # La vista solo encola el PDF; se mide la generación que hace la tarea
+        construir_reporte_pdf(BytesIO(), self.periodo['fecha_inicio'], self.periodo['fecha_fin'])
+        return 200
+
+    def api_auto_asignar(self):
+        if self.especialidad_pendiente is None:
+            return None
+        respuesta = self.cliente.post(
+            reverse('api_auto_asignar'), json.dumps({'especialidad_id': self.especialidad_pendiente}),
+            content_type='application/json',
+        )
+        return respuesta.status_code
+
+    # --- Medición ---
+
+    def medir(self, escenario, repeticiones, calentamiento):
+        tiempos, consultas, codigos = [], [], set()
+        for n in range(calentamiento + repeticiones):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    codigo = escenario()
+                    transcurrido = (time.perf_counter() - inicio) * 1000
+                transaction.set_rollback(True)
+            # Lo que el escenario escribió se deshizo: las cachés en memoria vuelven a la base
+            invalidar_indices()
+            invalidar_horarios()
+            with indice_semestre(self.semestre.id):
+                pass
+            if n >= calentamiento:
+                tiempos.append(transcurrido)
+                consultas.append(len(capturadas))
+                codigos.add(codigo)
+        tiempos.sort()
+        return {
+            'repeticiones': repeticiones,
+            'ms': {
+                'min': round(tiempos[0], 2),
+                'mediana': round(statistics.median(tiempos), 2),
+                'p95': round(tiempos[max(0, math.ceil(0.95 * len(tiempos)) - 1)], 2),
+                'max': round(tiempos[-1], 2),
+            },
+            'consultas': {'min': min(consultas), 'max': max(consultas)},
+            'http': sorted(c for c in codigos if c is not None),
+        }
+
+    def mostrar(self, nombre, resultado):
+        ms, consultas = resultado['ms'], resultado['consultas']
+        self.stdout.write(
+            f'{nombre:<24} mediana {ms["mediana"]:>9.1f} ms  p95 {ms["p95"]:>9.1f} ms  '
+            f'consultas {consultas["min"]}-{consultas["max"]}  http {resultado["http"]}'
+        )
+
+    def comparar(self, ruta, resultados):
+        with open(ruta, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+        self.stdout.write(f'\nComparación con {ruta} (commit {anterior.get("commit") or "desconocido"}):')
+        for nombre, actual in resultados.items():
+            previo = anterior.get('escenarios', {}).get(nombre)
+            if not previo:
+                continue
+            antes, ahora = previo['ms']['mediana'], actual['ms']['mediana']
+            cambio = (ahora - antes) / antes * 100 if antes else 0
+            self.stdout.write(
+                f'{nombre:<24} {antes:>9.1f} -> {ahora:>9.1f} ms ({cambio:+.0f}%)  '
+                f'consultas {previo["consultas"]["max"]} -> {actual["consultas"]["max"]}'
+            )
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
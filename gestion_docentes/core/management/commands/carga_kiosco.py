@@ -0,0 +1,224 @@
+import asyncio
+import json
+import math
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as hora, timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core.models import Asistencia, Curso
+from core.utils import acumulados, referencia, resumen, tareas
+from core.utils.almacenamiento import AlmacenamientoPorContenido
+from core.utils.ocupacion import DIAS_SEMANA
+
+RUTAS = {
+    'info': ('api_get_teacher_info', 'api_get_teacher_info_async'),
+    'marca': ('api_mark_attendance_foto', 'api_mark_attendance_foto_async'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga del kiosco: envía las mismas lecturas de QR y marcas con foto a las vistas '
+        'síncronas a través de WSGIHandler (con un pool de --hilos, como un servidor WSGI con hilos) y '
+        'a las vistas asíncronas a través de ASGIHandler (un solo bucle de eventos), y compara el '
+        'rendimiento. Las marcas que crea se borran al terminar. Con SQLite conviene el perfil '
+        'sqlite-wal (SIGEDO_DB) para que las escrituras simultáneas no se bloqueen.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=200, help='Peticiones por escenario y servidor.')
+        parser.add_argument('--concurrencia', type=int, default=20, help='Kioscos simultáneos.')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos del servidor WSGI simulado.')
+        parser.add_argument('--escenario', action='append', choices=sorted(RUTAS), help='Por defecto, todos.')
+        parser.add_argument(
+            '--latencia-foto', type=int, default=0,
+            help='Milisegundos extra por cada foto escrita, para simular un disco o un volumen de red lento.',
+        )
+
+    def handle(self, *args, **opciones):
+        semestre = referencia.semestre_activo()
+        if not semestre:
+            raise CommandError('No hay un semestre activo; genere datos con generate_load_dataset.')
+
+        # Último día hábil del semestre hasta hoy, a media mañana (como el comando benchmark)
+        fecha = min(timezone.localdate(), semestre.fecha_fin)
+        while fecha.weekday() >= 5:
+            fecha -= timedelta(days=1)
+        ahora = timezone.make_aware(datetime.combine(fecha, hora(10, 0)))
+        self.fecha = fecha
+
+        ya_marcados = Asistencia.objects.filter(fecha=fecha).values('curso_id')
+        self.cursos = list(
+            Curso.objects.filter(semestre=semestre, dia=DIAS_SEMANA[fecha.weekday()], docente__isnull=False)
+            .exclude(pk__in=ya_marcados).order_by('pk').values_list('pk', 'docente_id', 'docente__id_qr')
+        )
+        if not self.cursos:
+            raise CommandError('Ningún curso sin marcar se dicta el día simulado.')
+
+        foto = BytesIO()
+        Image.new('RGB', (640, 480), (120, 140, 160)).save(foto, 'JPEG', quality=85)
+        self.foto = foto.getvalue()
+
+        escribir = AlmacenamientoPorContenido._escribir
+        latencia = opciones['latencia_foto'] / 1000
+
+        def escribir_lento(storage, *a, **k):
+            time.sleep(latencia)
+            return escribir(storage, *a, **k)
+
+        self.stdout.write(
+            f'Día simulado {fecha}, {len(self.cursos)} cursos sin marcar, {opciones["concurrencia"]} kioscos, '
+            f'{opciones["hilos"]} hilos WSGI, motor {settings.DATABASES["default"]["ENGINE"].rsplit(".", 1)[-1]}.'
+        )
+        # Las tareas en segundo plano no forman parte del tiempo de respuesta
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                mock.patch.object(tareas, 'encolar', lambda *a, clave=None, **k: tareas.Tarea(clave=clave)), \
+                mock.patch.object(AlmacenamientoPorContenido, '_escribir', escribir_lento), \
+                mock.patch('django.utils.timezone.now', lambda: ahora):
+            for escenario in opciones['escenario'] or list(RUTAS):
+                peticiones = self.peticiones(escenario, opciones['peticiones'])
+                ruta_wsgi, ruta_asgi = (reverse(nombre) for nombre in RUTAS[escenario])
+                wsgi = self.medir(self.carga_wsgi, ruta_wsgi, peticiones, opciones)
+                asgi = self.medir(self.carga_asgi, ruta_asgi, peticiones, opciones)
+                self.mostrar(escenario, 'WSGI', wsgi)
+                self.mostrar(escenario, 'ASGI', asgi)
+                if wsgi['por_segundo']:
+                    self.stdout.write(f'{"":<8}ASGI/WSGI: {asgi["por_segundo"] / wsgi["por_segundo"]:.2f}x')
+
+    # --- Peticiones ---
+
+    def peticiones(self, escenario, total):
+        """Lista de ``(content_type, cuerpo)``; las marcas son entradas a cursos distintos."""
+        if escenario == 'info':
+            return [
+                ('application/json', json.dumps({'qrId': str(qr)}).encode())
+                for _, _, qr in (self.cursos[n % len(self.cursos)] for n in range(total))
+            ]
+        if total > len(self.cursos):
+            self.stdout.write(self.style.WARNING(f'Solo hay {len(self.cursos)} cursos para marcar; se envían esas marcas.'))
+        return [
+            (MULTIPART_CONTENT, encode_multipart(BOUNDARY, {
+                'qrId': str(qr), 'actionType': 'course_entry', 'courseId': curso_id,
+                'foto': _Foto(self.foto),
+            }))
+            for curso_id, _, qr in self.cursos[:total]
+        ]
+
+    def medir(self, carga, ruta, peticiones, opciones):
+        ultima = Asistencia.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        inicio = time.perf_counter()
+        resultados = carga(ruta, peticiones, opciones)
+        transcurrido = time.perf_counter() - inicio
+        self.deshacer_marcas(ultima)
+
+        tiempos = sorted(ms for _, ms in resultados)
+        return {
+            'segundos': transcurrido,
+            'por_segundo': len(resultados) / transcurrido if transcurrido else 0,
+            'mediana': statistics.median(tiempos),
+            'p95': tiempos[max(0, math.ceil(0.95 * len(tiempos)) - 1)],
+            'errores': sum(1 for estado, _ in resultados if estado >= 400),
+        }
+
+    def deshacer_marcas(self, ultima):
+        creadas = Asistencia.objects.filter(pk__gt=ultima)
+        docentes = set(creadas.values_list('docente_id', flat=True))
+        if not docentes:
+            return
+        # delete() emite las señales que descuentan las marcas de los resúmenes
+        creadas.delete()
+        acumulados.reconstruir(self.fecha, self.fecha, docentes)
+        resumen.actualizar_resumenes(docentes)
+
+    # --- Servidores simulados ---
+
+    def carga_wsgi(self, ruta, peticiones, opciones):
+        handler = WSGIHandler()
+
+        def enviar(peticion):
+            content_type, cuerpo = peticion
+            environ = {
+                'REQUEST_METHOD': 'POST', 'PATH_INFO': ruta, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+                'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(cuerpo)),
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'REMOTE_ADDR': '127.0.0.1', 'wsgi.input': BytesIO(cuerpo), 'wsgi.url_scheme': 'http',
+                'wsgi.errors': BytesIO(), 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+            }
+            estado = []
+            inicio = time.perf_counter()
+            respuesta = handler(environ, lambda status, headers: estado.append(int(status.split()[0])))
+            b''.join(respuesta)
+            respuesta.close()
+            return estado[0], (time.perf_counter() - inicio) * 1000
+
+        with ThreadPoolExecutor(max_workers=opciones['hilos']) as pool:
+            return list(pool.map(enviar, peticiones))
+
+    def carga_asgi(self, ruta, peticiones, opciones):
+        handler = ASGIHandler()
+
+        async def enviar(peticion, semaforo):
+            content_type, cuerpo = peticion
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+                'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [
+                    (b'host', b'testserver'), (b'content-type', content_type.encode()),
+                    (b'content-length', str(len(cuerpo)).encode()),
+                ],
+                'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+            }
+            mensajes = [{'type': 'http.request', 'body': cuerpo, 'more_body': False}]
+            desconexion = asyncio.Event()
+            estado = []
+
+            async def receive():
+                if mensajes:
+                    return mensajes.pop()
+                await desconexion.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(mensaje):
+                if mensaje['type'] == 'http.response.start':
+                    estado.append(mensaje['status'])
+
+            async with semaforo:
+                inicio = time.perf_counter()
+                await handler(scope, receive, send)
+                transcurrido = (time.perf_counter() - inicio) * 1000
+            desconexion.set()
+            return estado[0], transcurrido
+
+        async def principal():
+            semaforo = asyncio.Semaphore(opciones['concurrencia'])
+            return await asyncio.gather(*(enviar(peticion, semaforo) for peticion in peticiones))
+
+        return asyncio.run(principal())
+
+    def mostrar(self, escenario, servidor, resultado):
+        self.stdout.write(
+            f'{escenario:<8}{servidor:<6}{resultado["por_segundo"]:>8.1f} pet/s  mediana {resultado["mediana"]:>8.1f} ms  '
+            f'p95 {resultado["p95"]:>8.1f} ms  errores {resultado["errores"]}'
+        )
+
+
+class _Foto(BytesIO):
+    """Archivo en memoria con el nombre y tipo que ``encode_multipart`` usa para la parte."""
+
+    name = 'verificacion.jpg'
+    content_type = 'image/jpeg'
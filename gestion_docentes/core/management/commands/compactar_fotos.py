@@ -0,0 +1,141 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Asistencia, AsistenciaDiaria
+from core.utils.almacenamiento import fotos_verificacion
+from core.utils.imagenes import nombre_miniatura
+
+CAMPOS_FOTO = [
+    (Asistencia, 'foto_entrada'),
+    (Asistencia, 'foto_salida'),
+    (AsistenciaDiaria, 'foto_verificacion'),
+]
+LOTE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica la retención de las fotos de verificación, pasa las fotos guardadas con el esquema '
+        'anterior (por fecha) al almacenamiento por contenido y borra los archivos que ya nadie referencia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retencion-dias', type=int, default=getattr(settings, 'FOTOS_VERIFICACION_RETENCION_DIAS', None),
+            help='Quita las fotos de las marcas con más de N días (por defecto FOTOS_VERIFICACION_RETENCION_DIAS).',
+        )
+        parser.add_argument(
+            '--gracia-horas', type=int, default=24,
+            help='No borra archivos huérfanos más recientes que esto: pueden ser de una marca que aún se está guardando.',
+        )
+        parser.add_argument('--simular', action='store_true', help='Solo informa lo que haría.')
+
+    def handle(self, *args, **opciones):
+        self.storage = fotos_verificacion()
+        self.simular = opciones['simular']
+
+        if opciones['retencion_dias'] is not None:
+            self.aplicar_retencion(opciones['retencion_dias'])
+        self.migrar_fotos_antiguas()
+        self.recolectar_huerfanos(opciones['gracia_horas'])
+
+    def _borrar_antigua(self, nombre):
+        """Borra un archivo del esquema anterior y su miniatura (no están compartidos)."""
+        for ruta in (nombre, nombre_miniatura(nombre)):
+            if self.storage.exists(ruta):
+                self.storage.delete(ruta)
+        # Y los directorios por fecha que quedan vacíos
+        directorio = os.path.dirname(self.storage.path(nombre))
+        while directorio != os.path.normpath(self.storage.location) and os.path.isdir(directorio) and not os.listdir(directorio):
+            os.rmdir(directorio)
+            directorio = os.path.dirname(directorio)
+
+    def aplicar_retencion(self, dias):
+        limite = timezone.localdate() - timedelta(days=dias)
+        for modelo, campo in CAMPOS_FOTO:
+            con_foto = modelo.objects.filter(fecha__lt=limite).exclude(**{f'{campo}__isnull': True}).exclude(**{campo: ''})
+            total = con_foto.count()
+            if total and not self.simular:
+                # Los archivos del árbol por contenido se liberan en la recolección de huérfanos
+                for nombre in con_foto.values_list(campo, flat=True).iterator(chunk_size=LOTE):
+                    if not self.storage.en_arbol(nombre):
+                        self._borrar_antigua(nombre)
+                vacio = None if modelo._meta.get_field(campo).null else ''
+                con_foto.update(**{campo: vacio})
+            self.stdout.write(f'Retención ({dias} días): {total} fotos de {modelo.__name__}.{campo} anteriores al {limite}.')
+
+    def migrar_fotos_antiguas(self):
+        prefijo = f'{self.storage.prefijo}/'
+        for modelo, campo in CAMPOS_FOTO:
+            antiguas = (
+                modelo.objects.exclude(**{f'{campo}__isnull': True}).exclude(**{campo: ''})
+                .exclude(**{f'{campo}__startswith': prefijo}).only('pk', campo)
+            )
+            migradas, faltantes, lote, reemplazadas = 0, 0, [], []
+            for instancia in antiguas.iterator(chunk_size=LOTE):
+                nombre = getattr(instancia, campo).name
+                if not self.storage.exists(nombre):
+                    faltantes += 1
+                    continue
+                migradas += 1
+                if self.simular:
+                    continue
+                with self.storage.open(nombre, 'rb') as original:
+                    nuevo = self.storage.save(nombre, original)
+                if self.storage.exists(nombre_miniatura(nombre)) and not self.storage.exists(nombre_miniatura(nuevo)):
+                    with self.storage.open(nombre_miniatura(nombre), 'rb') as miniatura:
+                        self.storage.save(nombre_miniatura(nuevo), miniatura)
+                setattr(instancia, campo, nuevo)
+                lote.append(instancia)
+                reemplazadas.append(nombre)
+                if len(lote) >= LOTE:
+                    self._guardar_lote(modelo, campo, lote, reemplazadas)
+            self._guardar_lote(modelo, campo, lote, reemplazadas)
+            self.stdout.write(
+                f'{modelo.__name__}.{campo}: {migradas} fotos pasadas al almacenamiento por contenido, '
+                f'{faltantes} referencias a archivos inexistentes.'
+            )
+
+    def _guardar_lote(self, modelo, campo, lote, reemplazadas):
+        # Primero se actualizan las filas y después se borran los archivos viejos
+        modelo.objects.bulk_update(lote, [campo])
+        for nombre in reemplazadas:
+            self._borrar_antigua(nombre)
+        lote.clear()
+        reemplazadas.clear()
+
+    def recolectar_huerfanos(self, gracia_horas):
+        raiz = self.storage.path(self.storage.prefijo)
+        if not os.path.isdir(raiz):
+            return
+
+        referenciados = set()
+        for modelo, campo in CAMPOS_FOTO:
+            nombres = modelo.objects.filter(**{f'{campo}__startswith': f'{self.storage.prefijo}/'}).values_list(campo, flat=True)
+            for nombre in nombres.iterator(chunk_size=LOTE * 10):
+                referenciados.update((nombre, nombre_miniatura(nombre)))
+
+        limite = time.time() - gracia_horas * 3600
+        borrados, liberados = 0, 0
+        for directorio, _, archivos in os.walk(raiz, topdown=False):
+            for archivo in archivos:
+                ruta = os.path.join(directorio, archivo)
+                nombre = os.path.relpath(ruta, self.storage.location).replace(os.sep, '/')
+                if nombre in referenciados or os.path.getmtime(ruta) > limite:
+                    continue
+                borrados += 1
+                liberados += os.path.getsize(ruta)
+                if not self.simular:
+                    os.remove(ruta)
+            if directorio != raiz and not self.simular and not os.listdir(directorio):
+                os.rmdir(directorio)
+
+        accion = 'Se borrarían' if self.simular else 'Se borraron'
+        self.stdout.write(self.style.SUCCESS(
+            f'{accion} {borrados} archivos huérfanos ({liberados / (1024 * 1024):.1f} MB).'
+        ))
@@ -47,8 +47,8 @@ class Command(BaseCommand):
                     last_name=last_name,
                     email=email,
                     dni=str(dni),
-                    especialidad=random.choice(especialidades)
                 )
+                docente.especialidades.add(random.choice(especialidades))
                 self.stdout.write(self.style.SUCCESS(f'Docente creado: {docente.username} (DNI: {docente.dni})'))
 
             except Exception as e:
@@ -0,0 +1,221 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from core.models import (
+    Asistencia, AsistenciaDiaria, Carrera, Curso, Docente, Especialidad, FranjaHoraria, Grupo, Semestre,
+)
+from core.utils import acumulados, referencia
+from core.utils.almacenamiento import fotos_verificacion
+from core.utils.horarios import invalidar_horarios
+from core.utils.kiosco import minutos_minimos_en_clase
+from core.utils.ocupacion import DIAS_SEMANA, MapaOcupacion, Rejilla, invalidar_indices
+
+PREFIJO_USUARIO = 'carga'
+FRANJAS_POR_DEFECTO = [
+    ('MANANA', 7, 0), ('MANANA', 7, 50), ('MANANA', 8, 40), ('MANANA', 9, 30), ('MANANA', 10, 20),
+    ('TARDE', 14, 0), ('TARDE', 14, 50), ('TARDE', 15, 40), ('TARDE', 16, 30), ('TARDE', 17, 20),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera un conjunto de datos de carga (docentes, cursos con horario y un semestre completo de '
+        'asistencias) con inserciones masivas, para medir el sistema a tamaño real. El semestre creado '
+        'queda ACTIVO, así que úsese sobre una base de datos dedicada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docentes', type=int, default=1000)
+        parser.add_argument('--cursos', type=int, default=5000)
+        parser.add_argument('--especialidades', type=int, default=40)
+        parser.add_argument('--carreras', type=int, default=4)
+        parser.add_argument('--grupos', type=int, default=3)
+        parser.add_argument('--semestre', default='Semestre de carga')
+        parser.add_argument('--inicio', type=date.fromisoformat, help='Inicio del semestre (por defecto, 17 semanas atrás).')
+        parser.add_argument('--fin', type=date.fromisoformat, help='Fin del semestre (por defecto, dentro de 2 semanas).')
+        parser.add_argument('--sin-horario', type=float, default=0.1, help='Fracción de cursos que quedan sin programar.')
+        parser.add_argument('--asistencia', type=float, default=0.9, help='Probabilidad de que se marque cada clase.')
+        parser.add_argument('--lote', type=int, default=2000, help='Filas por inserción.')
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **opciones):
+        self.random = random.Random(opciones['semilla'])
+        self.lote = opciones['lote']
+        hoy = timezone.localdate()
+        inicio = opciones['inicio'] or hoy - timedelta(weeks=17)
+        fin = opciones['fin'] or hoy + timedelta(weeks=2)
+        if fin <= inicio:
+            raise CommandError('La fecha de fin debe ser posterior a la de inicio.')
+        if Semestre.objects.filter(nombre=opciones['semestre']).exists():
+            raise CommandError(f'Ya existe el semestre "{opciones["semestre"]}"; use otro nombre o una base de datos limpia.')
+        if Docente.objects.filter(username__startswith=f'{PREFIJO_USUARIO}_').exists():
+            raise CommandError('La base de datos ya tiene docentes de carga; use una base de datos limpia.')
+
+        comienzo = time.monotonic()
+        catalogo = self.crear_catalogo(opciones)
+        docentes = self.crear_docentes(opciones['docentes'], catalogo['especialidades'])
+
+        semestre = Semestre.objects.create(
+            nombre=opciones['semestre'], fecha_inicio=inicio, fecha_fin=fin, estado='ACTIVO',
+        )
+        cursos = self.crear_cursos(opciones['cursos'], semestre, catalogo, docentes)
+        programados = self.programar(cursos, catalogo, 1 - opciones['sin_horario'])
+
+        # Nada de lo anterior emitió señales: las cachés se renuevan a mano
+        referencia.invalidar(referencia.FRANJAS)
+        invalidar_indices()
+        invalidar_horarios()
+
+        marcas, diarias = self.crear_asistencias(programados, inicio, min(fin, hoy - timedelta(days=1)), opciones['asistencia'])
+        acumulados.reconstruir(inicio, fin)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(docentes)} docentes, {len(cursos)} cursos ({len(programados)} con horario), '
+            f'{marcas} asistencias a cursos y {diarias} entradas generales en {time.monotonic() - comienzo:.1f} s.'
+        ))
+
+    def _insertar(self, modelo, objetos):
+        for inicio in range(0, len(objetos), self.lote):
+            with transaction.atomic():
+                modelo.objects.bulk_create(objetos[inicio:inicio + self.lote])
+        return objetos
+
+    def crear_catalogo(self, opciones):
+        grupos = self._insertar(Grupo, [Grupo(nombre=f'Grupo carga {n + 1}') for n in range(opciones['grupos'])])
+        carreras = self._insertar(Carrera, [Carrera(nombre=f'Carrera carga {n + 1}') for n in range(opciones['carreras'])])
+        especialidades = self._insertar(Especialidad, [
+            Especialidad(nombre=f'Especialidad carga {n + 1}', grupo=grupos[n % len(grupos)])
+            for n in range(opciones['especialidades'])
+        ])
+        franjas = list(FranjaHoraria.objects.order_by('hora_inicio'))
+        if not franjas:
+            franjas = self._insertar(FranjaHoraria, [
+                FranjaHoraria(turno=turno, hora_inicio=datetime(2000, 1, 1, h, m).time(),
+                              hora_fin=(datetime(2000, 1, 1, h, m) + timedelta(minutes=50)).time())
+                for turno, h, m in FRANJAS_POR_DEFECTO
+            ])
+        return {'grupos': grupos, 'carreras': carreras, 'especialidades': especialidades, 'franjas': franjas}
+
+    def crear_docentes(self, cantidad, especialidades):
+        # Un único hash para todos: calcularlo por docente tomaría minutos
+        password = make_password(None)
+        dnis_usados = set(Docente.objects.values_list('dni', flat=True))
+        docentes = []
+        for n in range(cantidad):
+            dni = f'{self.random.randrange(10 ** 7, 10 ** 8)}'
+            while dni in dnis_usados:
+                dni = f'{self.random.randrange(10 ** 7, 10 ** 8)}'
+            dnis_usados.add(dni)
+            docentes.append(Docente(
+                username=f'{PREFIJO_USUARIO}_{n + 1:05d}', password=password, dni=dni,
+                first_name=f'Docente {n + 1}', last_name='Carga', email=f'{PREFIJO_USUARIO}_{n + 1:05d}@example.com',
+                disponibilidad=self.random.choices(['COMPLETO', 'MANANA', 'TARDE'], weights=[8, 1, 1])[0],
+            ))
+        self._insertar(Docente, docentes)
+
+        Enlace = Docente.especialidades.through
+        enlaces = []
+        for n, docente in enumerate(docentes):
+            # Cada especialidad recibe la misma cantidad de docentes; algunos suman una segunda
+            propias = {especialidades[n % len(especialidades)]}
+            if self.random.random() < 0.3:
+                propias.add(self.random.choice(especialidades))
+            docente.especialidades_carga = sorted(propias, key=lambda e: e.pk)
+            enlaces.extend(Enlace(docente_id=docente.pk, especialidad_id=e.pk) for e in propias)
+        self._insertar(Enlace, enlaces)
+        return docentes
+
+    def crear_cursos(self, cantidad, semestre, catalogo, docentes):
+        por_especialidad = {}
+        for docente in docentes:
+            for especialidad in docente.especialidades_carga:
+                por_especialidad.setdefault(especialidad.pk, []).append(docente)
+
+        cursos = []
+        for n in range(cantidad):
+            especialidad = catalogo['especialidades'][n % len(catalogo['especialidades'])]
+            candidatos = por_especialidad.get(especialidad.pk) or docentes
+            cursos.append(Curso(
+                nombre=f'Curso carga {n + 1}', semestre=semestre, especialidad=especialidad,
+                carrera=catalogo['carreras'][n % len(catalogo['carreras'])],
+                tipo_curso='GENERAL' if self.random.random() < 0.05 else 'ESPECIALIDAD',
+                semestre_cursado=(n // len(catalogo['especialidades'])) % 10 + 1,
+                docente=self.random.choice(candidatos), duracion_bloques=self.random.choice([1, 2, 2, 3]),
+            ))
+        return self._insertar(Curso, cursos)
+
+    def programar(self, cursos, catalogo, fraccion):
+        """Ubica sin cruces una fracción de los cursos con el mismo ``MapaOcupacion`` que usa el planificador."""
+        rejilla = Rejilla(catalogo['franjas'])
+        mapa = MapaOcupacion(rejilla)
+        programados = []
+        for curso in cursos:
+            if self.random.random() >= fraccion:
+                continue
+            posiciones = rejilla.inicios(curso.duracion_bloques)
+            desde = self.random.randrange(len(posiciones)) if posiciones else 0
+            for mascara, dia, indice in posiciones[desde:] + posiciones[:desde]:
+                if mapa.conflicto(curso, mascara) is None:
+                    mapa.ocupar(curso, mascara)
+                    curso.dia = dia
+                    curso.horario_inicio = rejilla.franjas[indice].hora_inicio
+                    curso.horario_fin = rejilla.franjas[indice + curso.duracion_bloques - 1].hora_fin
+                    programados.append(curso)
+                    break
+        for inicio in range(0, len(programados), self.lote):
+            with transaction.atomic():
+                Curso.objects.bulk_update(programados[inicio:inicio + self.lote], ['dia', 'horario_inicio', 'horario_fin'])
+        return programados
+
+    def crear_asistencias(self, programados, desde, hasta, probabilidad):
+        # Todas las marcas comparten una foto: el almacenamiento por contenido la guarda una sola vez
+        imagen = BytesIO()
+        Image.new('RGB', (320, 240), (120, 140, 160)).save(imagen, 'JPEG', quality=80)
+        self.foto = fotos_verificacion().save('carga.jpg', ContentFile(imagen.getvalue()))
+
+        por_dia = {}
+        for curso in programados:
+            por_dia.setdefault(curso.dia, []).append(curso)
+
+        marcas, diarias, pendientes = 0, 0, []
+        fecha = desde
+        while fecha <= hasta:
+            if fecha.weekday() < 5:
+                llegadas = {}
+                for curso in por_dia.get(DIAS_SEMANA[fecha.weekday()], ()):
+                    if self.random.random() >= probabilidad:
+                        continue
+                    entrada = timezone.make_aware(datetime.combine(fecha, curso.horario_inicio)) + timedelta(minutes=self.random.randint(-10, 10))
+                    permitida = entrada + timedelta(minutes=minutos_minimos_en_clase(curso.duracion_bloques))
+                    salida = permitida + timedelta(minutes=self.random.randint(15, 30)) if self.random.random() < 0.95 else None
+                    pendientes.append(Asistencia(
+                        docente_id=curso.docente_id, curso=curso, fecha=fecha,
+                        hora_entrada=entrada, hora_salida=salida, hora_salida_permitida=permitida,
+                        foto_entrada=self.foto, foto_salida=self.foto if salida else None,
+                    ))
+                    llegadas[curso.docente_id] = min(entrada, llegadas.get(curso.docente_id, entrada))
+                if len(pendientes) >= self.lote:
+                    marcas += len(self._insertar(Asistencia, pendientes))
+                    pendientes = []
+                diarias += self._crear_diarias(fecha, llegadas)
+            fecha += timedelta(days=1)
+        marcas += len(self._insertar(Asistencia, pendientes))
+        return marcas, diarias
+
+    def _crear_diarias(self, fecha, llegadas):
+        if not llegadas:
+            return 0
+        hora_entrada = min(llegadas.values()) - timedelta(minutes=15)
+        diarias = AsistenciaDiaria.objects.bulk_create([
+            AsistenciaDiaria(docente_id=d, fecha=fecha, hora_entrada=hora_entrada, foto_verificacion=self.foto)
+            for d in llegadas
+        ])
+        return len(diarias)
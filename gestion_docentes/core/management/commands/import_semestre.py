@@ -0,0 +1,82 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Semestre
+from core.utils.importacion import LOTE, Importador
+
+MAX_ERRORES_MOSTRADOS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa franjas, especialidades, docentes y cursos de un semestre desde archivos CSV o XLSX. '
+        'Columnas: franjas (turno, hora_inicio, hora_fin); especialidades (nombre, grupo); '
+        'docentes (dni, nombres, apellidos, email, usuario, disponibilidad, especialidades separadas por ";"); '
+        'cursos (nombre, carrera, especialidad, tipo_curso, semestre_cursado, docente_dni, duracion_bloques, dia, hora_inicio). '
+        'Si alguna fila tiene errores no se importa nada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semestre', required=True, help='Nombre del semestre al que pertenecen los cursos.')
+        parser.add_argument('--fecha-inicio', type=date.fromisoformat, help='Para crear el semestre si no existe (AAAA-MM-DD).')
+        parser.add_argument('--fecha-fin', type=date.fromisoformat, help='Para crear el semestre si no existe (AAAA-MM-DD).')
+        parser.add_argument('--tipo', choices=[codigo for codigo, _ in Semestre.TIPO_SEMESTRE], default='IMPAR')
+        parser.add_argument('--activar', action='store_true', help='Deja el semestre como activo al terminar.')
+        parser.add_argument('--franjas')
+        parser.add_argument('--especialidades')
+        parser.add_argument('--docentes')
+        parser.add_argument('--cursos')
+        parser.add_argument('--lote', type=int, default=LOTE, help='Filas por transacción al escribir.')
+        parser.add_argument('--password', help='Contraseña inicial de los docentes nuevos (por defecto quedan sin contraseña usable).')
+        parser.add_argument('--validar', action='store_true', help='Solo valida los archivos, sin escribir nada.')
+
+    def handle(self, *args, **opciones):
+        archivos = [(tipo, opciones[tipo]) for tipo in ('franjas', 'especialidades', 'docentes', 'cursos') if opciones[tipo]]
+        if not archivos:
+            raise CommandError('Indique al menos un archivo con --franjas, --especialidades, --docentes o --cursos.')
+
+        inicio = time.monotonic()
+        semestre = self._semestre(opciones)
+        importador = Importador(semestre, lote=opciones['lote'], password=opciones['password'])
+        for tipo, archivo in archivos:
+            try:
+                getattr(importador, f'importar_{tipo}')(archivo)
+            except (OSError, ValueError) as error:
+                raise CommandError(str(error))
+
+        if importador.errores:
+            for error in importador.errores[:MAX_ERRORES_MOSTRADOS]:
+                self.stderr.write(error)
+            if len(importador.errores) > MAX_ERRORES_MOSTRADOS:
+                self.stderr.write(f'... y {len(importador.errores) - MAX_ERRORES_MOSTRADOS} errores más.')
+            raise CommandError(f'{len(importador.errores)} filas con errores; no se importó nada.')
+
+        if opciones['validar']:
+            self.stdout.write(self.style.SUCCESS('Los archivos son válidos (no se escribió nada).'))
+        else:
+            if semestre.pk is None:
+                semestre.save()
+            importador.guardar()
+            if opciones['activar'] and semestre.estado != 'ACTIVO':
+                semestre.estado = 'ACTIVO'
+                semestre.save()
+
+        for modelo in sorted(set(importador.creados) | set(importador.actualizados)):
+            self.stdout.write(f'{modelo}: {importador.creados[modelo]} nuevos, {importador.actualizados[modelo]} actualizados.')
+        self.stdout.write(self.style.SUCCESS(f'Importación terminada en {time.monotonic() - inicio:.1f} s.'))
+
+    def _semestre(self, opciones):
+        semestre = Semestre.objects.filter(nombre=opciones['semestre']).order_by('-fecha_inicio').first()
+        if semestre:
+            return semestre
+        if not (opciones['fecha_inicio'] and opciones['fecha_fin']):
+            raise CommandError(f'No existe el semestre "{opciones["semestre"]}"; indique --fecha-inicio y --fecha-fin para crearlo.')
+        if opciones['fecha_fin'] <= opciones['fecha_inicio']:
+            raise CommandError('La fecha de fin debe ser posterior a la de inicio.')
+        # Se guarda recién al escribir, para que --validar no deje nada creado
+        return Semestre(
+            nombre=opciones['semestre'], tipo=opciones['tipo'],
+            fecha_inicio=opciones['fecha_inicio'], fecha_fin=opciones['fecha_fin'],
+        )
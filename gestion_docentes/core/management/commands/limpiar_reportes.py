@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.utils.exports import DIRECTORIO_PDF
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra los reportes PDF generados hace más de --dias días. Cada PDF se guarda con la versión '
+        'de los datos en el nombre; las versiones superadas del mismo periodo se borran al generar la '
+        'nueva, pero los periodos que nadie vuelve a pedir quedan hasta que se ejecuta este comando.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help='Antigüedad mínima de los PDF a borrar.')
+        parser.add_argument('--simular', action='store_true', help='Solo informa lo que haría.')
+
+    def handle(self, *args, **opciones):
+        if not default_storage.exists(DIRECTORIO_PDF):
+            self.stdout.write('No hay reportes generados.')
+            return
+
+        limite = timezone.now() - timedelta(days=opciones['dias'])
+        borrados = 0
+        _, archivos = default_storage.listdir(DIRECTORIO_PDF)
+        for archivo in archivos:
+            ruta = f'{DIRECTORIO_PDF}/{archivo}'
+            if default_storage.get_modified_time(ruta) < limite:
+                if not opciones['simular']:
+                    default_storage.delete(ruta)
+                borrados += 1
+
+        accion = 'Se borrarían' if opciones['simular'] else 'Se borraron'
+        self.stdout.write(self.style.SUCCESS(f'{accion} {borrados} de {len(archivos)} reportes PDF.'))
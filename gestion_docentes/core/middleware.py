@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from django.http import FileResponse
+
+from .utils import metricas
+
+
+class _Medicion:
+    """Cuenta las consultas y el tiempo en la base de todas las conexiones mientras está activa."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.db = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - inicio
+            self.consultas += 1
+
+    def activa(self):
+        pila = ExitStack()
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(self))
+        return pila
+
+
+class MetricasMiddleware:
+    """
+    Registra consultas, tiempo en la base, tiempo total y tamaño de cada
+    respuesta en ``core.utils.metricas``, agrupado por nombre de URL.
+
+    En las respuestas por streaming (p. ej. la exportación a Excel) la muestra
+    se toma al terminar de enviar el contenido, contando también las consultas
+    que se hacen mientras se genera.
+
+    Bajo ASGI funciona en modo asíncrono para no obligar a las vistas
+    asíncronas del kiosco a correr en un hilo. Las conexiones de Django son
+    por hilo, así que la medición se instala en el hilo donde ``sync_to_async``
+    ejecuta las consultas de la petición (el ORM asíncrono incluido).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        medicion = _Medicion()
+        with medicion.activa():
+            response = self.get_response(request)
+        return self._medir(request, response, medicion)
+
+    async def __acall__(self, request):
+        medicion = _Medicion()
+        pila = await sync_to_async(medicion.activa)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(pila.close)()
+        return self._medir(request, response, medicion)
+
+    def _medir(self, request, response, medicion):
+        match = request.resolver_match
+        vista = match.view_name if match else 'sin_ruta'
+
+        if response.streaming and response.is_async:
+            response.streaming_content = self._acontar_streaming(response.streaming_content, medicion, vista, response.status_code)
+        elif response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = self._contar_streaming(response.streaming_content, medicion, vista, response.status_code)
+        else:
+            tamano = int(response['Content-Length']) if response.has_header('Content-Length') else None
+            if not response.streaming:
+                tamano = len(response.content)
+            self._registrar(vista, medicion, tamano, response.status_code)
+        return response
+
+    def _contar_streaming(self, contenido, medicion, vista, estado):
+        tamano = 0
+        with medicion.activa():
+            for bloque in contenido:
+                tamano += len(bloque)
+                yield bloque
+        self._registrar(vista, medicion, tamano, estado)
+
+    async def _acontar_streaming(self, contenido, medicion, vista, estado):
+        # Las consultas de un generador asíncrono corren en otros hilos: solo se miden tiempo y tamaño
+        tamano = 0
+        async for bloque in contenido:
+            tamano += len(bloque)
+            yield bloque
+        self._registrar(vista, medicion, tamano, estado)
+
+    def _registrar(self, vista, medicion, tamano, estado):
+        metricas.registrar(vista, metricas.Muestra(
+            total_ms=(time.perf_counter() - medicion.inicio) * 1000, db_ms=medicion.db * 1000,
+            consultas=medicion.consultas, bytes=tamano, estado=estado,
+        ))
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:23
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def eliminar_duplicados(apps, schema_editor):
+    """
+    Deja una sola fila por (docente, fecha) en AsistenciaDiaria y por
+    (docente, curso, fecha) en Asistencia antes de crear las restricciones.
+    Se conserva la primera marca; si otra fila duplicada registró la salida,
+    esa salida se pasa a la fila conservada.
+    """
+    AsistenciaDiaria = apps.get_model('core', 'AsistenciaDiaria')
+    Asistencia = apps.get_model('core', 'Asistencia')
+
+    repetidas = (
+        AsistenciaDiaria.objects.values('docente_id', 'fecha')
+        .annotate(total=Count('id'), primera=Min('id')).filter(total__gt=1)
+    )
+    for grupo in repetidas:
+        AsistenciaDiaria.objects.filter(docente_id=grupo['docente_id'], fecha=grupo['fecha']).exclude(id=grupo['primera']).delete()
+
+    repetidas = (
+        Asistencia.objects.values('docente_id', 'curso_id', 'fecha')
+        .annotate(total=Count('id'), primera=Min('id')).filter(total__gt=1)
+    )
+    for grupo in repetidas:
+        filas = list(Asistencia.objects.filter(
+            docente_id=grupo['docente_id'], curso_id=grupo['curso_id'], fecha=grupo['fecha'],
+        ).order_by('id'))
+        conservada, sobrantes = filas[0], filas[1:]
+        if not conservada.hora_salida:
+            con_salida = next((a for a in sobrantes if a.hora_salida), None)
+            if con_salida:
+                conservada.hora_salida = con_salida.hora_salida
+                conservada.foto_salida = con_salida.foto_salida
+                conservada.save(update_fields=['hora_salida', 'foto_salida'])
+        Asistencia.objects.filter(id__in=[a.id for a in sobrantes]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_configuracioninstitucion_facultad'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_duplicados, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['fecha', 'docente'], name='asis_fecha_docente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asistenciadiaria',
+            index=models.Index(fields=['fecha', 'docente'], name='asisdiaria_fecha_docente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='curso',
+            index=models.Index(fields=['docente', 'dia', 'semestre'], name='curso_docente_dia_sem_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='curso',
+            index=models.Index(fields=['semestre', 'especialidad', 'dia'], name='curso_sem_esp_dia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='curso',
+            index=models.Index(condition=models.Q(('dia__isnull', False)), fields=['semestre', 'carrera'], name='curso_programado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='curso',
+            index=models.Index(condition=models.Q(('dia__isnull', True)), fields=['semestre', 'especialidad', 'semestre_cursado'], name='curso_pendiente_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='asistencia',
+            constraint=models.UniqueConstraint(fields=('docente', 'curso', 'fecha'), name='asis_docente_curso_fecha_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='asistenciadiaria',
+            constraint=models.UniqueConstraint(fields=('docente', 'fecha'), name='asisdiaria_docente_fecha_uniq'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_indices_asistencia_y_cursos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDocente',
+            fields=[
+                ('docente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('documentos_total', models.PositiveIntegerField(default=0)),
+                ('documentos_recibidos', models.PositiveIntegerField(default=0)),
+                ('documentos_en_revision', models.PositiveIntegerField(default=0)),
+                ('documentos_aprobados', models.PositiveIntegerField(default=0)),
+                ('documentos_observados', models.PositiveIntegerField(default=0)),
+                ('documentos_vencidos', models.PositiveIntegerField(default=0)),
+                ('asistencias_fecha', models.DateField(blank=True, help_text='Día al que corresponde asistencias_dia.', null=True)),
+                ('asistencias_dia', models.PositiveIntegerField(default=0)),
+                ('horario', models.JSONField(blank=True, default=list, help_text='Cursos del semestre activo: id, nombre, carrera, día y horas.')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen de Docente',
+                'verbose_name_plural': 'Resúmenes de Docentes',
+            },
+        ),
+        migrations.CreateModel(
+            name='ActividadDocente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('asistencia_entrada', 'Entrada a curso'), ('asistencia_salida', 'Salida de curso'), ('documento', 'Documento')], max_length=20)),
+                ('fecha', models.DateTimeField()),
+                ('texto', models.CharField(max_length=255)),
+                ('asistencia', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.asistencia')),
+                ('docente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actividades', to=settings.AUTH_USER_MODEL)),
+                ('version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.versiondocumento')),
+            ],
+            options={
+                'verbose_name': 'Actividad de Docente',
+                'verbose_name_plural': 'Actividad de Docentes',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['docente', '-fecha'], name='actividad_docente_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:33
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def inicializar_contadores(apps, schema_editor):
+    """
+    Renumera las versiones de los documentos que tienen números repetidos
+    (subidas simultáneas con la numeración anterior) por orden de subida y deja
+    en cada documento el último número usado.
+    """
+    Documento = apps.get_model('core', 'Documento')
+    VersionDocumento = apps.get_model('core', 'VersionDocumento')
+
+    repetidos = (
+        VersionDocumento.objects.values('documento_id', 'numero_version')
+        .annotate(total=Count('id')).filter(total__gt=1)
+    )
+    for documento_id in {grupo['documento_id'] for grupo in repetidos}:
+        versiones = list(VersionDocumento.objects.filter(documento_id=documento_id).order_by('numero_version', 'fecha_version', 'id'))
+        for numero, version in enumerate(versiones, 1):
+            version.numero_version = numero
+        VersionDocumento.objects.bulk_update(versiones, ['numero_version'])
+
+    ultimas = VersionDocumento.objects.values('documento_id').annotate(ultima=Max('numero_version'))
+    for grupo in ultimas:
+        Documento.objects.filter(pk=grupo['documento_id']).update(ultima_version=grupo['ultima'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_resumen_docente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documento',
+            name='ultima_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(inicializar_contadores, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='versiondocumento',
+            constraint=models.UniqueConstraint(fields=('documento', 'numero_version'), name='version_documento_numero_uniq'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:35
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_contador_versiones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaDocumento',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('titulo', models.CharField(blank=True, max_length=200)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('recibido', models.PositiveBigIntegerField(default=0)),
+                ('estado', models.CharField(choices=[('EN_CURSO', 'En curso'), ('COMPLETADA', 'Completada')], default='EN_CURSO', max_length=20)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+                ('docente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subidas', to=settings.AUTH_USER_MODEL)),
+                ('documento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subidas', to='core.documento')),
+                ('tipo_documento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.tipodocumento')),
+                ('version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.versiondocumento')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'actualizada'], name='subida_estado_fecha_idx')],
+            },
+        ),
+    ]
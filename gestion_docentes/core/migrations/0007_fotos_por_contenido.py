@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:38
+
+import core.utils.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_subidas_por_fragmentos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='asistencia',
+            name='foto_entrada',
+            field=models.ImageField(blank=True, null=True, storage=core.utils.almacenamiento.fotos_verificacion, upload_to='verificacion_cursos/entradas/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='asistencia',
+            name='foto_salida',
+            field=models.ImageField(blank=True, null=True, storage=core.utils.almacenamiento.fotos_verificacion, upload_to='verificacion_cursos/salidas/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='asistenciadiaria',
+            name='foto_verificacion',
+            field=models.ImageField(storage=core.utils.almacenamiento.fotos_verificacion, upload_to='verificacion_diaria/%Y/%m/%d/'),
+        ),
+    ]
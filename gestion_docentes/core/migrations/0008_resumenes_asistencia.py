@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_fotos_por_contenido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenAsistenciaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clases', models.PositiveIntegerField(default=0, help_text='Clases con entrada marcada.')),
+                ('llegadas_tarde', models.PositiveIntegerField(default=0)),
+                ('minutos_tardanza', models.PositiveIntegerField(default=0, help_text='Minutos de la entrada después del inicio del curso.')),
+                ('minutos_dictados', models.PositiveIntegerField(default=0, help_text='Minutos entre la entrada y la salida marcadas.')),
+                ('salidas_faltantes', models.PositiveIntegerField(default=0, help_text='Clases con entrada y sin salida.')),
+                ('fecha', models.DateField()),
+                ('entrada_general', models.BooleanField(default=False)),
+                ('docente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_dia', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Asistencia',
+                'verbose_name_plural': 'Resúmenes Diarios de Asistencia',
+                'indexes': [models.Index(fields=['fecha', 'docente'], name='resumendia_fecha_docente_idx')],
+                'constraints': [models.UniqueConstraint(fields=('docente', 'fecha'), name='resumendia_docente_fecha_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenAsistenciaMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clases', models.PositiveIntegerField(default=0, help_text='Clases con entrada marcada.')),
+                ('llegadas_tarde', models.PositiveIntegerField(default=0)),
+                ('minutos_tardanza', models.PositiveIntegerField(default=0, help_text='Minutos de la entrada después del inicio del curso.')),
+                ('minutos_dictados', models.PositiveIntegerField(default=0, help_text='Minutos entre la entrada y la salida marcadas.')),
+                ('salidas_faltantes', models.PositiveIntegerField(default=0, help_text='Clases con entrada y sin salida.')),
+                ('mes', models.DateField()),
+                ('dias_presente', models.PositiveIntegerField(default=0, help_text='Días con entrada general.')),
+                ('docente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_mes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen Mensual de Asistencia',
+                'verbose_name_plural': 'Resúmenes Mensuales de Asistencia',
+                'indexes': [models.Index(fields=['mes', 'docente'], name='resumenmes_mes_docente_idx')],
+                'constraints': [models.UniqueConstraint(fields=('docente', 'mes'), name='resumenmes_docente_mes_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenCursoMes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clases', models.PositiveIntegerField(default=0, help_text='Clases con entrada marcada.')),
+                ('llegadas_tarde', models.PositiveIntegerField(default=0)),
+                ('minutos_tardanza', models.PositiveIntegerField(default=0, help_text='Minutos de la entrada después del inicio del curso.')),
+                ('minutos_dictados', models.PositiveIntegerField(default=0, help_text='Minutos entre la entrada y la salida marcadas.')),
+                ('salidas_faltantes', models.PositiveIntegerField(default=0, help_text='Clases con entrada y sin salida.')),
+                ('mes', models.DateField()),
+                ('curso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_mes', to='core.curso')),
+                ('docente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_curso_mes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen Mensual de Curso',
+                'verbose_name_plural': 'Resúmenes Mensuales de Cursos',
+                'constraints': [models.UniqueConstraint(fields=('curso', 'docente', 'mes'), name='resumencurso_curso_docente_mes_uniq')],
+            },
+        ),
+    ]
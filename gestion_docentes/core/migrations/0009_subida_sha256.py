@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_resumenes_asistencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subidadocumento',
+            name='sha256',
+            field=models.CharField(blank=True, help_text='SHA-256 declarado por el cliente; vacío si no lo envió.', max_length=64),
+        ),
+    ]
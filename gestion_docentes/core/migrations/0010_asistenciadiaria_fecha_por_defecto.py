@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_subida_sha256'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='asistenciadiaria',
+            name='fecha',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='asistenciadiaria',
+            name='hora_entrada',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
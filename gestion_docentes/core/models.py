@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import uuid
 
+from .utils.almacenamiento import fotos_verificacion
+
 class Grupo(models.Model):
     nombre = models.CharField(max_length=100, help_text="Ej: Grupo A, Grupo B, Grupo C")
     def __str__(self):
@@ -79,6 +81,19 @@ class Curso(models.Model):
     horario_fin = models.TimeField(null=True, blank=True)
     dia = models.CharField(max_length=20, choices=[('Lunes', 'Lunes'), ('Martes', 'Martes'), ('Miércoles', 'Miércoles'), ('Jueves', 'Jueves'), ('Viernes', 'Viernes')], null=True, blank=True)
     duracion_bloques = models.IntegerField(default=2, help_text="Número de bloques de 50 minutos que dura el curso.")
+
+    class Meta:
+        indexes = [
+            # Cursos del día de un docente (dashboard, kiosco, cruces de horario)
+            models.Index(fields=['docente', 'dia', 'semestre'], name='curso_docente_dia_sem_idx'),
+            # Parrillas y planificador por especialidad
+            models.Index(fields=['semestre', 'especialidad', 'dia'], name='curso_sem_esp_dia_idx'),
+            # Solo los cursos ya programados (ver_horarios, índice de ocupación)
+            models.Index(fields=['semestre', 'carrera'], condition=models.Q(dia__isnull=False), name='curso_programado_idx'),
+            # Solo los pendientes de programar (planificador, auto-asignación)
+            models.Index(fields=['semestre', 'especialidad', 'semestre_cursado'], condition=models.Q(dia__isnull=True), name='curso_pendiente_idx'),
+        ]
+
     def __str__(self): return f"{self.nombre} ({self.especialidad.nombre if self.especialidad else 'N/A'})"
 
 class Documento(models.Model):
@@ -97,9 +112,30 @@ class Documento(models.Model):
     fecha_vencimiento = models.DateField(null=True, blank=True, help_text="Opcional: Dejar en blanco si el documento no vence.")
     estado = models.CharField(max_length=20, choices=ESTADOS_DOCUMENTO, default='RECIBIDO')
     observaciones = models.TextField(blank=True, help_text="Notas internas para la administración.")
+    # Último número de versión asignado; solo lo modifica reservar_versiones
+    ultima_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self): 
         return self.titulo
+
+    def save(self, *args, **kwargs):
+        # Guardar un documento cargado antes de una subida no debe pisar el contador
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'ultima_version'
+            ]
+        super().save(*args, **kwargs)
+
+    def reservar_versiones(self, cantidad=1):
+        """
+        Incrementa el contador con un UPDATE atómico y devuelve el último número
+        reservado; la fila queda bloqueada hasta el fin de la transacción, así
+        que dos subidas simultáneas nunca obtienen el mismo número.
+        """
+        with transaction.atomic():
+            Documento.objects.filter(pk=self.pk).update(ultima_version=models.F('ultima_version') + cantidad)
+            self.ultima_version = Documento.objects.filter(pk=self.pk).values_list('ultima_version', flat=True).get()
+        return self.ultima_version
     
 class VersionDocumento(models.Model):
     documento = models.ForeignKey(Documento, on_delete=models.CASCADE, related_name='versiones')
@@ -109,13 +145,31 @@ class VersionDocumento(models.Model):
 
     class Meta:
         ordering = ['-fecha_version']
+        constraints = [
+            models.UniqueConstraint(fields=['documento', 'numero_version'], name='version_documento_numero_uniq'),
+        ]
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            ultima_version = VersionDocumento.objects.filter(documento=self.documento).order_by('-numero_version').first()
-            self.numero_version = (ultima_version.numero_version + 1) if ultima_version else 1
+        if self.pk is None and self.numero_version is None:
+            # La reserva y el INSERT van juntos: si el INSERT falla el número se libera
+            with transaction.atomic():
+                self.numero_version = self.documento.reservar_versiones()
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
+    @classmethod
+    def crear_en_lote(cls, documento, versiones):
+        """Numera ``versiones`` con una sola reserva y las inserta con ``bulk_create`` (sin señales)."""
+        if not versiones:
+            return []
+        with transaction.atomic():
+            ultima = documento.reservar_versiones(len(versiones))
+            for numero, version in enumerate(versiones, ultima - len(versiones) + 1):
+                version.documento = documento
+                version.numero_version = numero
+            return cls.objects.bulk_create(versiones)
+
     def __str__(self):
         return f"{self.documento.titulo} (v{self.numero_version})"
 
@@ -126,17 +180,162 @@ class Asistencia(models.Model):
     hora_entrada = models.DateTimeField(null=True, blank=True)
     hora_salida = models.DateTimeField(null=True, blank=True)
     hora_salida_permitida = models.DateTimeField(null=True, blank=True, help_text="Hora mínima a la que se puede marcar la salida.")
-    foto_entrada = models.ImageField(upload_to='verificacion_cursos/entradas/%Y/%m/%d/', null=True, blank=True)
-    foto_salida = models.ImageField(upload_to='verificacion_cursos/salidas/%Y/%m/%d/', null=True, blank=True)
+    foto_entrada = models.ImageField(upload_to='verificacion_cursos/entradas/%Y/%m/%d/', null=True, blank=True, storage=fotos_verificacion)
+    foto_salida = models.ImageField(upload_to='verificacion_cursos/salidas/%Y/%m/%d/', null=True, blank=True, storage=fotos_verificacion)
+
+    class Meta:
+        constraints = [
+            # Una sola marca por docente, curso y día (el kiosco hace get_or_create sobre estos campos)
+            models.UniqueConstraint(fields=['docente', 'curso', 'fecha'], name='asis_docente_curso_fecha_uniq'),
+        ]
+        indexes = [
+            # Marcas del día de un docente (dashboard, perfil) y reportes por rango de fechas
+            models.Index(fields=['fecha', 'docente'], name='asis_fecha_docente_idx'),
+        ]
+
     def __str__(self): return f"Asistencia {self.docente} - {self.curso} ({self.fecha})"
 
 class AsistenciaDiaria(models.Model):
     docente = models.ForeignKey(Docente, on_delete=models.CASCADE)
-    fecha = models.DateField(auto_now_add=True)
-    hora_entrada = models.DateTimeField(auto_now_add=True)
-    foto_verificacion = models.ImageField(upload_to='verificacion_diaria/%Y/%m/%d/')
+    # Valores por defecto en lugar de auto_now_add: las marcas sin conexión traen su propia fecha y hora
+    fecha = models.DateField(default=timezone.localdate, editable=False)
+    hora_entrada = models.DateTimeField(default=timezone.now, editable=False)
+    foto_verificacion = models.ImageField(upload_to='verificacion_diaria/%Y/%m/%d/', storage=fotos_verificacion)
+
+    class Meta:
+        constraints = [
+            # Una sola entrada general por docente y día
+            models.UniqueConstraint(fields=['docente', 'fecha'], name='asisdiaria_docente_fecha_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha', 'docente'], name='asisdiaria_fecha_docente_idx'),
+        ]
+
     def __str__(self): return f"Asistencia Diaria de {self.docente} - {self.fecha}"
 
+class ContadoresAsistencia(models.Model):
+    """Contadores comunes de los resúmenes de asistencia (ver ``utils/acumulados.py``)."""
+    clases = models.PositiveIntegerField(default=0, help_text="Clases con entrada marcada.")
+    llegadas_tarde = models.PositiveIntegerField(default=0)
+    minutos_tardanza = models.PositiveIntegerField(default=0, help_text="Minutos de la entrada después del inicio del curso.")
+    minutos_dictados = models.PositiveIntegerField(default=0, help_text="Minutos entre la entrada y la salida marcadas.")
+    salidas_faltantes = models.PositiveIntegerField(default=0, help_text="Clases con entrada y sin salida.")
+
+    class Meta:
+        abstract = True
+
+class ResumenAsistenciaDia(ContadoresAsistencia):
+    """Asistencia de un docente en un día: entrada general y totales de sus clases."""
+    docente = models.ForeignKey(Docente, on_delete=models.CASCADE, related_name='resumenes_dia')
+    fecha = models.DateField()
+    entrada_general = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "Resumen Diario de Asistencia"; verbose_name_plural = "Resúmenes Diarios de Asistencia"
+        constraints = [models.UniqueConstraint(fields=['docente', 'fecha'], name='resumendia_docente_fecha_uniq')]
+        indexes = [models.Index(fields=['fecha', 'docente'], name='resumendia_fecha_docente_idx')]
+
+    def __str__(self): return f"Resumen de {self.docente} ({self.fecha})"
+
+class ResumenAsistenciaMes(ContadoresAsistencia):
+    """Asistencia de un docente en un mes (``mes`` es el primer día del mes)."""
+    docente = models.ForeignKey(Docente, on_delete=models.CASCADE, related_name='resumenes_mes')
+    mes = models.DateField()
+    dias_presente = models.PositiveIntegerField(default=0, help_text="Días con entrada general.")
+
+    class Meta:
+        verbose_name = "Resumen Mensual de Asistencia"; verbose_name_plural = "Resúmenes Mensuales de Asistencia"
+        constraints = [models.UniqueConstraint(fields=['docente', 'mes'], name='resumenmes_docente_mes_uniq')]
+        indexes = [models.Index(fields=['mes', 'docente'], name='resumenmes_mes_docente_idx')]
+
+    def __str__(self): return f"Resumen de {self.docente} ({self.mes:%Y-%m})"
+
+class ResumenCursoMes(ContadoresAsistencia):
+    """Asistencia a un curso en un mes, por docente (el curso puede cambiar de docente)."""
+    curso = models.ForeignKey(Curso, on_delete=models.CASCADE, related_name='resumenes_mes')
+    docente = models.ForeignKey(Docente, on_delete=models.CASCADE, related_name='resumenes_curso_mes')
+    mes = models.DateField()
+
+    class Meta:
+        verbose_name = "Resumen Mensual de Curso"; verbose_name_plural = "Resúmenes Mensuales de Cursos"
+        constraints = [models.UniqueConstraint(fields=['curso', 'docente', 'mes'], name='resumencurso_curso_docente_mes_uniq')]
+
+    def __str__(self): return f"Resumen de {self.curso} ({self.mes:%Y-%m})"
+
+class SubidaDocumento(models.Model):
+    """
+    Sesión de subida por fragmentos. Guarda el destino (documento nuevo o nueva
+    versión de ``documento``) y cuántos bytes se recibieron, para poder retomar
+    la subida tras un corte.
+    """
+    ESTADOS = [
+        ('EN_CURSO', 'En curso'),
+        ('COMPLETADA', 'Completada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    docente = models.ForeignKey(Docente, on_delete=models.CASCADE, related_name='subidas')
+    documento = models.ForeignKey(Documento, on_delete=models.CASCADE, null=True, blank=True, related_name='subidas')
+    tipo_documento = models.ForeignKey(TipoDocumento, on_delete=models.CASCADE, null=True, blank=True)
+    titulo = models.CharField(max_length=200, blank=True)
+    nombre_archivo = models.CharField(max_length=255)
+    tamano = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text='SHA-256 declarado por el cliente; vacío si no lo envió.')
+    recibido = models.PositiveBigIntegerField(default=0)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='EN_CURSO')
+    version = models.ForeignKey(VersionDocumento, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    creada = models.DateTimeField(auto_now_add=True)
+    actualizada = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'actualizada'], name='subida_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"Subida de {self.nombre_archivo} ({self.recibido}/{self.tamano})"
+
+class ResumenDocente(models.Model):
+    """
+    Resumen desnormalizado de cada docente para el dashboard y el perfil.
+    Lo mantienen las señales de Documento, Asistencia y Curso (ver ``utils/resumen.py``).
+    """
+    docente = models.OneToOneField(Docente, on_delete=models.CASCADE, primary_key=True, related_name='resumen')
+    documentos_total = models.PositiveIntegerField(default=0)
+    documentos_recibidos = models.PositiveIntegerField(default=0)
+    documentos_en_revision = models.PositiveIntegerField(default=0)
+    documentos_aprobados = models.PositiveIntegerField(default=0)
+    documentos_observados = models.PositiveIntegerField(default=0)
+    documentos_vencidos = models.PositiveIntegerField(default=0)
+    asistencias_fecha = models.DateField(null=True, blank=True, help_text="Día al que corresponde asistencias_dia.")
+    asistencias_dia = models.PositiveIntegerField(default=0)
+    horario = models.JSONField(default=list, blank=True, help_text="Cursos del semestre activo: id, nombre, carrera, día y horas.")
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen de Docente"; verbose_name_plural = "Resúmenes de Docentes"
+
+    def __str__(self): return f"Resumen de {self.docente}"
+
+class ActividadDocente(models.Model):
+    TIPO_CHOICES = [('asistencia_entrada', 'Entrada a curso'), ('asistencia_salida', 'Salida de curso'), ('documento', 'Documento')]
+    docente = models.ForeignKey(Docente, on_delete=models.CASCADE, related_name='actividades')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    fecha = models.DateTimeField()
+    texto = models.CharField(max_length=255)
+    asistencia = models.ForeignKey(Asistencia, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    version = models.ForeignKey(VersionDocumento, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    class Meta:
+        verbose_name = "Actividad de Docente"; verbose_name_plural = "Actividad de Docentes"; ordering = ['-fecha']
+        indexes = [models.Index(fields=['docente', '-fecha'], name='actividad_docente_fecha_idx')]
+
+    @property
+    def documento(self):
+        return self.version.documento if self.version_id else None
+
+    def __str__(self): return f"{self.docente}: {self.texto}"
+
 class SolicitudIntercambio(models.Model):
     docente_solicitante = models.ForeignKey(Docente, on_delete=models.CASCADE, related_name='solicitudes_enviadas')
     curso_solicitante = models.ForeignKey(Curso, on_delete=models.CASCADE, related_name='solicitudes_solicitante')
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Lecturas en la réplica.
+
+Si ``DATABASES`` define el alias ``replica`` (perfil ``postgres`` con
+``SIGEDO_DB_REPLICA_HOST``), las vistas decoradas con ``lectura_en_replica``
+(reportes, exportaciones y horarios públicos) y lo que se ejecute dentro de
+``usar_replica()`` leen de ella. Las escrituras y el resto de las lecturas van
+a ``default``. Sin réplica configurada no cambia nada.
+
+La réplica puede ir unos instantes atrás del primario, por eso solo se usa en
+vistas que no leen lo que acaban de escribir, y lo que se guarda en caché con
+un sello de versión (parrillas, datos de referencia) se lee dentro de
+``usar_primario()``: si no, una réplica atrasada dejaría datos viejos bajo un
+sello nuevo.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA = 'replica'
+
+_en_replica = contextvars.ContextVar('en_replica', default=False)
+
+
+@contextmanager
+def _leer_en_replica(activo):
+    token = _en_replica.set(activo)
+    try:
+        yield
+    finally:
+        _en_replica.reset(token)
+
+
+def usar_replica():
+    return _leer_en_replica(True)
+
+
+def usar_primario():
+    return _leer_en_replica(False)
+
+
+def lectura_en_replica(vista):
+    """
+    Ejecuta la vista con las lecturas en la réplica. Va debajo de
+    ``login_required``/``staff_member_required`` para que la sesión y el
+    usuario se lean del primario.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with usar_replica():
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _en_replica.get() and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Ambos alias tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # La réplica recibe el esquema por replicación
+        return db != REPLICA
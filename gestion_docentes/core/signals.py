@@ -0,0 +1,201 @@
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Semestre, DiaEspecial, Curso, FranjaHoraria, Especialidad, Docente, Documento, VersionDocumento, Asistencia,
+    AsistenciaDiaria, ConfiguracionInstitucion, Carrera,
+)
+from .utils.kiosco import invalidar_contexto_del_dia
+from .utils.ocupacion import actualizar_cursos, invalidar_indices, quitar_cursos
+from .utils.horarios import invalidar_horarios
+from .utils.reportes import invalidar_reportes
+from .utils import acumulados, planificador, referencia, resumen
+
+
+# --- Invalidación del contexto diario del kiosco ---
+
+@receiver([post_save, post_delete], sender=Semestre)
+@receiver([post_save, post_delete], sender=DiaEspecial)
+def invalidar_kiosco(sender, **kwargs):
+    invalidar_contexto_del_dia()
+
+
+# --- Datos de referencia en memoria ---
+
+@receiver([post_save, post_delete], sender=ConfiguracionInstitucion)
+def invalidar_configuracion(sender, **kwargs):
+    referencia.invalidar(referencia.CONFIGURACION)
+
+
+@receiver([post_save, post_delete], sender=Semestre)
+def invalidar_semestre_activo(sender, **kwargs):
+    referencia.invalidar(referencia.SEMESTRE_ACTIVO)
+
+
+@receiver([post_save, post_delete], sender=FranjaHoraria)
+def invalidar_franjas(sender, **kwargs):
+    referencia.invalidar(referencia.FRANJAS)
+
+
+# --- Índice de ocupación de horarios ---
+
+@receiver(post_save, sender=Curso)
+def actualizar_ocupacion_curso(sender, instance, **kwargs):
+    actualizar_cursos([instance])
+
+
+@receiver(post_delete, sender=Curso)
+def quitar_ocupacion_curso(sender, instance, **kwargs):
+    quitar_cursos([instance])
+
+
+# --- Deltas del planificador de horarios ---
+
+@receiver(post_save, sender=Curso)
+def publicar_curso_planificador(sender, instance, **kwargs):
+    planificador.publicar_cursos([instance])
+
+
+@receiver(post_delete, sender=Curso)
+def publicar_curso_eliminado_planificador(sender, instance, **kwargs):
+    planificador.curso_eliminado(instance)
+
+
+# Borrar un semestre o un docente desvincula sus cursos con un UPDATE, sin señales
+@receiver([post_save, post_delete], sender=FranjaHoraria)
+@receiver([post_save, post_delete], sender=Especialidad)
+@receiver(post_delete, sender=Semestre)
+@receiver(post_delete, sender=Docente)
+def invalidar_ocupacion(sender, **kwargs):
+    invalidar_indices()
+
+
+# --- Parrillas de horario en caché ---
+
+@receiver([post_save, post_delete], sender=Curso)
+@receiver([post_save, post_delete], sender=FranjaHoraria)
+@receiver([post_save, post_delete], sender=Especialidad)
+@receiver(post_delete, sender=Semestre)
+@receiver(post_delete, sender=Docente)
+def invalidar_parrillas(sender, **kwargs):
+    invalidar_horarios()
+
+
+@receiver(post_save, sender=Docente)
+def invalidar_parrillas_docente(sender, update_fields=None, **kwargs):
+    # Las parrillas muestran el nombre del docente; el login solo guarda last_login
+    if update_fields is None or {'first_name', 'last_name'} & set(update_fields):
+        invalidar_horarios()
+
+
+# --- Resumen por docente (dashboard y perfil) ---
+
+# Se recuerdan los valores cargados para aplicar solo la diferencia al guardar
+@receiver(post_init, sender=Documento)
+def recordar_estado_documento(sender, instance, **kwargs):
+    instance._estado_inicial = instance.estado
+
+
+@receiver(post_init, sender=Asistencia)
+def recordar_marcas_asistencia(sender, instance, **kwargs):
+    instance._marcas_iniciales = (instance.hora_entrada, instance.hora_salida)
+    instance._acumulado_inicial = acumulados.estado_asistencia(instance)
+
+
+@receiver(post_init, sender=Curso)
+def recordar_docente_curso(sender, instance, **kwargs):
+    instance._docente_inicial = instance.docente_id
+
+
+@receiver(post_save, sender=Documento)
+def resumen_documento_guardado(sender, instance, created, **kwargs):
+    resumen.documento_guardado(instance, created)
+
+
+@receiver(post_delete, sender=Documento)
+def resumen_documento_eliminado(sender, instance, **kwargs):
+    resumen.documento_eliminado(instance)
+
+
+@receiver(post_save, sender=VersionDocumento)
+def resumen_version_creada(sender, instance, created, **kwargs):
+    if created:
+        resumen.version_creada(instance)
+
+
+@receiver(post_save, sender=Asistencia)
+def resumen_asistencia_guardada(sender, instance, created, **kwargs):
+    resumen.asistencia_guardada(instance, created)
+
+
+@receiver(post_delete, sender=Asistencia)
+def resumen_asistencia_eliminada(sender, instance, **kwargs):
+    resumen.asistencia_eliminada(instance)
+
+
+@receiver([post_save, post_delete], sender=Curso)
+def resumen_horario_curso(sender, instance, **kwargs):
+    # Un curso reasignado sale del horario del docente anterior
+    resumen.actualizar_horarios({instance.docente_id, instance._docente_inicial})
+    instance._docente_inicial = instance.docente_id
+
+
+@receiver([post_save, post_delete], sender=Semestre)
+def resumen_horario_semestre(sender, **kwargs):
+    # Cambiar el semestre activo cambia el horario de todos
+    resumen.actualizar_horarios()
+
+
+# --- Resúmenes diarios y mensuales de asistencia ---
+
+@receiver(post_save, sender=Asistencia)
+def acumular_asistencia_guardada(sender, instance, **kwargs):
+    acumulados.asistencia_guardada(instance)
+
+
+@receiver(post_delete, sender=Asistencia)
+def acumular_asistencia_eliminada(sender, instance, **kwargs):
+    acumulados.asistencia_eliminada(instance)
+
+
+@receiver(post_save, sender=AsistenciaDiaria)
+def acumular_entrada_general(sender, instance, created, **kwargs):
+    if created:
+        acumulados.entrada_general(instance, True)
+
+
+@receiver(post_delete, sender=AsistenciaDiaria)
+def acumular_entrada_general_eliminada(sender, instance, **kwargs):
+    acumulados.entrada_general(instance, False)
+
+
+# --- Versión de los datos de los reportes ---
+
+@receiver([post_save, post_delete], sender=Asistencia)
+@receiver([post_save, post_delete], sender=AsistenciaDiaria)
+def invalidar_reportes_del_mes(sender, instance, **kwargs):
+    if instance.fecha:
+        invalidar_reportes(instance.fecha)
+
+
+@receiver([post_save, post_delete], sender=Curso)
+@receiver([post_save, post_delete], sender=Especialidad)
+@receiver([post_save, post_delete], sender=Carrera)
+@receiver([post_save, post_delete], sender=DiaEspecial)
+@receiver([post_save, post_delete], sender=ConfiguracionInstitucion)
+@receiver(post_delete, sender=Docente)
+def invalidar_todos_los_reportes(sender, **kwargs):
+    invalidar_reportes()
+
+
+@receiver(post_save, sender=Docente)
+def invalidar_reportes_docente(sender, update_fields=None, **kwargs):
+    # Los reportes muestran el nombre y el DNI; el login solo guarda last_login
+    if update_fields is None or {'first_name', 'last_name', 'dni'} & set(update_fields):
+        invalidar_reportes()
+
+
+@receiver(m2m_changed, sender=Docente.especialidades.through)
+def invalidar_reportes_especialidades(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar_reportes()
@@ -1,3 +1,1651 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+from PIL import Image
+
+from .models import (
+    ActividadDocente, Asistencia, AsistenciaDiaria, Carrera, ConfiguracionInstitucion, Curso, DiaEspecial, Docente, Documento,
+    Especialidad, FranjaHoraria, Grupo, PersonalDocente, ResumenAsistenciaDia, ResumenAsistenciaMes, ResumenCursoMes,
+    ResumenDocente, Semestre, SubidaDocumento, TipoDocumento, VersionDocumento,
+)
+from .routers import REPLICA, ReplicaRouter, lectura_en_replica, usar_primario
+from .utils import acumulados, credenciales, kiosco, metricas, planificador, referencia, tareas, versiones
+from .utils.horarios import horario_carrera
+from .utils.almacenamiento import fotos_verificacion
+from .utils.imagenes import nombre_miniatura, procesar_foto_verificacion
+from .utils.ocupacion import MapaOcupacion, Rejilla, indice_semestre
+from .utils.kiosco import contexto_del_dia, registrar_marca
+from .utils.reportes import HistorialAsistencia, ReporteAsistencia, version_datos_reporte
+from .utils.resumen import TAMANO_FEED, actualizar_horarios, actualizar_resumenes, resumen_docente
+from .utils.solver import LIMITE_NODOS, Solver, auto_asignar
+from .utils.subidas import SUBIDAS_VENCEN_HORAS, nombre_contenido, ruta_parcial
+
+
+class MediaTemporalMixin:
+    """Cada prueba escribe sus archivos en un MEDIA_ROOT temporal que se borra al terminar."""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+@skipUnless(connection.vendor == 'sqlite', "El plan de consultas se verifica con EXPLAIN QUERY PLAN de SQLite.")
+class PlanConsultasAsistenciaTests(TestCase):
+    """Las consultas más frecuentes de asistencia y horarios deben resolverse con un índice."""
+
+    def assertUsaIndice(self, queryset, *columnas):
+        """
+        El plan debe buscar en la tabla con un índice que filtre por ``columnas``.
+        Se verifican las columnas y no el nombre del índice porque SQLite crea
+        las restricciones UNIQUE como índices automáticos con otro nombre.
+        """
+        plan = queryset.explain()
+        tabla = queryset.model._meta.db_table
+        busqueda = re.search(rf'SEARCH {tabla} USING (?:COVERING )?INDEX \S+ \((?P<condicion>[^)]*)\)', plan)
+        self.assertIsNotNone(busqueda, f"{tabla} no se consulta por índice:\n{plan}")
+        for columna in columnas:
+            self.assertRegex(busqueda.group('condicion'), rf'\b{columna}[=<>]', f"El índice no filtra por {columna}:\n{plan}")
+
+    def test_asistencia_diaria_por_docente_y_dia(self):
+        self.assertUsaIndice(
+            AsistenciaDiaria.objects.filter(docente_id=1, fecha=date.today()),
+            'docente_id', 'fecha',
+        )
+
+    def test_asistencia_diaria_por_rango_de_fechas(self):
+        hoy = date.today()
+        self.assertUsaIndice(
+            AsistenciaDiaria.objects.filter(fecha__range=[hoy - timedelta(days=30), hoy]),
+            'fecha',
+        )
+
+    def test_asistencia_por_docente_curso_y_dia(self):
+        self.assertUsaIndice(
+            Asistencia.objects.filter(docente_id=1, curso_id=1, fecha=date.today()),
+            'docente_id', 'curso_id', 'fecha',
+        )
+
+    def test_asistencia_por_docente_y_dia(self):
+        self.assertUsaIndice(
+            Asistencia.objects.filter(docente_id=1, fecha=date.today()),
+            'docente_id', 'fecha',
+        )
+
+    def test_asistencia_por_rango_de_fechas(self):
+        hoy = date.today()
+        self.assertUsaIndice(
+            Asistencia.objects.filter(fecha__range=[hoy - timedelta(days=30), hoy]),
+            'fecha',
+        )
+
+    def test_cursos_del_dia_de_un_docente(self):
+        self.assertUsaIndice(
+            Curso.objects.filter(docente_id=1, dia='Lunes', semestre_id=1),
+            'docente_id', 'dia', 'semestre_id',
+        )
+
+    def test_cursos_por_especialidad_y_dia(self):
+        self.assertUsaIndice(
+            Curso.objects.filter(semestre_id=1, especialidad_id=1, dia='Lunes'),
+            'semestre_id', 'especialidad_id', 'dia',
+        )
+
+    def test_cursos_programados_de_una_carrera(self):
+        self.assertUsaIndice(
+            Curso.objects.filter(semestre_id=1, carrera_id=1, dia__isnull=False),
+            'semestre_id', 'carrera_id',
+        )
+
+    def test_cursos_pendientes_de_una_especialidad(self):
+        self.assertUsaIndice(
+            Curso.objects.filter(semestre_id=1, especialidad_id=1, semestre_cursado=1, dia__isnull=True),
+            'semestre_id', 'especialidad_id', 'semestre_cursado',
+        )
+
+
+class NumeracionVersionesTests(MediaTemporalMixin, TransactionTestCase):
+    """Las subidas simultáneas de versiones de un mismo documento reciben números distintos y consecutivos."""
+
+    SUBIDAS = 8
+
+    def setUp(self):
+        super().setUp()
+
+        docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        tipo = TipoDocumento.objects.create(nombre='CV')
+        self.documento = Documento.objects.create(titulo='Currículum', tipo_documento=tipo, docente=docente)
+
+    def _subir(self, barrera, numeros, errores):
+        try:
+            documento = Documento.objects.get(pk=self.documento.pk)
+            barrera.wait()
+            while True:
+                try:
+                    version = VersionDocumento.objects.create(documento=documento, archivo=ContentFile(b'%PDF', name='cv.pdf'))
+                    break
+                except OperationalError as e:
+                    # SQLite en memoria no espera a que se libere el bloqueo de otra conexión
+                    if 'locked' not in str(e):
+                        raise
+            numeros.append(version.numero_version)
+        except Exception as e:
+            errores.append(e)
+        finally:
+            close_old_connections()
+
+    def test_subidas_simultaneas(self):
+        barrera = threading.Barrier(self.SUBIDAS)
+        numeros, errores = [], []
+        hilos = [threading.Thread(target=self._subir, args=(barrera, numeros, errores)) for _ in range(self.SUBIDAS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(sorted(numeros), list(range(1, self.SUBIDAS + 1)))
+        self.documento.refresh_from_db()
+        self.assertEqual(self.documento.ultima_version, self.SUBIDAS)
+
+    def test_guardar_documento_no_pisa_el_contador(self):
+        cargado = Documento.objects.get(pk=self.documento.pk)
+        VersionDocumento.objects.create(documento=self.documento, archivo=ContentFile(b'%PDF', name='cv.pdf'))
+        cargado.estado = 'EN_REVISION'
+        cargado.save()
+        version = VersionDocumento.objects.create(documento=self.documento, archivo=ContentFile(b'%PDF', name='cv.pdf'))
+        self.assertEqual(version.numero_version, 2)
+
+    def test_crear_en_lote(self):
+        VersionDocumento.objects.create(documento=self.documento, archivo=ContentFile(b'%PDF', name='cv.pdf'))
+        nuevas = VersionDocumento.crear_en_lote(self.documento, [
+            VersionDocumento(archivo=ContentFile(b'%PDF', name=f'cv{i}.pdf')) for i in range(3)
+        ])
+        self.assertEqual([v.numero_version for v in nuevas], [2, 3, 4])
+        self.assertEqual(self.documento.versiones.count(), 4)
+
+
+class SubidaFragmentosTests(MediaTemporalMixin, TestCase):
+    """Subida de documentos por fragmentos: orden, reanudación, integridad y vencimiento de las sesiones."""
+
+    CONTENIDO = b'%PDF-1.4\n' + b'x' * 21
+
+    def setUp(self):
+        super().setUp()
+
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        self.client.force_login(self.docente)
+        self.tipo = TipoDocumento.objects.create(nombre='CV')
+
+    def _iniciar(self, **datos):
+        datos = {'nombre': 'cv.pdf', 'tamano': len(self.CONTENIDO), 'tipo_documento': self.tipo.pk, 'titulo': 'Currículum', **datos}
+        return self.client.post(reverse('api_iniciar_subida'), datos, content_type='application/json')
+
+    def _fragmento(self, subida_id, desde, hasta, contenido=None):
+        url = reverse('api_fragmento_subida', args=[subida_id]) + f'?offset={desde}'
+        return self.client.post(url, (contenido or self.CONTENIDO)[desde:hasta], content_type='application/octet-stream')
+
+    def _completar(self, subida_id):
+        return self.client.post(reverse('api_completar_subida', args=[subida_id]))
+
+    def test_fragmentos_fuera_de_orden_y_reanudacion(self):
+        sha256 = hashlib.sha256(self.CONTENIDO).hexdigest()
+        subida_id = self._iniciar(sha256=sha256).json()['subida']['id']
+
+        adelantado = self._fragmento(subida_id, 10, 20)
+        self.assertEqual((adelantado.status_code, adelantado.json()['recibido']), (409, 0))
+        self.assertEqual(self._fragmento(subida_id, 0, 10).json()['recibido'], 10)
+        # Reintentar un fragmento ya recibido no cambia nada
+        self.assertEqual(self._fragmento(subida_id, 0, 10).json()['recibido'], 10)
+
+        # Tras un corte, el cliente consulta el estado y retoma desde lo recibido
+        estado = self.client.get(reverse('api_estado_subida', args=[subida_id])).json()['subida']
+        self.assertEqual((estado['estado'], estado['recibido']), ('EN_CURSO', 10))
+        self.assertEqual(self._fragmento(subida_id, 10, len(self.CONTENIDO)).json()['recibido'], len(self.CONTENIDO))
+
+        respuesta = self._completar(subida_id)
+        self.assertEqual(respuesta.status_code, 200)
+        version = VersionDocumento.objects.get(documento__docente=self.docente)
+        self.assertEqual(version.archivo.name, nombre_contenido(sha256, '.pdf'))
+        with version.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.CONTENIDO)
+        # Completar dos veces es idempotente
+        self.assertEqual(self._completar(subida_id).json()['subida']['documento_id'], respuesta.json()['subida']['documento_id'])
+        self.assertEqual(VersionDocumento.objects.count(), 1)
+
+    def test_tamano_o_hash_que_no_coinciden(self):
+        self.assertEqual(self._iniciar(sha256='no-es-un-hash').status_code, 400)
+        self.assertEqual(self._iniciar(nombre='cv.exe').status_code, 400)
+
+        subida_id = self._iniciar().json()['subida']['id']
+        self.assertEqual(self._fragmento(subida_id, 0, 10, b'MZ' + self.CONTENIDO[2:]).status_code, 400)
+        self.assertEqual(self._fragmento(subida_id, 0, 20).status_code, 200)
+        excedido = self.client.post(
+            reverse('api_fragmento_subida', args=[subida_id]) + '?offset=20', b'x' * 20, content_type='application/octet-stream',
+        )
+        self.assertEqual(excedido.status_code, 400)
+        incompleta = self._completar(subida_id)
+        self.assertEqual(incompleta.status_code, 400)
+        self.assertIn('Faltan 10 bytes', incompleta.json()['message'])
+
+        # El archivo recibido no coincide con el SHA-256 declarado: se descarta y se retoma desde cero
+        subida_id = self._iniciar(sha256=hashlib.sha256(b'otro contenido').hexdigest()).json()['subida']['id']
+        self._fragmento(subida_id, 0, len(self.CONTENIDO))
+        self.assertEqual(self._completar(subida_id).status_code, 400)
+        subida = SubidaDocumento.objects.get(pk=subida_id)
+        self.assertEqual((subida.estado, subida.recibido), ('EN_CURSO', 0))
+        self.assertEqual(os.path.getsize(ruta_parcial(subida)), 0)
+        self.assertFalse(Documento.objects.exists())
+
+    def test_subidas_vencidas(self):
+        vencida_id = self._iniciar().json()['subida']['id']
+        self._fragmento(vencida_id, 0, 10)
+        vencida = SubidaDocumento.objects.get(pk=vencida_id)
+        SubidaDocumento.objects.filter(pk=vencida_id).update(actualizada=timezone.now() - timedelta(hours=SUBIDAS_VENCEN_HORAS + 1))
+        activa_id = self._iniciar().json()['subida']['id']
+
+        # Abrir otra sesión limpia las vencidas y su archivo parcial
+        self.assertFalse(os.path.exists(ruta_parcial(vencida)))
+        self.assertEqual(self.client.get(reverse('api_estado_subida', args=[vencida_id])).status_code, 404)
+        self.assertEqual(self._fragmento(vencida_id, 10, 20).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_estado_subida', args=[activa_id])).status_code, 200)
+
+
+@override_settings(METRICAS_PRESUPUESTO_ESTRICTO=True)
+class PresupuestoConsultasTests(TestCase):
+    """Las vistas con presupuesto en METRICAS_PRESUPUESTOS no deben superarlo."""
+
+    def setUp(self):
+        metricas.reiniciar()
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        self.client.force_login(self.docente)
+        # La fila de resumen se crea en la primera visita; el presupuesto es para las siguientes
+        resumen_docente(self.docente)
+
+    def test_vistas_del_docente(self):
+        for nombre in ('dashboard', 'perfil'):
+            self.assertEqual(self.client.get(reverse(nombre)).status_code, 200)
+        self.assertEqual({fila['vista'] for fila in metricas.resumen()}, {'dashboard', 'perfil'})
+
+    def test_kiosco(self):
+        respuesta = self.client.post(
+            reverse('api_get_teacher_info'), {'qrId': str(self.docente.id_qr)}, content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+
+    @override_settings(METRICAS_PRESUPUESTOS={'dashboard': 1})
+    def test_superar_el_presupuesto_falla(self):
+        with self.assertRaises(metricas.PresupuestoExcedido):
+            self.client.get(reverse('dashboard'))
+
+
+class ResumenDocenteLoteTests(TestCase):
+    """Los resúmenes de varios docentes se recalculan con un número fijo de consultas."""
+
+    def setUp(self):
+        semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        carrera = Carrera.objects.create(nombre='Educación')
+        self.docentes = []
+        for n in range(4):
+            docente = Docente.objects.create_user(f'docente{n}', password='x', dni=f'1000000{n}')
+            resumen_docente(docente)
+            curso = Curso.objects.create(
+                nombre=f'Curso {n}', carrera=carrera, docente=docente, semestre=semestre,
+                dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(9, 40),
+            )
+            for dia in range(1, TAMANO_FEED + 3):
+                Asistencia.objects.create(
+                    docente=docente, curso=curso, fecha=date(2025, 3, dia),
+                    hora_entrada=timezone.make_aware(datetime(2025, 3, dia, 8, 0)),
+                )
+            self.docentes.append(docente)
+        # Resúmenes desactualizados, como tras un bulk_create
+        ResumenDocente.objects.update(horario=[])
+        ActividadDocente.objects.all().delete()
+
+    def test_consultas_no_dependen_de_los_docentes(self):
+        consultas = []
+        for docentes in (self.docentes[:2], self.docentes):
+            with CaptureQueriesContext(connection) as contexto:
+                actualizar_resumenes([d.pk for d in docentes])
+                actualizar_horarios([d.pk for d in docentes])
+            consultas.append(len(contexto))
+        self.assertEqual(consultas[0], consultas[1])
+
+        for docente in self.docentes:
+            feed = list(ActividadDocente.objects.filter(docente=docente))
+            self.assertEqual(len(feed), TAMANO_FEED)
+            self.assertEqual(feed[0].fecha, timezone.make_aware(datetime(2025, 3, TAMANO_FEED + 2, 8, 0)))
+            self.assertEqual([c['nombre'] for c in ResumenDocente.objects.get(pk=docente.pk).horario], [f'Curso {self.docentes.index(docente)}'])
+
+
+class ResumenesAsistenciaTests(TestCase):
+    """Los resúmenes incrementales deben coincidir con una reconstrucción completa."""
+
+    def setUp(self):
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        self.curso = Curso.objects.create(
+            nombre='Álgebra', carrera=Carrera.objects.create(nombre='Educación'), docente=self.docente,
+            dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(9, 40), duracion_bloques=2,
+        )
+
+    def _momento(self, fecha, hora, minuto):
+        return timezone.make_aware(datetime.combine(fecha, time(hora, minuto)))
+
+    def _filas(self):
+        # Sin el id, que cambia al reconstruir
+        return [
+            [{campo: valor for campo, valor in fila.items() if campo != 'id'} for fila in modelo.objects.order_by(orden).values()]
+            for modelo, orden in ((ResumenAsistenciaDia, 'fecha'), (ResumenAsistenciaMes, 'mes'), (ResumenCursoMes, 'mes'))
+        ]
+
+    def _marcar_clase(self, fecha, llegada, salida=None):
+        registrar_marca(self.docente, 'course_entry', self.curso.pk, now=self._momento(fecha, 8, llegada))
+        if salida:
+            registrar_marca(self.docente, 'course_exit', self.curso.pk, now=self._momento(fecha, *salida))
+
+    def test_marcas_del_kiosco(self):
+        lunes = date(2025, 3, 31)
+        self._marcar_clase(lunes, 10, salida=(9, 40))
+        self._marcar_clase(lunes + timedelta(days=7), 0)
+
+        dia = ResumenAsistenciaDia.objects.get(docente=self.docente, fecha=lunes)
+        self.assertEqual((dia.clases, dia.llegadas_tarde, dia.minutos_tardanza, dia.minutos_dictados, dia.salidas_faltantes), (1, 1, 10, 90, 0))
+        marzo, abril = ResumenCursoMes.objects.filter(curso=self.curso).order_by('mes')
+        self.assertEqual((marzo.mes, marzo.minutos_dictados), (date(2025, 3, 1), 90))
+        self.assertEqual((abril.clases, abril.llegadas_tarde, abril.salidas_faltantes), (1, 0, 1))
+
+        incrementales = self._filas()
+        acumulados.reconstruir()
+        self.assertEqual(self._filas(), incrementales)
+
+    def test_borrar_una_marca(self):
+        lunes = date(2025, 3, 31)
+        self._marcar_clase(lunes, 5, salida=(9, 40))
+        Asistencia.objects.get().delete()
+        mes = ResumenAsistenciaMes.objects.get()
+        self.assertEqual((mes.clases, mes.minutos_tardanza, mes.minutos_dictados), (0, 0, 0))
+
+    def test_totales_de_un_periodo_largo(self):
+        for semana in range(6):
+            self._marcar_clase(date(2025, 3, 3) + timedelta(weeks=semana), 5, salida=(9, 40))
+        AsistenciaDiaria.objects.create(docente=self.docente, foto_verificacion='x.jpg')
+
+        # Marzo completo sale del resumen mensual y los días de abril del diario
+        with self.assertNumQueries(2):
+            totales = acumulados.totales_periodo(date(2025, 3, 1), date(2025, 4, 8))
+        self.assertEqual(totales[self.docente.pk]['clases'], 6)
+        self.assertEqual(totales[self.docente.pk]['minutos_tardanza'], 30)
+        hoy = timezone.localdate()
+        self.assertEqual(acumulados.totales_periodo(hoy, hoy)[self.docente.pk]['dias_presente'], 1)
+
+
+class ReporteAsistenciaTests(TestCase):
+    """Conteos del reporte de un día: presente es tener entrada general; el curso solo filtra las filas."""
+
+    def setUp(self):
+        self.dia = date(2025, 3, 31)
+        carrera = Carrera.objects.create(nombre='Educación')
+        self.docentes = {
+            apellido: Docente.objects.create_user(apellido.lower(), password='x', dni=f'1000000{n}', last_name=apellido)
+            for n, apellido in enumerate(('Aguilar', 'Bravo', 'Cruz', 'Díaz'))
+        }
+        datos = {'carrera': carrera, 'dia': 'Lunes', 'horario_inicio': time(8, 0), 'horario_fin': time(9, 40)}
+        self.algebra = Curso.objects.create(nombre='Álgebra', docente=self.docentes['Bravo'], **datos)
+        fisica = Curso.objects.create(nombre='Física', docente=self.docentes['Aguilar'], **datos)
+
+        # Aguilar llega 10 minutos tarde, Bravo a tiempo y Cruz dicta Álgebra 20 minutos tarde sin entrada general
+        for apellido, curso, minuto in (('Aguilar', fisica, 10), ('Bravo', self.algebra, 0), ('Cruz', self.algebra, 20)):
+            Asistencia.objects.create(
+                docente=self.docentes[apellido], curso=curso, fecha=self.dia,
+                hora_entrada=timezone.make_aware(datetime.combine(self.dia, time(8, minuto))),
+            )
+        for apellido in ('Aguilar', 'Bravo'):
+            AsistenciaDiaria.objects.create(docente=self.docentes[apellido], fecha=self.dia, foto_verificacion='x.jpg')
+        acumulados.reconstruir()
+
+    def _reporte(self, **filtros):
+        return ReporteAsistencia(self.dia.isoformat(), self.dia.isoformat(), **filtros)
+
+    def _apellidos(self, **filtros):
+        return [docente.last_name for docente in self._reporte(**filtros).docentes()]
+
+    def test_contadores_del_dia(self):
+        esperados = {'total_docentes': 4, 'presentes_count': 2, 'ausentes_count': 2}
+        self.assertEqual(self._reporte().contadores(), esperados)
+        # Las tarjetas no dependen del curso elegido
+        self.assertEqual(self._reporte(curso_id=self.algebra.pk).contadores(), esperados)
+
+    def test_filtros_de_estado_y_curso(self):
+        self.assertEqual(self._apellidos(), ['Aguilar', 'Bravo', 'Cruz', 'Díaz'])
+        self.assertEqual(self._apellidos(estado='presente'), ['Aguilar', 'Bravo'])
+        self.assertEqual(self._apellidos(estado='ausente'), ['Cruz', 'Díaz'])
+        self.assertEqual(self._apellidos(curso_id=self.algebra.pk), ['Bravo', 'Cruz'])
+        self.assertEqual(self._apellidos(estado='presente', curso_id=self.algebra.pk), ['Bravo'])
+        self.assertEqual(self._apellidos(estado='ausente', curso_id=self.algebra.pk), ['Cruz'])
+
+    def test_tardanzas_y_ausencias_por_fila(self):
+        def conteos(reporte):
+            return {
+                fila['docente'].last_name: (
+                    fila['asistencia_general'] is not None, fila['totales']['llegadas_tarde'],
+                    fila['totales']['minutos_tardanza'], fila['totales']['dias_ausente'],
+                )
+                for fila in reporte[0:10]
+            }
+
+        self.assertEqual(conteos(self._reporte()), {
+            'Aguilar': (True, 1, 10, 0), 'Bravo': (True, 0, 0, 0), 'Cruz': (False, 1, 20, 1), 'Díaz': (False, 0, 0, 1),
+        })
+        self.assertEqual(conteos(self._reporte(curso_id=self.algebra.pk)), {
+            'Bravo': (True, 0, 0, 0), 'Cruz': (False, 1, 20, 1),
+        })
+
+
+class HistorialAsistenciaTests(TestCase):
+    """El historial se recorre completo siguiendo los cursores, con consultas fijas por página."""
+
+    def setUp(self):
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        carrera = Carrera.objects.create(nombre='Educación')
+        self.hoy = timezone.localdate()
+        for n, nombre in enumerate(['Álgebra', 'Física']):
+            curso = Curso.objects.create(nombre=nombre, carrera=carrera, docente=self.docente)
+            for dias in range(n, 10, 2):
+                Asistencia.objects.create(docente=self.docente, curso=curso, fecha=self.hoy - timedelta(days=dias))
+
+    def _pagina(self, **parametros):
+        historial = HistorialAsistencia(self.docente, limite=3, **parametros)
+        # Una consulta por lista que aún no terminó
+        with CaptureQueriesContext(connection) as consultas:
+            pagina = json.loads(''.join(historial.json()))
+        self.assertLessEqual(len(consultas), 2)
+        return pagina
+
+    def test_recorrer_todas_las_paginas(self):
+        pagina = self._pagina(fecha_inicio=(self.hoy - timedelta(days=7)).isoformat())
+        fechas = []
+        while True:
+            self.assertLessEqual(len(pagina['asistencias_cursos']), 3)
+            fechas += [fila['fecha'] for fila in pagina['asistencias_cursos']]
+            if not pagina['siguiente']:
+                break
+            pagina = self._pagina(cursor=pagina['siguiente'])
+        esperadas = [(self.hoy - timedelta(days=dias)).isoformat() for dias in range(8)]
+        self.assertEqual(fechas, esperadas)
+
+    def test_vista(self):
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        url = reverse('detalle_asistencia_docente_ajax', args=[self.docente.pk])
+        respuesta = self.client.get(url, {'limite': 4})
+        datos = json.loads(b''.join(respuesta.streaming_content))
+        self.assertEqual((datos['status'], len(datos['asistencias_cursos'])), ('success', 4))
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('detalle_asistencia_docente_ajax', args=[0])).status_code, 404)
+
+
+class ReplicaRouterTests(TestCase):
+    """Solo las lecturas de las vistas marcadas van a la réplica, y únicamente si está configurada."""
+
+    router = ReplicaRouter()
+
+    def test_sin_replica_todo_va_al_primario(self):
+        lectura = lectura_en_replica(lambda request: self.router.db_for_read(Docente))
+        self.assertIsNone(lectura(None))
+
+    def test_vistas_marcadas_leen_de_la_replica(self):
+        with mock.patch.dict(settings.DATABASES, {REPLICA: {}}):
+            lectura = lectura_en_replica(lambda request: self.router.db_for_read(Docente))
+            self.assertEqual(lectura(None), REPLICA)
+            self.assertIsNone(self.router.db_for_read(Docente))
+
+            @lectura_en_replica
+            def vista_con_cache(request):
+                with usar_primario():
+                    return self.router.db_for_read(Curso), self.router.db_for_write(Curso)
+            self.assertEqual(vista_con_cache(None), (None, 'default'))
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'core'))
+
+
+class KioscoAsincronoTests(MediaTemporalMixin, TestCase):
+    """Las vistas ASGI del kiosco responden como las síncronas y escriben la foto fuera del hilo de la petición."""
+
+    def setUp(self):
+        super().setUp()
+        # Un lunes de clases; las tareas en segundo plano no se ejecutan
+        for parche in (
+            mock.patch('django.utils.timezone.now', lambda: timezone.make_aware(datetime(2025, 3, 31, 8, 5))),
+            mock.patch.object(tareas, 'encolar'),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+        cache.clear()
+        metricas.reiniciar()
+
+        semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        self.curso = Curso.objects.create(
+            nombre='Álgebra', carrera=Carrera.objects.create(nombre='Educación'), docente=self.docente,
+            semestre=semestre, dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(9, 40),
+        )
+        # Como en un kiosco en uso, el contexto del día ya está en caché
+        contexto_del_dia()
+
+    def test_info_igual_que_la_sincrona(self):
+        datos = json.dumps({'qrId': str(self.docente.id_qr)})
+        sincrona = self.client.post(reverse('api_get_teacher_info'), datos, content_type='application/json')
+        asincrona = self.client.post(reverse('api_get_teacher_info_async'), datos, content_type='application/json')
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.json(), sincrona.json())
+        self.assertEqual(asincrona.json()['courses'][0]['id'], self.curso.pk)
+
+    async def test_marca_con_foto(self):
+        foto = BytesIO()
+        Image.new('RGB', (32, 24)).save(foto, 'JPEG')
+        respuesta = await self.async_client.post(reverse('api_mark_attendance_foto_async'), {
+            'qrId': str(self.docente.id_qr), 'actionType': 'course_entry', 'courseId': self.curso.pk,
+            'foto': SimpleUploadedFile('foto.jpg', foto.getvalue(), content_type='image/jpeg'),
+        })
+        self.assertEqual(respuesta.status_code, 200)
+
+        asistencia = await Asistencia.objects.aget(docente=self.docente, curso=self.curso)
+        self.assertTrue(asistencia.foto_entrada.name.startswith('verificacion/'))
+        self.assertTrue(asistencia.foto_entrada.storage.exists(asistencia.foto_entrada.name))
+        tareas.encolar.assert_called_once_with(procesar_foto_verificacion, Asistencia, asistencia.pk, 'foto_entrada')
+        # El middleware de métricas mide también las consultas de las vistas asíncronas
+        muestra, = [fila for fila in metricas.resumen() if fila['vista'] == 'api_mark_attendance_foto_async']
+        self.assertGreater(muestra['consultas']['p50'], 0)
+
+        # Una segunda entrada no cambia la marca ni escribe otra foto
+        await self.async_client.post(reverse('api_mark_attendance_foto_async'), {
+            'qrId': str(self.docente.id_qr), 'actionType': 'course_entry', 'courseId': self.curso.pk,
+            'foto': SimpleUploadedFile('otra.jpg', foto.getvalue(), content_type='image/jpeg'),
+        })
+        self.assertEqual(tareas.encolar.call_count, 1)
+
+    def test_error_inesperado_queda_en_el_log(self):
+        datos = json.dumps({'qrId': str(self.docente.id_qr), 'actionType': 'general_entry', 'photoBase64': None})
+        with self.assertLogs('core.views', 'ERROR') as log:
+            respuesta = self.client.post(reverse('api_mark_attendance_async'), datos, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertIn('mark_attendance_kiosk_async', log.output[0])
+        self.assertIn('Traceback', log.output[0])
+
+        with mock.patch('core.views.ainfo_docente_kiosco', side_effect=RuntimeError('falla')), \
+                self.assertLogs('core.views', 'ERROR') as log:
+            respuesta = self.client.post(
+                reverse('api_get_teacher_info_async'), {'qrId': str(self.docente.id_qr)}, content_type='application/json',
+            )
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertIn('get_teacher_info_async', log.output[0])
+
+
+class FotoKioscoTests(MediaTemporalMixin, TestCase):
+    """Solo se guardan fotos que Pillow reconoce como JPEG o WebP."""
+
+    def setUp(self):
+        super().setUp()
+        for parche in (
+            mock.patch('django.utils.timezone.now', lambda: timezone.make_aware(datetime(2025, 3, 31, 8, 5))),
+            mock.patch.object(tareas, 'encolar'),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+        cache.clear()
+
+        Semestre.objects.create(nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO')
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+
+    def _imagen(self, formato):
+        contenido = BytesIO()
+        Image.new('RGB', (32, 24)).save(contenido, formato)
+        return contenido.getvalue()
+
+    def _marcar(self, contenido, content_type):
+        return self.client.post(reverse('api_mark_attendance_foto'), {
+            'qrId': str(self.docente.id_qr), 'actionType': 'general_entry',
+            'foto': SimpleUploadedFile('foto', contenido, content_type=content_type),
+        })
+
+    def test_formatos_rechazados_no_se_guardan(self):
+        for contenido, content_type in (
+            (self._imagen('PNG'), 'image/png'),
+            (b'no es una imagen', 'image/jpeg'),
+            (self._imagen('PNG'), 'image/jpeg'),
+        ):
+            respuesta = self._marcar(contenido, content_type)
+            self.assertEqual(respuesta.status_code, 415, content_type)
+        self.assertFalse(AsistenciaDiaria.objects.exists())
+        self.assertFalse(os.listdir(settings.MEDIA_ROOT))
+
+    def test_webp_en_el_cuerpo(self):
+        respuesta = self.client.post(
+            reverse('api_mark_attendance_foto') + f'?qrId={self.docente.id_qr}&actionType=general_entry',
+            self._imagen('WEBP'), content_type='image/webp',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        diaria = AsistenciaDiaria.objects.get(docente=self.docente)
+        self.assertTrue(diaria.foto_verificacion.name.endswith('.webp'))
+
+    def test_error_inesperado_queda_en_el_log(self):
+        with mock.patch('core.views.registrar_marca', side_effect=RuntimeError('disco lleno')), \
+                self.assertLogs('core.views', 'ERROR') as log:
+            respuesta = self._marcar(self._imagen('JPEG'), 'image/jpeg')
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertIn('disco lleno', log.output[0])
+
+
+@override_settings(KIOSCO_TOKEN='kiosco-prueba')
+class SincronizacionKioscoTests(MediaTemporalMixin, TestCase):
+    """El lote sin conexión es idempotente, aísla las marcas mal formadas y resiste la carrera con una marca en línea."""
+
+    def setUp(self):
+        super().setUp()
+        for parche in (
+            mock.patch('django.utils.timezone.now', lambda: timezone.make_aware(datetime(2025, 3, 31, 8, 5))),
+            mock.patch.object(tareas, 'encolar'),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+        cache.clear()
+
+        semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        self.curso = Curso.objects.create(
+            nombre='Álgebra', carrera=Carrera.objects.create(nombre='Educación'), docente=self.docente,
+            semestre=semestre, dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(9, 40),
+        )
+        foto = BytesIO()
+        Image.new('RGB', (32, 24)).save(foto, 'JPEG')
+        self.foto = 'data:image/jpeg;base64,' + base64.b64encode(foto.getvalue()).decode()
+
+    def _marca(self, id, accion, minuto, **extra):
+        marca = {
+            'id': id, 'qrId': str(self.docente.id_qr), 'actionType': accion, 'courseId': self.curso.pk,
+            'timestamp': timezone.make_aware(datetime(2025, 3, 31, 7, minuto)).isoformat(), 'photoBase64': self.foto,
+        }
+        marca.update(extra)
+        return marca
+
+    def _sincronizar(self, *marcas):
+        respuesta = self.client.post(
+            reverse('api_kiosco_sync'), {'marks': list(marcas)}, content_type='application/json',
+            headers={'X-Kiosco-Token': 'kiosco-prueba'},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return {r['id']: r['status'] for r in respuesta.json()['results']}
+
+    def test_reenvio_del_lote_es_duplicado(self):
+        marcas = [self._marca('a', 'general_entry', 50), self._marca('b', 'course_entry', 55)]
+        self.assertEqual(self._sincronizar(*marcas), {'a': 'applied', 'b': 'applied'})
+        diaria = AsistenciaDiaria.objects.get(docente=self.docente)
+        self.assertEqual(diaria.fecha, date(2025, 3, 31))
+        asistencia = Asistencia.objects.get(docente=self.docente, curso=self.curso)
+        self.assertTrue(asistencia.foto_entrada.storage.exists(asistencia.foto_entrada.name))
+        self.assertEqual(tareas.encolar.call_count, 2)
+
+        self.assertEqual(self._sincronizar(*marcas), {'a': 'duplicate', 'b': 'duplicate'})
+        self.assertEqual(Asistencia.objects.count(), 1)
+        self.assertEqual(tareas.encolar.call_count, 2)
+
+    def test_marca_mal_formada_no_rechaza_el_lote(self):
+        resultados = self._sincronizar(
+            self._marca('a', 'general_entry', 50, photoBase64='data:image/jpeg;base64,no-es-base64!'),
+            self._marca('b', 'course_entry', 55, photoBase64='data:image/gif;base64,R0lGODlh'),
+            self._marca('c', 'course_entry', 56),
+        )
+        self.assertEqual(resultados, {'a': 'rejected', 'b': 'rejected', 'c': 'applied'})
+        self.assertFalse(AsistenciaDiaria.objects.exists())
+        self.assertTrue(Asistencia.objects.filter(docente=self.docente, hora_entrada__isnull=False).exists())
+
+    def test_carrera_con_marca_en_linea(self):
+        # La marca en línea se guarda después de que el lote leyó las asistencias y antes de su bulk_create
+        minutos_minimos = kiosco.minutos_minimos_en_clase
+        carrera = []
+
+        def con_carrera(bloques):
+            if not carrera:
+                carrera.append(True)
+                registrar_marca(self.docente, 'course_entry', self.curso.pk)
+            return minutos_minimos(bloques)
+
+        with mock.patch.object(kiosco, 'minutos_minimos_en_clase', con_carrera):
+            resultados = self._sincronizar(self._marca('a', 'general_entry', 50), self._marca('b', 'course_entry', 55))
+        self.assertEqual(resultados, {'a': 'applied', 'b': 'duplicate'})
+        self.assertTrue(AsistenciaDiaria.objects.filter(docente=self.docente).exists())
+        asistencia = Asistencia.objects.get(docente=self.docente, curso=self.curso)
+        # Se conserva la marca en línea y la foto del lote no queda huérfana
+        self.assertEqual(asistencia.hora_entrada, timezone.now())
+        self.assertFalse(asistencia.foto_entrada)
+        self.assertEqual(tareas.encolar.call_count, 1)
+
+    def test_entrada_de_un_dia_anterior_conserva_su_fecha(self):
+        registrar_marca(self.docente, 'general_entry')
+        viernes = timezone.make_aware(datetime(2025, 3, 28, 7, 50))
+        resultados = self._sincronizar(self._marca('a', 'general_entry', 50, timestamp=viernes.isoformat()))
+        self.assertEqual(resultados, {'a': 'applied'})
+        self.assertEqual(
+            list(AsistenciaDiaria.objects.order_by('fecha').values_list('fecha', 'hora_entrada')),
+            [(date(2025, 3, 28), viernes), (date(2025, 3, 31), timezone.now())],
+        )
+
+    def test_rechaza_fines_de_semana_y_dias_sin_semestre(self):
+        domingo = timezone.make_aware(datetime(2025, 3, 30, 7, 50)).isoformat()
+        sin_semestre = timezone.make_aware(datetime(2025, 2, 28, 7, 50)).isoformat()
+        resultados = self._sincronizar(
+            self._marca('a', 'general_entry', 50, timestamp=domingo),
+            self._marca('b', 'general_entry', 50, timestamp=sin_semestre),
+        )
+        self.assertEqual(resultados, {'a': 'rejected', 'b': 'rejected'})
+        self.assertFalse(AsistenciaDiaria.objects.exists())
+
+
+class PlanificadorDeltasTests(TestCase):
+    """Las APIs del planificador devuelven solo los cursos que cambiaron y los publican para los demás."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        self.semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.franjas = [
+            FranjaHoraria.objects.create(turno='MANANA', hora_inicio=time(8 + i, 0), hora_fin=time(8 + i, 50))
+            for i in range(3)
+        ]
+        grupo = Grupo.objects.create(nombre='Grupo A')
+        self.especialidad = Especialidad.objects.create(nombre='Matemática', grupo=grupo)
+        otra = Especialidad.objects.create(nombre='Lengua', grupo=Grupo.objects.create(nombre='Grupo B'))
+        carrera = Carrera.objects.create(nombre='Educación')
+        datos = {'carrera': carrera, 'semestre': self.semestre, 'semestre_cursado': 1, 'duracion_bloques': 2}
+        self.curso = Curso.objects.create(nombre='Álgebra', especialidad=self.especialidad, **datos)
+        self.ajeno = Curso.objects.create(nombre='Redacción', especialidad=otra, **datos)
+
+    def _mover(self, curso, franja):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(
+                reverse('api_asignar_horario'), {'curso_id': curso.pk, 'dia': 'Lunes', 'franja_id': franja.pk},
+                content_type='application/json',
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['cambios']
+
+    def test_asignar_y_desasignar_devuelven_el_delta(self):
+        desde = planificador.secuencia(self.semestre.pk)
+        cambios = self._mover(self.curso, self.franjas[1])
+        self.assertEqual(len(cambios), 1)
+        self.assertEqual((cambios[0]['id'], cambios[0]['dia'], cambios[0]['franja_id_inicio']), (self.curso.pk, 'Lunes', self.franjas[1].pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse('api_desasignar_horario'), {'curso_id': self.curso.pk}, content_type='application/json')
+        self.assertIsNone(respuesta.json()['cambios'][0]['franja_id_inicio'])
+
+        eventos = planificador.eventos_desde(self.semestre.pk, desde)
+        self.assertEqual([filas[0]['dia'] for _, filas in eventos], ['Lunes', None])
+
+    def test_stream_solo_envia_lo_visible(self):
+        respuesta = self.client.get(reverse('api_get_cursos_no_asignados'), {'especialidad_id': self.especialidad.pk, 'semestre_cursado': 1})
+        desde = respuesta.json()['secuencia']
+        self._mover(self.ajeno, self.franjas[0])
+        self._mover(self.curso, self.franjas[0])
+
+        flujo = planificador.flujo_eventos(self.semestre.pk, self.especialidad.pk, self.especialidad.grupo_id, 1, desde)
+        self.assertTrue(next(flujo).startswith('retry:'))
+        # El curso de otra especialidad solo avanza el id
+        self.assertEqual(next(flujo), f'id: {desde + 1}\n\n')
+        evento = next(flujo)
+        self.assertTrue(evento.startswith(f'id: {desde + 2}\nevent: cursos\n'))
+        self.assertEqual(json.loads(evento.split('data: ', 1)[1])['cursos'][0]['id'], self.curso.pk)
+
+        # Perdido el registro (p. ej. la caché se vació), el navegador debe recargar
+        cache.clear()
+        flujo = planificador.flujo_eventos(self.semestre.pk, self.especialidad.pk, self.especialidad.grupo_id, 1, desde + 2)
+        next(flujo)
+        self.assertTrue(next(flujo).startswith('event: recargar'))
+
+    def test_sin_cupo_entrega_lo_pendiente_y_cierra(self):
+        desde = planificador.secuencia(self.semestre.pk)
+        self._mover(self.curso, self.franjas[0])
+        with mock.patch.object(planificador, '_flujos', threading.BoundedSemaphore(1)) as cupos:
+            flujo = planificador.flujo_eventos(self.semestre.pk, self.especialidad.pk, self.especialidad.grupo_id, 1, desde)
+            next(flujo)
+            # El stream que espera retiene el único cupo hasta cerrarse
+            self.assertFalse(cupos.acquire(blocking=False))
+            sondeo = list(planificador.flujo_eventos(self.semestre.pk, self.especialidad.pk, self.especialidad.grupo_id, 1, desde))
+            self.assertEqual(sondeo[0], f'retry: {planificador.REINTENTO_SONDEO_MS}\n\n')
+            self.assertTrue(sondeo[1].startswith(f'id: {desde + 1}\nevent: cursos\n'))
+            flujo.close()
+            self.assertTrue(cupos.acquire(blocking=False))
+
+    def test_stream_asincrono(self):
+        desde = planificador.secuencia(self.semestre.pk)
+        self._mover(self.curso, self.franjas[0])
+
+        async def primeros(n):
+            flujo = planificador.aflujo_eventos(self.semestre.pk, self.especialidad.pk, self.especialidad.grupo_id, 1, desde)
+            mensajes = [await anext(flujo) for _ in range(n)]
+            await flujo.aclose()
+            return mensajes
+
+        retry, evento = async_to_sync(primeros)(2)
+        self.assertEqual(retry, f'retry: {planificador.REINTENTO_MS}\n\n')
+        self.assertTrue(evento.startswith(f'id: {desde + 1}\nevent: cursos\n'))
+
+
+class MovimientosLoteTests(TestCase):
+    """Los movimientos en lote validan solo el horario final y se guardan todos juntos o ninguno."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.franjas = [
+            FranjaHoraria.objects.create(turno='MANANA', hora_inicio=time(8 + i, 0), hora_fin=time(8 + i, 50))
+            for i in range(3)
+        ]
+        especialidad = Especialidad.objects.create(nombre='Matemática', grupo=Grupo.objects.create(nombre='Grupo A'))
+        datos = {
+            'carrera': Carrera.objects.create(nombre='Educación'), 'semestre': semestre, 'especialidad': especialidad,
+            'semestre_cursado': 1, 'duracion_bloques': 1, 'dia': 'Lunes',
+        }
+        # Misma especialidad y semestre cursado: no pueden compartir franja
+        self.a = Curso.objects.create(nombre='Álgebra', horario_inicio=time(8, 0), horario_fin=time(8, 50), **datos)
+        self.b = Curso.objects.create(nombre='Geometría', horario_inicio=time(9, 0), horario_fin=time(9, 50), **datos)
+
+    def _enviar(self, *operaciones):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('api_mover_horarios'), {'operaciones': list(operaciones)}, content_type='application/json')
+
+    def _horas(self):
+        return [Curso.objects.get(pk=curso.pk).horario_inicio for curso in (self.a, self.b)]
+
+    def test_intercambio_con_un_solo_update(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self._enviar({'tipo': 'intercambiar', 'curso_a': self.a.pk, 'curso_b': self.b.pk})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self._horas(), [time(9, 0), time(8, 0)])
+        self.assertEqual(sum(1 for q in consultas.captured_queries if q['sql'].startswith('UPDATE "core_curso"')), 1)
+        self.assertEqual({fila['id']: fila['franja_id_inicio'] for fila in respuesta.json()['cambios']}, {
+            self.a.pk: self.franjas[1].pk, self.b.pk: self.franjas[0].pk,
+        })
+
+    def test_paso_intermedio_con_cruce(self):
+        # Mover A a la franja de B choca hasta que B se mueve a la tercera
+        respuesta = self._enviar(
+            {'tipo': 'mover', 'curso_id': self.a.pk, 'dia': 'Lunes', 'franja_id': self.franjas[1].pk},
+            {'tipo': 'mover', 'curso_id': self.b.pk, 'dia': 'Lunes', 'franja_id': self.franjas[2].pk},
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self._horas(), [time(9, 0), time(10, 0)])
+
+    def test_horario_final_invalido_no_guarda_nada(self):
+        respuesta = self._enviar(
+            {'tipo': 'desasignar', 'curso_id': self.b.pk},
+            {'tipo': 'mover', 'curso_id': self.b.pk, 'dia': 'Lunes', 'franja_id': self.franjas[2].pk},
+            {'tipo': 'mover', 'curso_id': self.a.pk, 'dia': 'Lunes', 'franja_id': self.franjas[2].pk},
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('Geometría', respuesta.json()['message'])
+        self.assertEqual(self._horas(), [time(8, 0), time(9, 0)])
+        # El índice compartido sigue igual: A aún puede ir a la tercera franja sola
+        respuesta = self._enviar({'tipo': 'mover', 'curso_id': self.a.pk, 'dia': 'Lunes', 'franja_id': self.franjas[2].pk})
+        self.assertEqual(respuesta.status_code, 200)
+
+
+class DatosReferenciaTests(TestCase):
+    """Los datos de referencia se sirven de la memoria del proceso hasta que cambia su sello compartido."""
+
+    def setUp(self):
+        cache.clear()
+        self.semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+
+    def test_sin_cambios_no_consulta(self):
+        self.assertEqual(referencia.semestre_activo(), self.semestre)
+        with self.assertNumQueries(0):
+            self.assertEqual(referencia.semestre_activo(), self.semestre)
+            self.assertIsNone(referencia.semestre_activo(date(2025, 8, 1)))
+
+    def test_las_senales_invalidan(self):
+        self.assertEqual(referencia.franjas_horarias(), ())
+        franja = FranjaHoraria.objects.create(turno='MANANA', hora_inicio=time(8, 0), hora_fin=time(8, 50))
+        self.assertEqual(referencia.franjas_horarias(), (franja,))
+
+        self.semestre.estado = 'CERRADO'
+        self.semestre.save()
+        self.assertIsNone(referencia.semestre_activo())
+
+    def test_cambio_hecho_por_otro_proceso(self):
+        referencia.semestre_activo()
+        # Otro proceso solo puede renovar el sello compartido: la copia de este sigue en memoria
+        Semestre.objects.filter(pk=self.semestre.pk).update(nombre='2025-I')
+        versiones.renovar('referencia:semestre_activo')
+        self.assertEqual(referencia.semestre_activo().nombre, '2025-I')
+
+    def test_sello_perdido_recarga(self):
+        referencia.semestre_activo()
+        Semestre.objects.filter(pk=self.semestre.pk).update(nombre='2025-I')
+        cache.clear()
+        self.assertEqual(referencia.semestre_activo().nombre, '2025-I')
+
+    def test_se_renueva_al_confirmar(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            referencia.invalidar(referencia.SEMESTRE_ACTIVO)
+            # Otro proceso recarga antes del commit y guarda el sello ya renovado
+            antes = versiones.sello('referencia:semestre_activo')
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(versiones.sello('referencia:semestre_activo'), antes)
+
+
+class ContextoDiaKioscoTests(TestCase):
+    """El contexto del día del kiosco se calcula una vez y se invalida en todos los procesos."""
+
+    def setUp(self):
+        cache.clear()
+        self.semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.lunes = date(2025, 3, 31)
+
+    def test_dia_especial_creado_durante_el_dia(self):
+        self.assertIsNone(contexto_del_dia(self.lunes)['dia_especial'])
+        with self.assertNumQueries(0):
+            contexto_del_dia(self.lunes)
+        # También las fechas distintas de hoy quedan invalidadas
+        DiaEspecial.objects.create(fecha=self.lunes, motivo='Aniversario', tipo='FERIADO')
+        self.assertEqual(contexto_del_dia(self.lunes)['dia_especial'], {'motivo': 'Aniversario', 'tipo': 'FERIADO'})
+
+    def test_cambio_hecho_por_otro_proceso(self):
+        self.assertEqual(contexto_del_dia(self.lunes)['semestre_id'], self.semestre.pk)
+        # Otro proceso cierra el semestre: el contexto guardado sigue en la caché, pero con el sello anterior
+        Semestre.objects.filter(pk=self.semestre.pk).update(estado='CERRADO')
+        versiones.renovar('kiosco:contexto_dia')
+        self.assertIsNone(contexto_del_dia(self.lunes)['semestre_id'])
+
+
+class ParrillasHorarioTests(TestCase):
+    """Las parrillas de horario se sirven de la caché hasta que cambia el sello compartido."""
+
+    def setUp(self):
+        cache.clear()
+        self.semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.franja = FranjaHoraria.objects.create(turno='MANANA', hora_inicio=time(8, 0), hora_fin=time(8, 50))
+        self.carrera = Carrera.objects.create(nombre='Educación')
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678', first_name='Ana', last_name='Quispe')
+        self.curso = Curso.objects.create(
+            nombre='Álgebra', carrera=self.carrera, docente=self.docente, semestre=self.semestre,
+            dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(8, 50), duracion_bloques=1,
+        )
+
+    def _celda(self):
+        return horario_carrera(self.semestre.pk, self.carrera.pk)['grid'][self.franja.pk]
+
+    def test_cacheada_hasta_un_cambio(self):
+        self.assertEqual(self._celda()['Lunes']['nombre'], 'Álgebra')
+        with self.assertNumQueries(0):
+            self._celda()
+        self.curso.dia = 'Martes'
+        self.curso.save()
+        celda = self._celda()
+        self.assertIsNone(celda['Lunes'])
+        self.assertEqual(celda['Martes']['id'], self.curso.pk)
+
+    def test_renombrar_al_docente(self):
+        self._celda()
+        self.docente.last_name = 'Mamani'
+        self.docente.save()
+        self.assertEqual(self._celda()['Lunes']['docente'], str(Docente.objects.get(pk=self.docente.pk)))
+
+    def test_cambio_hecho_por_otro_proceso(self):
+        self._celda()
+        Curso.objects.filter(pk=self.curso.pk).update(nombre='Álgebra lineal')
+        versiones.renovar('horarios')
+        self.assertEqual(self._celda()['Lunes']['nombre'], 'Álgebra lineal')
+
+
+class IndiceOcupacionTests(TestCase):
+    """El índice de ocupación sigue a los cursos y, antes de guardar, la base de datos tiene la última palabra."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        self.semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        self.franjas = [
+            FranjaHoraria.objects.create(turno='MANANA', hora_inicio=time(8 + i, 0), hora_fin=time(8 + i, 50))
+            for i in range(2)
+        ]
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        self.otro_docente = Docente.objects.create_user('otro', password='x', dni='11111111')
+        datos = {
+            'carrera': Carrera.objects.create(nombre='Educación'), 'semestre': self.semestre,
+            'especialidad': Especialidad.objects.create(nombre='Matemática'), 'duracion_bloques': 1,
+        }
+        self.a = Curso.objects.create(nombre='Álgebra', docente=self.docente, semestre_cursado=1, **datos)
+        self.b = Curso.objects.create(nombre='Física', docente=self.docente, semestre_cursado=2, **datos)
+
+    def _ocupados(self, docente):
+        with indice_semestre(self.semestre.pk) as mapa:
+            return set(mapa.docentes.por_curso.get(docente.pk, {}))
+
+    def _asignar(self, curso, franja):
+        return self.client.post(
+            reverse('api_asignar_horario'), {'curso_id': curso.pk, 'dia': 'Lunes', 'franja_id': franja.pk},
+            content_type='application/json',
+        )
+
+    def test_guardar_borrar_y_reasignar(self):
+        self.assertEqual(self._ocupados(self.docente), set())
+        self.assertEqual(self._asignar(self.a, self.franjas[0]).status_code, 200)
+        self.assertEqual(self._ocupados(self.docente), {self.a.pk})
+
+        curso = Curso.objects.get(pk=self.a.pk)
+        curso.docente = self.otro_docente
+        curso.save()
+        self.assertEqual((self._ocupados(self.docente), self._ocupados(self.otro_docente)), (set(), {self.a.pk}))
+
+        curso.delete()
+        self.assertEqual(self._ocupados(self.otro_docente), set())
+
+    def test_cruce_que_solo_esta_en_la_base(self):
+        self._ocupados(self.docente)
+        # Otro proceso programa A en la misma celda y este aún no vio el cambio
+        Curso.objects.filter(pk=self.a.pk).update(dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(8, 50))
+
+        respuesta = self._asignar(self.b, self.franjas[0])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('Álgebra', respuesta.json()['message'])
+        self.assertIsNone(Curso.objects.get(pk=self.b.pk).dia)
+        # El índice desactualizado se descartó
+        self.assertEqual(self._ocupados(self.docente), {self.a.pk})
+
+    def test_lote_con_cruce_que_solo_esta_en_la_base(self):
+        self._asignar(self.b, self.franjas[1])
+        Curso.objects.filter(pk=self.a.pk).update(dia='Lunes', horario_inicio=time(8, 0), horario_fin=time(8, 50))
+        respuesta = self.client.post(reverse('api_mover_horarios'), {'operaciones': [
+            {'tipo': 'mover', 'curso_id': self.b.pk, 'dia': 'Lunes', 'franja_id': self.franjas[0].pk},
+        ]}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(Curso.objects.get(pk=self.b.pk).horario_inicio, time(9, 0))
+
+
+class SolverHorariosTests(TestCase):
+    """La asignación automática ubica lo que puede, informa lo que no y termina acotada en carreras grandes."""
+
+    def setUp(self):
+        cache.clear()
+        self.semestre = Semestre.objects.create(
+            nombre='2025-A', fecha_inicio=date(2025, 3, 1), fecha_fin=date(2025, 7, 31), estado='ACTIVO',
+        )
+        for i, turno in enumerate(['MANANA', 'MANANA', 'TARDE']):
+            FranjaHoraria.objects.create(turno=turno, hora_inicio=time(8 + 3 * i, 0), hora_fin=time(8 + 3 * i, 50))
+        self.datos = {
+            'carrera': Carrera.objects.create(nombre='Educación'), 'semestre': self.semestre,
+            'especialidad': Especialidad.objects.create(nombre='Matemática'), 'semestre_cursado': 1,
+        }
+
+    def _sin_cruces(self, cursos):
+        with indice_semestre(self.semestre.pk) as compartido:
+            mapa = MapaOcupacion(compartido.rejilla)
+        for curso in cursos:
+            mascara = mapa.rejilla.mascara_curso(curso)
+            self.assertIsNone(mapa.conflicto(curso, mascara), curso.nombre)
+            mapa.ocupar(curso, mascara)
+
+    def test_instancia_factible(self):
+        docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        for n in range(10):
+            Curso.objects.create(nombre=f'Curso {n}', docente=docente, duracion_bloques=1 + n % 2, **self.datos)
+        asignados, total = auto_asignar(self.semestre, Curso.objects.all())
+        self.assertEqual((len(asignados), total), (10, 10))
+        self._sin_cruces(Curso.objects.select_related('docente', 'especialidad'))
+
+    def test_instancia_infactible(self):
+        # Solo hay una franja de tarde por día: el sexto curso de la tarde no entra
+        docente = Docente.objects.create_user('docente', password='x', dni='12345678', disponibilidad='TARDE')
+        for n in range(6):
+            Curso.objects.create(nombre=f'Curso {n}', docente=docente, duracion_bloques=1, **self.datos)
+        asignados, total = auto_asignar(self.semestre, Curso.objects.all())
+        self.assertEqual((len(asignados), total), (5, 6))
+        self.assertEqual(Curso.objects.filter(dia__isnull=True).count(), 1)
+
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        respuesta = self.client.post(reverse('api_auto_asignar'), {'especialidad_id': self.datos['especialidad'].pk}, content_type='application/json')
+        self.assertEqual(respuesta.json()['message'], 'Proceso finalizado. Se asignaron 0 de 1 cursos.')
+
+    def test_carrera_completa_sin_recursion(self):
+        # 1200 cursos en memoria: una recursión por curso superaría el límite de Python
+        rejilla = Rejilla([
+            FranjaHoraria(id=i + 1, turno='MANANA' if i < 5 else 'TARDE', hora_inicio=time(7 + i, 0), hora_fin=time(7 + i, 50))
+            for i in range(10)
+        ])
+        docentes = [Docente(id=i + 1, disponibilidad=('COMPLETO', 'MANANA', 'TARDE')[i % 3]) for i in range(240)]
+        especialidades = [Especialidad(id=i + 1, grupo_id=1 + i % 4) for i in range(24)]
+        cursos = [
+            Curso(
+                id=n + 1, nombre=f'Curso {n}', docente=docentes[n % 240], especialidad=especialidades[n % 24],
+                tipo_curso='GENERAL' if n % 10 == 0 else 'ESPECIALIDAD', semestre_cursado=1 + n % 5, duracion_bloques=1 + n % 2,
+            )
+            for n in range(1200)
+        ]
+        solver = Solver(MapaOcupacion(rejilla), cursos, limite_segundos=2)
+        inicio = timezone.now()
+        solucion = solver.resolver()
+        self.assertLess((timezone.now() - inicio).total_seconds(), 10)
+        self.assertLessEqual(solver.nodos, LIMITE_NODOS + len(cursos))
+        self.assertGreater(len(solucion), 600)
+
+        mapa = MapaOcupacion(rejilla)
+        for curso in cursos:
+            if curso.id in solucion:
+                mascara = solucion[curso.id][0]
+                self.assertIsNone(mapa.conflicto(curso, mascara))
+                mapa.ocupar(curso, mascara)
+
+
+    def test_presupuesto_agotado_completa_en_modo_voraz(self):
+        docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+        for n in range(4):
+            Curso.objects.create(nombre=f'Curso {n}', docente=docente, duracion_bloques=1, **self.datos)
+        with indice_semestre(self.semestre.pk) as compartido:
+            mapa = compartido.copia()
+        cursos = list(Curso.objects.select_related('docente', 'especialidad'))
+        # Búsqueda agotada sin haber ubicado nada: todo sale del relleno voraz
+        solver = Solver(mapa, cursos, limite_nodos=0)
+        with mock.patch.object(solver, '_buscar'):
+            solucion = solver.resolver()
+        self.assertEqual(len(solucion), 4)
+
+        mapa = MapaOcupacion(mapa.rejilla)
+        for curso in cursos:
+            self.assertIsNone(mapa.conflicto(curso, solucion[curso.id][0]))
+            mapa.ocupar(curso, solucion[curso.id][0])
+
+
+class ColaTareasTests(TestCase):
+    """El estado de las tareas vive en la caché, así que cualquier proceso lo consulta y respeta la clave."""
+
+    def setUp(self):
+        cache.clear()
+        # El pool ejecuta la tarea en el mismo hilo
+        parche = mock.patch.object(tareas, '_get_executor', return_value=mock.Mock(submit=lambda funcion, *args: funcion(*args)))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_estado_compartido_y_clave(self):
+        funcion = mock.Mock(return_value={'archivo': 'a.pdf'})
+        tarea = tareas.encolar(funcion, 1, clave='reportes/a.pdf')
+        guardada = tareas.obtener(tarea.id)
+        self.assertIsNot(guardada, tarea)
+        self.assertEqual((guardada.estado, guardada.resultado), (tareas.COMPLETADA, {'archivo': 'a.pdf'}))
+
+        self.assertEqual(tareas.encolar(funcion, 1, clave='reportes/a.pdf').id, tarea.id)
+        funcion.assert_called_once_with(1)
+        self.assertIsNone(tareas.obtener('otra'))
+
+    def test_tarea_fallida_se_vuelve_a_encolar(self):
+        with self.assertLogs('core.utils.tareas', 'ERROR'):
+            fallida = tareas.encolar(mock.Mock(side_effect=OSError('disco lleno')), clave='reportes/b.pdf')
+        self.assertEqual((tareas.obtener(fallida.id).estado, tareas.obtener(fallida.id).error), (tareas.FALLIDA, 'disco lleno'))
+        nueva = tareas.encolar(mock.Mock(return_value=1), clave='reportes/b.pdf')
+        self.assertNotEqual(nueva.id, fallida.id)
+        self.assertEqual(tareas.obtener(nueva.id).estado, tareas.COMPLETADA)
+
+
+class ReportePDFCacheTests(MediaTemporalMixin, TestCase):
+    """Los PDF del reporte se reutilizan mientras no cambie lo que muestran, y las versiones superadas se borran."""
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        # La generación corre en el mismo hilo
+        parche = mock.patch.object(tareas, 'encolar', side_effect=self._encolar)
+        self.encolar = parche.start()
+        self.addCleanup(parche.stop)
+
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        ConfiguracionInstitucion.load()
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678', first_name='Ana', last_name='Quispe')
+        self.curso = Curso.objects.create(nombre='Álgebra', carrera=Carrera.objects.create(nombre='Educación'), docente=self.docente)
+        self.periodo = {'fecha_inicio': '2025-03-01', 'fecha_fin': '2025-03-31'}
+        self.marcas = [
+            Asistencia.objects.create(
+                docente=self.docente, curso=self.curso, fecha=date(2025, 3, dia),
+                hora_entrada=timezone.make_aware(datetime(2025, 3, dia, 8, minuto)),
+            )
+            for dia, minuto in ((3, 5), (4, 10))
+        ]
+
+    def _encolar(self, funcion, *args, clave=None, **kwargs):
+        tarea = tareas.Tarea(clave=clave)
+        tarea.estado, tarea.resultado = tareas.COMPLETADA, funcion(*args, **kwargs)
+        return tarea
+
+    def _pdfs(self):
+        return default_storage.listdir('reportes/pdf')[1] if default_storage.exists('reportes/pdf') else []
+
+    def _exportar(self, **extra):
+        return self.client.get(reverse('exportar_pdf'), {**self.periodo, **extra})
+
+    def _version(self):
+        return version_datos_reporte(self.periodo['fecha_inicio'], self.periodo['fecha_fin'])
+
+    def test_segunda_descarga_sale_de_la_cache(self):
+        self.assertEqual(self._exportar().status_code, 202)
+        respuesta = self._exportar()
+        self.assertEqual((respuesta.status_code, respuesta['Content-Type']), (200, 'application/pdf'))
+        self.assertEqual(self.encolar.call_count, 1)
+        self.assertEqual(len(self._pdfs()), 1)
+
+    def test_cambios_que_invalidan(self):
+        version = self._version()
+        # Una hora de entrada que no es la mayor del periodo
+        self.marcas[0].hora_entrada += timedelta(minutes=1)
+        self.marcas[0].save()
+        self.assertNotEqual(self._version(), version)
+
+        version = self._version()
+        self.docente.last_name = 'Mamani'
+        self.docente.save()
+        self.assertNotEqual(self._version(), version)
+
+        version = self._version()
+        self.docente.especialidades.add(Especialidad.objects.create(nombre='Matemática'))
+        self.assertNotEqual(self._version(), version)
+
+        version = self._version()
+        configuracion = ConfiguracionInstitucion.load()
+        configuracion.nombre_institucion = 'Instituto'
+        configuracion.save()
+        self.assertNotEqual(self._version(), version)
+
+    def test_cambios_que_no_invalidan(self):
+        version = self._version()
+        # Una marca de otro mes y un inicio de sesión no cambian el reporte de marzo
+        Asistencia.objects.create(docente=self.docente, curso=self.curso, fecha=date(2025, 4, 1))
+        self.docente.last_login = timezone.now()
+        self.docente.save(update_fields=['last_login'])
+        self.assertEqual(self._version(), version)
+
+    def test_borra_la_version_superada(self):
+        self._exportar()
+        anterior = self._pdfs()
+        self.marcas[1].delete()
+        self._exportar()
+        actual = self._pdfs()
+        self.assertEqual(len(actual), 1)
+        self.assertNotEqual(actual, anterior)
+
+        call_command('limpiar_reportes', dias=0, stdout=StringIO())
+        self.assertEqual(self._pdfs(), [])
+
+    def test_curso_no_valido(self):
+        respuesta = self._exportar(curso='abc')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self._exportar(curso=str(self.curso.pk)).status_code, 202)
+
+
+class ExportacionExcelTests(TestCase):
+    """El XLSX del reporte se envía por bloques, respeta los filtros y valida los parámetros."""
+
+    def setUp(self):
+        carrera = Carrera.objects.create(nombre='Educación')
+        self.docentes = {}
+        for apellido, dni in (('Huamán', '11111111'), ('Quispe', '22222222'), ('Rojas', '33333333')):
+            docente = Docente.objects.create_user(apellido.lower(), password='x', dni=dni, first_name='Ana', last_name=apellido)
+            self.docentes[apellido] = docente
+        self.curso = Curso.objects.create(nombre='Álgebra', carrera=carrera, docente=self.docentes['Quispe'])
+        for apellido in ('Huamán', 'Quispe'):
+            AsistenciaDiaria.objects.create(docente=self.docentes[apellido], fecha=date(2025, 3, 31))
+        Asistencia.objects.create(
+            docente=self.docentes['Quispe'], curso=self.curso, fecha=date(2025, 3, 31),
+            hora_entrada=timezone.make_aware(datetime(2025, 3, 31, 8, 5)),
+        )
+
+    def _filas(self, **filtros):
+        respuesta = self.client.get(reverse('exportar_excel'), {'fecha_inicio': '2025-03-31', 'fecha_fin': '2025-03-31', **filtros})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        libro = load_workbook(BytesIO(b''.join(respuesta.streaming_content)), read_only=True)
+        encabezado, *filas = libro.active.iter_rows(values_only=True)
+        self.assertEqual(encabezado[:3], ('Docente', 'DNI', 'Asistencia General'))
+        return filas
+
+    def test_filas_y_filtro_de_estado(self):
+        self.assertEqual([fila[0] for fila in self._filas()], ['Huamán, Ana', 'Quispe, Ana', 'Rojas, Ana'])
+        presentes = self._filas(estado='presente')
+        self.assertEqual([fila[1] for fila in presentes], ['11111111', '22222222'])
+        self.assertTrue(all(fila[2].startswith('Presente') for fila in presentes))
+        ausentes = self._filas(estado='ausente')
+        self.assertEqual([(fila[0], fila[2]) for fila in ausentes], [('Rojas, Ana', 'Ausente')])
+        quispe, = self._filas(curso=self.curso.pk)
+        self.assertIn('Álgebra (Entrada: 08:05', quispe[3])
+
+    def test_texto_con_caracteres_de_control(self):
+        self.docentes['Rojas'].first_name = 'Ana\x07'
+        self.docentes['Rojas'].save()
+        self.assertEqual(self._filas()[-1][0], 'Rojas, Ana')
+
+    def test_parametros_no_validos(self):
+        for parametros in (
+            {}, {'fecha_inicio': '2025-03-31', 'fecha_fin': '2025-02-30'},
+            {'fecha_inicio': '2025-03-31', 'fecha_fin': '2025-03-31', 'curso': 'x'},
+        ):
+            respuesta = self.client.get(reverse('exportar_excel'), parametros)
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertEqual(respuesta.json()['status'], 'error')
+
+
+class CredencialesLoteTests(MediaTemporalMixin, TestCase):
+    """Los QR y el PDF del lote se generan en el pool de procesos, y solo una vez."""
+
+    def setUp(self):
+        super().setUp()
+        # La tarea corre en el mismo hilo; la cola solo la registra para la descarga
+        self.tareas = {}
+        for parche in (
+            mock.patch.object(tareas, 'encolar', side_effect=self._encolar),
+            mock.patch.object(tareas, 'obtener', side_effect=self.tareas.get),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.addCleanup(self._cerrar_pool)
+        cache.clear()
+
+        self.client.force_login(Docente.objects.create_superuser('admin', password='x', dni='87654321'))
+        ConfiguracionInstitucion.load()
+        self.docentes = [
+            PersonalDocente.objects.create_user(f'docente{n}', password='x', dni=f'1234567{n}', first_name='Ana', last_name=f'Quispe {n}')
+            for n in range(2)
+        ]
+
+    def _encolar(self, funcion, *args, clave=None, **kwargs):
+        tarea = tareas.Tarea(clave=clave)
+        tarea.estado, tarea.resultado = tareas.COMPLETADA, funcion(*args, **kwargs)
+        self.tareas[tarea.id] = tarea
+        return tarea
+
+    def _cerrar_pool(self):
+        if credenciales._pool is not None:
+            credenciales._pool.shutdown()
+            credenciales._pool = None
+
+    def test_lote_generado_en_el_pool(self):
+        ids = [str(d.pk) for d in self.docentes]
+        respuesta = self.client.post(reverse('credenciales_lote'), {'docentes': ids})
+        self.assertEqual(respuesta.status_code, 202)
+        descarga = self.client.get(respuesta.json()['url_descarga'])
+        self.assertEqual(descarga.status_code, 200)
+        self.assertTrue(b''.join(descarga.streaming_content).startswith(b'%PDF'))
+        for docente in self.docentes:
+            with Image.open(default_storage.path(credenciales.nombre_qr(docente.id_qr))) as qr:
+                self.assertEqual(qr.format, 'PNG')
+
+        # Los QR ya están en disco: un lote con los mismos docentes no los vuelve a generar
+        with mock.patch.object(credenciales, '_get_pool') as pool:
+            credenciales.asegurar_qrs([d.id_qr for d in self.docentes])
+        pool.assert_not_called()
+
+    def test_cambiar_un_docente_produce_otro_lote(self):
+        ids = [str(d.pk) for d in self.docentes]
+        anterior = credenciales.nombre_lote(ids)
+        self.docentes[0].last_name = 'Rojas'
+        self.docentes[0].save()
+        self.assertNotEqual(credenciales.nombre_lote(ids), anterior)
+
+
+class ImportacionSemestreTests(TestCase):
+    """import_semestre crea el semestre completo, es idempotente y no escribe nada si una fila falla."""
+
+    def setUp(self):
+        cache.clear()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        self.archivos = {
+            'franjas': self._csv('franjas.csv', 'turno,hora_inicio,hora_fin', 'Mañana,08:00,08:50', 'mañana,08:50,09:40', 'MANANA,09:40,10:30'),
+            'especialidades': self._csv('especialidades.csv', 'nombre;grupo', 'Matemática;Ciencias', 'Física;Ciencias'),
+            'docentes': self._xlsx('docentes.xlsx', [
+                ('DNI', 'Nombres', 'Apellidos', 'Email', 'Especialidades'),
+                # Excel guarda el DNI como número y pierde el cero inicial
+                (1234567.0, 'Ana', 'Quispe', 'ana@example.com', 'Matematica; Física'),
+                (87654321.0, 'Luis', 'Rojas', '', 'Física'),
+            ]),
+            'cursos': self._csv(
+                'cursos.csv', 'nombre,carrera,especialidad,semestre_cursado,docente_dni,duracion_bloques,dia,hora_inicio',
+                'Álgebra,Educación,Matemática,1,01234567,2,Lunes,08:00',
+                'Mecánica,Educación,física,1,87654321,1,Lunes,08:00',
+                'Geometría,Educación,Matemática,1,01234567,1,,',
+            ),
+        }
+
+    def _csv(self, nombre, *lineas):
+        ruta = os.path.join(self.directorio, nombre)
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write('\n'.join(lineas) + '\n')
+        return ruta
+
+    def _xlsx(self, nombre, filas):
+        libro = Workbook()
+        for fila in filas:
+            libro.active.append(fila)
+        ruta = os.path.join(self.directorio, nombre)
+        libro.save(ruta)
+        return ruta
+
+    def _importar(self, **archivos):
+        salida = StringIO()
+        argumentos = [f'--{tipo}={ruta}' for tipo, ruta in {**self.archivos, **archivos}.items()]
+        call_command(
+            'import_semestre', '--semestre=2025-A', '--fecha-inicio=2025-03-01', '--fecha-fin=2025-07-31', '--activar',
+            *argumentos, stdout=salida, stderr=StringIO(),
+        )
+        return salida.getvalue()
+
+    def _estado(self):
+        return {
+            'franjas': list(FranjaHoraria.objects.order_by('hora_inicio').values_list('pk', 'hora_inicio', 'hora_fin')),
+            'docentes': list(Docente.objects.order_by('dni').values_list('pk', 'dni', 'username', 'first_name', 'email')),
+            'especialidades': sorted(Docente.especialidades.through.objects.values_list('docente__dni', 'especialidad__nombre')),
+            'cursos': list(Curso.objects.order_by('nombre').values_list(
+                'pk', 'nombre', 'especialidad__nombre', 'docente__dni', 'dia', 'horario_inicio', 'horario_fin',
+            )),
+        }
+
+    def test_importar_y_reimportar(self):
+        salida = self._importar()
+        self.assertIn('Curso: 3 nuevos, 0 actualizados.', salida)
+        semestre = Semestre.objects.get(nombre='2025-A')
+        self.assertEqual(semestre.estado, 'ACTIVO')
+
+        estado = self._estado()
+        self.assertEqual(len(estado['franjas']), 3)
+        self.assertEqual([fila[1:4] for fila in estado['docentes']], [('01234567', '01234567', 'Ana'), ('87654321', '87654321', 'Luis')])
+        self.assertFalse(Docente.objects.get(dni='01234567').has_usable_password())
+        self.assertEqual(estado['especialidades'], [('01234567', 'Física'), ('01234567', 'Matemática'), ('87654321', 'Física')])
+        self.assertEqual([fila[1:] for fila in estado['cursos']], [
+            ('Geometría', 'Matemática', '01234567', None, None, None),
+            ('Mecánica', 'Física', '87654321', 'Lunes', time(8, 0), time(8, 50)),
+            ('Álgebra', 'Matemática', '01234567', 'Lunes', time(8, 0), time(9, 40)),
+        ])
+        self.assertEqual(Curso.objects.filter(semestre=semestre).count(), 3)
+
+        # Reimportar los mismos archivos no crea ni cambia nada
+        salida = self._importar()
+        self.assertNotIn('nuevos', salida)
+        self.assertEqual(self._estado(), estado)
+
+        # Un cambio en una fila actualiza ese registro y nada más
+        docentes = self._xlsx('docentes2.xlsx', [
+            ('dni', 'nombres', 'apellidos', 'email'), ('01234567', 'Ana', 'Quispe', 'ana.quispe@example.com'),
+        ])
+        self.assertIn('Docente: 0 nuevos, 1 actualizados.', self._importar(docentes=docentes))
+        self.assertEqual(Docente.objects.get(dni='01234567').email, 'ana.quispe@example.com')
+        self.assertEqual(Docente.objects.count(), 2)
+
+    def test_filas_invalidas_no_importan_nada(self):
+        cursos = self._csv(
+            'cursos_invalidos.csv', 'nombre,carrera,especialidad,semestre_cursado,docente_dni,duracion_bloques,dia,hora_inicio',
+            'Álgebra,Educación,Matemática,1,01234567,2,Lunes,08:00',
+            # Cruce del docente con Álgebra
+            'Aritmética,Educación,Matemática,1,01234567,1,Lunes,08:50',
+            'Química,Educación,Química,1,,1,,',
+            'Mecánica,Educación,Física,1,87654321,1,Lunes,08:30',
+            'Óptica,Educación,Física,1,87654321,5,Martes,08:00',
+            'Estadística,Educación,Matemática,2,,1,,',
+            'Estadística,Educación,matemática,2,,1,,',
+            ',Educación,Física,1,,1,,',
+        )
+        docentes = self._csv('docentes_invalidos.csv', 'dni,nombres,apellidos,email', '123,Ana,Quispe,', 'ABC,Luis,Rojas,no-es-email')
+
+        def errores_de(**archivos):
+            errores = StringIO()
+            with self.assertRaisesMessage(CommandError, 'no se importó nada'):
+                call_command(
+                    'import_semestre', '--semestre=2025-A', '--fecha-inicio=2025-03-01', '--fecha-fin=2025-07-31',
+                    *[f'--{tipo}={ruta}' for tipo, ruta in {**self.archivos, **archivos}.items()],
+                    stdout=StringIO(), stderr=errores,
+                )
+            return errores.getvalue()
+
+        errores = errores_de(cursos=cursos)
+        for mensaje in (
+            'cursos_invalidos.csv, fila 3: "Aritmética" el docente ya dicta "Álgebra" a esa hora.',
+            'cursos_invalidos.csv, fila 4: La especialidad "Química" no existe.',
+            'cursos_invalidos.csv, fila 5: La hora 08:30 no es el inicio de ninguna franja.',
+            'cursos_invalidos.csv, fila 6: Duración debe estar entre 1 y 3.',
+            'cursos_invalidos.csv, fila 8: repite la fila 7.',
+            'cursos_invalidos.csv, fila 9: faltan nombre.',
+        ):
+            self.assertIn(mensaje, errores)
+        errores = errores_de(docentes=docentes, cursos=self._csv('vacio.csv', 'nombre,carrera,especialidad'))
+        self.assertIn('docentes_invalidos.csv, fila 3: DNI "ABC" debe tener 8 dígitos.', errores)
+        self.assertEqual(errores.count('docentes_invalidos.csv'), 1)
+
+        for modelo in (Semestre, FranjaHoraria, Especialidad, Docente, Curso):
+            self.assertFalse(modelo.objects.exists(), modelo.__name__)
+
+
+class AlmacenamientoFotosTests(MediaTemporalMixin, TestCase):
+    """Las fotos se guardan una vez por contenido y compactar_fotos solo borra lo que nadie referencia."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = fotos_verificacion()
+        self.docente = Docente.objects.create_user('docente', password='x', dni='12345678')
+
+    def _guardar(self, contenido, nombre='foto.jpg', horas=0):
+        nombre = self.storage.save(nombre, ContentFile(contenido))
+        if horas:
+            antiguedad = datetime.now().timestamp() - horas * 3600
+            os.utime(self.storage.path(nombre), (antiguedad, antiguedad))
+        return nombre
+
+    def _compactar(self, *argumentos):
+        salida = StringIO()
+        call_command('compactar_fotos', *argumentos, stdout=salida)
+        return salida.getvalue()
+
+    def test_contenido_identico_se_guarda_una_vez(self):
+        entrada = self._guardar(b'foto', 'docente_1.jpg')
+        salida = self._guardar(b'foto', 'docente_2.JPG')
+        sha256 = hashlib.sha256(b'foto').hexdigest()
+        self.assertEqual(entrada, f'verificacion/{sha256[:2]}/{sha256[2:4]}/{sha256}.jpg')
+        self.assertEqual(salida, entrada)
+        self.assertNotEqual(self._guardar(b'otra foto'), entrada)
+        archivos = [nombre for _, _, nombres in os.walk(self.storage.path('verificacion')) for nombre in nombres]
+        self.assertEqual(len(archivos), 2)
+
+    def test_delete_no_borra_archivos_compartidos(self):
+        compartido = self._guardar(b'foto')
+        self.storage.delete(compartido)
+        self.assertTrue(self.storage.exists(compartido))
+
+        # Los nombres del esquema anterior (por fecha) no se comparten y sí se borran
+        antiguo = 'verificacion_diaria/2025/03/31/foto.jpg'
+        os.makedirs(os.path.dirname(self.storage.path(antiguo)))
+        with open(self.storage.path(antiguo), 'wb') as archivo:
+            archivo.write(b'foto')
+        self.storage.delete(antiguo)
+        self.assertFalse(self.storage.exists(antiguo))
+
+    def test_recolectar_huerfanos_con_gracia(self):
+        referenciada = self._guardar(b'referenciada', horas=48)
+        miniatura = self.storage.save(nombre_miniatura(referenciada), ContentFile(b'mini'))
+        os.utime(self.storage.path(miniatura), (datetime.now().timestamp() - 48 * 3600,) * 2)
+        AsistenciaDiaria.objects.create(docente=self.docente, foto_verificacion=referenciada)
+        huerfana = self._guardar(b'huerfana', horas=25)
+        reciente = self._guardar(b'de una marca que se esta guardando', horas=1)
+
+        self.assertIn('Se borrarían 1 archivos huérfanos', self._compactar('--simular'))
+        self.assertTrue(self.storage.exists(huerfana))
+
+        self.assertIn('Se borraron 1 archivos huérfanos', self._compactar())
+        self.assertFalse(self.storage.exists(huerfana))
+        self.assertFalse(os.path.exists(os.path.dirname(self.storage.path(huerfana))))
+        for nombre in (referenciada, miniatura, reciente):
+            self.assertTrue(self.storage.exists(nombre), nombre)
+
+        self._compactar('--gracia-horas=0')
+        self.assertFalse(self.storage.exists(reciente))
+        self.assertTrue(self.storage.exists(referenciada))
+
+    def test_retencion_y_fotos_antiguas(self):
+        vieja = self._guardar(b'vieja', horas=48)
+        diaria = AsistenciaDiaria.objects.create(docente=self.docente, foto_verificacion=vieja)
+        AsistenciaDiaria.objects.filter(pk=diaria.pk).update(fecha=timezone.localdate() - timedelta(days=40))
+
+        # Una foto del esquema anterior se pasa al árbol por contenido
+        otro = Docente.objects.create_user('otro', password='x', dni='87654321')
+        antiguo = 'verificacion_diaria/2025/03/31/otro.jpg'
+        os.makedirs(os.path.dirname(self.storage.path(antiguo)))
+        with open(self.storage.path(antiguo), 'wb') as archivo:
+            archivo.write(b'antigua')
+        reciente = AsistenciaDiaria.objects.create(docente=otro, foto_verificacion=antiguo)
+
+        self._compactar('--retencion-dias=30')
+        diaria.refresh_from_db()
+        reciente.refresh_from_db()
+        self.assertEqual(diaria.foto_verificacion.name, '')
+        self.assertFalse(self.storage.exists(vieja))
+        self.assertTrue(self.storage.en_arbol(reciente.foto_verificacion.name))
+        with reciente.foto_verificacion.open('rb') as archivo:
+            self.assertEqual(archivo.read(), b'antigua')
+        self.assertFalse(os.path.exists(self.storage.path('verificacion_diaria')))
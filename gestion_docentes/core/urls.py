@@ -6,6 +6,10 @@ from .utils import exports
 urlpatterns = [
     path('subir_documento/', views.subir_documento, name='subir_documento'),
     path('documentos/<int:documento_id>/subir_version/', views.subir_nueva_version, name='subir_nueva_version'),
+    path('api/documentos/subidas/', views.api_iniciar_subida, name='api_iniciar_subida'),
+    path('api/documentos/subidas/<uuid:subida_id>/', views.api_estado_subida, name='api_estado_subida'),
+    path('api/documentos/subidas/<uuid:subida_id>/fragmento/', views.api_fragmento_subida, name='api_fragmento_subida'),
+    path('api/documentos/subidas/<uuid:subida_id>/completar/', views.api_completar_subida, name='api_completar_subida'),
     path('documentos/', views.lista_documentos, name='lista_documentos'),
     path('asistencia/', views.registrar_asistencia, name='asistencia'),
     path('', views.dashboard, name='dashboard'),
@@ -25,19 +29,31 @@ urlpatterns = [
     # APIs que usará el JavaScript del kiosco
     path('api/get-teacher-info/', views.get_teacher_info, name='api_get_teacher_info'),
     path('api/mark-attendance/', views.mark_attendance_kiosk, name='api_mark_attendance'),
+    path('api/mark-attendance/foto/', views.mark_attendance_kiosk_foto, name='api_mark_attendance_foto'),
+    # Las mismas APIs como vistas asíncronas, para servir el kiosco con ASGI (KIOSCO_ASYNC)
+    path('api/async/get-teacher-info/', views.get_teacher_info_async, name='api_get_teacher_info_async'),
+    path('api/async/mark-attendance/', views.mark_attendance_kiosk_async, name='api_mark_attendance_async'),
+    path('api/async/mark-attendance/foto/', views.mark_attendance_kiosk_foto_async, name='api_mark_attendance_foto_async'),
+    path('api/kiosco/roster/', views.api_kiosco_roster, name='api_kiosco_roster'),
+    path('api/kiosco/sync/', views.api_kiosco_sync, name='api_kiosco_sync'),
 
         # --- INICIO DE URLS PARA CREDENCIALES ---
     path('credenciales/', views.lista_docentes_credenciales, name='lista_credenciales'),
     path('credenciales/<int:docente_id>/', views.generar_credencial_docente, name='generar_credencial'),
+    path('credenciales/lote/', views.credenciales_lote, name='credenciales_lote'),
+    path('credenciales/lote/tareas/<str:tarea_id>/', views.estado_credenciales_lote, name='estado_credenciales_lote'),
+    path('credenciales/lote/tareas/<str:tarea_id>/descargar/', views.descargar_credenciales_lote, name='descargar_credenciales_lote'),
     # --- FIN DE URLS PARA CREDENCIALES ---
     path('reportes/asistencia/', views.reporte_asistencia, name='reporte_asistencia'),
 
     path('planificador/', views.planificador_horarios, name='planificador_horarios'),
     path('api/asignar-horario/', views.api_asignar_horario, name='api_asignar_horario'),
     path('api/desasignar-horario/', views.api_desasignar_horario, name='api_desasignar_horario'),
+    path('api/mover-horarios/', views.api_mover_horarios, name='api_mover_horarios'),
     path('api/get-teacher-conflicts/', views.api_get_teacher_conflicts, name='api_get_teacher_conflicts'),
     path('api/auto-asignar/', views.api_auto_asignar, name='api_auto_asignar'),
     path('api/get-cursos-no-asignados/', views.api_get_cursos_no_asignados, name='api_get_cursos_no_asignados'),
+    path('api/planificador/eventos/', views.api_planificador_eventos, name='api_planificador_eventos'),
 
     path('horarios/ver/', views.vista_publica_horarios, name='vista_publica_horarios'),
 
@@ -45,5 +61,10 @@ urlpatterns = [
     # Las URLs de exportación ahora apuntan al nuevo módulo
     path('reporte-asistencia/excel/', exports.exportar_reporte_excel, name='exportar_excel'),
     path('reporte-asistencia/pdf/', exports.exportar_reporte_pdf, name='exportar_pdf'),
+    path('reporte-asistencia/pdf/tareas/<str:tarea_id>/', exports.estado_reporte_pdf, name='estado_reporte_pdf'),
+    path('reporte-asistencia/pdf/tareas/<str:tarea_id>/descargar/', exports.descargar_reporte_pdf, name='descargar_reporte_pdf'),
     path('reporte-asistencia/detalle/<int:docente_id>/', views.detalle_asistencia_docente_ajax, name='detalle_asistencia_docente_ajax'),
+    path('reporte-asistencia/semestre/', views.resumen_asistencia_semestre, name='resumen_asistencia_semestre'),
+
+    path('api/metricas/', views.metricas_vistas, name='metricas_vistas'),
 ]
\ No newline at end of file
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Resúmenes diarios y mensuales de asistencia.
+
+``ResumenAsistenciaDia`` (docente y día), ``ResumenAsistenciaMes`` (docente y
+mes) y ``ResumenCursoMes`` (curso, docente y mes) acumulan las clases marcadas,
+las llegadas tarde, los minutos de tardanza, los minutos dictados y las salidas
+sin marcar. El detalle por curso y día es la propia ``Asistencia``.
+
+Las señales aplican cada marca como una diferencia sobre las filas afectadas;
+las operaciones en bloque (sincronización del kiosco, datos de carga) y los
+cambios de horario de un curso se corrigen con ``reconstruir``, que también usa
+el comando ``reconstruir_resumenes_asistencia``.
+"""
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from ..models import (
+    Asistencia, AsistenciaDiaria, Curso, DiaEspecial, ResumenAsistenciaDia, ResumenAsistenciaMes, ResumenCursoMes,
+)
+
+CAMPOS = ('clases', 'llegadas_tarde', 'minutos_tardanza', 'minutos_dictados', 'salidas_faltantes')
+LOTE = 2000
+
+
+def _mes(fecha):
+    return fecha.replace(day=1)
+
+
+def _fin_de_mes(fecha):
+    return fecha.replace(day=monthrange(fecha.year, fecha.month)[1])
+
+
+def _fecha(valor):
+    # ``fecha`` tiene timezone.now como default, así que antes de recargarse puede ser un datetime
+    return Asistencia._meta.get_field('fecha').to_python(valor)
+
+
+def contribucion(horario_inicio, entrada, salida):
+    """Lo que suma a los contadores una marca de curso con las horas indicadas."""
+    if not entrada:
+        return dict.fromkeys(CAMPOS, 0)
+    tardanza = 0
+    if horario_inicio:
+        local = timezone.localtime(entrada)
+        inicio = datetime.combine(local.date(), horario_inicio, tzinfo=local.tzinfo)
+        tardanza = max(int((local - inicio).total_seconds() // 60), 0)
+    return {
+        'clases': 1,
+        'llegadas_tarde': 1 if tardanza else 0,
+        'minutos_tardanza': tardanza,
+        'minutos_dictados': max(int((salida - entrada).total_seconds() // 60), 0) if salida else 0,
+        'salidas_faltantes': 0 if salida else 1,
+    }
+
+
+def _aplicar(modelo, claves, delta, **valores):
+    """Suma ``delta`` (y asigna ``valores``) a la fila de ``claves``, creándola si no existe."""
+    cambios = {campo: F(campo) + v if v > 0 else Greatest(F(campo) + v, 0) for campo, v in delta.items() if v}
+    cambios.update(valores)
+    if not cambios or modelo.objects.filter(**claves).update(**cambios):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**claves, **{campo: max(v, 0) for campo, v in delta.items()}, **valores)
+    except IntegrityError:
+        # Otra marca simultánea creó la fila
+        modelo.objects.filter(**claves).update(**cambios)
+
+
+def _sumar_marca(docente_id, curso_id, fecha, delta):
+    if not any(delta.values()):
+        return
+    _aplicar(ResumenAsistenciaDia, {'docente_id': docente_id, 'fecha': fecha}, delta)
+    _aplicar(ResumenAsistenciaMes, {'docente_id': docente_id, 'mes': _mes(fecha)}, delta)
+    _aplicar(ResumenCursoMes, {'curso_id': curso_id, 'docente_id': docente_id, 'mes': _mes(fecha)}, delta)
+
+
+# --- Cambios incrementales (desde core.signals) ---
+
+CAMPOS_ESTADO = ('docente_id', 'curso_id', 'fecha', 'hora_entrada', 'hora_salida')
+
+
+def estado_asistencia(asistencia):
+    # Con .only()/.defer() el estado guardado no se conoce sin otra consulta (que volvería a emitir post_init)
+    if any(campo not in asistencia.__dict__ for campo in CAMPOS_ESTADO):
+        return None
+    return tuple(asistencia.__dict__[campo] for campo in CAMPOS_ESTADO)
+
+
+def _horario_inicio(asistencia, curso_id):
+    if curso_id == asistencia.curso_id:
+        return asistencia.curso.horario_inicio
+    return Curso.objects.filter(pk=curso_id).values_list('horario_inicio', flat=True).first()
+
+
+def asistencia_guardada(asistencia):
+    inicial, actual = asistencia._acumulado_inicial, estado_asistencia(asistencia)
+    asistencia._acumulado_inicial = actual
+    if inicial is None:
+        fecha = _fecha(asistencia.fecha)
+        reconstruir(fecha, fecha, [asistencia.docente_id])
+        return
+    if inicial == actual:
+        return
+    docente_antes, curso_antes, fecha_antes, entrada_antes, salida_antes = inicial
+    antes = contribucion(_horario_inicio(asistencia, curso_antes), entrada_antes, salida_antes) if entrada_antes else None
+    ahora = contribucion(asistencia.curso.horario_inicio, asistencia.hora_entrada, asistencia.hora_salida)
+
+    clave_antes = (docente_antes, curso_antes, _fecha(fecha_antes))
+    clave = (asistencia.docente_id, asistencia.curso_id, _fecha(asistencia.fecha))
+    if antes and clave_antes != clave:
+        _sumar_marca(*clave_antes, {campo: -v for campo, v in antes.items()})
+        antes = None
+    _sumar_marca(*clave, {campo: v - (antes[campo] if antes else 0) for campo, v in ahora.items()})
+
+
+def asistencia_eliminada(asistencia):
+    if asistencia._acumulado_inicial is None:
+        fecha = _fecha(asistencia.fecha)
+        reconstruir(fecha, fecha, [asistencia.docente_id])
+        return
+    docente_id, curso_id, fecha, entrada, salida = asistencia._acumulado_inicial
+    if entrada:
+        antes = contribucion(_horario_inicio(asistencia, curso_id), entrada, salida)
+        _sumar_marca(docente_id, curso_id, _fecha(fecha), {campo: -v for campo, v in antes.items()})
+
+
+def entrada_general(diaria, presente):
+    _aplicar(ResumenAsistenciaDia, {'docente_id': diaria.docente_id, 'fecha': diaria.fecha}, {}, entrada_general=presente)
+    _aplicar(ResumenAsistenciaMes, {'docente_id': diaria.docente_id, 'mes': _mes(diaria.fecha)}, {'dias_presente': 1 if presente else -1})
+
+
+# --- Reconstrucción completa ---
+
+def reconstruir(desde=None, hasta=None, docente_ids=None):
+    """
+    Recalcula los resúmenes desde las marcas, por meses completos: los de
+    ``desde`` y ``hasta`` (o todos si se omiten), de los docentes indicados (o
+    de todos). Devuelve cuántas filas de cada resumen se escribieron.
+    """
+    filtro_dia, filtro_mes = Q(), Q()
+    if desde:
+        filtro_dia &= Q(fecha__gte=_mes(desde))
+        filtro_mes &= Q(mes__gte=_mes(desde))
+    if hasta:
+        filtro_dia &= Q(fecha__lte=_fin_de_mes(hasta))
+        filtro_mes &= Q(mes__lte=_mes(hasta))
+    if docente_ids is not None:
+        filtro_dia &= Q(docente_id__in=docente_ids)
+        filtro_mes &= Q(docente_id__in=docente_ids)
+
+    dias, meses, cursos = {}, {}, {}
+
+    def fila(tabla, clave, **iniciales):
+        if clave not in tabla:
+            tabla[clave] = dict.fromkeys(CAMPOS, 0) | iniciales
+        return tabla[clave]
+
+    marcas = Asistencia.objects.filter(filtro_dia, hora_entrada__isnull=False).values_list(
+        'docente_id', 'curso_id', 'fecha', 'hora_entrada', 'hora_salida', 'curso__horario_inicio',
+    )
+    for docente_id, curso_id, fecha, entrada, salida, horario_inicio in marcas.iterator(chunk_size=LOTE):
+        aporte = contribucion(horario_inicio, entrada, salida)
+        for contadores in (
+            fila(dias, (docente_id, fecha), entrada_general=False),
+            fila(meses, (docente_id, _mes(fecha)), dias_presente=0),
+            fila(cursos, (curso_id, docente_id, _mes(fecha))),
+        ):
+            for campo, valor in aporte.items():
+                contadores[campo] += valor
+
+    for docente_id, fecha in AsistenciaDiaria.objects.filter(filtro_dia).values_list('docente_id', 'fecha').iterator(chunk_size=LOTE):
+        fila(dias, (docente_id, fecha), entrada_general=False)['entrada_general'] = True
+        fila(meses, (docente_id, _mes(fecha)), dias_presente=0)['dias_presente'] += 1
+
+    with transaction.atomic():
+        ResumenAsistenciaDia.objects.filter(filtro_dia).delete()
+        ResumenAsistenciaMes.objects.filter(filtro_mes).delete()
+        ResumenCursoMes.objects.filter(filtro_mes).delete()
+        ResumenAsistenciaDia.objects.bulk_create(
+            [ResumenAsistenciaDia(docente_id=d, fecha=f, **c) for (d, f), c in dias.items()], batch_size=LOTE,
+        )
+        ResumenAsistenciaMes.objects.bulk_create(
+            [ResumenAsistenciaMes(docente_id=d, mes=m, **c) for (d, m), c in meses.items()], batch_size=LOTE,
+        )
+        ResumenCursoMes.objects.bulk_create(
+            [ResumenCursoMes(curso_id=cu, docente_id=d, mes=m, **c) for (cu, d, m), c in cursos.items()], batch_size=LOTE,
+        )
+    # Quien reconstruye acaba de escribir marcas sin señales (o de corregirlas)
+    from .reportes import invalidar_reportes
+    if desde and hasta:
+        invalidar_reportes(desde, hasta)
+    else:
+        invalidar_reportes()
+    return {'dias': len(dias), 'meses': len(meses), 'cursos': len(cursos)}
+
+
+# --- Lectura ---
+
+def como_fecha(valor):
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def dias_laborables(desde, hasta):
+    """Días de lunes a viernes del periodo, sin contar los feriados."""
+    desde, hasta = como_fecha(desde), como_fecha(hasta)
+    if hasta < desde:
+        return 0
+    semanas, resto = divmod((hasta - desde).days + 1, 7)
+    total = semanas * 5 + sum(1 for n in range(resto) if (desde + timedelta(days=n)).weekday() < 5)
+    feriados = DiaEspecial.objects.filter(tipo='FERIADO', fecha__range=[desde, hasta]).values_list('fecha', flat=True)
+    return total - sum(1 for fecha in feriados if fecha.weekday() < 5)
+
+
+def totales_periodo(desde, hasta, docente_ids=None):
+    """
+    Totales de cada docente en el periodo, con ``dias_presente`` y los
+    contadores de ``CAMPOS``. Los meses completos se leen de
+    ``ResumenAsistenciaMes`` y los días sueltos de los bordes de
+    ``ResumenAsistenciaDia``, así que el costo no crece con el largo del periodo.
+    """
+    desde, hasta = como_fecha(desde), como_fecha(hasta)
+    primero = desde if desde.day == 1 else _fin_de_mes(desde) + timedelta(days=1)
+    ultimo = hasta if hasta == _fin_de_mes(hasta) else _mes(hasta) - timedelta(days=1)
+
+    sumas = {campo: Sum(campo) for campo in CAMPOS}
+    if primero <= ultimo:
+        meses = ResumenAsistenciaMes.objects.filter(mes__range=[primero, _mes(ultimo)])
+        bordes = Q(fecha__range=[desde, primero - timedelta(days=1)]) | Q(fecha__range=[ultimo + timedelta(days=1), hasta])
+    else:
+        meses = ResumenAsistenciaMes.objects.none()
+        bordes = Q(fecha__range=[desde, hasta])
+    dias = ResumenAsistenciaDia.objects.filter(bordes)
+    if docente_ids is not None:
+        meses, dias = meses.filter(docente_id__in=docente_ids), dias.filter(docente_id__in=docente_ids)
+
+    totales = {}
+    consultas = (
+        meses.values('docente_id').annotate(presentes=Sum('dias_presente'), **sumas),
+        dias.values('docente_id').annotate(presentes=Count('pk', filter=Q(entrada_general=True)), **sumas),
+    )
+    for consulta in consultas:
+        for fila in consulta.order_by():
+            total = totales.setdefault(fila['docente_id'], dict.fromkeys(('dias_presente',) + CAMPOS, 0))
+            total['dias_presente'] += fila['presentes'] or 0
+            for campo in CAMPOS:
+                total[campo] += fila[campo] or 0
+    return totales
+
+
+def resumen_semestre(semestre_id, docente_id=None):
+    """Totales por curso del semestre. Los cursos solo se dictan dentro del semestre, así que bastan sus meses."""
+    filas = ResumenCursoMes.objects.filter(curso__semestre_id=semestre_id)
+    if docente_id:
+        filas = filas.filter(docente_id=docente_id)
+    return list(
+        filas.values('curso_id', 'curso__nombre', 'docente_id')
+        .annotate(**{campo: Sum(campo) for campo in CAMPOS})
+        .order_by('curso__nombre', 'curso_id', 'docente_id')
+    )
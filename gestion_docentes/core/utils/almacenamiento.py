@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Almacenamiento por contenido para las fotos de verificación del kiosco.
+
+Cada foto se guarda con el SHA-256 de su contenido como nombre, repartida en
+subdirectorios por los primeros caracteres del hash
+(``verificacion/ab/cd/abcd….jpg``). Dos fotos idénticas (p. ej. la de salida
+repitiendo la de entrada) comparten un único archivo.
+
+Como un archivo puede estar referenciado por varias filas, ``delete`` no borra
+nada dentro del árbol: los archivos huérfanos los elimina el comando
+``compactar_fotos``, que también aplica la retención configurada.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+PREFIJO_FOTOS = 'verificacion'
+
+
+class AlmacenamientoPorContenido(FileSystemStorage):
+
+    def __init__(self, prefijo, **kwargs):
+        super().__init__(**kwargs)
+        self.prefijo = prefijo
+
+    def nombre_por_contenido(self, sha256, extension):
+        return f'{self.prefijo}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension.lower()}'
+
+    def en_arbol(self, nombre):
+        return nombre.replace('\\', '/').startswith(f'{self.prefijo}/')
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide el contenido en _save
+        return name
+
+    def _save(self, name, content):
+        if self.en_arbol(name):
+            # Derivados de un archivo del árbol (miniaturas): su nombre ya es único
+            if self.exists(name):
+                return name
+            return self._escribir(name, content)
+        return self._escribir(None, content, extension=os.path.splitext(name)[1])
+
+    def _escribir(self, name, content, extension=''):
+        """Copia ``content`` a un temporal calculando su hash y lo mueve a su nombre definitivo."""
+        directorio = self.path(self.prefijo)
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        sha256 = hashlib.sha256()
+        try:
+            with os.fdopen(descriptor, 'wb') as destino:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for bloque in content.chunks():
+                    sha256.update(bloque)
+                    destino.write(bloque)
+            os.chmod(temporal, self.file_permissions_mode or 0o644)
+
+            name = name or self.nombre_por_contenido(sha256.hexdigest(), extension)
+            ruta = self.path(name)
+            if os.path.exists(ruta):
+                os.remove(temporal)
+            else:
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                os.replace(temporal, ruta)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        return name
+
+    def delete(self, name):
+        # Dentro del árbol un archivo puede estar compartido; solo se borran los nombres antiguos
+        if name and not self.en_arbol(name):
+            super().delete(name)
+
+
+# Sin location explícita sigue a MEDIA_ROOT/MEDIA_URL aunque cambien los settings
+_fotos_verificacion = AlmacenamientoPorContenido(PREFIJO_FOTOS)
+
+
+def fotos_verificacion():
+    """Storage de las fotos de verificación (callable para que las migraciones no lo serialicen)."""
+    return _fotos_verificacion
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Credenciales en lote.
+
+Los PNG de los QR se guardan en disco con el UUID del docente como nombre, así
+que solo se generan una vez. La generación de QR faltantes y el dibujo del PDF
+(trabajo de CPU) se reparten en un pool de procesos; la consulta de docentes y
+la gestión del archivo final quedan en la tarea de ``tareas`` que los coordina.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from ..models import PersonalDocente
+from .dibujo_credenciales import dibujar_credenciales, generar_png_qr
+from .referencia import configuracion_institucion
+
+_lock = threading.Lock()
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # 'spawn' evita heredar hilos y conexiones abiertas del proceso web
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'CREDENCIALES_MAX_PROCESOS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def nombre_qr(id_qr):
+    return f'credenciales/qr/{id_qr}.png'
+
+
+def asegurar_qrs(ids_qr):
+    """Devuelve ``{id_qr: ruta}`` generando en el pool solo los PNG que faltan en disco."""
+    rutas = {id_qr: default_storage.path(nombre_qr(id_qr)) for id_qr in ids_qr}
+    faltantes = [id_qr for id_qr, ruta in rutas.items() if not os.path.exists(ruta)]
+    if faltantes:
+        list(_get_pool().map(generar_png_qr, [str(i) for i in faltantes], [rutas[i] for i in faltantes]))
+    return rutas
+
+
+def _ruta_archivo(campo):
+    try:
+        return campo.path if campo else None
+    except (ValueError, NotImplementedError):
+        return None
+
+
+def _datos_lote(docente_ids):
+    docentes = list(PersonalDocente.objects.filter(id__in=docente_ids).order_by('last_name', 'first_name', 'pk'))
+    configuracion = configuracion_institucion()
+    institucion = {
+        'nombre': configuracion.nombre_institucion,
+        'direccion': configuracion.direccion,
+        'logo': _ruta_archivo(configuracion.logo),
+    }
+    return docentes, institucion
+
+
+def nombre_lote(docente_ids):
+    """
+    Ruta en MEDIA_ROOT del PDF de un lote. La huella incluye los datos impresos,
+    de modo que editar un docente o la institución produce un archivo nuevo.
+    """
+    docentes, institucion = _datos_lote(docente_ids)
+    huella = repr((
+        sorted(institucion.items()),
+        [(d.pk, d.first_name, d.last_name, d.dni, str(d.id_qr), d.foto.name if d.foto else '') for d in docentes],
+    ))
+    return f"credenciales/lotes/credenciales_{len(docentes)}_{hashlib.sha1(huella.encode('utf-8')).hexdigest()[:16]}.pdf"
+
+
+def generar_lote_credenciales(nombre, docente_ids):
+    """Tarea de fondo: arma el PDF de credenciales del lote y lo guarda en ``nombre``."""
+    if not default_storage.exists(nombre):
+        docentes, institucion = _datos_lote(docente_ids)
+        qrs = asegurar_qrs([d.id_qr for d in docentes])
+        fichas = [
+            {
+                'nombre': f'{d.first_name} {d.last_name}',
+                'dni': d.dni,
+                'foto': _ruta_archivo(d.foto),
+                'qr': qrs[d.id_qr],
+            }
+            for d in docentes
+        ]
+        ruta = default_storage.path(nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Se dibuja en un temporal para que nadie sirva un PDF a medio escribir
+        _get_pool().submit(dibujar_credenciales, f'{ruta}.tmp', fichas, institucion).result()
+        os.replace(f'{ruta}.tmp', ruta)
+    return {'archivo': nombre, 'descarga': 'Credenciales_Docentes.pdf'}
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Dibujo de credenciales y códigos QR.
+
+Este módulo no depende de Django: recibe datos simples y rutas de archivo para
+poder ejecutarse en los procesos del pool de ``credenciales``.
+"""
+import os
+import tempfile
+
+import qrcode
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+# Tamaño CR80 en vertical, el mismo formato que la credencial HTML
+ANCHO_CREDENCIAL = 54 * mm
+ALTO_CREDENCIAL = 85.6 * mm
+MARGEN_PAGINA = 6 * mm
+SEPARACION = 4 * mm
+
+COLOR_FONDO = colors.HexColor('#2c2a4a')
+COLOR_ACENTO = colors.HexColor('#4f46e5')
+
+
+def generar_png_qr(texto, ruta):
+    """Genera el PNG del QR de ``texto`` en ``ruta`` (escritura atómica) y devuelve la ruta."""
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=2)
+    qr.add_data(texto)
+    qr.make(fit=True)
+    imagen = qr.make_image(fill_color='black', back_color='white')
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(ruta))
+    with os.fdopen(descriptor, 'wb') as archivo:
+        imagen.save(archivo, format='PNG')
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def disposicion(pagesize=letter):
+    """Columnas y filas de credenciales que entran en una página."""
+    ancho, alto = pagesize
+    columnas = int((ancho - 2 * MARGEN_PAGINA + SEPARACION) // (ANCHO_CREDENCIAL + SEPARACION))
+    filas = int((alto - 2 * MARGEN_PAGINA + SEPARACION) // (ALTO_CREDENCIAL + SEPARACION))
+    return max(columnas, 1), max(filas, 1)
+
+
+def _posiciones(pagesize, columnas, filas):
+    """Esquina inferior izquierda de cada celda, por filas de arriba hacia abajo y centradas."""
+    ancho, alto = pagesize
+    ancho_total = columnas * ANCHO_CREDENCIAL + (columnas - 1) * SEPARACION
+    alto_total = filas * ALTO_CREDENCIAL + (filas - 1) * SEPARACION
+    x0 = (ancho - ancho_total) / 2
+    y0 = (alto + alto_total) / 2 - ALTO_CREDENCIAL
+    return [
+        [(x0 + c * (ANCHO_CREDENCIAL + SEPARACION), y0 - f * (ALTO_CREDENCIAL + SEPARACION)) for c in range(columnas)]
+        for f in range(filas)
+    ]
+
+
+def _texto_centrado(c, texto, x, y, fuente, tamano, ancho_maximo, max_lineas=2):
+    """Escribe ``texto`` centrado en ``x`` partiéndolo en líneas; devuelve la ``y`` siguiente."""
+    lineas = simpleSplit(texto or '', fuente, tamano, ancho_maximo)[:max_lineas]
+    c.setFont(fuente, tamano)
+    for linea in lineas:
+        c.drawCentredString(x, y, linea)
+        y -= tamano * 1.2
+    return y
+
+
+def _imagen(c, ruta, x, y, ancho, alto):
+    if ruta and os.path.exists(ruta):
+        c.drawImage(ruta, x, y, width=ancho, height=alto, preserveAspectRatio=True, anchor='c', mask='auto')
+
+
+def _anverso(c, x, y, ficha, institucion):
+    centro = x + ANCHO_CREDENCIAL / 2
+    c.setFillColor(COLOR_FONDO)
+    c.roundRect(x, y, ANCHO_CREDENCIAL, ALTO_CREDENCIAL, 4 * mm, stroke=0, fill=1)
+
+    # Logo de la institución sobre una franja blanca
+    c.setFillColor(colors.white)
+    c.roundRect(x + 4 * mm, y + ALTO_CREDENCIAL - 18 * mm, ANCHO_CREDENCIAL - 8 * mm, 14 * mm, 2 * mm, stroke=0, fill=1)
+    _imagen(c, institucion.get('logo'), x + 6 * mm, y + ALTO_CREDENCIAL - 17 * mm, ANCHO_CREDENCIAL - 12 * mm, 12 * mm)
+
+    # Foto circular
+    lado = 30 * mm
+    fx, fy = centro - lado / 2, y + ALTO_CREDENCIAL - 52 * mm
+    c.saveState()
+    trazo = c.beginPath()
+    trazo.circle(centro, fy + lado / 2, lado / 2)
+    c.clipPath(trazo, stroke=0, fill=0)
+    c.setFillColor(colors.white)
+    c.rect(fx, fy, lado, lado, stroke=0, fill=1)
+    _imagen(c, ficha.get('foto'), fx, fy, lado, lado)
+    c.restoreState()
+    c.setStrokeColor(COLOR_ACENTO)
+    c.setLineWidth(1.5)
+    c.circle(centro, fy + lado / 2, lado / 2, stroke=1, fill=0)
+
+    c.setFillColor(colors.white)
+    siguiente = _texto_centrado(c, ficha.get('nombre'), centro, fy - 6 * mm, 'Helvetica-Bold', 10, ANCHO_CREDENCIAL - 6 * mm)
+    c.setFillColor(colors.HexColor('#c7d2fe'))
+    _texto_centrado(c, 'Docente', centro, siguiente - 1 * mm, 'Helvetica', 8, ANCHO_CREDENCIAL - 6 * mm, 1)
+
+    c.setFillColor(colors.white)
+    c.setFont('Helvetica-Bold', 8)
+    c.drawCentredString(centro, y + 5 * mm, f"ID: {ficha.get('dni', '')}")
+
+
+def _reverso(c, x, y, ficha, institucion):
+    centro = x + ANCHO_CREDENCIAL / 2
+    c.setFillColor(colors.white)
+    c.setStrokeColor(colors.HexColor('#d1d5db'))
+    c.setLineWidth(0.5)
+    c.roundRect(x, y, ANCHO_CREDENCIAL, ALTO_CREDENCIAL, 4 * mm, stroke=1, fill=1)
+
+    c.setFillColor(COLOR_FONDO)
+    _texto_centrado(c, 'Escanee para Asistencia', centro, y + ALTO_CREDENCIAL - 10 * mm, 'Helvetica-Bold', 9, ANCHO_CREDENCIAL - 6 * mm, 1)
+
+    lado = 40 * mm
+    _imagen(c, ficha.get('qr'), centro - lado / 2, y + ALTO_CREDENCIAL - 55 * mm, lado, lado)
+
+    c.setFillColor(colors.black)
+    siguiente = _texto_centrado(c, institucion.get('nombre'), centro, y + 22 * mm, 'Helvetica-Bold', 7, ANCHO_CREDENCIAL - 6 * mm)
+    c.setFillColor(colors.HexColor('#4b5563'))
+    _texto_centrado(c, institucion.get('direccion'), centro, siguiente, 'Helvetica', 6, ANCHO_CREDENCIAL - 6 * mm)
+
+
+def dibujar_credenciales(ruta_pdf, fichas, institucion, pagesize=letter):
+    """
+    Dibuja las credenciales de ``fichas`` en ``ruta_pdf``, varias por hoja.
+
+    Cada hoja de anversos va seguida de su hoja de reversos con las columnas en
+    espejo, de modo que al imprimir a doble cara cada QR cae detrás de su foto.
+    ``fichas`` son diccionarios con ``nombre``, ``dni``, ``foto`` y ``qr`` (rutas);
+    ``institucion`` trae ``nombre``, ``direccion`` y ``logo``.
+    """
+    columnas, filas = disposicion(pagesize)
+    posiciones = _posiciones(pagesize, columnas, filas)
+    por_hoja = columnas * filas
+
+    c = canvas.Canvas(ruta_pdf, pagesize=pagesize)
+    c.setTitle('Credenciales')
+    for inicio in range(0, len(fichas), por_hoja):
+        hoja = fichas[inicio:inicio + por_hoja]
+        for i, ficha in enumerate(hoja):
+            fila, columna = divmod(i, columnas)
+            _anverso(c, *posiciones[fila][columna], ficha, institucion)
+        c.showPage()
+        for i, ficha in enumerate(hoja):
+            fila, columna = divmod(i, columnas)
+            _reverso(c, *posiciones[fila][columnas - 1 - columna], ficha, institucion)
+        c.showPage()
+    c.save()
+    return ruta_pdf
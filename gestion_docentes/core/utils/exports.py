@@ -1,12 +1,26 @@
 # -*- coding: utf-8 -*-
-from django.http import HttpResponse
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+from django.db.models import FilteredRelation, OuterRef, Q, Subquery
 from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from reportlab.lib.pagesizes import letter, landscape
 from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from ..models import Docente, Asistencia, Curso, ConfiguracionInstitucion
+from ..models import AsistenciaDiaria, Curso
+from ..routers import lectura_en_replica, usar_replica
+from . import acumulados, tareas
+from .referencia import configuracion_institucion
+from .reportes import ReporteAsistencia, version_datos_reporte
 from io import BytesIO
 # Se quita urlopen porque ya no es necesario
 from django.utils import timezone
@@ -27,30 +41,33 @@ STYLES.add(ParagraphStyle(name='StatusAusente', parent=STYLES['TableCellCenter']
 
 class ReportePDFTemplate(BaseDocTemplate):
     def __init__(self, filename, **kwargs):
-        self.request = kwargs.pop('request', None)
         self.configuracion = kwargs.pop('configuracion', None)
         self.fecha_inicio = kwargs.pop('fecha_inicio', '')
         self.fecha_fin = kwargs.pop('fecha_fin', '')
         super().__init__(filename, **kwargs)
+        self.logo_bytes = self._leer_logo()
         self.page_count = 0
         frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
         template = PageTemplate(id='main_template', frames=[frame], onPage=self._draw_header_footer)
         self.addPageTemplates([template])
 
-    def _draw_header_footer(self, canvas, doc):
-        canvas.saveState()
-        
-        logo_img = Paragraph("AQUI VA EL LOGO", STYLES['Normal'])
-        
-        # --- CAMBIO: Se lee la imagen desde la ruta del archivo, no desde una URL ---
+    def _leer_logo(self):
+        # Se lee la imagen desde la ruta del archivo, no desde una URL
         if self.configuracion and self.configuracion.logo and hasattr(self.configuracion.logo, 'path'):
             try:
-                # Se usa la ruta directa del archivo, que es más confiable
-                logo_path = self.configuracion.logo.path
-                logo_img = Image(logo_path, width=1.2*inch, height=1.2*inch, hAlign='CENTER')
+                with open(self.configuracion.logo.path, 'rb') as logo_file:
+                    return logo_file.read()
             except Exception as e:
                 print(f"Error cargando logo para PDF desde la ruta: {e}")
-        # --- FIN DEL CAMBIO ---
+        return None
+
+    def _draw_header_footer(self, canvas, doc):
+        canvas.saveState()
+        
+        logo_img = Paragraph("AQUI VA EL LOGO", STYLES['Normal'])
+        if self.logo_bytes:
+            # El logo se leyó una sola vez del disco; ReportLab lo incrusta una vez en el PDF
+            logo_img = Image(BytesIO(self.logo_bytes), width=1.2*inch, height=1.2*inch, hAlign='CENTER')
 
         nombre_institucion = Paragraph(self.configuracion.nombre_institucion if self.configuracion else "Nombre de Institución", STYLES['InstitutionTitle'])
         if self.configuracion and self.configuracion.facultad:
@@ -82,38 +99,20 @@ class ReportePDFTemplate(BaseDocTemplate):
         if hasattr(flowable, 'style') and flowable.style.name == 'TableHeader':
             self.page_count = self.page
 
-# El resto del archivo (la función exportar_reporte_pdf) no necesita cambios
-# ... (todo el código desde la línea 'def exportar_reporte_pdf(request):' hasta el final se mantiene igual)
-# PEGAR AQUÍ EL RESTO DEL ARCHIVO exports.py QUE YA TIENES
-
+# --- Exportación a PDF en segundo plano ---
 
-# --- Función exportar_reporte_pdf (sin cambios) ---
-def exportar_reporte_pdf(request):
-    fecha_inicio = request.GET.get('fecha_inicio', '')
-    fecha_fin = request.GET.get('fecha_fin', '')
-    curso_id = request.GET.get('curso')
+def construir_reporte_pdf(destino, fecha_inicio, fecha_fin, curso_id=None):
+    """Dibuja el reporte de asistencia del periodo en ``destino`` (ruta o archivo)."""
+    reporte = ReporteAsistencia(fecha_inicio, fecha_fin, curso_id=curso_id)
+    curso_filtrado = Curso.objects.filter(id=curso_id).first() if curso_id else None
+    if curso_id and not curso_filtrado:
+        reporte.curso_id = None
+    docentes = list(reporte.docentes().prefetch_related('especialidades'))
 
-    asistencias_qs = Asistencia.objects.filter(fecha__range=[fecha_inicio, fecha_fin]).select_related('docente', 'curso')
-    
-    docentes = Docente.objects.all().order_by('last_name', 'first_name').prefetch_related('especialidades')
-    
-    curso_filtrado = None
-    if curso_id:
-        try:
-            curso_filtrado = Curso.objects.get(id=curso_id)
-            docentes_con_asistencia_en_curso_ids = asistencias_qs.filter(curso_id=curso_id).values_list('docente_id', flat=True).distinct()
-            docentes = docentes.filter(id__in=docentes_con_asistencia_en_curso_ids)
-        except Curso.DoesNotExist:
-            curso_id = None
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Reporte_Asistencia_{fecha_inicio}_a_{fecha_fin}.pdf"'
-    buffer = BytesIO()
-    
     template_kwargs = {
         'pagesize': landscape(letter), 'leftMargin': 0.5*inch, 'rightMargin': 0.5*inch,
-        'topMargin': 0.5*inch, 'bottomMargin': 0.5*inch, 'request': request,
-        'configuracion': ConfiguracionInstitucion.load(), 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin
+        'topMargin': 0.5*inch, 'bottomMargin': 0.5*inch,
+        'configuracion': configuracion_institucion(), 'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin
     }
     
     elements = [Spacer(1, 1.0*inch)]
@@ -137,10 +136,10 @@ def exportar_reporte_pdf(request):
     table_headers = ["Docente", "Especialidad", "Asistencia General", "Detalle de Asistencias por Curso"]
     table_data = [[Paragraph(txt, STYLES['TableHeader']) for txt in table_headers]]
     
-    for docente in docentes:
-        asistencias_docente = asistencias_qs.filter(docente=docente)
-        asistencia_general = asistencias_docente.filter(curso__isnull=True).first()
-        asistencias_cursos = list(asistencias_docente.filter(curso__isnull=False).select_related('curso'))
+    for fila in reporte.filas(docentes):
+        docente = fila['docente']
+        asistencia_general = fila['asistencia_general']
+        asistencias_cursos = fila['asistencias_cursos']
 
         especialidades_list = [esp.nombre for esp in docente.especialidades.all()]
         especialidades_str = ", ".join(especialidades_list) if especialidades_list else "No asignada"
@@ -158,6 +157,14 @@ def exportar_reporte_pdf(request):
                     entrada = f"Entrada: {asistencia_curso.hora_entrada.strftime('%H:%M')}"
                     salida = f"Salida: {asistencia_curso.hora_salida.strftime('%H:%M')}" if asistencia_curso.hora_salida else "Salida: --:--"
                     cursos_cells.append(Paragraph(f"• {asistencia_curso.curso.nombre} <i>({entrada} | {salida})</i>", STYLES['TableCellSmall']))
+        elif not reporte.detallado:
+            # En periodos largos se muestran los totales en lugar de cada marca
+            t = fila['totales']
+            cursos_cells.append(Paragraph(
+                f"{t['clases']} clases ({t['minutos_dictados']} min dictados) | "
+                f"{t['llegadas_tarde']} tardanzas ({t['minutos_tardanza']} min) | {t['salidas_faltantes']} sin salida",
+                STYLES['TableCellSmall'],
+            ))
         else:
             cursos_cells.append(Paragraph("Sin clases asignadas en el periodo.", STYLES['TableCellSmall']))
 
@@ -181,46 +188,213 @@ def exportar_reporte_pdf(request):
     ]))
     elements.append(table)
     
-    doc = ReportePDFTemplate(buffer, **template_kwargs)
+    doc = ReportePDFTemplate(destino, **template_kwargs)
     doc.build(elements)
 
-    response.write(buffer.getvalue())
-    buffer.close()
-    return response
 
-# --- Función de exportación a Excel (sin cambios) ---
+DIRECTORIO_PDF = 'reportes/pdf'
+
+
+def _prefijo_reporte_pdf(fecha_inicio, fecha_fin, curso_id):
+    return f"asistencia_{fecha_inicio}_{fecha_fin}_{curso_id or 'todos'}_"
+
+
+def _nombre_reporte_pdf(fecha_inicio, fecha_fin, curso_id):
+    """Ruta en MEDIA_ROOT del PDF cacheado para (periodo, curso, versión de datos)."""
+    version = version_datos_reporte(fecha_inicio, fecha_fin)
+    return f"{DIRECTORIO_PDF}/{_prefijo_reporte_pdf(fecha_inicio, fecha_fin, curso_id)}{version}.pdf"
+
+
+def _borrar_versiones_anteriores(nombre, fecha_inicio, fecha_fin, curso_id):
+    """Borra los PDF del mismo periodo y curso generados con datos ya superados."""
+    if nombre != _nombre_reporte_pdf(fecha_inicio, fecha_fin, curso_id):
+        # Los datos cambiaron mientras se generaba: este PDF también quedó superado
+        return
+    prefijo = _prefijo_reporte_pdf(fecha_inicio, fecha_fin, curso_id)
+    _, archivos = default_storage.listdir(DIRECTORIO_PDF)
+    for archivo in archivos:
+        ruta = f'{DIRECTORIO_PDF}/{archivo}'
+        if archivo.startswith(prefijo) and ruta != nombre:
+            default_storage.delete(ruta)
+
+
+def _nombre_descarga_pdf(fecha_inicio, fecha_fin):
+    return f"Reporte_Asistencia_{fecha_inicio}_a_{fecha_fin}.pdf"
+
+
+def _generar_reporte_pdf(nombre, fecha_inicio, fecha_fin, curso_id):
+    if not default_storage.exists(nombre):
+        buffer = BytesIO()
+        # La tarea corre en otro hilo, fuera del contexto de la vista
+        with usar_replica():
+            construir_reporte_pdf(buffer, fecha_inicio, fecha_fin, curso_id)
+        nombre = default_storage.save(nombre, ContentFile(buffer.getvalue()))
+        _borrar_versiones_anteriores(nombre, fecha_inicio, fecha_fin, curso_id)
+    return {'archivo': nombre, 'descarga': _nombre_descarga_pdf(fecha_inicio, fecha_fin)}
+
+
+def _respuesta_pdf(nombre, descarga):
+    return FileResponse(default_storage.open(nombre, 'rb'), as_attachment=True, filename=descarga, content_type='application/pdf')
+
+
+def _estado_tarea_pdf(tarea):
+    data = {'status': 'success', 'tarea': tarea.como_dict(), 'url_estado': reverse('estado_reporte_pdf', args=[tarea.id])}
+    if tarea.estado == tareas.COMPLETADA:
+        data['url_descarga'] = reverse('descargar_reporte_pdf', args=[tarea.id])
+    return data
+
+
+@staff_member_required
+@lectura_en_replica
+def exportar_reporte_pdf(request):
+    """
+    Devuelve el PDF si ya está generado para los mismos datos; si no, encola su
+    generación y responde 202 con la URL para consultar el estado.
+    """
+    fecha_inicio = request.GET.get('fecha_inicio', '')
+    fecha_fin = request.GET.get('fecha_fin', '')
+
+    try:
+        fechas_validas = parse_date(fecha_inicio) and parse_date(fecha_fin)
+    except ValueError:
+        fechas_validas = False
+    if not fechas_validas:
+        return JsonResponse({'status': 'error', 'message': 'Debe indicar un rango de fechas válido.'}, status=400)
+    try:
+        curso_id = int(request.GET['curso']) if request.GET.get('curso') else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'El curso debe ser un número entero.'}, status=400)
+
+    nombre = _nombre_reporte_pdf(fecha_inicio, fecha_fin, curso_id)
+    if default_storage.exists(nombre):
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'status': 'success', 'url_descarga': request.get_full_path()})
+        return _respuesta_pdf(nombre, _nombre_descarga_pdf(fecha_inicio, fecha_fin))
+
+    tarea = tareas.encolar(_generar_reporte_pdf, nombre, fecha_inicio, fecha_fin, curso_id, clave=nombre)
+    return JsonResponse(_estado_tarea_pdf(tarea), status=202)
+
+
+@staff_member_required
+def estado_reporte_pdf(request, tarea_id):
+    tarea = tareas.obtener(tarea_id)
+    if not tarea:
+        return JsonResponse({'status': 'error', 'message': 'Tarea no encontrada.'}, status=404)
+    return JsonResponse(_estado_tarea_pdf(tarea))
+
+
+@staff_member_required
+def descargar_reporte_pdf(request, tarea_id):
+    tarea = tareas.obtener(tarea_id)
+    # El archivo pudo borrarse si los datos cambiaron después (o con limpiar_reportes)
+    if not tarea or tarea.estado != tareas.COMPLETADA or not default_storage.exists(tarea.resultado['archivo']):
+        raise Http404("El reporte no está disponible.")
+    return _respuesta_pdf(tarea.resultado['archivo'], tarea.resultado['descarga'])
+
+# --- Exportación a Excel en modo streaming ---
+
+EXCEL_CHUNK_SIZE = 64 * 1024
+# Hasta este tamaño el libro se arma en memoria; los más grandes pasan a disco
+EXCEL_EN_MEMORIA = 8 * 1024 * 1024
+COLUMNAS_TOTALES = {
+    'dias_presente': "Días Presente",
+    'clases': "Clases",
+    'minutos_dictados': "Minutos Dictados",
+    'llegadas_tarde': "Tardanzas",
+    'minutos_tardanza': "Minutos de Tardanza",
+    'salidas_faltantes': "Salidas sin Marcar",
+}
+
+
+def _hora_local(valor):
+    return timezone.localtime(valor).strftime('%H:%M') if valor else None
+
+
+def _filas_reporte_excel(fecha_inicio, fecha_fin, estado, curso_id):
+    """
+    Recorre un único cursor (docentes LEFT JOIN asistencias del periodo) y
+    produce una fila de Excel por docente a medida que se lee.
+    """
+    primera_entrada_general = AsistenciaDiaria.objects.filter(
+        docente=OuterRef('pk'), fecha__range=[fecha_inicio, fecha_fin]
+    ).order_by('hora_entrada').values('hora_entrada')[:1]
+
+    cursor = ReporteAsistencia(fecha_inicio, fecha_fin, estado=estado, curso_id=curso_id).docentes().annotate(
+        entrada_general=Subquery(primera_entrada_general),
+        asis=FilteredRelation('asistencia', condition=Q(asistencia__fecha__range=[fecha_inicio, fecha_fin])),
+    ).order_by(
+        'last_name', 'first_name', 'pk', 'asis__fecha', 'asis__hora_entrada'
+    ).values_list(
+        'pk', 'last_name', 'first_name', 'dni', 'entrada_general',
+        'asis__curso__nombre', 'asis__hora_entrada', 'asis__hora_salida',
+    ).iterator(chunk_size=2000)
+
+    totales = acumulados.totales_periodo(fecha_inicio, fecha_fin)
+    vacio = dict.fromkeys(('dias_presente',) + acumulados.CAMPOS, 0)
+
+    for docente_id, registros in groupby(cursor, key=itemgetter(0)):
+        cursos_list = []
+        for _, last_name, first_name, dni, entrada_general, curso_nombre, hora_entrada, hora_salida in registros:
+            if hora_entrada:
+                salida = _hora_local(hora_salida) or '--:--'
+                cursos_list.append(f"{curso_nombre} (Entrada: {_hora_local(hora_entrada)}, Salida: {salida})")
+        asistencia_general_str = f"Presente ({_hora_local(entrada_general)})" if entrada_general else "Ausente"
+        cursos_str = " | ".join(cursos_list) if cursos_list else "N/A"
+        total = totales.get(docente_id, vacio)
+        yield [f"{last_name}, {first_name}", dni, asistencia_general_str, cursos_str] + [total[campo] for campo in COLUMNAS_TOTALES]
+
+
+def _leer_por_bloques(archivo):
+    try:
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(EXCEL_CHUNK_SIZE)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
+
+
+@lectura_en_replica
 def exportar_reporte_excel(request):
-    fecha_inicio = request.GET.get('fecha_inicio')
-    fecha_fin = request.GET.get('fecha_fin')
-    curso_id = request.GET.get('curso')
-    asistencias_qs = Asistencia.objects.filter(fecha__range=[fecha_inicio, fecha_fin]).select_related('docente', 'curso')
-    docentes = Docente.objects.all().order_by('last_name', 'first_name')
-    if curso_id:
-        docentes_con_asistencia_en_curso_ids = asistencias_qs.filter(curso_id=curso_id).values_list('docente_id', flat=True).distinct()
-        docentes = docentes.filter(id__in=docentes_con_asistencia_en_curso_ids)
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    """
+    Exporta el reporte a XLSX sin mantener el libro en memoria.
+
+    Las filas se escriben en una hoja write-only (openpyxl las vuelca a disco)
+    mientras se recorre el cursor; el libro se guarda en un archivo temporal
+    que queda en memoria si es pequeño y se envía por bloques con un
+    StreamingHttpResponse.
+    """
+    fecha_inicio = request.GET.get('fecha_inicio', '')
+    fecha_fin = request.GET.get('fecha_fin', '')
+    estado = request.GET.get('estado', 'todos')
+
+    try:
+        fechas_validas = parse_date(fecha_inicio) and parse_date(fecha_fin)
+    except ValueError:
+        fechas_validas = False
+    if not fechas_validas:
+        return JsonResponse({'status': 'error', 'message': 'Debe indicar un rango de fechas válido.'}, status=400)
+    try:
+        curso_id = int(request.GET['curso']) if request.GET.get('curso') else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'El curso debe ser un número entero.'}, status=400)
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title="Reporte de Asistencia")
+    worksheet.append(["Docente", "DNI", "Asistencia General", "Detalle de Cursos"] + list(COLUMNAS_TOTALES.values()))
+    for fila in _filas_reporte_excel(fecha_inicio, fecha_fin, estado, curso_id):
+        # openpyxl rechaza los caracteres de control que XML no admite
+        worksheet.append([ILLEGAL_CHARACTERS_RE.sub('', valor) if isinstance(valor, str) else valor for valor in fila])
+
+    archivo = tempfile.SpooledTemporaryFile(max_size=EXCEL_EN_MEMORIA)
+    workbook.save(archivo)
+
+    response = StreamingHttpResponse(
+        _leer_por_bloques(archivo),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
     response['Content-Disposition'] = f'attachment; filename="Reporte_Asistencia_{fecha_inicio}_a_{fecha_fin}.xlsx"'
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Reporte de Asistencia"
-    headers = ["Docente", "DNI", "Asistencia General", "Detalle de Cursos"]
-    worksheet.append(headers)
-    for docente in docentes:
-        asistencias_docente = asistencias_qs.filter(docente=docente)
-        asistencia_general = asistencias_docente.filter(curso__isnull=True).first()
-        asistencias_cursos = asistencias_docente.filter(curso__isnull=False)
-        asistencia_general_str = "Ausente"
-        if asistencia_general:
-            asistencia_general_str = f"Presente ({asistencia_general.hora_entrada.strftime('%H:%M')})"
-        cursos_list = []
-        for asistencia_curso in asistencias_cursos:
-            if asistencia_curso.hora_entrada:
-                entrada = asistencia_curso.hora_entrada.strftime('%H:%M')
-                salida = asistencia_curso.hora_salida.strftime('%H:%M') if asistencia_curso.hora_salida else '--:--'
-                cursos_list.append(f"{asistencia_curso.curso.nombre} (Entrada: {entrada}, Salida: {salida})")
-        cursos_str = "N/A"
-        if cursos_list:
-            cursos_str = " | ".join(cursos_list)
-        worksheet.append([f"{docente.last_name}, {docente.first_name}", docente.dni, asistencia_general_str, cursos_str])
-    workbook.save(response)
-    return response
\ No newline at end of file
+    response['Content-Length'] = archivo.tell()
+    return response
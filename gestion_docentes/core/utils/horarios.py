@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Parrillas de horario precalculadas.
+
+Las parrillas franja × día de ``ver_horarios`` y ``vista_publica_horarios`` se
+guardan en la caché como diccionarios simples, con el sello compartido
+``horarios`` en la clave (ver ``versiones``). Las señales de ``Curso``,
+``FranjaHoraria`` y afines renuevan el sello, por lo que una página ya
+calculada no vuelve a consultar la tabla de cursos hasta que cambia algún
+horario en cualquier proceso. La expiración de una hora solo acota lo que
+dura un cambio hecho sin señales (p. ej. un ``update()`` en la consola).
+"""
+from django.core.cache import cache
+
+from ..models import Curso
+from ..routers import usar_primario
+from . import versiones
+from .ocupacion import DIAS_SEMANA, Rejilla
+from .referencia import franjas_horarias
+
+HORARIOS_CACHE_SEGUNDOS = 60 * 60
+
+_SELLO = 'horarios'
+
+
+def version_horarios():
+    return versiones.sello(_SELLO)
+
+
+def invalidar_horarios():
+    versiones.invalidar(_SELLO)
+
+
+def _franja_como_dict(franja):
+    return {'id': franja.id, 'turno': franja.turno, 'hora_inicio': franja.hora_inicio, 'hora_fin': franja.hora_fin}
+
+
+def _curso_como_dict(curso):
+    return {
+        'id': curso.id,
+        'nombre': curso.nombre,
+        'tipo_curso': curso.tipo_curso,
+        'duracion_bloques': curso.duracion_bloques,
+        'semestre_cursado': curso.semestre_cursado,
+        'docente_id': curso.docente_id,
+        'docente': str(curso.docente) if curso.docente_id else None,
+    }
+
+
+def construir_parrilla(cursos, rejilla):
+    """
+    Parrilla ``{franja_id: {dia: curso | 'OCUPADO' | None}}``. El curso va en
+    su franja de inicio y las franjas siguientes que ocupa quedan 'OCUPADO'.
+    """
+    grid = {franja.id: {dia: None for dia in DIAS_SEMANA} for franja in rejilla.franjas}
+    for curso in cursos:
+        start_index = rejilla.indice_por_hora.get(curso.horario_inicio)
+        # Si un curso tiene una hora de inicio que no coincide con ninguna franja, lo omitimos
+        if start_index is None or curso.dia not in rejilla.indice_dia:
+            continue
+        grid[rejilla.franjas[start_index].id][curso.dia] = _curso_como_dict(curso)
+        for franja in rejilla.franjas[start_index + 1 : start_index + curso.duracion_bloques]:
+            grid[franja.id][curso.dia] = 'OCUPADO'
+    return grid
+
+
+def _cacheado(clave, construir):
+    clave = f'horarios:{version_horarios()}:{clave}'
+    datos = cache.get(clave)
+    if datos is None:
+        with usar_primario():
+            datos = construir()
+        cache.set(clave, datos, HORARIOS_CACHE_SEGUNDOS)
+    return datos
+
+
+def horario_carrera(semestre_id, carrera_id):
+    """``{'franjas': [...], 'grid': parrilla}`` de los cursos programados de una carrera."""
+    def construir():
+        rejilla = Rejilla(franjas_horarias())
+        cursos = Curso.objects.filter(
+            carrera_id=carrera_id, semestre_id=semestre_id, dia__isnull=False, horario_inicio__isnull=False,
+        ).select_related('docente').order_by('dia', 'horario_inicio')
+        return {
+            'franjas': [_franja_como_dict(f) for f in rejilla.franjas],
+            'grid': construir_parrilla(cursos, rejilla),
+        }
+    return _cacheado(f'carrera:{semestre_id}:{carrera_id}', construir)
+
+
+def horario_especialidad(semestre_id, especialidad_id, grupo_id):
+    """
+    ``{'franjas': [...], 'por_semestre_cursado': {n: parrilla}}`` con los cursos
+    de la especialidad y los generales de su grupo, en una sola consulta.
+    """
+    def construir():
+        rejilla = Rejilla(franjas_horarias())
+        filtro = Curso.objects.filter(especialidad_id=especialidad_id)
+        if grupo_id:
+            filtro = filtro | Curso.objects.filter(tipo_curso='GENERAL', especialidad__grupo_id=grupo_id)
+        cursos = filtro.filter(semestre_id=semestre_id, dia__isnull=False).select_related('docente').order_by('semestre_cursado', 'pk')
+
+        por_semestre = {}
+        for curso in cursos:
+            por_semestre.setdefault(curso.semestre_cursado, []).append(curso)
+        return {
+            'franjas': [_franja_como_dict(f) for f in rejilla.franjas],
+            'por_semestre_cursado': {
+                semestre_num: construir_parrilla(cursos_del_semestre, rejilla)
+                for semestre_num, cursos_del_semestre in por_semestre.items()
+            },
+        }
+    return _cacheado(f'especialidad:{semestre_id}:{especialidad_id}:{grupo_id}', construir)
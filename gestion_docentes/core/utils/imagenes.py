@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Procesamiento de las fotos de verificación del kiosco.
+
+Las fotos se guardan tal como llegan para responder de inmediato al kiosco; la
+recompresión a JPEG y la miniatura se generan después en la cola de tareas.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+FOTO_MAX_BYTES = 5 * 1024 * 1024
+FOTO_MAX_LADO = 1280
+FOTO_CALIDAD = 80
+MINIATURA_LADO = 240
+FORMATOS_PERMITIDOS = {'image/jpeg': 'jpg', 'image/webp': 'webp'}
+_FORMATOS_PILLOW = {'image/jpeg': 'JPEG', 'image/webp': 'WEBP'}
+
+
+def nombre_miniatura(nombre):
+    """Ruta de la miniatura asociada a una foto ya procesada."""
+    return f"{os.path.splitext(nombre)[0]}_mini.jpg"
+
+
+def verificar_foto(archivo, content_type):
+    """
+    Comprueba con Pillow que ``archivo`` es de verdad una imagen del tipo
+    declarado, antes de guardarlo; lanza ``ValueError`` si no lo es. Solo lee
+    la cabecera y la estructura del archivo, sin decodificar los píxeles.
+    """
+    try:
+        archivo.seek(0)
+        with Image.open(archivo, formats=[_FORMATOS_PILLOW[content_type]]) as imagen:
+            imagen.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValueError('El archivo no es una imagen JPEG o WebP válida.')
+    finally:
+        archivo.seek(0)
+
+
+def _como_jpeg(imagen, lado_maximo, calidad):
+    copia = imagen.copy()
+    copia.thumbnail((lado_maximo, lado_maximo))
+    buffer = BytesIO()
+    copia.save(buffer, format='JPEG', quality=calidad, optimize=True)
+    return buffer.getvalue()
+
+
+def procesar_foto_verificacion(modelo, pk, campo):
+    """
+    Recomprime la foto ``campo`` del registro ``modelo(pk)`` a JPEG y genera su
+    miniatura. Se ejecuta fuera de la petición mediante ``core.utils.tareas``.
+    """
+    instancia = modelo.objects.filter(pk=pk).first()
+    archivo = getattr(instancia, campo, None) if instancia else None
+    if not archivo:
+        return None
+
+    nombre_original = archivo.name
+    with archivo.open('rb') as original:
+        imagen = ImageOps.exif_transpose(Image.open(original))
+        imagen = imagen.convert('RGB')
+
+    contenido = _como_jpeg(imagen, FOTO_MAX_LADO, FOTO_CALIDAD)
+    miniatura = _como_jpeg(imagen, MINIATURA_LADO, FOTO_CALIDAD)
+
+    base = os.path.splitext(os.path.basename(nombre_original))[0]
+    archivo.save(f"{base}.jpg", ContentFile(contenido), save=False)
+    modelo.objects.filter(pk=pk).update(**{campo: archivo.name})
+    archivo.storage.save(nombre_miniatura(archivo.name), ContentFile(miniatura))
+
+    if archivo.name != nombre_original:
+        archivo.storage.delete(nombre_original)
+    return archivo.name
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Importación masiva de un semestre desde archivos CSV o XLSX.
+
+Los archivos se leen fila a fila (``csv`` o ``openpyxl`` en modo solo lectura)
+y cada fila se valida en memoria contra diccionarios precargados con lo que ya
+existe en la base: no se hace ninguna consulta por fila. Las filas crean o
+actualizan objetos que solo se escriben al final, con ``bulk_create`` /
+``bulk_update`` en lotes, y únicamente si no hubo ningún error.
+
+Claves con las que se reconoce un registro existente:
+- Franja: turno + hora de inicio.
+- Especialidad, grupo y carrera: nombre (sin distinguir mayúsculas ni tildes).
+- Docente: DNI.
+- Curso: nombre + especialidad + semestre cursado, dentro del semestre.
+"""
+import csv
+import os
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime, time
+from functools import lru_cache
+from types import SimpleNamespace
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from openpyxl import load_workbook
+
+from ..models import Carrera, Curso, Docente, Especialidad, FranjaHoraria, Grupo
+from .ocupacion import DIAS_SEMANA, MapaOcupacion, Rejilla
+
+LOTE = 1000
+
+COLUMNAS = {
+    'franjas': ('turno', 'hora_inicio', 'hora_fin'),
+    'especialidades': ('nombre',),
+    'docentes': ('dni', 'nombres', 'apellidos'),
+    'cursos': ('nombre', 'carrera', 'especialidad'),
+}
+
+MOTIVOS_CRUCE = {
+    'DISPONIBILIDAD': 'está fuera de la disponibilidad del docente',
+    'DOCENTE': 'el docente ya dicta "{otro}" a esa hora',
+    'GRUPO': 'se cruza con "{otro}" del mismo grupo',
+}
+
+
+class ErrorDeFila(ValueError):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def _clave(texto):
+    """Forma normalizada de un nombre: sin tildes, sin mayúsculas y con espacios simples."""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.split()).casefold()
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (datetime, time)):
+        return valor.strftime('%H:%M')
+    if isinstance(valor, float) and valor.is_integer():
+        # Excel guarda los DNI y los números como float
+        return str(int(valor))
+    return str(valor).strip()
+
+
+def leer_filas(ruta):
+    """Genera ``(número de fila, dict)`` de un CSV o XLSX, con las cabeceras normalizadas."""
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == '.xlsx':
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            cabeceras = [_clave(_texto(c)).replace(' ', '_') for c in next(filas, ())]
+            for numero, valores in enumerate(filas, 2):
+                fila = {c: _texto(v) for c, v in zip(cabeceras, valores) if c}
+                if any(fila.values()):
+                    yield numero, fila
+        finally:
+            libro.close()
+    elif extension == '.csv':
+        with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+            try:
+                dialecto = csv.Sniffer().sniff(archivo.read(4096), delimiters=',;\t')
+            except csv.Error:
+                dialecto = csv.excel
+            archivo.seek(0)
+            lector = csv.reader(archivo, dialecto)
+            cabeceras = [_clave(c).replace(' ', '_') for c in next(lector, [])]
+            for numero, valores in enumerate(lector, 2):
+                fila = {c: v.strip() for c, v in zip(cabeceras, valores) if c}
+                if any(fila.values()):
+                    yield numero, fila
+    else:
+        raise ValueError(f'{ruta}: solo se admiten archivos .csv o .xlsx.')
+
+
+def _opcion(valor, opciones, campo):
+    """Código de ``opciones`` que coincide con ``valor`` por código o por etiqueta."""
+    buscado = _clave(valor)
+    for codigo, etiqueta in opciones:
+        if buscado in (_clave(codigo), _clave(etiqueta)):
+            return codigo
+    raise ErrorDeFila(f'{campo} "{valor}" no es válido.')
+
+
+def _hora(valor, campo):
+    for formato in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(valor, formato).time()
+        except ValueError:
+            pass
+    raise ErrorDeFila(f'{campo} "{valor}" no es una hora válida (HH:MM).')
+
+
+def _entero(valor, campo, minimo=None, maximo=None):
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorDeFila(f'{campo} "{valor}" no es un número entero.')
+    if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+        raise ErrorDeFila(f'{campo} debe estar entre {minimo} y {maximo}.')
+    return numero
+
+
+class Importador:
+    """
+    Acumula en memoria lo que hay que crear o actualizar. Las filas de un
+    archivo pueden referirse a objetos creados por un archivo anterior (por eso
+    se importan en el orden franjas, especialidades, docentes, cursos).
+    """
+
+    def __init__(self, semestre, lote=LOTE, password=None):
+        self.semestre = semestre
+        self.lote = lote
+        # Un solo hash para todos los docentes nuevos; sin contraseña quedan sin acceso hasta que se les asigne
+        self.password = make_password(password) if password else None
+        self.errores = []
+        self.creados = Counter()
+        self.actualizados = Counter()
+        self.nuevos = defaultdict(list)
+        self.modificados = defaultdict(dict)
+        self.campos = defaultdict(set)
+        self.enlaces = []
+        self.docentes_afectados = set()
+        self.cursos_importados = {}
+
+        grupos = {g.pk: g for g in Grupo.objects.all()}
+        self.grupos = {_clave(g.nombre): g for g in grupos.values()}
+        self.carreras = {_clave(c.nombre): c for c in Carrera.objects.all()}
+        especialidades = {}
+        for especialidad in Especialidad.objects.all():
+            especialidad.grupo = grupos.get(especialidad.grupo_id)
+            especialidades[especialidad.pk] = especialidad
+        self.especialidades = {_clave(e.nombre): e for e in especialidades.values()}
+        self.franjas = {(f.turno, f.hora_inicio): f for f in FranjaHoraria.objects.all()}
+
+        docentes = {d.pk: d for d in Docente.objects.only('dni', 'username', 'first_name', 'last_name', 'email', 'disponibilidad')}
+        self.docentes = {d.dni: d for d in docentes.values()}
+        self.usuarios = {d.username: d for d in docentes.values()}
+
+        # Los cursos del semestre apuntan a los mismos objetos de los diccionarios
+        self.cursos = {}
+        for curso in (Curso.objects.filter(semestre=semestre) if semestre.pk else ()):
+            curso.docente = docentes.get(curso.docente_id)
+            curso.especialidad = especialidades.get(curso.especialidad_id)
+            self.cursos[self._clave_curso(curso.nombre, curso.especialidad, curso.semestre_cursado)] = curso
+
+    # --- Registro de cambios ---
+
+    def _error(self, archivo, numero, mensaje):
+        self.errores.append(f'{os.path.basename(archivo)}, fila {numero}: {mensaje}')
+
+    def _crear(self, objeto):
+        self.nuevos[type(objeto)].append(objeto)
+        self.creados[type(objeto).__name__] += 1
+        return objeto
+
+    def _asignar(self, objeto, **valores):
+        """Asigna los valores y, si el objeto ya existía y alguno cambió, lo marca para ``bulk_update``."""
+        cambiados = []
+        for campo, valor in valores.items():
+            campo_modelo = objeto._meta.get_field(campo)
+            if campo_modelo.is_relation:
+                actual = getattr(objeto, campo_modelo.attname)
+                distinto = (valor is None) != (actual is None) or (valor is not None and valor.pk != actual)
+            else:
+                distinto = getattr(objeto, campo) != valor
+            if distinto:
+                setattr(objeto, campo, valor)
+                cambiados.append(campo)
+        if objeto.pk and cambiados:
+            modelo = type(objeto)
+            if objeto.pk not in self.modificados[modelo]:
+                self.actualizados[modelo.__name__] += 1
+            self.modificados[modelo][objeto.pk] = objeto
+            self.campos[modelo].update(cambiados)
+
+    def _procesar(self, archivo, tipo, procesar_fila):
+        vistos = {}
+        for numero, fila in leer_filas(archivo):
+            faltantes = [c for c in COLUMNAS[tipo] if not fila.get(c)]
+            if faltantes:
+                self._error(archivo, numero, f'faltan {", ".join(faltantes)}.')
+                continue
+            try:
+                clave = procesar_fila(fila, numero)
+            except ErrorDeFila as error:
+                self._error(archivo, numero, str(error))
+                continue
+            if clave in vistos:
+                self._error(archivo, numero, f'repite la fila {vistos[clave]}.')
+            vistos[clave] = numero
+
+    # --- Archivos ---
+
+    def importar_franjas(self, archivo):
+        def fila_franja(fila, numero):
+            turno = _opcion(fila['turno'], FranjaHoraria.TURNO_CHOICES, 'Turno')
+            inicio, fin = _hora(fila['hora_inicio'], 'Hora de inicio'), _hora(fila['hora_fin'], 'Hora de fin')
+            if fin <= inicio:
+                raise ErrorDeFila('La hora de fin debe ser posterior a la de inicio.')
+            franja = self.franjas.get((turno, inicio))
+            if franja is None:
+                franja = self.franjas[(turno, inicio)] = self._crear(FranjaHoraria(turno=turno, hora_inicio=inicio, hora_fin=fin))
+            else:
+                self._asignar(franja, hora_fin=fin)
+            return turno, inicio
+        self._procesar(archivo, 'franjas', fila_franja)
+
+    def _grupo(self, nombre):
+        if not nombre:
+            return None
+        grupo = self.grupos.get(_clave(nombre))
+        if grupo is None:
+            grupo = self.grupos[_clave(nombre)] = self._crear(Grupo(nombre=nombre[:100]))
+        return grupo
+
+    def _carrera(self, nombre):
+        carrera = self.carreras.get(_clave(nombre))
+        if carrera is None:
+            carrera = self.carreras[_clave(nombre)] = self._crear(Carrera(nombre=nombre[:100]))
+        return carrera
+
+    def importar_especialidades(self, archivo):
+        def fila_especialidad(fila, numero):
+            clave = _clave(fila['nombre'])
+            grupo = self._grupo(fila.get('grupo'))
+            especialidad = self.especialidades.get(clave)
+            if especialidad is None:
+                self.especialidades[clave] = self._crear(Especialidad(nombre=fila['nombre'][:100], grupo=grupo))
+            elif grupo is not None:
+                self._asignar(especialidad, grupo=grupo)
+            return clave
+        self._procesar(archivo, 'especialidades', fila_especialidad)
+
+    def importar_docentes(self, archivo):
+        def fila_docente(fila, numero):
+            dni = fila['dni']
+            if dni.isdigit() and len(dni) < 8:
+                dni = dni.zfill(8)
+            if not (dni.isdigit() and len(dni) == 8):
+                raise ErrorDeFila(f'DNI "{fila["dni"]}" debe tener 8 dígitos.')
+            usuario = fila.get('usuario') or dni
+            otro = self.usuarios.get(usuario)
+            if otro is not None and otro.dni != dni:
+                raise ErrorDeFila(f'El usuario "{usuario}" ya pertenece al DNI {otro.dni}.')
+            email = fila.get('email', '')
+            if email:
+                try:
+                    validate_email(email)
+                except ValidationError:
+                    raise ErrorDeFila(f'Email "{email}" no es válido.')
+            valores = {'first_name': fila['nombres'][:150], 'last_name': fila['apellidos'][:150], 'email': email}
+            if fila.get('disponibilidad'):
+                valores['disponibilidad'] = _opcion(fila['disponibilidad'], Docente.DISPONIBILIDAD_CHOICES, 'Disponibilidad')
+            especialidades = []
+            for nombre in filter(None, (n.strip() for n in fila.get('especialidades', '').split(';'))):
+                if _clave(nombre) not in self.especialidades:
+                    raise ErrorDeFila(f'La especialidad "{nombre}" no existe.')
+                especialidades.append(self.especialidades[_clave(nombre)])
+
+            docente = self.docentes.get(dni)
+            if docente is None:
+                docente = self._crear(Docente(username=usuario, dni=dni, **valores))
+                if self.password:
+                    docente.password = self.password
+                else:
+                    docente.set_unusable_password()
+                self.docentes[dni] = self.usuarios[usuario] = docente
+            else:
+                self._asignar(docente, **valores)
+            self.enlaces.extend((docente, especialidad) for especialidad in especialidades)
+            return dni
+        self._procesar(archivo, 'docentes', fila_docente)
+
+    def _clave_curso(self, nombre, especialidad, semestre_cursado):
+        return _clave(nombre), id(especialidad), semestre_cursado
+
+    def importar_cursos(self, archivo):
+        rejilla = Rejilla(sorted(self.franjas.values(), key=lambda f: f.hora_inicio))
+
+        def fila_curso(fila, numero):
+            especialidad = self.especialidades.get(_clave(fila['especialidad']))
+            if especialidad is None:
+                raise ErrorDeFila(f'La especialidad "{fila["especialidad"]}" no existe.')
+            semestre_cursado = _entero(fila['semestre_cursado'], 'Semestre cursado', 1, 10) if fila.get('semestre_cursado') else None
+            valores = {
+                'carrera': self._carrera(fila['carrera']),
+                'tipo_curso': _opcion(fila['tipo_curso'], Curso.TIPO_CURSO_CHOICES, 'Tipo de curso') if fila.get('tipo_curso') else 'ESPECIALIDAD',
+                'duracion_bloques': _entero(fila['duracion_bloques'], 'Duración', 1, rejilla.n_franjas) if fila.get('duracion_bloques') else 2,
+            }
+            dni = fila.get('docente_dni', '')
+            if dni:
+                dni = dni.zfill(8) if dni.isdigit() else dni
+                if dni not in self.docentes:
+                    raise ErrorDeFila(f'No hay un docente con DNI {dni}.')
+                valores['docente'] = self.docentes[dni]
+            # El horario es opcional; si no viene, un curso existente conserva el suyo
+            if fila.get('dia') or fila.get('hora_inicio'):
+                if not (fila.get('dia') and fila.get('hora_inicio')):
+                    raise ErrorDeFila('Indique el día y la hora de inicio, o ninguno de los dos.')
+                dia = _opcion(fila['dia'], [(d, d) for d in DIAS_SEMANA], 'Día')
+                indice = rejilla.indice_por_hora.get(_hora(fila['hora_inicio'], 'Hora de inicio'))
+                if indice is None:
+                    raise ErrorDeFila(f'La hora {fila["hora_inicio"]} no es el inicio de ninguna franja.')
+                if rejilla.bloque(dia, indice, valores['duracion_bloques']) is None:
+                    raise ErrorDeFila('El curso no entra en las franjas que quedan en el día.')
+                valores.update(
+                    dia=dia, horario_inicio=rejilla.franjas[indice].hora_inicio,
+                    horario_fin=rejilla.franjas[indice + valores['duracion_bloques'] - 1].hora_fin,
+                )
+
+            clave = self._clave_curso(fila['nombre'], especialidad, semestre_cursado)
+            curso = self.cursos.get(clave)
+            if curso is None:
+                curso = self.cursos[clave] = self._crear(Curso(
+                    nombre=fila['nombre'][:100], especialidad=especialidad, semestre=self.semestre,
+                    semestre_cursado=semestre_cursado, **valores,
+                ))
+            else:
+                self.docentes_afectados.add(curso.docente_id)
+                self._asignar(curso, **valores)
+            self.cursos_importados[id(curso)] = (curso, numero, archivo)
+            return clave
+
+        self._procesar(archivo, 'cursos', fila_curso)
+        self._validar_cruces(rejilla)
+
+    def _validar_cruces(self, rejilla):
+        """Comprueba que los horarios importados no se crucen entre sí ni con los cursos que ya estaban."""
+        def vista(curso):
+            # Los objetos nuevos aún no tienen pk: se identifican por el objeto en memoria
+            especialidad = curso.especialidad
+            return SimpleNamespace(
+                id=id(curso), docente_id=id(curso.docente) if curso.docente else None, docente=curso.docente,
+                tipo_curso=curso.tipo_curso, semestre_cursado=curso.semestre_cursado,
+                especialidad_id=id(especialidad) if especialidad else None,
+                especialidad=SimpleNamespace(grupo_id=id(especialidad.grupo) if especialidad and especialidad.grupo else None),
+            )
+
+        mapa = MapaOcupacion(rejilla)
+        por_id = {id(curso): curso for curso in self.cursos.values()}
+        for curso in self.cursos.values():
+            if curso.dia and id(curso) not in self.cursos_importados:
+                mapa.ocupar(vista(curso), rejilla.mascara_curso(curso))
+        for curso, numero, archivo in self.cursos_importados.values():
+            if not curso.dia:
+                continue
+            mascara = rejilla.mascara_curso(curso)
+            conflicto = mapa.conflicto(vista(curso), mascara)
+            if conflicto:
+                motivo, otro = conflicto
+                self._error(archivo, numero, f'"{curso.nombre}" {MOTIVOS_CRUCE[motivo].format(otro=por_id[otro].nombre if otro else "")}.')
+            else:
+                mapa.ocupar(vista(curso), mascara)
+
+    # --- Escritura ---
+
+    def _en_lotes(self, operacion, objetos):
+        for inicio in range(0, len(objetos), self.lote):
+            with transaction.atomic():
+                operacion(objetos[inicio:inicio + self.lote])
+
+    def guardar(self):
+        """Escribe todo lo acumulado. Cada lote va en su propia transacción."""
+        for modelo in (Grupo, Carrera, Especialidad, FranjaHoraria, Docente, Curso):
+            # bulk_create completa el pk de cada objeto, y los objetos que lo referencian lo toman al guardarse
+            self._en_lotes(modelo.objects.bulk_create, self.nuevos[modelo])
+            campos = sorted(self.campos[modelo])
+            self._en_lotes(lambda lote: modelo.objects.bulk_update(lote, campos), list(self.modificados[modelo].values()))
+
+        Enlace = Docente.especialidades.through
+        enlaces = list({
+            (docente.pk, especialidad.pk): Enlace(docente_id=docente.pk, especialidad_id=especialidad.pk)
+            for docente, especialidad in self.enlaces
+        }.values())
+        self._en_lotes(lambda lote: Enlace.objects.bulk_create(lote, ignore_conflicts=True), enlaces)
+
+        self._actualizar_caches()
+
+    def _actualizar_caches(self):
+        # bulk_create/bulk_update no emiten señales: las cachés se renuevan a mano
+        from . import referencia, resumen
+        from .horarios import invalidar_horarios
+        from .ocupacion import invalidar_indices
+        from .reportes import invalidar_reportes
+
+        if self.nuevos[FranjaHoraria] or self.modificados[FranjaHoraria]:
+            referencia.invalidar(referencia.FRANJAS)
+        if self.nuevos[Curso] or self.modificados[Curso] or self.modificados[Especialidad] or self.modificados[Docente]:
+            invalidar_indices()
+            invalidar_horarios()
+            self.docentes_afectados.update(curso.docente_id for curso, _, _ in self.cursos_importados.values())
+            resumen.actualizar_horarios(self.docentes_afectados)
+        if any(self.nuevos[modelo] or self.modificados[modelo] for modelo in (Docente, Curso, Especialidad)) or self.enlaces:
+            invalidar_reportes()
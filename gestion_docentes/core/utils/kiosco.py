@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""
+Consultas y marcas del kiosco de asistencia.
+
+Los datos que dependen solo de la fecha (semestre activo, día especial, día de
+la semana) se calculan una vez al día y se comparten entre todas las lecturas
+de QR; los datos del docente se resuelven con dos consultas con JOIN.
+"""
+import base64
+import logging
+import uuid
+from datetime import datetime, time, timedelta
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, FilteredRelation, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import Docente, Curso, Asistencia, AsistenciaDiaria, Semestre, DiaEspecial
+from . import acumulados, versiones
+from .imagenes import FORMATOS_PERMITIDOS, FOTO_MAX_BYTES, verificar_foto
+from .resumen import actualizar_resumenes
+
+logger = logging.getLogger(__name__)
+
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
+_SELLO_CONTEXTO = 'kiosco:contexto_dia'
+
+
+def _clave_contexto(fecha):
+    return f'kiosco:contexto_dia:{versiones.sello(_SELLO_CONTEXTO)}:{fecha.isoformat()}'
+
+
+def _segundos_hasta_medianoche(ahora):
+    manana = timezone.make_aware(datetime.combine(ahora.date() + timedelta(days=1), time.min), ahora.tzinfo)
+    return max(int((manana - ahora).total_seconds()), 1)
+
+
+def contexto_del_dia(fecha=None):
+    """
+    Devuelve los datos del día compartidos por todas las lecturas del kiosco.
+
+    El resultado se guarda en la caché hasta la medianoche local, con el sello
+    compartido ``kiosco:contexto_dia`` en la clave; el sello se renueva cuando
+    cambia un ``Semestre`` o un ``DiaEspecial`` (ver ``core.signals``), para
+    cualquier fecha y en todos los procesos.
+    """
+    ahora = timezone.localtime(timezone.now())
+    fecha = fecha or ahora.date()
+    clave = _clave_contexto(fecha)
+    contexto = cache.get(clave)
+    if contexto is None:
+        semestre = Semestre.objects.filter(
+            estado='ACTIVO', fecha_inicio__lte=fecha, fecha_fin__gte=fecha
+        ).values('id', 'nombre').first()
+        dia_especial = DiaEspecial.objects.filter(fecha=fecha).values('motivo', 'tipo').first()
+        contexto = {
+            'fecha': fecha,
+            'dia': DIAS_SEMANA[fecha.weekday()],
+            'es_fin_de_semana': fecha.weekday() in [5, 6],
+            'semestre_id': semestre['id'] if semestre else None,
+            'dia_especial': dia_especial,
+        }
+        cache.set(clave, contexto, _segundos_hasta_medianoche(ahora))
+    return contexto
+
+
+def invalidar_contexto_del_dia():
+    versiones.invalidar(_SELLO_CONTEXTO)
+
+
+def _consulta_docente(fecha):
+    # Docente + marca diaria en una sola consulta
+    return Docente.objects.annotate(
+        is_daily_marked=Exists(AsistenciaDiaria.objects.filter(docente=OuterRef('pk'), fecha=fecha))
+    ).only('id', 'first_name', 'last_name', 'dni', 'foto')
+
+
+def _consulta_cursos(docente_id, contexto):
+    # Cursos del día con su asistencia de hoy (LEFT JOIN) en una sola consulta
+    return Curso.objects.filter(
+        docente_id=docente_id, dia=contexto['dia'], semestre_id=contexto['semestre_id']
+    ).annotate(
+        asis=FilteredRelation('asistencia', condition=Q(asistencia__fecha=contexto['fecha'], asistencia__docente_id=docente_id))
+    ).order_by('horario_inicio', 'id').values(
+        'id', 'nombre', 'horario_inicio', 'horario_fin',
+        'asis__hora_entrada', 'asis__hora_salida', 'asis__hora_salida_permitida',
+    )
+
+
+def _cursos_kiosco(cursos_hoy, ahora):
+    courses = {}
+    for curso in cursos_hoy:
+        if curso['id'] in courses:
+            continue
+        hora_entrada = curso['asis__hora_entrada']
+        hora_salida = curso['asis__hora_salida']
+        salida_permitida = curso['asis__hora_salida_permitida']
+        can_mark_exit = bool(hora_entrada and not hora_salida and salida_permitida and ahora >= salida_permitida)
+        inicio = curso['horario_inicio'].strftime("%H:%M") if curso['horario_inicio'] else '--:--'
+        fin = curso['horario_fin'].strftime("%H:%M") if curso['horario_fin'] else '--:--'
+        courses[curso['id']] = {
+            'id': curso['id'],
+            'name': f"{curso['nombre']} ({inicio} - {fin})",
+            'entryMarked': hora_entrada is not None,
+            'exitMarked': hora_salida is not None,
+            'canMarkExit': can_mark_exit,
+        }
+    return list(courses.values())
+
+
+def info_docente_kiosco(qr_id, contexto, ahora=None):
+    """
+    Resuelve un ``id_qr`` a la información que muestra el kiosco.
+
+    Devuelve ``(docente, is_daily_marked, courses)``. Lanza ``Docente.DoesNotExist``
+    si el QR no corresponde a ningún docente.
+    """
+    ahora = ahora or timezone.now()
+    docente = _consulta_docente(contexto['fecha']).get(id_qr=qr_id)
+    if not contexto['semestre_id']:
+        return docente, docente.is_daily_marked, []
+    return docente, docente.is_daily_marked, _cursos_kiosco(_consulta_cursos(docente.pk, contexto), ahora)
+
+
+async def ainfo_docente_kiosco(qr_id, contexto, ahora=None):
+    """Versión asíncrona de ``info_docente_kiosco``, con las mismas dos consultas."""
+    ahora = ahora or timezone.now()
+    docente = await _consulta_docente(contexto['fecha']).aget(id_qr=qr_id)
+    if not contexto['semestre_id']:
+        return docente, docente.is_daily_marked, []
+    cursos_hoy = [curso async for curso in _consulta_cursos(docente.pk, contexto)]
+    return docente, docente.is_daily_marked, _cursos_kiosco(cursos_hoy, ahora)
+
+
+def minutos_minimos_en_clase(duracion_bloques):
+    """Minutos que deben pasar desde la entrada a un curso para poder marcar la salida."""
+    duracion_minima_minutos = (duracion_bloques * 50) - 15
+    if duracion_minima_minutos < 15:
+        duracion_minima_minutos = 15
+    return duracion_minima_minutos
+
+
+def registrar_marca(docente, action_type, curso_id=None, photo_file=None, now=None):
+    """
+    Aplica una marca del kiosco (entrada general, entrada o salida de curso).
+
+    Devuelve ``(instancia, campo)`` con el registro y el nombre del campo de
+    imagen en el que se guardó la foto, o ``(None, None)`` si la marca no
+    cambió nada (por ejemplo, una entrada ya registrada).
+    """
+    now = now or timezone.now()
+    today = timezone.localtime(now).date()
+
+    if action_type == 'general_entry':
+        if not AsistenciaDiaria.objects.filter(docente=docente, fecha=today).exists():
+            try:
+                with transaction.atomic():
+                    asistencia = AsistenciaDiaria.objects.create(
+                        docente=docente, fecha=today, hora_entrada=now, foto_verificacion=photo_file,
+                    )
+            except IntegrityError:
+                # Otra lectura simultánea del mismo QR ya registró la entrada del día
+                return None, None
+            return asistencia, 'foto_verificacion'
+
+    elif action_type in ['course_entry', 'course_exit']:
+        curso = Curso.objects.get(id=curso_id)
+        asistencia, created = Asistencia.objects.get_or_create(docente=docente, curso=curso, fecha=today)
+        # Las señales de la marca leen el curso; así no se vuelve a consultar
+        asistencia.curso = curso
+
+        if action_type == 'course_entry' and not asistencia.hora_entrada:
+            asistencia.hora_entrada = now
+            asistencia.foto_entrada = photo_file
+            asistencia.hora_salida_permitida = now + timedelta(minutes=minutos_minimos_en_clase(curso.duracion_bloques))
+            asistencia.save()
+            return asistencia, 'foto_entrada'
+
+        elif action_type == 'course_exit' and asistencia.hora_entrada and not asistencia.hora_salida:
+            if asistencia.hora_salida_permitida and now >= asistencia.hora_salida_permitida:
+                asistencia.hora_salida = now
+                asistencia.foto_salida = photo_file
+                asistencia.save()
+                return asistencia, 'foto_salida'
+
+    return None, None
+
+
+async def aregistrar_marca(docente, action_type, curso_id=None, photo_file=None, now=None):
+    """
+    Versión asíncrona de ``registrar_marca`` para las vistas ASGI del kiosco.
+
+    La marca se aplica con ``registrar_marca`` en el hilo de la petición (usa
+    una transacción y las señales de los resúmenes, que son síncronas). La
+    foto se escribe después en un hilo aparte, sin ocupar ese hilo ni el
+    bucle de eventos mientras el disco responde, y se asocia a la marca con un
+    ``UPDATE``. Si la marca no cambió nada no se escribe ninguna foto.
+    """
+    asistencia, campo = await sync_to_async(registrar_marca)(docente, action_type, curso_id, now=now)
+    if asistencia is None or photo_file is None:
+        return asistencia, campo
+
+    campo_foto = asistencia._meta.get_field(campo)
+    nombre = campo_foto.generate_filename(asistencia, photo_file.name)
+    nombre = await sync_to_async(campo_foto.storage.save, thread_sensitive=False)(
+        nombre, photo_file, max_length=campo_foto.max_length,
+    )
+    await type(asistencia).objects.filter(pk=asistencia.pk).aupdate(**{campo: nombre})
+    setattr(asistencia, campo, nombre)
+    return asistencia, campo
+
+
+# --- Modo sin conexión: padrón diario y sincronización por lotes ---
+
+ACCIONES_KIOSCO = ('general_entry', 'course_entry', 'course_exit')
+
+
+def roster_del_dia(contexto):
+    """
+    Padrón compacto del día para que el kiosco valide lecturas sin conexión.
+
+    Incluye a todos los docentes activos con su marca diaria y los cursos de hoy
+    con el estado de entrada/salida y la hora mínima de salida. Cuesta dos
+    consultas, sin importar el número de docentes.
+    """
+    fecha = contexto['fecha']
+    docentes = Docente.objects.filter(is_active=True).annotate(
+        is_daily_marked=Exists(AsistenciaDiaria.objects.filter(docente=OuterRef('pk'), fecha=fecha))
+    ).values_list('id', 'id_qr', 'first_name', 'last_name', 'dni', 'foto', 'is_daily_marked')
+
+    roster = {}
+    for pk, id_qr, first_name, last_name, dni, foto, is_daily_marked in docentes:
+        roster[pk] = {
+            'qr': str(id_qr),
+            'name': f'{first_name} {last_name}',
+            'dni': dni,
+            'photoUrl': default_storage.url(foto) if foto else None,
+            'dailyMarked': is_daily_marked,
+            'courses': [],
+        }
+
+    if contexto['semestre_id'] and not contexto['es_fin_de_semana']:
+        cursos_hoy = Curso.objects.filter(
+            dia=contexto['dia'], semestre_id=contexto['semestre_id'], docente__isnull=False
+        ).annotate(
+            asis=FilteredRelation('asistencia', condition=Q(asistencia__fecha=fecha, asistencia__docente=F('docente')))
+        ).order_by('horario_inicio', 'id').values_list(
+            'id', 'docente_id', 'nombre', 'horario_inicio', 'horario_fin', 'duracion_bloques',
+            'asis__hora_entrada', 'asis__hora_salida', 'asis__hora_salida_permitida',
+        )
+        for pk, docente_id, nombre, inicio, fin, bloques, hora_entrada, hora_salida, salida_permitida in cursos_hoy:
+            if docente_id not in roster:
+                continue
+            inicio_str = inicio.strftime("%H:%M") if inicio else '--:--'
+            fin_str = fin.strftime("%H:%M") if fin else '--:--'
+            roster[docente_id]['courses'].append({
+                'id': pk,
+                'name': f'{nombre} ({inicio_str} - {fin_str})',
+                'entryMarked': hora_entrada is not None,
+                'exitMarked': hora_salida is not None,
+                'exitAllowedAt': salida_permitida.isoformat() if salida_permitida else None,
+                'minMinutes': minutos_minimos_en_clase(bloques),
+            })
+
+    return list(roster.values())
+
+
+def _leer_foto(photo_base64):
+    """
+    Decodifica la foto de una marca sin conexión (data URL en base64) y
+    devuelve ``(contenido, extension)``, ``None`` si la marca no trae foto, o
+    lanza ``ValueError`` si la foto no es válida.
+    """
+    if not photo_base64:
+        return None
+    try:
+        formato, imgstr = photo_base64.split(';base64,')
+        contenido = base64.b64decode(imgstr, validate=True)
+    except (AttributeError, ValueError):
+        raise ValueError('La foto de la marca no es válida.')
+    content_type = formato.removeprefix('data:')
+    if content_type not in FORMATOS_PERMITIDOS:
+        raise ValueError('Formato de foto no permitido.')
+    if not contenido or len(contenido) > FOTO_MAX_BYTES:
+        raise ValueError(f'La foto debe pesar menos de {FOTO_MAX_BYTES // (1024 * 1024)} MB.')
+    verificar_foto(BytesIO(contenido), content_type)
+    return contenido, FORMATOS_PERMITIDOS[content_type]
+
+
+def _leer_marca(marca):
+    """Normaliza una marca recibida del kiosco o lanza ``ValueError``."""
+    if marca.get('actionType') not in ACCIONES_KIOSCO:
+        raise ValueError('Tipo de marca no válido.')
+    momento = parse_datetime(marca.get('timestamp') or '')
+    if momento is None:
+        raise ValueError('Fecha y hora de la marca no válidas.')
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    if momento > timezone.now() + timedelta(minutes=5):
+        raise ValueError('La marca tiene una hora futura.')
+    curso_id = marca.get('courseId')
+    if marca['actionType'] != 'general_entry':
+        curso_id = int(curso_id)
+    return {
+        'id': marca.get('id'),
+        'qr': str(uuid.UUID(str(marca.get('qrId')))),
+        'accion': marca['actionType'],
+        'curso_id': curso_id,
+        'momento': momento,
+        'fecha': timezone.localtime(momento).date(),
+        'foto': _leer_foto(marca.get('photoBase64')),
+    }
+
+
+def _aplicar_marcas(validas):
+    """
+    Aplica ``validas`` (ya ordenadas) en una transacción y devuelve
+    ``(resultados, fotos, cambiadas)``. Las fotos quedan como triples
+    ``(instancia, campo, archivo)`` sin escribir.
+
+    Como en línea, se rechazan las marcas de fines de semana y de días sin
+    semestre activo; los días especiales no bloquean la marca (el kiosco en
+    línea tampoco lo hace).
+
+    Lanza ``IntegrityError`` si una marca en línea creó una de las filas entre
+    la lectura y el ``bulk_create``; en ese caso no se guarda nada.
+    """
+    docentes = {str(d.id_qr): d for d in Docente.objects.filter(id_qr__in={m['qr'] for m in validas})}
+    cursos = Curso.objects.in_bulk({m['curso_id'] for m in validas if m['curso_id']})
+    fechas = {m['fecha'] for m in validas}
+    contextos = {fecha: contexto_del_dia(fecha) for fecha in fechas}
+    docente_ids = [d.pk for d in docentes.values()]
+
+    diarias = set(AsistenciaDiaria.objects.filter(
+        docente_id__in=docente_ids, fecha__in=fechas
+    ).values_list('docente_id', 'fecha'))
+    asistencias = {
+        (a.docente_id, a.curso_id, a.fecha): a
+        for a in Asistencia.objects.filter(docente_id__in=docente_ids, curso_id__in=list(cursos), fecha__in=fechas)
+    }
+
+    resultados, nuevas_diarias, nuevas_asistencias, modificadas, fotos = [], [], [], {}, []
+
+    for marca in validas:
+        contexto = contextos[marca['fecha']]
+        if contexto['es_fin_de_semana']:
+            resultados.append({'id': marca['id'], 'status': 'rejected', 'message': 'El kiosco de asistencia no está disponible los fines de semana.'})
+            continue
+        if not contexto['semestre_id']:
+            resultados.append({'id': marca['id'], 'status': 'rejected', 'message': 'No hay un semestre académico activo.'})
+            continue
+        docente = docentes.get(marca['qr'])
+        if not docente:
+            resultados.append({'id': marca['id'], 'status': 'rejected', 'message': 'QR no válido o docente no encontrado.'})
+            continue
+        estado, instancia, campo = 'duplicate', None, None
+
+        if marca['accion'] == 'general_entry':
+            if (docente.pk, marca['fecha']) not in diarias:
+                instancia = AsistenciaDiaria(docente=docente, fecha=marca['fecha'], hora_entrada=marca['momento'])
+                campo = 'foto_verificacion'
+                nuevas_diarias.append(instancia)
+                diarias.add((docente.pk, marca['fecha']))
+                estado = 'applied'
+        else:
+            curso = cursos.get(marca['curso_id'])
+            if not curso or curso.docente_id != docente.pk:
+                resultados.append({'id': marca['id'], 'status': 'rejected', 'message': 'El curso no pertenece al docente.'})
+                continue
+            clave = (docente.pk, curso.pk, marca['fecha'])
+            asistencia = asistencias.get(clave)
+            if asistencia is None:
+                asistencia = Asistencia(docente=docente, curso=curso, fecha=marca['fecha'])
+                asistencias[clave] = asistencia
+                nuevas_asistencias.append(asistencia)
+
+            if marca['accion'] == 'course_entry' and not asistencia.hora_entrada:
+                asistencia.hora_entrada = marca['momento']
+                asistencia.hora_salida_permitida = marca['momento'] + timedelta(minutes=minutos_minimos_en_clase(curso.duracion_bloques))
+                instancia, campo, estado = asistencia, 'foto_entrada', 'applied'
+            elif (marca['accion'] == 'course_exit' and asistencia.hora_entrada and not asistencia.hora_salida
+                    and asistencia.hora_salida_permitida and marca['momento'] >= asistencia.hora_salida_permitida):
+                asistencia.hora_salida = marca['momento']
+                instancia, campo, estado = asistencia, 'foto_salida', 'applied'
+            if estado == 'applied' and asistencia.pk:
+                modificadas[asistencia.pk] = asistencia
+
+        if estado == 'applied' and marca['foto']:
+            contenido, extension = marca['foto']
+            nombre = f"{docente.username}_{marca['momento'].timestamp()}.{extension}"
+            fotos.append((instancia, campo, ContentFile(contenido, name=nombre)))
+        resultados.append({'id': marca['id'], 'status': estado})
+
+    with transaction.atomic():
+        AsistenciaDiaria.objects.bulk_create(nuevas_diarias)
+        # Las asistencias nuevas ya llevan todos sus datos; solo las existentes se actualizan
+        nuevas_asistencias = [a for a in nuevas_asistencias if a.hora_entrada]
+        Asistencia.objects.bulk_create(nuevas_asistencias)
+        Asistencia.objects.bulk_update(
+            list(modificadas.values()), ['hora_entrada', 'hora_salida', 'hora_salida_permitida'],
+        )
+    return resultados, fotos, nuevas_diarias + nuevas_asistencias + list(modificadas.values())
+
+
+def _guardar_fotos(fotos):
+    """
+    Escribe las fotos de marcas ya confirmadas y devuelve los pares
+    ``(instancia, campo)`` guardados. Cada foto se asigna con un ``update``
+    del campo, para no pisar lo que otra marca haya cambiado en la fila.
+    """
+    guardadas = []
+    for instancia, campo, archivo in fotos:
+        try:
+            getattr(instancia, campo).save(archivo.name, archivo, save=False)
+        except OSError:
+            logger.exception('No se pudo guardar la foto %s de %s %s', campo, type(instancia).__name__, instancia.pk)
+            continue
+        type(instancia).objects.filter(pk=instancia.pk).update(**{campo: getattr(instancia, campo).name})
+        guardadas.append((instancia, campo))
+    return guardadas
+
+
+def sincronizar_marcas(marcas):
+    """
+    Aplica un lote de marcas registradas sin conexión.
+
+    Las marcas se aplican en orden cronológico con las mismas reglas que
+    ``registrar_marca``, por lo que reenviar un lote ya aplicado no cambia nada
+    (la marca se informa como ``duplicate``). Una marca mal formada, incluida
+    su foto, se informa como ``rejected`` sin afectar a las demás. Todo el lote
+    se escribe en una transacción con ``bulk_create``/``bulk_update``; si una
+    marca en línea gana la carrera por una fila, cada marca se aplica por
+    separado. Las fotos se escriben solo después de confirmar la transacción.
+
+    Devuelve ``(resultados, fotos)``: el estado de cada marca y los pares
+    ``(instancia, campo)`` con fotos pendientes de procesar.
+    """
+    resultados = []
+    validas = []
+    for marca in marcas:
+        try:
+            validas.append(_leer_marca(marca))
+        except (TypeError, ValueError, AttributeError) as e:
+            resultados.append({'id': marca.get('id') if isinstance(marca, dict) else None, 'status': 'rejected', 'message': str(e)})
+    validas.sort(key=lambda m: m['momento'])
+
+    try:
+        aplicados, fotos, cambiadas = _aplicar_marcas(validas)
+    except IntegrityError:
+        aplicados, fotos, cambiadas = [], [], []
+        for marca in validas:
+            try:
+                parcial = _aplicar_marcas([marca])
+            except IntegrityError:
+                # Otra marca en línea la volvió a ganar: la fila ya existe
+                parcial = [{'id': marca['id'], 'status': 'duplicate'}], [], []
+            aplicados += parcial[0]
+            fotos += parcial[1]
+            cambiadas += parcial[2]
+    resultados += aplicados
+
+    # Las operaciones en bloque no emiten señales: el resumen de cada docente se recalcula
+    actualizar_resumenes({a.docente_id for a in cambiadas if isinstance(a, Asistencia)})
+    if cambiadas:
+        acumulados.reconstruir(
+            min(a.fecha for a in cambiadas), max(a.fecha for a in cambiadas), {a.docente_id for a in cambiadas},
+        )
+
+    return resultados, _guardar_fotos(fotos)
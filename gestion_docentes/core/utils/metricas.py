@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas de las peticiones por vista, en memoria del proceso.
+
+``core.middleware.MetricasMiddleware`` registra por cada petición el número de
+consultas SQL, el tiempo en la base, el tiempo total y el tamaño de la
+respuesta. Cada vista (por nombre de URL) guarda sus últimas
+``METRICAS_MUESTRAS_POR_VISTA`` muestras en un buffer circular, y los
+percentiles se calculan al consultarlos. Cada proceso del servidor lleva sus
+propias métricas.
+
+``METRICAS_PRESUPUESTOS`` fija el máximo de consultas por vista. Al superarlo
+se registra una advertencia o, con ``METRICAS_PRESUPUESTO_ESTRICTO`` (pensado
+para los tests), se lanza ``PresupuestoExcedido``.
+"""
+import logging
+import math
+import threading
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MUESTRAS_POR_VISTA = 500
+PERCENTILES = (50, 95, 99)
+CAMPOS = ('total_ms', 'db_ms', 'consultas', 'bytes')
+
+
+class PresupuestoExcedido(AssertionError):
+    pass
+
+
+class Muestra:
+    __slots__ = CAMPOS + ('estado',)
+
+    def __init__(self, total_ms, db_ms, consultas, bytes, estado):
+        self.total_ms = total_ms
+        self.db_ms = db_ms
+        self.consultas = consultas
+        self.bytes = bytes
+        self.estado = estado
+
+
+_lock = threading.Lock()
+_muestras = {}
+_totales = {}
+
+
+def presupuesto(vista):
+    return getattr(settings, 'METRICAS_PRESUPUESTOS', {}).get(vista)
+
+
+def registrar(vista, muestra):
+    tamano = getattr(settings, 'METRICAS_MUESTRAS_POR_VISTA', MUESTRAS_POR_VISTA)
+    with _lock:
+        muestras = _muestras.get(vista)
+        if muestras is None or muestras.maxlen != tamano:
+            muestras = _muestras[vista] = deque(muestras or (), maxlen=tamano)
+        muestras.append(muestra)
+        _totales[vista] = _totales.get(vista, 0) + 1
+
+    limite = presupuesto(vista)
+    if limite is not None and muestra.consultas > limite:
+        mensaje = f'La vista {vista} hizo {muestra.consultas} consultas (presupuesto: {limite}).'
+        if getattr(settings, 'METRICAS_PRESUPUESTO_ESTRICTO', False):
+            raise PresupuestoExcedido(mensaje)
+        logger.warning(mensaje)
+
+
+def _percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def resumen():
+    """Percentiles por vista, de la más lenta (p95 del tiempo total) a la más rápida."""
+    with _lock:
+        copia = {vista: list(muestras) for vista, muestras in _muestras.items()}
+        totales = dict(_totales)
+
+    vistas = []
+    for vista, muestras in copia.items():
+        fila = {
+            'vista': vista,
+            'peticiones': totales[vista],
+            'muestras': len(muestras),
+            'errores': sum(1 for m in muestras if m.estado >= 500),
+            'presupuesto_consultas': presupuesto(vista),
+        }
+        for campo in CAMPOS:
+            valores = sorted(getattr(m, campo) for m in muestras if getattr(m, campo) is not None)
+            fila[campo] = {f'p{p}': round(_percentil(valores, p), 2) for p in PERCENTILES} if valores else None
+        limite = fila['presupuesto_consultas']
+        fila['sobre_presupuesto'] = sum(1 for m in muestras if limite is not None and m.consultas > limite)
+        vistas.append(fila)
+    vistas.sort(key=lambda fila: fila['total_ms']['p95'], reverse=True)
+    return vistas
+
+
+def reiniciar():
+    with _lock:
+        _muestras.clear()
+        _totales.clear()
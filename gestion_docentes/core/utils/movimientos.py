@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Movimientos en lote del planificador de horarios.
+
+Una lista de operaciones (``mover``, ``desasignar`` e ``intercambiar``) se
+aplica primero sobre las posiciones en memoria, y solo el horario final se
+valida contra una copia del ``MapaOcupacion`` del semestre: un paso intermedio
+puede cruzarse con otro (p. ej. al rotar tres cursos) mientras el resultado
+sea válido. Todo se guarda con un único ``bulk_update`` o no se guarda nada.
+"""
+from django.db import transaction
+
+from ..models import Curso
+from . import planificador
+from .horarios import invalidar_horarios
+from .ocupacion import actualizar_cursos, conflicto_en_bd, indice_semestre
+from .resumen import actualizar_horarios
+
+MAX_OPERACIONES = 200
+CAMPOS_HORARIO = ['dia', 'horario_inicio', 'horario_fin']
+
+
+def guardar_horarios(cursos):
+    """
+    Guarda el horario de ``cursos`` con un ``bulk_update`` y actualiza lo que
+    dependía de las señales. Lanza ``ValueError`` si la base de datos muestra
+    un cruce que el índice de este proceso no vio (ver ``conflicto_en_bd``).
+    """
+    with transaction.atomic():
+        conflicto = conflicto_en_bd(cursos)
+        if conflicto:
+            curso, motivo = conflicto
+            raise ValueError(f'"{curso.nombre}": {describir_conflicto(*motivo)}')
+        Curso.objects.bulk_update(cursos, CAMPOS_HORARIO)
+    # bulk_update no emite señales: el índice, las parrillas y los deltas se actualizan a mano
+    actualizar_cursos(cursos)
+    invalidar_horarios()
+    actualizar_horarios({curso.docente_id for curso in cursos})
+    planificador.publicar_cursos(cursos)
+
+
+def describir_conflicto(motivo, conflicto_id):
+    """Mensaje para el usuario de un conflicto devuelto por ``MapaOcupacion.conflicto``."""
+    if motivo == 'DISPONIBILIDAD':
+        return 'Conflicto de Disponibilidad del docente.'
+    otro = Curso.objects.select_related('especialidad').get(pk=conflicto_id)
+    if motivo == 'DOCENTE':
+        return f'Conflicto: El docente ya dicta "{otro.nombre}" en este horario.'
+    if otro.tipo_curso == 'GENERAL':
+        return f'Conflicto de Grupo: El curso general "{otro.nombre}" ya está programado.'
+    return f'Conflicto de Grupo: El curso "{otro.nombre}" ({otro.especialidad.nombre}) ya está programado.'
+
+
+def _leer_operaciones(operaciones):
+    """Normaliza las operaciones a ``(tipo, ids, datos)`` o lanza ``ValueError``."""
+    if not isinstance(operaciones, list) or not operaciones:
+        raise ValueError('Indique al menos una operación.')
+    if len(operaciones) > MAX_OPERACIONES:
+        raise ValueError(f'Se permiten hasta {MAX_OPERACIONES} operaciones por lote.')
+
+    leidas = []
+    for n, operacion in enumerate(operaciones, 1):
+        try:
+            tipo = operacion.get('tipo')
+            if tipo == 'mover':
+                leidas.append((tipo, [int(operacion['curso_id'])], (operacion.get('dia'), int(operacion['franja_id']))))
+            elif tipo == 'desasignar':
+                leidas.append((tipo, [int(operacion['curso_id'])], None))
+            elif tipo == 'intercambiar':
+                leidas.append((tipo, [int(operacion['curso_a']), int(operacion['curso_b'])], None))
+            else:
+                raise ValueError
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f'Operación {n}: use "mover" (curso_id, dia, franja_id), "desasignar" (curso_id) o "intercambiar" (curso_a, curso_b).')
+    return leidas
+
+
+def aplicar_movimientos(semestre, operaciones):
+    """
+    Valida y aplica en bloque las ``operaciones`` sobre los cursos del semestre.
+
+    Devuelve los cursos cuyo horario cambió. Lanza ``ValueError`` con el motivo
+    si una operación no es válida o si el horario final tiene un cruce; en ese
+    caso no se guarda nada.
+    """
+    leidas = _leer_operaciones(operaciones)
+    ids = {curso_id for _, curso_ids, _ in leidas for curso_id in curso_ids}
+    cursos = Curso.objects.filter(semestre=semestre).select_related('docente', 'especialidad').in_bulk(ids)
+    if len(cursos) != len(ids):
+        faltantes = ', '.join(str(curso_id) for curso_id in sorted(ids - set(cursos)))
+        raise ValueError(f'Cursos no encontrados en el semestre activo: {faltantes}.')
+
+    # El índice queda bloqueado hasta guardar, como en api_asignar_horario
+    with indice_semestre(semestre.id) as compartido:
+        mapa = compartido.copia()
+        rejilla = mapa.rejilla
+
+        # 1. Posición final (día, índice de franja) de cada curso, sin validar los pasos intermedios
+        posicion = {
+            curso.id: (curso.dia, rejilla.indice_por_hora.get(curso.horario_inicio)) if curso.dia else None
+            for curso in cursos.values()
+        }
+        for n, (tipo, curso_ids, destino) in enumerate(leidas, 1):
+            if tipo == 'mover':
+                dia, franja_id = destino
+                indice = rejilla.indice_por_id.get(franja_id)
+                if indice is None or dia not in rejilla.indice_dia:
+                    raise ValueError(f'Operación {n}: franja horaria o día no válido.')
+                posicion[curso_ids[0]] = (dia, indice)
+            elif tipo == 'desasignar':
+                posicion[curso_ids[0]] = None
+            else:
+                a, b = curso_ids
+                posicion[a], posicion[b] = posicion[b], posicion[a]
+
+        cambiados = []
+        for curso in cursos.values():
+            final = posicion[curso.id]
+            inicio = rejilla.franjas[final[1]].hora_inicio if final and final[1] is not None else None
+            if (curso.dia, curso.horario_inicio) != ((final[0], inicio) if final else (None, None)):
+                cambiados.append(curso)
+
+        # 2. Solo el horario final se valida: primero se retiran todos los cursos que cambian
+        for curso in cambiados:
+            mapa.liberar(curso)
+        for curso in sorted(cambiados, key=lambda c: c.id):
+            final = posicion[curso.id]
+            if final is None:
+                curso.dia = curso.horario_inicio = curso.horario_fin = None
+                continue
+            dia, indice = final
+            if indice is None:
+                raise ValueError(f'"{curso.nombre}": su horario actual no coincide con las franjas; muévalo a una franja.')
+            # Como en api_asignar_horario, un curso que se sale del día ocupa solo las franjas que quedan
+            franjas = rejilla.franjas[indice:indice + curso.duracion_bloques]
+            mascara = rejilla.bloque(dia, indice, len(franjas))
+            conflicto = mapa.conflicto(curso, mascara)
+            if conflicto:
+                raise ValueError(f'"{curso.nombre}": {describir_conflicto(*conflicto)}')
+            mapa.ocupar(curso, mascara)
+            curso.dia, curso.horario_inicio, curso.horario_fin = dia, franjas[0].hora_inicio, franjas[-1].hora_fin
+
+        # 3. Un único bulk_update con todos los cambios
+        if cambiados:
+            guardar_horarios(cambiados)
+    return cambiados
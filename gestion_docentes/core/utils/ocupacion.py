@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo de ocupación de horarios con máscaras de bits.
+
+Cada celda (día, franja) de la semana es un bit: ``bit = indice_dia * n_franjas
++ indice_franja``. Un curso ocupa ``duracion_bloques`` bits consecutivos de un
+mismo día, y comprobar un cruce es un simple ``&`` entre enteros.
+
+Reglas de cruce (las que valida ``api_asignar_horario``, más el cruce entre
+cursos que comparten a los mismos alumnos):
+- Un docente no puede dictar dos cursos en la misma celda.
+- Un docente con disponibilidad MANANA/TARDE solo puede dictar en ese turno.
+- Dentro de un grupo y semestre cursado, un curso GENERAL no puede cruzarse
+  con cursos de ESPECIALIDAD, ni con otro GENERAL del mismo grupo.
+- Un curso de ESPECIALIDAD no puede cruzarse con un GENERAL de su grupo ni con
+  otro curso de su misma especialidad y semestre cursado.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Q
+
+from . import versiones
+
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes']
+
+
+class Rejilla:
+    """Geometría de la semana: días hábiles × franjas horarias ordenadas."""
+
+    def __init__(self, franjas, dias=DIAS_SEMANA):
+        self.franjas = list(franjas)
+        self.dias = list(dias)
+        self.n_franjas = len(self.franjas)
+        self.indice_dia = {dia: i for i, dia in enumerate(self.dias)}
+        self.indice_por_hora = {f.hora_inicio: i for i, f in enumerate(self.franjas)}
+        self.indice_por_id = {f.id: i for i, f in enumerate(self.franjas)}
+
+    def bit(self, dia, indice_franja):
+        return self.indice_dia[dia] * self.n_franjas + indice_franja
+
+    def bloque(self, dia, indice_inicio, duracion):
+        """Máscara de ``duracion`` franjas desde ``indice_inicio``; ``None`` si no entra en el día."""
+        if dia not in self.indice_dia or indice_inicio is None or indice_inicio + duracion > self.n_franjas:
+            return None
+        return ((1 << duracion) - 1) << self.bit(dia, indice_inicio)
+
+    def mascara_curso(self, curso):
+        """Máscara que ocupa un curso ya programado (o 0 si no coincide con la rejilla)."""
+        indice = self.indice_por_hora.get(curso.horario_inicio)
+        if not curso.dia or indice is None:
+            return 0
+        # Igual que en las vistas, un curso que se sale de la rejilla solo ocupa las franjas existentes
+        duracion = min(curso.duracion_bloques, self.n_franjas - indice)
+        return self.bloque(curso.dia, indice, duracion) or 0
+
+    def celdas(self, mascara):
+        """Itera ``(dia, franja)`` de cada bit encendido en la máscara."""
+        while mascara:
+            bajo = mascara & -mascara
+            bit = bajo.bit_length() - 1
+            yield self.dias[bit // self.n_franjas], self.franjas[bit % self.n_franjas]
+            mascara ^= bajo
+
+    def mascara_fuera_de_turno(self, disponibilidad):
+        """Celdas en las que un docente con esa disponibilidad no puede dictar."""
+        turno = {'MANANA': 'MANANA', 'TARDE': 'TARDE'}.get(disponibilidad)
+        if not turno:
+            return 0
+        por_dia = 0
+        for i, franja in enumerate(self.franjas):
+            if franja.turno != turno:
+                por_dia |= 1 << i
+        mascara = 0
+        for d in range(len(self.dias)):
+            mascara |= por_dia << (d * self.n_franjas)
+        return mascara
+
+    def inicios(self, duracion):
+        """Todas las posiciones ``(mascara, dia, indice_franja)`` posibles para una duración."""
+        posiciones = []
+        for dia in self.dias:
+            for i in range(self.n_franjas - duracion + 1):
+                posiciones.append((self.bloque(dia, i, duracion), dia, i))
+        return posiciones
+
+
+def grupo_de(curso):
+    especialidad = curso.especialidad
+    return especialidad.grupo_id if especialidad else None
+
+
+class Ocupacion:
+    """Unión de máscaras por clave, recordando qué curso ocupa cada celda."""
+
+    def __init__(self):
+        self.union = {}
+        self.por_curso = {}
+
+    def get(self, clave):
+        return self.union.get(clave, 0)
+
+    def ocupar(self, clave, curso_id, mascara):
+        self.por_curso.setdefault(clave, {})[curso_id] = mascara
+        self.union[clave] = self.union.get(clave, 0) | mascara
+
+    def liberar(self, clave, curso_id):
+        cursos = self.por_curso.get(clave, {})
+        if cursos.pop(curso_id, None) is None:
+            return
+        union = 0
+        for mascara in cursos.values():
+            union |= mascara
+        self.union[clave] = union
+
+    def ocupantes(self, clave, mascara):
+        """Ids de los cursos de ``clave`` que se cruzan con ``mascara``."""
+        return [curso_id for curso_id, m in self.por_curso.get(clave, {}).items() if m & mascara]
+
+
+class MapaOcupacion:
+    """
+    Ocupación de un semestre por docente y por cohorte (grupo/especialidad +
+    semestre cursado). Los cursos deben traer ``docente`` y ``especialidad``
+    cargados (``select_related``) para no disparar consultas.
+    """
+
+    TABLAS = ('docentes', 'generales', 'especialidades_grupo', 'por_especialidad')
+
+    def __init__(self, rejilla):
+        self.rejilla = rejilla
+        self.docentes = Ocupacion()
+        self.generales = Ocupacion()
+        self.especialidades_grupo = Ocupacion()
+        self.por_especialidad = Ocupacion()
+        self.asignados = {}
+        self._claves_de = {}
+        self._fuera_de_turno = {}
+
+    def claves(self, curso):
+        """Pares ``(tabla, clave)`` en los que un curso deja ocupadas sus celdas."""
+        grupo_id = grupo_de(curso)
+        sc = curso.semestre_cursado
+        claves = []
+        if curso.docente_id:
+            claves.append((self.docentes, curso.docente_id))
+        if curso.tipo_curso == 'GENERAL':
+            if grupo_id:
+                claves.append((self.generales, (grupo_id, sc)))
+        elif curso.especialidad_id:
+            claves.append((self.por_especialidad, (curso.especialidad_id, sc)))
+            if grupo_id:
+                claves.append((self.especialidades_grupo, (grupo_id, sc)))
+        return claves
+
+    def restricciones(self, curso):
+        """Pares ``(tabla, clave)`` con los que un curso no puede cruzarse."""
+        grupo_id = grupo_de(curso)
+        sc = curso.semestre_cursado
+        restricciones = []
+        if curso.docente_id:
+            restricciones.append((self.docentes, curso.docente_id))
+        if curso.tipo_curso == 'GENERAL':
+            if grupo_id:
+                restricciones.append((self.especialidades_grupo, (grupo_id, sc)))
+                restricciones.append((self.generales, (grupo_id, sc)))
+        elif curso.especialidad_id:
+            restricciones.append((self.por_especialidad, (curso.especialidad_id, sc)))
+            if grupo_id:
+                restricciones.append((self.generales, (grupo_id, sc)))
+        return restricciones
+
+    def fuera_de_turno(self, curso):
+        disponibilidad = curso.docente.disponibilidad if curso.docente_id else None
+        if disponibilidad not in self._fuera_de_turno:
+            self._fuera_de_turno[disponibilidad] = self.rejilla.mascara_fuera_de_turno(disponibilidad)
+        return self._fuera_de_turno[disponibilidad]
+
+    def bloqueadas(self, curso):
+        """Celdas en las que ``curso`` no puede tener ninguna de sus franjas."""
+        mascara = self.fuera_de_turno(curso)
+        propio = curso.id in self.asignados
+        for tabla, clave in self.restricciones(curso):
+            if propio:
+                # Un curso ya ubicado no choca consigo mismo al reubicarlo
+                for curso_id, m in tabla.por_curso.get(clave, {}).items():
+                    if curso_id != curso.id:
+                        mascara |= m
+            else:
+                mascara |= tabla.get(clave)
+        return mascara
+
+    def conflicto(self, curso, mascara):
+        """
+        Primer motivo por el que ``curso`` no puede ocupar ``mascara``:
+        ``('DISPONIBILIDAD', None)``, ``('DOCENTE', curso_id)``,
+        ``('GRUPO', curso_id)`` o ``None`` si la ubicación es válida.
+        """
+        if mascara & self.fuera_de_turno(curso):
+            return 'DISPONIBILIDAD', None
+        for tabla, clave in self.restricciones(curso):
+            for curso_id in tabla.ocupantes(clave, mascara):
+                if curso_id != curso.id:
+                    return ('DOCENTE' if tabla is self.docentes else 'GRUPO'), curso_id
+        return None
+
+    def ocupar(self, curso, mascara):
+        if not mascara:
+            return
+        claves = self.claves(curso)
+        self.asignados[curso.id] = mascara
+        self._claves_de[curso.id] = claves
+        for tabla, clave in claves:
+            tabla.ocupar(clave, curso.id, mascara)
+
+    def liberar(self, curso):
+        # Se usan las claves con las que se ocupó, por si cambió el docente o la especialidad
+        self.asignados.pop(curso.id, None)
+        for tabla, clave in self._claves_de.pop(curso.id, ()):
+            tabla.liberar(clave, curso.id)
+
+    def cargar(self, cursos):
+        """Marca como ocupadas las celdas de los cursos ya programados."""
+        for curso in cursos:
+            self.ocupar(curso, self.rejilla.mascara_curso(curso))
+        return self
+
+    def copia(self):
+        """Copia independiente, para que el solver explore sin tocar el índice compartido."""
+        otro = MapaOcupacion(self.rejilla)
+        equivalentes = {}
+        for nombre in self.TABLAS:
+            tabla, nueva = getattr(self, nombre), getattr(otro, nombre)
+            nueva.union = dict(tabla.union)
+            nueva.por_curso = {clave: dict(cursos) for clave, cursos in tabla.por_curso.items()}
+            equivalentes[id(tabla)] = nueva
+        # Las claves guardadas apuntan a las tablas del original; se traducen a las de la copia
+        otro._claves_de = {
+            curso_id: [(equivalentes[id(tabla)], clave) for tabla, clave in claves]
+            for curso_id, claves in self._claves_de.items()
+        }
+        otro.asignados = dict(self.asignados)
+        otro._fuera_de_turno = dict(self._fuera_de_turno)
+        return otro
+
+
+# --- Índice de ocupación por semestre ---
+#
+# Se construye una vez por semestre y se mantiene al día con las señales de
+# ``Curso``. Un sello de versión compartido (ver ``versiones``) permite que
+# cada proceso detecte los cambios hechos por otros procesos y reconstruya su
+# copia. Entre la lectura del sello y el guardado otro proceso aún puede
+# ocupar la misma celda, así que antes de guardar se repite la validación
+# contra la base de datos (``conflicto_en_bd``).
+
+_SELLO = 'ocupacion'
+_lock = threading.RLock()
+_indices = {}
+
+
+def _construir(semestre_id):
+    from ..models import Curso
+    from .referencia import franjas_horarias
+
+    rejilla = Rejilla(franjas_horarias())
+    programados = Curso.objects.filter(semestre_id=semestre_id, dia__isnull=False).select_related('especialidad')
+    return MapaOcupacion(rejilla).cargar(programados)
+
+
+@contextmanager
+def indice_semestre(semestre_id):
+    """Entrega el ``MapaOcupacion`` del semestre con el índice bloqueado para otros hilos."""
+    with _lock:
+        version = versiones.sello(_SELLO)
+        entrada = _indices.get(semestre_id)
+        if entrada is None or entrada[0] != version:
+            entrada = (version, _construir(semestre_id))
+            _indices[semestre_id] = entrada
+        yield entrada[1]
+
+
+def _aplicar(cambio):
+    """Aplica ``cambio(semestre_id, mapa)`` a los índices cargados y renueva el sello."""
+    with _lock:
+        previa = versiones.sello(_SELLO)
+        nueva = versiones.renovar(_SELLO)
+        for semestre_id, (version, mapa) in list(_indices.items()):
+            if version != previa:
+                # Otro proceso cambió algo que no vimos: se reconstruirá al pedirlo
+                del _indices[semestre_id]
+                continue
+            cambio(semestre_id, mapa)
+            _indices[semestre_id] = (nueva, mapa)
+
+
+def actualizar_cursos(cursos):
+    """Refleja en los índices cargados el horario actual de ``cursos``."""
+    def cambio(semestre_id, mapa):
+        for curso in cursos:
+            mapa.liberar(curso)
+            if curso.semestre_id == semestre_id:
+                mapa.ocupar(curso, mapa.rejilla.mascara_curso(curso))
+    _aplicar(cambio)
+
+
+def quitar_cursos(cursos):
+    def cambio(semestre_id, mapa):
+        for curso in cursos:
+            mapa.liberar(curso)
+    _aplicar(cambio)
+
+
+def invalidar_indices():
+    with _lock:
+        _indices.clear()
+        versiones.renovar(_SELLO)
+
+
+def conflicto_en_bd(cursos):
+    """
+    Vuelve a validar contra la base de datos el horario de ``cursos`` antes de
+    guardarlo; debe llamarse dentro de la transacción que lo guarda.
+
+    Bloquea las filas de sus semestres (``select_for_update``) para que dos
+    procesos no guarden a la vez horarios del mismo semestre, y busca cruces
+    con los demás cursos programados, leídos de la base y no del índice.
+    Devuelve ``(curso, (motivo, curso_id))`` del primer cruce o ``None``. Si
+    hay un cruce, el índice de este proceso estaba desactualizado y se descarta.
+    """
+    from ..models import Curso, Semestre
+    from .referencia import franjas_horarias
+
+    cursos = [curso for curso in cursos if curso.dia]
+    if not cursos:
+        return None
+    semestres = sorted({curso.semestre_id for curso in cursos})
+    list(Semestre.objects.select_for_update().filter(pk__in=semestres).order_by('pk').values_list('pk', flat=True))
+
+    # Solo los cursos que comparten docente o cohorte con los que se guardan
+    relacionados = Q(docente_id__in={curso.docente_id for curso in cursos if curso.docente_id})
+    grupos = {grupo_de(curso) for curso in cursos} - {None}
+    if grupos:
+        relacionados |= Q(especialidad__grupo_id__in=grupos)
+    relacionados |= Q(especialidad_id__in={curso.especialidad_id for curso in cursos if curso.especialidad_id})
+    otros = (
+        Curso.objects.filter(relacionados, semestre_id__in=semestres, dia__in={curso.dia for curso in cursos})
+        .exclude(pk__in=[curso.pk for curso in cursos]).select_related('especialidad')
+    )
+
+    rejilla = Rejilla(franjas_horarias())
+    mapas = {semestre_id: MapaOcupacion(rejilla) for semestre_id in semestres}
+    for otro in otros:
+        mapas[otro.semestre_id].ocupar(otro, rejilla.mascara_curso(otro))
+    for curso in cursos:
+        mapa, mascara = mapas[curso.semestre_id], rejilla.mascara_curso(curso)
+        conflicto = mapa.conflicto(curso, mascara)
+        if conflicto:
+            invalidar_indices()
+            return curso, conflicto
+        mapa.ocupar(curso, mascara)
+    return None
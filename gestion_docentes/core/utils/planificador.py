@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Cambios del planificador de horarios como deltas.
+
+Las APIs que mueven cursos devuelven solo las filas de los cursos que
+cambiaron (``datos_curso``), y cada cambio se publica en un registro por
+semestre guardado en la caché compartida, con un número de secuencia. El
+stream SSE ``api_planificador_eventos`` lo recorre desde el último número que
+vio cada navegador, así que varios coordinadores pueden planificar a la vez
+sin recargar la parrilla completa.
+
+Los cambios se publican desde las señales de ``Curso``, y a mano después de
+un ``bulk_update`` (ver ``solver``). Si un navegador se atrasa más que la
+retención del registro, se le pide recargar. La secuencia y los eventos viven
+en la caché por defecto, que debe ser compartida entre procesos (ver CACHES
+en settings): un navegador que se reconecta a otro worker sigue donde iba.
+
+Con WSGI cada stream retiene un hilo mientras espera: solo ``MAX_FLUJOS`` por
+proceso esperan cambios, y los demás reciben lo pendiente y se reconectan
+más tarde, como un sondeo. Con ASGI (``aflujo_eventos``) la espera no ocupa
+hilos.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from . import referencia
+
+RETENCION_EVENTOS = 10 * 60
+MAX_EVENTOS_PENDIENTES = 500
+INTERVALO_EVENTOS = 1
+LATIDO = 15
+DURACION_FLUJO = 5 * 60
+REINTENTO_MS = 3000
+MAX_FLUJOS = 4
+REINTENTO_SONDEO_MS = 10000
+
+RECARGAR = 'event: recargar\ndata: {}\n\n'
+
+_flujos = threading.BoundedSemaphore(MAX_FLUJOS)
+
+
+def _clave_secuencia(semestre_id):
+    return f'planificador:{semestre_id}:secuencia'
+
+
+def _clave_evento(semestre_id, numero):
+    return f'planificador:{semestre_id}:evento:{numero}'
+
+
+def datos_curso(curso):
+    """
+    Fila de un curso tal como la dibuja el planificador (asignado o no). El
+    curso debe traer ``docente`` y ``especialidad`` cargados.
+    """
+    franjas = {franja.hora_inicio: franja.id for franja in referencia.franjas_horarias()}
+    docente, especialidad = curso.docente, curso.especialidad
+    return {
+        'id': curso.id, 'nombre': curso.nombre, 'tipo_curso': curso.tipo_curso,
+        'semestre_cursado': curso.semestre_cursado, 'duracion_bloques': curso.duracion_bloques,
+        'docente__first_name': docente.first_name if docente else '',
+        'docente__last_name': docente.last_name if docente else 'N/A',
+        'especialidad__nombre': especialidad.nombre if especialidad else 'N/A',
+        'especialidad__id': curso.especialidad_id,
+        'grupo_id': especialidad.grupo_id if especialidad else None,
+        'dia': curso.dia,
+        'horario_inicio': curso.horario_inicio.strftime('%H:%M:%S') if curso.horario_inicio else None,
+        'franja_id_inicio': franjas.get(curso.horario_inicio) if curso.dia else None,
+    }
+
+
+def secuencia(semestre_id):
+    """Número del último cambio publicado del semestre (0 si no hay ninguno)."""
+    return cache.get(_clave_secuencia(semestre_id), 0)
+
+
+def publicar(semestre_id, filas):
+    """Agrega un evento con ``filas`` al registro del semestre y devuelve su número."""
+    if not semestre_id or not filas:
+        return None
+    clave = _clave_secuencia(semestre_id)
+    cache.add(clave, 0, None)
+    numero = cache.incr(clave)
+    cache.set(_clave_evento(semestre_id, numero), filas, RETENCION_EVENTOS)
+    return numero
+
+
+def publicar_cursos(cursos):
+    """
+    Publica las filas de ``cursos``, agrupadas por semestre, al confirmarse la
+    transacción: los demás navegadores no deben ver un cambio que aún puede
+    deshacerse.
+    """
+    cursos = list(cursos)
+
+    def enviar():
+        por_semestre = {}
+        for curso in cursos:
+            por_semestre.setdefault(curso.semestre_id, []).append(datos_curso(curso))
+        for semestre_id, filas in por_semestre.items():
+            publicar(semestre_id, filas)
+    transaction.on_commit(enviar)
+
+
+def curso_eliminado(curso):
+    fila = {'id': curso.id, 'eliminado': True}
+    transaction.on_commit(lambda: publicar(curso.semestre_id, [fila]))
+
+
+def eventos_desde(semestre_id, ultimo):
+    """
+    Eventos publicados después de ``ultimo`` como pares ``(numero, filas)``.
+
+    Devuelve ``None`` si ya no se pueden reconstruir (el navegador se atrasó
+    más que la retención o la caché se vació): hay que recargar la parrilla.
+    """
+    actual = secuencia(semestre_id)
+    if ultimo > actual or actual - ultimo > MAX_EVENTOS_PENDIENTES:
+        return None
+    claves = {numero: _clave_evento(semestre_id, numero) for numero in range(ultimo + 1, actual + 1)}
+    guardados = cache.get_many(list(claves.values()))
+    if len(guardados) != len(claves):
+        return None
+    return [(numero, guardados[clave]) for numero, clave in claves.items()]
+
+
+def visible_en(fila, especialidad_id, grupo_id, semestre_cursado):
+    """Si un curso aparece en el planificador abierto en esa especialidad y semestre cursado."""
+    if fila.get('eliminado'):
+        return True
+    if fila['semestre_cursado'] != semestre_cursado:
+        return False
+    if fila['especialidad__id'] == especialidad_id:
+        return True
+    # Igual que api_get_cursos_no_asignados: los cursos generales del grupo de la especialidad
+    return fila['tipo_curso'] == 'GENERAL' and fila['grupo_id'] == grupo_id
+
+
+def _pendientes(semestre_id, especialidad_id, grupo_id, semestre_cursado, ultimo):
+    """
+    Mensajes SSE de los eventos publicados después de ``ultimo`` y el número
+    del último, o ``None`` si hay que recargar. Los eventos que no afectan a
+    este planificador solo avanzan el ``id``.
+    """
+    eventos = eventos_desde(semestre_id, ultimo)
+    if eventos is None:
+        return None
+    mensajes = []
+    for ultimo, filas in eventos:
+        visibles = [fila for fila in filas if visible_en(fila, especialidad_id, grupo_id, semestre_cursado)]
+        if visibles:
+            mensajes.append(f'id: {ultimo}\nevent: cursos\ndata: {json.dumps({"cursos": visibles})}\n\n')
+        else:
+            mensajes.append(f'id: {ultimo}\n\n')
+    return mensajes, ultimo
+
+
+def flujo_eventos(semestre_id, especialidad_id, grupo_id, semestre_cursado, ultimo):
+    """
+    Genera el stream SSE con los cambios visibles en un planificador abierto.
+
+    Revisa la caché cada ``INTERVALO_EVENTOS`` segundos y termina a los
+    ``DURACION_FLUJO`` para no retener un hilo del servidor indefinidamente:
+    el ``EventSource`` del navegador se reconecta solo y continúa desde el
+    último ``id`` recibido. Si ya hay ``MAX_FLUJOS`` esperando en este
+    proceso, entrega lo pendiente y pide reconectar en ``REINTENTO_SONDEO_MS``.
+    """
+    if not _flujos.acquire(blocking=False):
+        yield f'retry: {REINTENTO_SONDEO_MS}\n\n'
+        pendientes = _pendientes(semestre_id, especialidad_id, grupo_id, semestre_cursado, ultimo)
+        yield from pendientes[0] if pendientes else [RECARGAR]
+        return
+
+    try:
+        inicio = ultimo_envio = time.monotonic()
+        yield f'retry: {REINTENTO_MS}\n\n'
+        while time.monotonic() - inicio < DURACION_FLUJO:
+            pendientes = _pendientes(semestre_id, especialidad_id, grupo_id, semestre_cursado, ultimo)
+            if pendientes is None:
+                yield RECARGAR
+                return
+            mensajes, ultimo = pendientes
+            if mensajes:
+                yield from mensajes
+                ultimo_envio = time.monotonic()
+            if time.monotonic() - ultimo_envio >= LATIDO:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ': latido\n\n'
+                ultimo_envio = time.monotonic()
+            time.sleep(INTERVALO_EVENTOS)
+    finally:
+        _flujos.release()
+
+
+async def aflujo_eventos(semestre_id, especialidad_id, grupo_id, semestre_cursado, ultimo):
+    """Como ``flujo_eventos``, para ASGI: espera con ``asyncio.sleep`` sin ocupar un hilo ni un cupo."""
+    pendientes_async = sync_to_async(_pendientes, thread_sensitive=False)
+    inicio = ultimo_envio = time.monotonic()
+    yield f'retry: {REINTENTO_MS}\n\n'
+    while time.monotonic() - inicio < DURACION_FLUJO:
+        pendientes = await pendientes_async(semestre_id, especialidad_id, grupo_id, semestre_cursado, ultimo)
+        if pendientes is None:
+            yield RECARGAR
+            return
+        mensajes, ultimo = pendientes
+        for mensaje in mensajes:
+            yield mensaje
+        if mensajes:
+            ultimo_envio = time.monotonic()
+        if time.monotonic() - ultimo_envio >= LATIDO:
+            yield ': latido\n\n'
+            ultimo_envio = time.monotonic()
+        await asyncio.sleep(INTERVALO_EVENTOS)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Datos de referencia en memoria del proceso.
+
+La configuración de la institución, el semestre activo y las franjas horarias
+cambian muy poco pero se consultan en casi todas las vistas. Se guardan en un
+LRU por proceso; cada entrada recuerda el sello de versión compartido con el
+que se cargó (ver ``versiones``), y las señales de esos modelos renuevan el
+sello (ver ``core.signals``) para que todos los procesos los vuelvan a leer.
+
+Los objetos devueltos se comparten entre peticiones: no deben modificarse.
+"""
+import threading
+from collections import OrderedDict
+
+from ..models import ConfiguracionInstitucion, FranjaHoraria, Semestre
+from ..routers import usar_primario
+from . import versiones
+
+MAX_ENTRADAS = 16
+
+CONFIGURACION = 'configuracion'
+SEMESTRE_ACTIVO = 'semestre_activo'
+FRANJAS = 'franjas'
+
+_lock = threading.Lock()
+_entradas = OrderedDict()
+
+
+def _sello(nombre):
+    return f'referencia:{nombre}'
+
+
+def _obtener(nombre, cargar):
+    version = versiones.sello(_sello(nombre))
+    with _lock:
+        entrada = _entradas.get(nombre)
+        if entrada is not None and entrada[0] == version:
+            _entradas.move_to_end(nombre)
+            return entrada[1]
+
+    with usar_primario():
+        valor = cargar()
+    with _lock:
+        _entradas[nombre] = (version, valor)
+        _entradas.move_to_end(nombre)
+        while len(_entradas) > MAX_ENTRADAS:
+            _entradas.popitem(last=False)
+    return valor
+
+
+def invalidar(*nombres):
+    for nombre in nombres:
+        versiones.invalidar(_sello(nombre))
+        with _lock:
+            _entradas.pop(nombre, None)
+
+
+def configuracion_institucion():
+    return _obtener(CONFIGURACION, ConfiguracionInstitucion.load)
+
+
+def semestre_activo(fecha=None):
+    """El semestre en estado ACTIVO; con ``fecha``, solo si esa fecha cae dentro de él."""
+    semestre = _obtener(SEMESTRE_ACTIVO, lambda: Semestre.objects.filter(estado='ACTIVO').first())
+    if semestre and fecha and not (semestre.fecha_inicio <= fecha <= semestre.fecha_fin):
+        return None
+    return semestre
+
+
+def franjas_horarias():
+    """Tupla de las franjas ordenadas por hora de inicio."""
+    return _obtener(FRANJAS, lambda: tuple(FranjaHoraria.objects.order_by('hora_inicio')))
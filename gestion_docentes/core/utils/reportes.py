@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Motor del reporte de asistencia.
+
+El reporte se calcula por conjuntos: el estado presente/ausente de cada docente
+se resuelve con subconsultas EXISTS sobre la misma consulta de docentes, de modo
+que el Paginator corta la página directamente en la base de datos y solo se
+construyen las filas visibles. Los totales del periodo salen de los resúmenes
+de ``utils/acumulados.py``; las marcas una a una solo se cargan en periodos de
+hasta ``MAX_DIAS_DETALLE`` días.
+
+El historial de un docente (``HistorialAsistencia``) se entrega por páginas con
+un cursor por clave en lugar de OFFSET.
+"""
+import hashlib
+import json
+from datetime import date, timedelta
+
+from django.core import signing
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from ..models import Docente, Asistencia, AsistenciaDiaria
+from . import acumulados, versiones
+
+MAX_DIAS_DETALLE = 7
+
+DIAS_HISTORIAL = 30
+TAMANO_PAGINA_HISTORIAL = 50
+MAX_PAGINA_HISTORIAL = 200
+
+
+class ReporteAsistencia:
+    """
+    Secuencia perezosa de filas del reporte, compatible con ``Paginator``.
+
+    Cada fila es un diccionario con las claves ``docente``, ``asistencia_general``
+    (la primera ``AsistenciaDiaria`` del periodo o ``None``), ``asistencias_cursos``
+    (vacía si el periodo es más largo que ``MAX_DIAS_DETALLE``) y ``totales``
+    (ver ``acumulados.totales_periodo``, más ``dias_ausente``). Sin importar el
+    tamaño de la página ni el largo del periodo, obtener una página cuesta a lo
+    sumo cinco consultas.
+    """
+
+    def __init__(self, fecha_inicio, fecha_fin, estado='todos', curso_id=None):
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.estado = estado
+        self.curso_id = curso_id or None
+        self.detallado = (acumulados.como_fecha(fecha_fin) - acumulados.como_fecha(fecha_inicio)).days < MAX_DIAS_DETALLE
+        self._dias_laborables = None
+
+    @property
+    def dias_laborables(self):
+        if self._dias_laborables is None:
+            self._dias_laborables = acumulados.dias_laborables(self.fecha_inicio, self.fecha_fin)
+        return self._dias_laborables
+
+    def _asistencias_diarias(self):
+        return AsistenciaDiaria.objects.filter(fecha__range=[self.fecha_inicio, self.fecha_fin])
+
+    def _asistencias_cursos(self):
+        return Asistencia.objects.filter(fecha__range=[self.fecha_inicio, self.fecha_fin])
+
+    def _presente(self):
+        return Exists(self._asistencias_diarias().filter(docente=OuterRef('pk')))
+
+    def docentes(self):
+        """Consulta de docentes ya filtrada por estado y curso, ordenada por apellido."""
+        docentes = Docente.objects.annotate(presente=self._presente())
+
+        if self.estado == 'presente':
+            docentes = docentes.filter(presente=True)
+        elif self.estado == 'ausente':
+            docentes = docentes.filter(presente=False)
+
+        if self.curso_id:
+            docentes = docentes.filter(Exists(
+                self._asistencias_cursos().filter(docente=OuterRef('pk'), curso_id=self.curso_id)
+            ))
+
+        return docentes.order_by('last_name', 'first_name', 'pk')
+
+    def contadores(self):
+        """Totales para las tarjetas del reporte, resueltos en una sola consulta."""
+        totales = Docente.objects.annotate(presente=self._presente()).aggregate(
+            total=Count('pk'),
+            presentes=Count('pk', filter=Q(presente=True)),
+        )
+        return {
+            'total_docentes': totales['total'],
+            'presentes_count': totales['presentes'],
+            'ausentes_count': totales['total'] - totales['presentes'],
+        }
+
+    def filas(self, docentes):
+        """Construye las filas del reporte para una lista ya materializada de docentes."""
+        ids = [docente.pk for docente in docentes]
+        if not ids:
+            return []
+
+        generales = {}
+        for asistencia in self._asistencias_diarias().filter(docente_id__in=ids).order_by('fecha', 'hora_entrada'):
+            generales.setdefault(asistencia.docente_id, asistencia)
+
+        por_curso = {}
+        if self.detallado:
+            cursos_qs = self._asistencias_cursos().filter(docente_id__in=ids).select_related('curso').order_by('fecha', 'hora_entrada')
+            for asistencia in cursos_qs:
+                por_curso.setdefault(asistencia.docente_id, []).append(asistencia)
+
+        totales = acumulados.totales_periodo(self.fecha_inicio, self.fecha_fin, ids)
+        filas = []
+        for docente in docentes:
+            total = totales.get(docente.pk) or dict.fromkeys(('dias_presente',) + acumulados.CAMPOS, 0)
+            total['dias_ausente'] = max(self.dias_laborables - total['dias_presente'], 0)
+            filas.append({
+                'docente': docente,
+                'asistencia_general': generales.get(docente.pk),
+                'asistencias_cursos': por_curso.get(docente.pk, []),
+                'totales': total,
+            })
+        return filas
+
+    # --- Protocolo de secuencia usado por Paginator ---
+
+    def count(self):
+        return self.docentes().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.filas(list(self.docentes()[key]))
+        return self.filas([self.docentes()[key]])[0]
+
+
+# --- Versión de los datos de los reportes ---
+#
+# Los PDF generados se guardan con la versión de los datos en el nombre. La
+# versión combina un sello compartido general (docentes, cursos,
+# especialidades, días especiales, configuración de la institución) con uno
+# por cada mes del periodo, que solo cambia con las marcas de ese mes: un
+# reporte de meses pasados sigue en caché aunque hoy se marque asistencia.
+
+_SELLO = 'reportes'
+
+
+def _sello_mes(fecha):
+    return f'reportes:{fecha:%Y-%m}'
+
+
+def _meses(desde, hasta):
+    mes = acumulados.como_fecha(desde).replace(day=1)
+    hasta = acumulados.como_fecha(hasta)
+    while mes <= hasta:
+        yield mes
+        mes = (mes + timedelta(days=32)).replace(day=1)
+
+
+def version_datos_reporte(fecha_inicio, fecha_fin):
+    """Versión de los datos que muestra el reporte del periodo (ver ``invalidar_reportes``)."""
+    sellos = [versiones.sello(_SELLO)] + [versiones.sello(_sello_mes(mes)) for mes in _meses(fecha_inicio, fecha_fin)]
+    return hashlib.sha1(':'.join(sellos).encode('utf-8')).hexdigest()[:16]
+
+
+def invalidar_reportes(desde=None, hasta=None):
+    """
+    Renueva la versión de los reportes de los meses entre ``desde`` y ``hasta``
+    (un solo mes si se omite ``hasta``), o de todos si se omiten ambos. La
+    llaman las señales (ver ``core.signals``) y, tras una operación en bloque
+    sin señales, quien la hace.
+    """
+    if desde is None:
+        versiones.invalidar(_SELLO)
+        return
+    for mes in _meses(desde, hasta or desde):
+        versiones.invalidar(_sello_mes(mes))
+
+
+# --- Historial de un docente ---
+
+def _hora_local(valor):
+    return timezone.localtime(valor).strftime('%H:%M') if valor else None
+
+
+def _url(archivo):
+    return archivo.url if archivo else None
+
+
+class HistorialAsistencia:
+    """
+    Una página del historial de asistencia de un docente en un periodo.
+
+    Las entradas generales y las marcas de curso se recorren de la más reciente
+    a la más antigua, ordenadas por ``(fecha, id)``. El cursor (firmado) guarda
+    la última fila entregada de cada lista junto con el docente y el periodo,
+    así que cada página cuesta una consulta por lista aunque esté muy atrás en
+    el historial. ``json()`` produce la respuesta por fragmentos.
+    """
+    FIN = 'fin'
+    SALT = 'reportes.historial'
+
+    def __init__(self, docente, fecha_inicio=None, fecha_fin=None, limite=None, cursor=None):
+        self.docente = docente
+        try:
+            self.limite = min(max(int(limite or TAMANO_PAGINA_HISTORIAL), 1), MAX_PAGINA_HISTORIAL)
+        except ValueError:
+            raise ValueError('El límite debe ser un número entero.')
+
+        if cursor:
+            try:
+                estado = signing.loads(cursor, salt=self.SALT)
+            except signing.BadSignature:
+                raise ValueError('Cursor no válido.')
+            if estado['docente'] != docente.pk:
+                raise ValueError('El cursor corresponde a otro docente.')
+            fecha_inicio, fecha_fin = estado['periodo']
+            self.posiciones = estado['posiciones']
+        else:
+            self.posiciones = {'generales': None, 'cursos': None}
+
+        try:
+            self.fecha_fin = date.fromisoformat(fecha_fin) if fecha_fin else timezone.localdate()
+            self.fecha_inicio = date.fromisoformat(fecha_inicio) if fecha_inicio else self.fecha_fin - timedelta(days=DIAS_HISTORIAL - 1)
+        except ValueError:
+            raise ValueError('Las fechas deben tener el formato AAAA-MM-DD.')
+        if self.fecha_inicio > self.fecha_fin:
+            raise ValueError('La fecha de inicio es posterior a la fecha de fin.')
+
+    def _pagina(self, queryset, lista):
+        """Filas de la página de ``lista`` y la posición desde la que sigue la próxima (o ``FIN``)."""
+        posicion = self.posiciones[lista]
+        if posicion == self.FIN:
+            return [], self.FIN
+        queryset = queryset.filter(docente=self.docente, fecha__range=[self.fecha_inicio, self.fecha_fin])
+        if posicion:
+            fecha, pk = date.fromisoformat(posicion[0]), posicion[1]
+            queryset = queryset.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, pk__lt=pk))
+        filas = list(queryset.order_by('-fecha', '-pk')[:self.limite + 1])
+        if len(filas) <= self.limite:
+            return filas, self.FIN
+        filas = filas[:self.limite]
+        return filas, [filas[-1].fecha.isoformat(), filas[-1].pk]
+
+    def generales(self):
+        filas, self.posiciones['generales'] = self._pagina(
+            AsistenciaDiaria.objects.only('fecha', 'hora_entrada', 'foto_verificacion'), 'generales',
+        )
+        for asistencia in filas:
+            yield {
+                'fecha': asistencia.fecha.isoformat(),
+                'hora_entrada': _hora_local(asistencia.hora_entrada),
+                'foto_entrada_url': _url(asistencia.foto_verificacion),
+            }
+
+    def cursos(self):
+        filas, self.posiciones['cursos'] = self._pagina(
+            # El curso se carga completo: post_init de Curso lee su docente
+            Asistencia.objects.select_related('curso').only(
+                'fecha', 'hora_entrada', 'hora_salida', 'foto_entrada', 'foto_salida', 'curso',
+            ), 'cursos',
+        )
+        for asistencia in filas:
+            yield {
+                'curso': asistencia.curso.nombre,
+                'fecha': asistencia.fecha.isoformat(),
+                'hora_entrada': _hora_local(asistencia.hora_entrada),
+                'hora_salida': _hora_local(asistencia.hora_salida),
+                'foto_entrada_url': _url(asistencia.foto_entrada),
+                'foto_salida_url': _url(asistencia.foto_salida),
+            }
+
+    def siguiente(self):
+        """Cursor de la próxima página, o ``None`` si ya se entregó todo."""
+        if all(posicion == self.FIN for posicion in self.posiciones.values()):
+            return None
+        return signing.dumps({
+            'docente': self.docente.pk,
+            'periodo': [self.fecha_inicio.isoformat(), self.fecha_fin.isoformat()],
+            'posiciones': self.posiciones,
+        }, salt=self.SALT)
+
+    def json(self):
+        docente = {
+            'nombre_completo': f'{self.docente.first_name} {self.docente.last_name}',
+            'dni': self.docente.dni,
+            'foto_url': _url(self.docente.foto),
+        }
+        periodo = {'fecha_inicio': self.fecha_inicio.isoformat(), 'fecha_fin': self.fecha_fin.isoformat()}
+        yield f'{{"status": "success", "docente": {json.dumps(docente)}, "periodo": {json.dumps(periodo)}'
+        for lista in ('generales', 'cursos'):
+            yield f', "asistencias_{lista}": ['
+            for n, fila in enumerate(getattr(self, lista)()):
+                yield (', ' if n else '') + json.dumps(fila)
+            yield ']'
+        yield f', "siguiente": {json.dumps(self.siguiente())}}}'
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Resumen por docente para el dashboard y el perfil.
+
+``ResumenDocente`` guarda los contadores de documentos por estado, las marcas
+del día y el horario del semestre activo; ``ActividadDocente`` es el feed de
+actividad reciente. Las señales aplican cada cambio de forma incremental y, si
+un docente todavía no tiene resumen, se calcula completo la primera vez que se
+necesita.
+"""
+from datetime import time
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from ..models import ActividadDocente, Asistencia, Curso, Documento, ResumenDocente, VersionDocumento
+
+TAMANO_FEED = 10
+
+CAMPO_POR_ESTADO = {
+    'RECIBIDO': 'documentos_recibidos',
+    'EN_REVISION': 'documentos_en_revision',
+    'APROBADO': 'documentos_aprobados',
+    'OBSERVADO': 'documentos_observados',
+    'VENCIDO': 'documentos_vencidos',
+}
+
+
+# --- Cálculo completo ---
+# Cada cálculo recibe varios docentes y resuelve cada dato con una sola consulta
+# agrupada por docente, en lugar de una consulta por docente.
+
+def _horarios(docente_ids):
+    horarios = {docente_id: [] for docente_id in docente_ids}
+    cursos = Curso.objects.filter(
+        docente_id__in=horarios, semestre__estado='ACTIVO', dia__isnull=False,
+    ).order_by('horario_inicio', 'pk').values('docente_id', 'id', 'nombre', 'carrera__nombre', 'dia', 'horario_inicio', 'horario_fin')
+    for c in cursos:
+        horarios[c['docente_id']].append({
+            'id': c['id'],
+            'nombre': c['nombre'],
+            'carrera': c['carrera__nombre'],
+            'dia': c['dia'],
+            'horario_inicio': c['horario_inicio'].isoformat() if c['horario_inicio'] else None,
+            'horario_fin': c['horario_fin'].isoformat() if c['horario_fin'] else None,
+        })
+    return horarios
+
+
+def _conteos_documentos(docente_ids):
+    vacio = dict.fromkeys(['documentos_total', *CAMPO_POR_ESTADO.values()], 0)
+    conteos = {docente_id: dict(vacio) for docente_id in docente_ids}
+    filas = Documento.objects.filter(docente_id__in=conteos).values('docente_id').annotate(
+        documentos_total=Count('pk'),
+        **{campo: Count('pk', filter=Q(estado=estado)) for estado, campo in CAMPO_POR_ESTADO.items()},
+    ).order_by()
+    for fila in filas:
+        conteos[fila.pop('docente_id')] = fila
+    return conteos
+
+
+def _asistencias_del_dia(docente_ids, fecha):
+    return dict(
+        Asistencia.objects.filter(docente_id__in=docente_ids, fecha=fecha)
+        .values('docente_id').annotate(total=Count('pk')).order_by().values_list('docente_id', 'total')
+    )
+
+
+def _actividad_entrada(asistencia):
+    return ActividadDocente(
+        docente_id=asistencia.docente_id, tipo='asistencia_entrada', fecha=asistencia.hora_entrada, asistencia=asistencia,
+        texto=f"Marcó entrada en el curso '{asistencia.curso.nombre}'.",
+    )
+
+
+def _actividad_salida(asistencia):
+    return ActividadDocente(
+        docente_id=asistencia.docente_id, tipo='asistencia_salida', fecha=asistencia.hora_salida, asistencia=asistencia,
+        texto=f"Marcó salida del curso '{asistencia.curso.nombre}'.",
+    )
+
+
+def _actividad_version(version):
+    return ActividadDocente(
+        docente_id=version.documento.docente_id, tipo='documento', fecha=version.fecha_version, version=version,
+        texto=f"Subió una nueva versión (v{version.numero_version}) del documento '{version.documento.titulo}'.",
+    )
+
+
+def _ultimas(queryset, docente, orden):
+    """Las ``TAMANO_FEED`` filas más recientes de cada docente, numeradas con una función de ventana."""
+    return queryset.annotate(
+        puesto=Window(RowNumber(), partition_by=F(docente), order_by=F(orden).desc()),
+    ).filter(puesto__lte=TAMANO_FEED)
+
+
+def _reconstruir_feeds(docente_ids):
+    actividades = {docente_id: [] for docente_id in docente_ids}
+    asistencias = Asistencia.objects.filter(docente_id__in=actividades, hora_entrada__isnull=False).select_related('curso')
+    for asistencia in _ultimas(asistencias, 'docente_id', 'hora_entrada'):
+        actividades[asistencia.docente_id].append(_actividad_entrada(asistencia))
+        if asistencia.hora_salida:
+            actividades[asistencia.docente_id].append(_actividad_salida(asistencia))
+    versiones = VersionDocumento.objects.filter(documento__docente_id__in=actividades).select_related('documento')
+    for version in _ultimas(versiones, 'documento__docente_id', 'fecha_version'):
+        actividades[version.documento.docente_id].append(_actividad_version(version))
+
+    feeds = []
+    for feed in actividades.values():
+        feed.sort(key=lambda a: a.fecha, reverse=True)
+        feeds.extend(feed[:TAMANO_FEED])
+    ActividadDocente.objects.filter(docente_id__in=actividades).delete()
+    ActividadDocente.objects.bulk_create(feeds)
+
+
+def recalcular_resumen(docente_id):
+    """Calcula el resumen de un docente desde las tablas de origen."""
+    hoy = timezone.localdate()
+    with transaction.atomic():
+        resumen, _ = ResumenDocente.objects.update_or_create(docente_id=docente_id, defaults={
+            **_conteos_documentos([docente_id])[docente_id],
+            'asistencias_fecha': hoy,
+            'asistencias_dia': _asistencias_del_dia([docente_id], hoy).get(docente_id, 0),
+            'horario': _horarios([docente_id])[docente_id],
+        })
+        _reconstruir_feeds([docente_id])
+    return resumen
+
+
+def resumen_docente(docente):
+    try:
+        return ResumenDocente.objects.get(pk=docente.pk)
+    except ResumenDocente.DoesNotExist:
+        return recalcular_resumen(docente.pk)
+
+
+def actualizar_resumenes(docente_ids):
+    """
+    Recalcula los resúmenes ya existentes de ``docente_ids``, p. ej. tras un
+    ``bulk_create`` que no emite señales. Los que faltan se calculan al leerse.
+    """
+    resumenes = list(ResumenDocente.objects.filter(pk__in=set(docente_ids)))
+    if not resumenes:
+        return
+    ids = [resumen.pk for resumen in resumenes]
+    hoy, ahora = timezone.localdate(), timezone.now()
+    conteos, asistencias, horarios = _conteos_documentos(ids), _asistencias_del_dia(ids, hoy), _horarios(ids)
+    for resumen in resumenes:
+        for campo, valor in conteos[resumen.pk].items():
+            setattr(resumen, campo, valor)
+        resumen.asistencias_fecha, resumen.asistencias_dia = hoy, asistencias.get(resumen.pk, 0)
+        resumen.horario, resumen.actualizado = horarios[resumen.pk], ahora
+    with transaction.atomic():
+        ResumenDocente.objects.bulk_update(resumenes, [
+            'documentos_total', *CAMPO_POR_ESTADO.values(), 'asistencias_fecha', 'asistencias_dia', 'horario', 'actualizado',
+        ], batch_size=500)
+        _reconstruir_feeds(ids)
+
+
+# --- Lectura para las vistas ---
+
+def asistencias_de_hoy(resumen):
+    return resumen.asistencias_dia if resumen.asistencias_fecha == timezone.localdate() else 0
+
+
+def cursos_del_dia(resumen, dia):
+    """Cursos del horario guardado para ``dia``, con las horas como ``time`` para las plantillas."""
+    cursos = []
+    for curso in resumen.horario:
+        if curso['dia'] != dia:
+            continue
+        cursos.append({
+            **curso,
+            'carrera': {'nombre': curso['carrera']},
+            'horario_inicio': time.fromisoformat(curso['horario_inicio']) if curso['horario_inicio'] else None,
+            'horario_fin': time.fromisoformat(curso['horario_fin']) if curso['horario_fin'] else None,
+        })
+    return cursos
+
+
+# --- Mantenimiento incremental (llamado desde signals.py) ---
+
+def _existe(docente_id):
+    """
+    ``True`` si el docente ya tenía resumen. Si no, se calcula completo (lo que
+    ya incluye el cambio que disparó la señal) y se devuelve ``False``.
+    """
+    if ResumenDocente.objects.filter(pk=docente_id).exists():
+        return True
+    recalcular_resumen(docente_id)
+    return False
+
+
+def _sumar(docente_id, **deltas):
+    ResumenDocente.objects.filter(pk=docente_id).update(**{campo: F(campo) + delta for campo, delta in deltas.items()})
+
+
+def _agregar_actividades(docente_id, actividades):
+    ActividadDocente.objects.bulk_create(actividades)
+    # El feed solo conserva los últimos TAMANO_FEED eventos
+    conservar = list(ActividadDocente.objects.filter(docente_id=docente_id).values_list('pk', flat=True)[:TAMANO_FEED])
+    ActividadDocente.objects.filter(docente_id=docente_id).exclude(pk__in=conservar).delete()
+
+
+def documento_guardado(documento, created):
+    anterior = documento._estado_inicial
+    documento._estado_inicial = documento.estado
+    if not _existe(documento.docente_id):
+        return
+    if created:
+        _sumar(documento.docente_id, documentos_total=1, **{CAMPO_POR_ESTADO[documento.estado]: 1})
+    elif anterior != documento.estado:
+        _sumar(documento.docente_id, **{CAMPO_POR_ESTADO[anterior]: -1, CAMPO_POR_ESTADO[documento.estado]: 1})
+
+
+def documento_eliminado(documento):
+    _sumar(documento.docente_id, documentos_total=-1, **{CAMPO_POR_ESTADO[documento._estado_inicial]: -1})
+
+
+def version_creada(version):
+    if _existe(version.documento.docente_id):
+        _agregar_actividades(version.documento.docente_id, [_actividad_version(version)])
+
+
+def _fecha_asistencia(asistencia):
+    # ``fecha`` tiene timezone.now como default, así que antes de recargarse puede ser un datetime
+    return Asistencia._meta.get_field('fecha').to_python(asistencia.fecha)
+
+
+def _contar_asistencia(docente_id, fecha, delta):
+    with transaction.atomic():
+        resumen = ResumenDocente.objects.select_for_update().filter(pk=docente_id).first()
+        if resumen is None:
+            return
+        if resumen.asistencias_fecha == fecha:
+            resumen.asistencias_dia = max(resumen.asistencias_dia + delta, 0)
+        elif delta > 0 and (resumen.asistencias_fecha is None or fecha > resumen.asistencias_fecha):
+            resumen.asistencias_fecha, resumen.asistencias_dia = fecha, 1
+        else:
+            return
+        resumen.save(update_fields=['asistencias_fecha', 'asistencias_dia'])
+
+
+def asistencia_guardada(asistencia, created):
+    entrada_inicial, salida_inicial = asistencia._marcas_iniciales
+    asistencia._marcas_iniciales = (asistencia.hora_entrada, asistencia.hora_salida)
+    if not _existe(asistencia.docente_id):
+        return
+    if created:
+        _contar_asistencia(asistencia.docente_id, _fecha_asistencia(asistencia), 1)
+    nuevas = []
+    if asistencia.hora_entrada and not entrada_inicial:
+        nuevas.append(_actividad_entrada(asistencia))
+    if asistencia.hora_salida and not salida_inicial:
+        nuevas.append(_actividad_salida(asistencia))
+    if nuevas:
+        _agregar_actividades(asistencia.docente_id, nuevas)
+
+
+def asistencia_eliminada(asistencia):
+    # Las actividades de la marca se borran en cascada
+    _contar_asistencia(asistencia.docente_id, _fecha_asistencia(asistencia), -1)
+
+
+def actualizar_horarios(docente_ids=None):
+    """Vuelve a guardar el horario de los docentes indicados (o de todos si es ``None``)."""
+    resumenes = ResumenDocente.objects.only('pk')
+    if docente_ids is not None:
+        resumenes = resumenes.filter(pk__in=set(docente_ids) - {None})
+    resumenes = list(resumenes)
+    horarios = _horarios([resumen.pk for resumen in resumenes])
+    for resumen in resumenes:
+        resumen.horario = horarios[resumen.pk]
+    ResumenDocente.objects.bulk_update(resumenes, ['horario'], batch_size=500)
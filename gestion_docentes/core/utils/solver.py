@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Asignación automática de horarios.
+
+Búsqueda con retroceso sobre el ``MapaOcupacion``: en cada paso se elige el
+curso con menos posiciones libres (MRV), se prueba cada posición y se propaga
+la ocupación con operaciones de bits. Si un curso no tiene lugar se deja sin
+asignar y se sigue con el resto; se conserva la mejor solución encontrada. Al
+agotar el presupuesto de nodos o de tiempo se deja de retroceder y los cursos
+que la mejor solución dejó sin asignar se completan en modo voraz (primera
+posición libre), de modo que la respuesta queda acotada incluso con una
+carrera completa.
+"""
+import time
+
+from .movimientos import guardar_horarios
+from .ocupacion import indice_semestre
+
+LIMITE_NODOS = 20000
+LIMITE_SEGUNDOS = 0.5
+
+_POSICION = 'posicion'
+_SIN_ASIGNAR = 'sin_asignar'
+
+
+class Solver:
+    def __init__(self, mapa, cursos, limite_nodos=LIMITE_NODOS, limite_segundos=LIMITE_SEGUNDOS):
+        self.mapa = mapa
+        self.rejilla = mapa.rejilla
+        self.cursos = list(cursos)
+        self.limite_nodos = limite_nodos
+        self.limite = time.monotonic() + limite_segundos
+        self.nodos = 0
+        self.actual = {}
+        self.mejor = {}
+        self._posiciones = {}
+        self._dominios = {}
+        # Qué cursos pendientes ven cambiar su dominio cuando se ocupa una clave
+        self._afectados = {}
+        for curso in self.cursos:
+            for tabla, clave in mapa.restricciones(curso):
+                self._afectados.setdefault((id(tabla), clave), []).append(curso.id)
+
+    @property
+    def agotado(self):
+        return self.nodos >= self.limite_nodos or time.monotonic() >= self.limite
+
+    def candidatos(self, curso):
+        dominio = self._dominios.get(curso.id)
+        if dominio is None:
+            duracion = curso.duracion_bloques
+            if duracion not in self._posiciones:
+                self._posiciones[duracion] = self.rejilla.inicios(duracion)
+            bloqueadas = self.mapa.bloqueadas(curso)
+            dominio = [posicion for posicion in self._posiciones[duracion] if not posicion[0] & bloqueadas]
+            self._dominios[curso.id] = dominio
+        return dominio
+
+    def _invalidar(self, curso):
+        for tabla, clave in self.mapa.claves(curso):
+            for curso_id in self._afectados.get((id(tabla), clave), ()):
+                self._dominios.pop(curso_id, None)
+
+    def resolver(self):
+        """Devuelve ``{curso_id: (mascara, dia, indice_franja)}`` con la mejor asignación hallada."""
+        self._buscar(self.cursos)
+        if self.agotado and len(self.mejor) < len(self.cursos):
+            self._completar_voraz()
+        return self.mejor
+
+    def _completar_voraz(self):
+        """
+        Ubica en su primera posición libre, en el orden de entrada, los cursos
+        que la mejor solución dejó sin asignar. La búsqueda ya deshizo todo lo
+        que ocupó, así que se parte de la ocupación de ``self.mejor``.
+        """
+        for curso in self.cursos:
+            if curso.id in self.mejor:
+                self.mapa.ocupar(curso, self.mejor[curso.id][0])
+                self._invalidar(curso)
+        for curso in self.cursos:
+            if curso.id in self.mejor:
+                continue
+            posiciones = self.candidatos(curso)
+            if posiciones:
+                self.mapa.ocupar(curso, posiciones[0][0])
+                self._invalidar(curso)
+                self.mejor[curso.id] = posiciones[0]
+
+    def _nodo(self, pendientes, pila):
+        """
+        Entra en un nodo con los cursos ``pendientes``. Devuelve su resultado si
+        se resuelve sin explorar (``True`` si no queda nada por ubicar, ``False``
+        si se poda), o ``None`` tras apilar su marco.
+        """
+        if len(self.actual) > len(self.mejor):
+            self.mejor = dict(self.actual)
+        if not pendientes:
+            return True
+        # Poda: aun ubicando todo lo pendiente no se mejoraría lo ya encontrado
+        if len(self.actual) + len(pendientes) <= len(self.mejor):
+            return False
+        self.nodos += 1
+
+        elegido, opciones = None, None
+        for curso in pendientes:
+            posiciones = self.candidatos(curso)
+            if opciones is None or len(posiciones) < len(opciones):
+                elegido, opciones = curso, posiciones
+                if not posiciones:
+                    break
+        resto = [curso for curso in pendientes if curso is not elegido]
+        # Marco: [curso elegido, posiciones por probar, resto, qué rama está abierta]
+        pila.append([elegido, iter(opciones), resto, None])
+        return None
+
+    def _buscar(self, pendientes):
+        """
+        Búsqueda en profundidad con una pila explícita (una carrera completa
+        supera el límite de recursión de Python). Cada marco prueba las
+        posiciones de su curso y, como última alternativa, lo deja sin asignar.
+        Devuelve ``True`` si se ubicaron todos los cursos.
+        """
+        pila = []
+        resultado = self._nodo(pendientes, pila)
+        while pila:
+            marco = pila[-1]
+            elegido, opciones, resto, rama = marco
+            if rama == _POSICION:
+                # Volvió la rama con el curso ubicado: se deshace antes de seguir
+                self.mapa.liberar(elegido)
+                self._invalidar(elegido)
+                del self.actual[elegido.id]
+                if resultado or self.agotado:
+                    pila.pop()
+                    continue
+            elif rama == _SIN_ASIGNAR:
+                # El resultado de la rama sin este curso es el del marco
+                pila.pop()
+                continue
+
+            posicion = next(opciones, None)
+            if posicion is not None:
+                self.mapa.ocupar(elegido, posicion[0])
+                self._invalidar(elegido)
+                self.actual[elegido.id] = posicion
+                marco[3] = _POSICION
+            else:
+                marco[3] = _SIN_ASIGNAR
+            resultado = self._nodo(resto, pila)
+        return resultado
+
+
+def auto_asignar(semestre, cursos_qs):
+    """
+    Ubica los cursos sin horario de ``cursos_qs`` respetando lo ya programado
+    en el semestre y guarda el resultado con un único ``bulk_update``.
+
+    Devuelve ``(asignados, total)``: los cursos que se ubicaron y cuántos había
+    por ubicar.
+    """
+    with indice_semestre(semestre.id) as compartido:
+        mapa = compartido.copia()
+    rejilla = mapa.rejilla
+
+    # Los cursos largos primero, como hacía la asignación anterior ante empates de MRV
+    cursos = list(cursos_qs.filter(dia__isnull=True).select_related('docente', 'especialidad').order_by('-duracion_bloques', 'pk'))
+    if not cursos or not rejilla.n_franjas:
+        return [], len(cursos)
+
+    solucion = Solver(mapa, cursos).resolver()
+
+    por_actualizar = []
+    for curso in cursos:
+        if curso.id not in solucion:
+            continue
+        _, dia, indice = solucion[curso.id]
+        curso.dia = dia
+        curso.horario_inicio = rejilla.franjas[indice].hora_inicio
+        curso.horario_fin = rejilla.franjas[indice + curso.duracion_bloques - 1].hora_fin
+        por_actualizar.append(curso)
+
+    guardar_horarios(por_actualizar)
+    return por_actualizar, len(cursos)
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Subida de documentos por fragmentos.
+
+El cliente abre una sesión (``SubidaDocumento``), envía el archivo en trozos
+con su desplazamiento y, al terminar, la sesión se completa creando el
+documento o la nueva versión. Los fragmentos se escriben directamente en un
+archivo parcial bajo MEDIA_ROOT; el tipo se valida con la firma de los primeros
+bytes y el tamaño con lo declarado al abrir la sesión. El archivo final se
+guarda con su SHA-256 como nombre, así que subir dos veces el mismo contenido
+no ocupa espacio dos veces.
+"""
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Documento, SubidaDocumento, VersionDocumento
+
+DOCUMENTO_MAX_BYTES = getattr(settings, 'DOCUMENTO_MAX_BYTES', 50 * 1024 * 1024)
+FRAGMENTO_MAX_BYTES = getattr(settings, 'DOCUMENTO_FRAGMENTO_BYTES', 1024 * 1024)
+SUBIDAS_VENCEN_HORAS = 24
+BLOQUE_LECTURA = 64 * 1024
+
+# Firma de los primeros bytes de cada formato admitido (un DOCX es un ZIP)
+FIRMAS = {
+    '.pdf': b'%PDF-',
+    '.docx': b'PK\x03\x04',
+}
+
+
+class FragmentoFueraDeOrden(ValueError):
+    """El fragmento no empieza donde terminó lo recibido; el cliente debe retomar desde ``recibido``."""
+
+    def __init__(self, recibido):
+        super().__init__('El fragmento no continúa la subida.')
+        self.recibido = recibido
+
+
+def extension_de(nombre):
+    return os.path.splitext(nombre)[1].lower()
+
+
+def validar_archivo(nombre, tamano):
+    if extension_de(nombre) not in FIRMAS:
+        raise ValueError('Solo se permiten archivos PDF o DOCX.')
+    if tamano < len(FIRMAS[extension_de(nombre)]):
+        raise ValueError('El archivo está vacío.')
+    if tamano > DOCUMENTO_MAX_BYTES:
+        raise ValueError(f'El archivo no debe exceder {DOCUMENTO_MAX_BYTES // (1024 * 1024)}MB.')
+
+
+def ruta_parcial(subida):
+    return default_storage.path(f'documentos/subidas/{subida.pk}.part')
+
+
+def nombre_contenido(sha256, extension):
+    return f'documentos/contenido/{sha256[:2]}/{sha256}{extension}'
+
+
+def eliminar_subidas_vencidas():
+    """Borra las sesiones sin actividad en SUBIDAS_VENCEN_HORAS junto con su archivo parcial."""
+    limite = timezone.now() - timedelta(hours=SUBIDAS_VENCEN_HORAS)
+    vencidas = list(SubidaDocumento.objects.filter(estado='EN_CURSO', actualizada__lt=limite))
+    for subida in vencidas:
+        if os.path.exists(ruta_parcial(subida)):
+            os.remove(ruta_parcial(subida))
+    SubidaDocumento.objects.filter(pk__in=[s.pk for s in vencidas]).delete()
+    return len(vencidas)
+
+
+def iniciar_subida(docente, nombre, tamano, documento=None, tipo_documento=None, titulo='', sha256=''):
+    validar_archivo(nombre, tamano)
+    sha256 = sha256.lower()
+    if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        raise ValueError('El SHA-256 declarado no es válido.')
+    if documento is None and (tipo_documento is None or not titulo):
+        raise ValueError('Indique el título y la categoría del documento.')
+    eliminar_subidas_vencidas()
+    subida = SubidaDocumento.objects.create(
+        docente=docente, documento=documento, tipo_documento=tipo_documento, titulo=titulo[:200],
+        nombre_archivo=os.path.basename(nombre)[:255], tamano=tamano, sha256=sha256,
+    )
+    os.makedirs(os.path.dirname(ruta_parcial(subida)), exist_ok=True)
+    open(ruta_parcial(subida), 'wb').close()
+    return subida
+
+
+def _leer(flujo, longitud):
+    """Itera ``longitud`` bytes de ``flujo`` en bloques, sin cargarlos completos en memoria."""
+    restante = longitud
+    while restante:
+        bloque = flujo.read(min(BLOQUE_LECTURA, restante))
+        if not bloque:
+            raise ValueError('El fragmento llegó incompleto.')
+        restante -= len(bloque)
+        yield bloque
+
+
+def escribir_fragmento(subida, desplazamiento, flujo, longitud):
+    """
+    Escribe ``longitud`` bytes de ``flujo`` en la posición ``desplazamiento`` y
+    devuelve los bytes recibidos. Reenviar un fragmento ya recibido no cambia
+    nada, de modo que el cliente puede reintentar sin miedo.
+    """
+    if subida.estado != 'EN_CURSO':
+        raise ValueError('La subida ya fue completada.')
+    if longitud <= 0 or longitud > FRAGMENTO_MAX_BYTES:
+        raise ValueError(f'Cada fragmento debe tener entre 1 byte y {FRAGMENTO_MAX_BYTES} bytes.')
+    if desplazamiento + longitud > subida.tamano:
+        raise ValueError('El fragmento excede el tamaño declarado del archivo.')
+    if desplazamiento > subida.recibido:
+        raise FragmentoFueraDeOrden(subida.recibido)
+    if desplazamiento + longitud <= subida.recibido:
+        return subida.recibido
+
+    firma = FIRMAS[extension_de(subida.nombre_archivo)]
+    cabecera = b''
+    with open(ruta_parcial(subida), 'r+b') as parcial:
+        parcial.seek(desplazamiento)
+        for bloque in _leer(flujo, longitud):
+            # El tipo se comprueba con los primeros bytes, antes de escribir el resto
+            if desplazamiento == 0 and len(cabecera) < len(firma):
+                cabecera += bloque[:len(firma) - len(cabecera)]
+                if len(cabecera) == len(firma) and cabecera != firma:
+                    raise ValueError('El contenido no corresponde a un archivo PDF o DOCX.')
+            parcial.write(bloque)
+
+    # Si otra petición avanzó más, no se retrocede el contador
+    SubidaDocumento.objects.filter(pk=subida.pk, recibido__lt=desplazamiento + longitud).update(
+        recibido=desplazamiento + longitud, actualizada=timezone.now(),
+    )
+    subida.recibido = max(subida.recibido, desplazamiento + longitud)
+    return subida.recibido
+
+
+def _hash_archivo(ruta):
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(BLOQUE_LECTURA), b''):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+
+def guardar_contenido(ruta, extension, sha256=None):
+    """
+    Mueve el archivo de ``ruta`` a su nombre por contenido y devuelve ese
+    nombre. Si el contenido ya estaba guardado, el archivo se descarta.
+    """
+    nombre = nombre_contenido(sha256 or _hash_archivo(ruta), extension)
+    destino = default_storage.path(nombre)
+    if os.path.exists(destino):
+        os.remove(ruta)
+    else:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(ruta, destino)
+    return nombre
+
+
+def guardar_archivo_subido(archivo):
+    """Como ``guardar_contenido``, para un archivo recibido por formulario."""
+    sha256 = hashlib.sha256()
+    for bloque in archivo.chunks():
+        sha256.update(bloque)
+    nombre = nombre_contenido(sha256.hexdigest(), extension_de(archivo.name))
+    if not default_storage.exists(nombre):
+        archivo.seek(0)
+        nombre = default_storage.save(nombre, archivo)
+    return nombre
+
+
+def completar_subida(subida_id, docente):
+    """
+    Crea el documento o la nueva versión con el archivo recibido. Es idempotente.
+    Si el archivo no coincide con el SHA-256 declarado, se descarta lo recibido
+    (el cliente retoma desde el byte 0) y se lanza ``ValueError``.
+    """
+    with transaction.atomic():
+        subida = SubidaDocumento.objects.select_for_update().select_related('documento').get(pk=subida_id, docente=docente)
+        if subida.estado == 'COMPLETADA':
+            return subida
+        if subida.recibido != subida.tamano:
+            raise ValueError(f'Faltan {subida.tamano - subida.recibido} bytes por recibir.')
+
+        sha256 = _hash_archivo(ruta_parcial(subida))
+        if subida.sha256 and sha256 != subida.sha256:
+            open(ruta_parcial(subida), 'wb').close()
+            subida.recibido = 0
+            subida.save(update_fields=['recibido', 'actualizada'])
+        else:
+            archivo = guardar_contenido(ruta_parcial(subida), extension_de(subida.nombre_archivo), sha256)
+            if subida.documento:
+                documento = subida.documento
+                version = VersionDocumento.objects.create(documento=documento, archivo=archivo)
+                documento.estado = 'EN_REVISION'
+                documento.save()
+            else:
+                # Documento nuevo: la primera versión se numera sin consultar el contador
+                documento = Documento.objects.create(
+                    titulo=subida.titulo, tipo_documento=subida.tipo_documento, docente=docente, ultima_version=1,
+                )
+                version = VersionDocumento.objects.create(documento=documento, archivo=archivo, numero_version=1)
+
+            subida.estado = 'COMPLETADA'
+            subida.documento = documento
+            subida.version = version
+            subida.save(update_fields=['estado', 'documento', 'version', 'actualizada'])
+            return subida
+    raise ValueError('El archivo recibido no coincide con el enviado; vuelva a subirlo.')
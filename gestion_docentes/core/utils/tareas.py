@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Cola local de tareas en segundo plano.
+
+Las tareas pesadas (PDFs, procesamiento de imágenes, etc.) se ejecutan en un
+pool de hilos del proceso que las encola, para no bloquear el hilo de la
+petición. El estado de cada tarea se guarda en la caché por defecto, de modo
+que cualquier worker puede consultarlo por su identificador (con varios
+procesos la caché debe ser compartida, ver CACHES en settings).
+"""
+import hashlib
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE = 'PENDIENTE'
+EN_PROCESO = 'EN_PROCESO'
+COMPLETADA = 'COMPLETADA'
+FALLIDA = 'FALLIDA'
+
+# Segundos que se conserva el estado de una tarea desde su último cambio
+TAREAS_VIGENCIA = 60 * 60
+
+
+class Tarea:
+    def __init__(self, clave=None):
+        self.id = uuid.uuid4().hex
+        self.clave = clave
+        self.estado = PENDIENTE
+        self.resultado = None
+        self.error = None
+        self.creada = timezone.now()
+        self.finalizada = None
+
+    @property
+    def terminada(self):
+        return self.estado in (COMPLETADA, FALLIDA)
+
+    def como_dict(self):
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'error': self.error,
+            'creada': self.creada.isoformat(),
+            'finalizada': self.finalizada.isoformat() if self.finalizada else None,
+        }
+
+
+_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TAREAS_MAX_WORKERS', 2),
+                thread_name_prefix='sigedo-tareas',
+            )
+        return _executor
+
+
+def _clave_tarea(tarea_id):
+    return f'tareas:{tarea_id}'
+
+
+def _clave_por_clave(clave):
+    # Las claves son rutas de archivo; memcached no admite espacios ni claves largas
+    return f'tareas:clave:{hashlib.sha1(str(clave).encode()).hexdigest()}'
+
+
+def _guardar(tarea):
+    cache.set(_clave_tarea(tarea.id), tarea, TAREAS_VIGENCIA)
+
+
+def _ejecutar(tarea, funcion, args, kwargs):
+    tarea.estado = EN_PROCESO
+    _guardar(tarea)
+    close_old_connections()
+    try:
+        tarea.resultado = funcion(*args, **kwargs)
+        tarea.estado = COMPLETADA
+    except Exception as e:
+        logger.exception("Error en la tarea %s", tarea.id)
+        tarea.error = str(e)
+        tarea.estado = FALLIDA
+    finally:
+        tarea.finalizada = timezone.now()
+        _guardar(tarea)
+        # Cada hilo del pool abre sus propias conexiones; las cerramos al terminar.
+        connections.close_all()
+
+
+def encolar(funcion, *args, clave=None, **kwargs):
+    """
+    Encola ``funcion(*args, **kwargs)`` y devuelve la ``Tarea`` asociada.
+
+    Si se indica ``clave`` y ya existe una tarea con esa clave pendiente o
+    completada (en cualquier proceso), se devuelve esa misma tarea en lugar de
+    encolar otra.
+    """
+    tarea = Tarea(clave=clave)
+    _guardar(tarea)
+    if clave is not None:
+        clave_cache = _clave_por_clave(clave)
+        if not cache.add(clave_cache, tarea.id, TAREAS_VIGENCIA):
+            existente = obtener(cache.get(clave_cache))
+            if existente and existente.estado != FALLIDA:
+                cache.delete(_clave_tarea(tarea.id))
+                return existente
+            cache.set(clave_cache, tarea.id, TAREAS_VIGENCIA)
+    _get_executor().submit(_ejecutar, tarea, funcion, args, kwargs)
+    return tarea
+
+
+def obtener(tarea_id):
+    return cache.get(_clave_tarea(tarea_id)) if tarea_id else None
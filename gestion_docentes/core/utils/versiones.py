@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Sellos de versión compartidos entre procesos.
+
+Quien guarda datos derivados (en memoria del proceso o en la caché) recuerda
+el sello con el que los calculó y los descarta cuando el sello cambia. Los
+sellos viven en la caché por defecto, sin expiración, así que son comunes a
+todos los procesos solo si esa caché es compartida: ``settings.CACHES`` exige
+Redis o Memcached (``SIGEDO_CACHE_URL``) en el perfil postgres.
+
+Si la caché pierde un sello, el siguiente ``sello`` crea uno nuevo y todos los
+datos derivados se recalculan: se pierde trabajo, nunca se sirven datos viejos.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _clave(nombre):
+    return f'version:{nombre}'
+
+
+def sello(nombre):
+    """Sello actual de ``nombre``; lo crea si no existe."""
+    clave = _clave(nombre)
+    version = cache.get(clave)
+    if version is None:
+        # add() no pisa el sello que otro proceso haya creado al mismo tiempo
+        nuevo = uuid.uuid4().hex
+        cache.add(clave, nuevo, None)
+        version = cache.get(clave) or nuevo
+    return version
+
+
+def renovar(nombre):
+    """Cambia el sello de ``nombre`` y devuelve el nuevo."""
+    version = uuid.uuid4().hex
+    cache.set(_clave(nombre), version, None)
+    return version
+
+
+def invalidar(nombre):
+    """
+    Renueva el sello ya y otra vez al confirmarse la transacción en curso: un
+    proceso que recargue los datos antes del commit los guardaría con el sello
+    nuevo y seguiría sirviendo la versión anterior.
+    """
+    renovar(nombre)
+    transaction.on_commit(lambda: renovar(nombre))
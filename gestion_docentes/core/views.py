@@ -2,29 +2,54 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from datetime import time, timedelta, date
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 import json
 import base64
+import logging
 from django.core.files.base import ContentFile
 import random
-import io
-from django.db import models
+from django.db import transaction
 from django.db.models import Q
 from django.templatetags.static import static
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.urls import reverse
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 
 # Importamos todos los modelos, incluyendo los nuevos
 from .models import (
     Docente, Curso, Documento, Asistencia, Carrera, SolicitudIntercambio,
-    TipoDocumento, AsistenciaDiaria, PersonalDocente, ConfiguracionInstitucion,
-    Semestre, DiaEspecial, Especialidad, FranjaHoraria, VersionDocumento,  
+    TipoDocumento, PersonalDocente, DiaEspecial, Especialidad, VersionDocumento,
+    ActividadDocente, SubidaDocumento, Semestre,
 )
+from .routers import lectura_en_replica
 from .forms import DocumentoForm, SolicitudIntercambioForm, VersionDocumentoForm
 from .utils.exports import exportar_reporte_excel, exportar_reporte_pdf
-import qrcode
+from .utils.reportes import MAX_DIAS_DETALLE, HistorialAsistencia, ReporteAsistencia
+from .utils.kiosco import (
+    ainfo_docente_kiosco, aregistrar_marca, contexto_del_dia, info_docente_kiosco, registrar_marca, roster_del_dia,
+    sincronizar_marcas,
+)
+from .utils.imagenes import procesar_foto_verificacion, verificar_foto, FORMATOS_PERMITIDOS, FOTO_MAX_BYTES
+from .utils.solver import auto_asignar
+from .utils.movimientos import aplicar_movimientos, describir_conflicto
+from .utils.ocupacion import conflicto_en_bd, indice_semestre, DIAS_SEMANA
+from .utils.horarios import horario_carrera, horario_especialidad
+from .utils.credenciales import generar_lote_credenciales, nombre_lote
+from .utils.resumen import TAMANO_FEED, asistencias_de_hoy, cursos_del_dia, resumen_docente
+from .utils.subidas import (
+    DOCUMENTO_MAX_BYTES, FRAGMENTO_MAX_BYTES, FragmentoFueraDeOrden,
+    completar_subida, escribir_fragmento, guardar_archivo_subido, iniciar_subida,
+)
+from .utils import acumulados, metricas, planificador, referencia, tareas
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
@@ -33,114 +58,51 @@ def dashboard(request):
     now = timezone.localtime(timezone.now())
     today = now.date()
 
-    # --- LÓGICA MEJORADA PARA EL NUEVO DASHBOARD ---
+    # Las métricas salen de la fila de resumen del docente, que mantienen las señales
+    resumen = resumen_docente(docente)
 
-    # 1. Datos para las tarjetas de métricas
-    documentos_qs = Documento.objects.filter(docente=docente)
-    documentos_observados_count = documentos_qs.filter(estado='OBSERVADO').count()
-    asistencias_count = Asistencia.objects.filter(docente=docente, fecha=today).count()
-    
     dia_actual_str = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'][today.weekday()]
-    cursos_hoy_qs = Curso.objects.filter(
-        docente=docente,
-        dia=dia_actual_str,
-        semestre__estado='ACTIVO'
-    )
-    cursos_hoy_count = cursos_hoy_qs.count()
+    cursos_hoy = cursos_del_dia(resumen, dia_actual_str)
 
-    # 2. Encontrar el próximo curso del día
-    proximo_curso = cursos_hoy_qs.filter(horario_inicio__gte=now.time()).order_by('horario_inicio').first()
+    # Próximo curso del día (el horario guardado ya viene ordenado por hora de inicio)
+    proximo_curso = next(
+        (curso for curso in cursos_hoy if curso['horario_inicio'] and curso['horario_inicio'] >= now.time()),
+        None,
+    )
 
-    # 3. Crear la línea de tiempo de actividad reciente (últimas 3 acciones)
-    asistencias_recientes = Asistencia.objects.filter(docente=docente).order_by('-hora_entrada')[:3]
-    versiones_recientes = VersionDocumento.objects.filter(documento__docente=docente).select_related('documento').order_by('-fecha_version')[:3]
-    
-    actividad_reciente = []
-    for asistencia in asistencias_recientes:
-        if asistencia.hora_entrada:
-            actividad_reciente.append({
-                'fecha': asistencia.hora_entrada,
-                'texto': f"Marcó entrada en '{asistencia.curso.nombre}'",
-                'tipo': 'asistencia'
-            })
-    for version in versiones_recientes:
-        actividad_reciente.append({
-            'fecha': version.fecha_version,
-            'texto': f"Subió el documento '{version.documento.titulo}'",
-            'tipo': 'documento'
-        })
-    
-    # Ordenamos la actividad combinada por fecha y tomamos los 3 más recientes
-    actividad_reciente.sort(key=lambda item: item['fecha'], reverse=True)
-    
     context = {
-        'asistencias_count': asistencias_count,
-        'documentos_observados_count': documentos_observados_count,
-        'cursos_hoy_count': cursos_hoy_count,
+        'asistencias_count': asistencias_de_hoy(resumen),
+        'documentos_observados_count': resumen.documentos_observados,
+        'cursos_hoy_count': len(cursos_hoy),
         'proximo_curso': proximo_curso,
-        'actividad_reciente': actividad_reciente[:3], # Pasamos solo los 3 últimos eventos
+        'actividad_reciente': ActividadDocente.objects.filter(docente=docente)[:3],
     }
     return render(request, 'dashboard.html', context)
 
 @login_required
 def perfil(request):
     docente = request.user
-    
-    # --- PREPARACIÓN DE DATOS PARA EL NUEVO PERFIL ---
+    resumen = resumen_docente(docente)
 
     # 1. Datos para el Gráfico de Documentos
-    documentos = Documento.objects.filter(docente=docente)
     status_counts = {
-        'APROBADO': documentos.filter(estado='APROBADO').count(),
-        'EN_REVISION': documentos.filter(estado='EN_REVISION').count(),
-        'OBSERVADO': documentos.filter(estado='OBSERVADO').count(),
-        'RECIBIDO': documentos.filter(estado='RECIBIDO').count(),
+        'APROBADO': resumen.documentos_aprobados,
+        'EN_REVISION': resumen.documentos_en_revision,
+        'OBSERVADO': resumen.documentos_observados,
+        'RECIBIDO': resumen.documentos_recibidos,
     }
     # Convertimos a JSON para pasarlo al JavaScript del gráfico
     documentos_status_json = json.dumps(list(status_counts.values()))
     documentos_labels_json = json.dumps(list(status_counts.keys()))
 
-    # 2. Creación de la Línea de Tiempo (Timeline)
-    # Combinamos las asistencias de hoy y las versiones de documentos recientes
-    
-    today = timezone.localtime(timezone.now()).date()
-    asistencias_hoy = Asistencia.objects.filter(docente=docente, fecha=today)
-    versiones_recientes = VersionDocumento.objects.filter(documento__docente=docente).select_related('documento').order_by('-fecha_version')[:10]
-
-    timeline = []
-    
-    # Añadimos las asistencias de hoy a la línea de tiempo
-    for asistencia in asistencias_hoy:
-        if asistencia.hora_entrada:
-            timeline.append({
-                'tipo': 'asistencia_entrada',
-                'fecha': asistencia.hora_entrada,
-                'texto': f"Marcó entrada en el curso '{asistencia.curso.nombre}'.",
-            })
-        if asistencia.hora_salida:
-            timeline.append({
-                'tipo': 'asistencia_salida',
-                'fecha': asistencia.hora_salida,
-                'texto': f"Marcó salida del curso '{asistencia.curso.nombre}'.",
-            })
-            
-    # Añadimos las subidas de documentos a la línea de tiempo
-    for version in versiones_recientes:
-        timeline.append({
-            'tipo': 'documento',
-            'fecha': version.fecha_version,
-            'texto': f"Subió una nueva versión (v{version.numero_version}) del documento '{version.documento.titulo}'.",
-            'documento': version.documento # Pasamos el objeto para crear enlaces
-        })
-        
-    # Ordenamos la línea de tiempo por fecha, de más reciente a más antiguo
-    timeline.sort(key=lambda item: item['fecha'], reverse=True)
+    # 2. Línea de tiempo: el feed de actividad ya guarda los últimos eventos ordenados
+    timeline = ActividadDocente.objects.filter(docente=docente).select_related('version__documento')[:TAMANO_FEED]
 
     context = {
-        'timeline': timeline[:10],  # Mostramos los 10 eventos más recientes
+        'timeline': timeline,
         'documentos_status_json': documentos_status_json,
         'documentos_labels_json': documentos_labels_json,
-        'total_documentos': documentos.count(),
+        'total_documentos': resumen.documentos_total,
     }
     
     return render(request, 'perfil.html', context)
@@ -154,13 +116,16 @@ def subir_documento(request):
         if form.is_valid():
             documento = form.save(commit=False)
             documento.docente = request.user
-            # El estado por defecto 'RECIBIDO' se asigna desde el modelo
-            documento.save() 
-
-            VersionDocumento.objects.create(
-                documento=documento,
-                archivo=form.cleaned_data['archivo']
-            )
+            # El estado por defecto 'RECIBIDO' se asigna desde el modelo.
+            # El documento es nuevo, así que la primera versión se numera sin consultar el contador
+            documento.ultima_version = 1
+            with transaction.atomic():
+                documento.save()
+                VersionDocumento.objects.create(
+                    documento=documento,
+                    archivo=guardar_archivo_subido(form.cleaned_data['archivo']),
+                    numero_version=1,
+                )
 
             messages.success(request, f'El documento "{documento.titulo}" se ha subido correctamente.')
             return redirect('lista_documentos')
@@ -169,7 +134,9 @@ def subir_documento(request):
         
     context = {
         'form': form,
-        'tipos_documento': tipos_documento # Le pasamos las categorías a la plantilla
+        'tipos_documento': tipos_documento, # Le pasamos las categorías a la plantilla
+        'documento_max_bytes': DOCUMENTO_MAX_BYTES,
+        'documento_max_mb': DOCUMENTO_MAX_BYTES // (1024 * 1024),
     }
     return render(request, 'subir_documento.html', context)
 
@@ -182,6 +149,7 @@ def subir_nueva_version(request, documento_id):
         if form.is_valid():
             nueva_version = form.save(commit=False)
             nueva_version.documento = documento
+            nueva_version.archivo = guardar_archivo_subido(form.cleaned_data['archivo'])
             nueva_version.save()
             
             # Opcional: Cambiar el estado del documento a "En Revisión"
@@ -195,10 +163,92 @@ def subir_nueva_version(request, documento_id):
         
     context = {
         'form': form,
-        'documento': documento
+        'documento': documento,
+        'documento_max_mb': DOCUMENTO_MAX_BYTES // (1024 * 1024),
     }
     return render(request, 'subir_version.html', context)
 
+
+# --- SUBIDA DE DOCUMENTOS POR FRAGMENTOS ---
+
+def _datos_subida(subida):
+    datos = {
+        'id': str(subida.pk),
+        'nombre_archivo': subida.nombre_archivo,
+        'tamano': subida.tamano,
+        'recibido': subida.recibido,
+        'estado': subida.estado,
+        'tamano_fragmento': FRAGMENTO_MAX_BYTES,
+    }
+    if subida.estado == 'COMPLETADA':
+        datos['documento_id'] = subida.documento_id
+        datos['numero_version'] = subida.version.numero_version if subida.version else None
+    return datos
+
+
+@login_required
+def api_iniciar_subida(request):
+    """Abre una sesión de subida para un documento nuevo o para una nueva versión de ``documento_id``."""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    try:
+        data = json.loads(request.body)
+        documento = tipo_documento = None
+        if data.get('documento_id'):
+            documento = get_object_or_404(Documento, id=data['documento_id'], docente=request.user)
+        else:
+            tipo_documento = TipoDocumento.objects.filter(pk=data.get('tipo_documento')).first()
+        subida = iniciar_subida(
+            request.user, str(data.get('nombre', '')), int(data.get('tamano', 0)),
+            documento=documento, tipo_documento=tipo_documento, titulo=str(data.get('titulo', '')).strip(),
+            sha256=str(data.get('sha256') or ''),
+        )
+    except (json.JSONDecodeError, TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'subida': _datos_subida(subida)}, status=201)
+
+
+@login_required
+def api_estado_subida(request, subida_id):
+    """Estado de la sesión; el cliente lo consulta para retomar desde ``recibido``."""
+    subida = get_object_or_404(SubidaDocumento.objects.select_related('version'), pk=subida_id, docente=request.user)
+    return JsonResponse({'status': 'success', 'subida': _datos_subida(subida)})
+
+
+@login_required
+def api_fragmento_subida(request, subida_id):
+    """
+    Recibe un fragmento como cuerpo crudo de la petición; el desplazamiento va
+    en el parámetro ``offset``. El cuerpo se lee por bloques, sin pasar por los
+    manejadores de subida de Django.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    subida = get_object_or_404(SubidaDocumento, pk=subida_id, docente=request.user)
+    try:
+        recibido = escribir_fragmento(
+            subida, int(request.GET.get('offset', '')), request, int(request.META.get('CONTENT_LENGTH') or 0),
+        )
+    except FragmentoFueraDeOrden as e:
+        return JsonResponse({'status': 'error', 'message': str(e), 'recibido': e.recibido}, status=409)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'recibido': recibido})
+
+
+@login_required
+def api_completar_subida(request, subida_id):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    try:
+        subida = completar_subida(subida_id, request.user)
+    except SubidaDocumento.DoesNotExist:
+        raise Http404("La subida no existe.")
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    messages.success(request, f'El documento "{subida.documento.titulo}" se ha subido correctamente.')
+    return JsonResponse({'status': 'success', 'subida': _datos_subida(subida), 'redirect_url': reverse('lista_documentos')})
+
 @login_required
 def lista_documentos(request):
     # Usamos prefetch_related para cargar las versiones de forma eficiente
@@ -210,7 +260,7 @@ def registrar_asistencia(request):
     # Esta vista puede servir como un historial simple para el docente.
     docente = request.user
     now = timezone.now()
-    semestre_activo = Semestre.objects.filter(estado='ACTIVO', fecha_inicio__lte=now.date(), fecha_fin__gte=now.date()).first()
+    semestre_activo = referencia.semestre_activo(now.date())
     
     curso_actual = None
     if semestre_activo:
@@ -235,58 +285,27 @@ def registrar_asistencia(request):
     })
 
 @login_required
+@lectura_en_replica
 def ver_horarios(request, carrera_id):
-    semestre_activo = Semestre.objects.filter(estado='ACTIVO').first()
+    semestre_activo = referencia.semestre_activo()
     carrera = Carrera.objects.get(id=carrera_id)
     
-    # Obtenemos solo los cursos que ya tienen un día y hora asignados
-    cursos_asignados = Curso.objects.filter(
-        carrera=carrera, 
-        semestre=semestre_activo,
-        dia__isnull=False, 
-        horario_inicio__isnull=False
-    ).order_by('dia', 'horario_inicio')
-    
-    # Preparamos los elementos necesarios para construir la parrilla del horario
-    franjas_horarias = list(FranjaHoraria.objects.all().order_by('hora_inicio'))
-    dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes']
-    
-    # Inicializamos la parrilla vacía. Ej: horario_grid[franja_id][dia] = None
-    horario_grid = {franja.id: {dia: None for dia in dias_semana} for franja in franjas_horarias}
-
-    # Poblamos la parrilla con los cursos asignados
-    for curso in cursos_asignados:
-        try:
-            # Buscamos la franja horaria donde inicia el curso
-            franja_inicio_obj = next(f for f in franjas_horarias if f.hora_inicio == curso.horario_inicio)
-            
-            # Colocamos el objeto 'curso' en la celda correcta de la parrilla
-            horario_grid[franja_inicio_obj.id][curso.dia] = curso
-            
-            # Si el curso dura más de un bloque, marcamos las celdas siguientes como 'OCUPADO'
-            if curso.duracion_bloques > 1:
-                start_index = franjas_horarias.index(franja_inicio_obj)
-                for i in range(1, curso.duracion_bloques):
-                    if (start_index + i) < len(franjas_horarias):
-                        franja_ocupada = franjas_horarias[start_index + i]
-                        horario_grid[franja_ocupada.id][curso.dia] = 'OCUPADO'
-        except (StopIteration, TypeError, AttributeError):
-            # Si un curso tiene una hora de inicio que no coincide con ninguna franja, lo omitimos
-            continue
+    # La parrilla viene precalculada de la caché; solo se arma al cambiar algún horario
+    horario = horario_carrera(semestre_activo.id if semestre_activo else None, carrera.id)
 
     context = {
         'carrera': carrera,
         'semestre_activo': semestre_activo,
-        'horario_grid': horario_grid,
-        'franjas_horarias': franjas_horarias,
-        'dias_semana': dias_semana,
+        'horario_grid': horario['grid'],
+        'franjas_horarias': horario['franjas'],
+        'dias_semana': DIAS_SEMANA,
     }
     
     return render(request, 'ver_horarios.html', context)
 
 @staff_member_required
 def generar_horarios(request, carrera_id):
-    semestre_activo = Semestre.objects.filter(estado='ACTIVO').first()
+    semestre_activo = referencia.semestre_activo()
     if not semestre_activo:
         messages.error(request, "No hay un semestre activo para generar horarios.")
         return redirect('ver_horarios', carrera_id=carrera_id)
@@ -403,7 +422,13 @@ def responder_solicitud(request, solicitud_id):
 # --- VISTAS PARA EL KIOSCO ---
 
 def kiosco_page(request):
-    return render(request, 'kiosco.html')
+    # Con KIOSCO_ASYNC (servidor ASGI) el kiosco usa las vistas asíncronas
+    sufijo = '_async' if getattr(settings, 'KIOSCO_ASYNC', False) else ''
+    rutas = {
+        'info': reverse(f'api_get_teacher_info{sufijo}'),
+        'marca': reverse(f'api_mark_attendance_foto{sufijo}'),
+    }
+    return render(request, 'kiosco.html', {'rutas_kiosco': rutas})
 
 @csrf_exempt
 def get_teacher_info(request):
@@ -411,48 +436,23 @@ def get_teacher_info(request):
         try:
             data = json.loads(request.body)
             qr_id = data.get('qrId')
-            today = timezone.localtime(timezone.now()).date()
+            contexto = contexto_del_dia()
 
-            if today.weekday() in [5, 6]:
+            if contexto['es_fin_de_semana']:
                 return JsonResponse({'status': 'weekend_off', 'message': 'El kiosco de asistencia no está disponible los fines de semana.'})
 
-            docente = Docente.objects.get(id_qr=qr_id)
+            # Docente, marca diaria y cursos del día se resuelven en dos consultas
+            docente, is_daily_marked, courses_data = info_docente_kiosco(qr_id, contexto)
             
             photo_url = request.build_absolute_uri(docente.foto.url) if docente.foto and hasattr(docente.foto, 'url') else request.build_absolute_uri(static('placeholder.png'))
 
-            dia_especial = DiaEspecial.objects.filter(fecha=today).first()
-            if dia_especial:
+            if contexto['dia_especial']:
                 # ... (la lógica de día especial no cambia)
                 pass
 
-            semestre_activo = Semestre.objects.filter(estado='ACTIVO', fecha_inicio__lte=today, fecha_fin__gte=today).first()
-            if not semestre_activo:
+            if not contexto['semestre_id']:
                 return JsonResponse({'status': 'error', 'message': 'No hay un semestre académico activo.'}, status=400)
 
-            is_daily_marked = AsistenciaDiaria.objects.filter(docente=docente, fecha=today).exists()
-            dia_actual_str = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'][today.weekday()]
-            
-            cursos_hoy = Curso.objects.filter(docente=docente, dia=dia_actual_str, semestre=semestre_activo)
-            
-            courses_data = []
-            for curso in cursos_hoy:
-                asistencia_curso = Asistencia.objects.filter(docente=docente, curso=curso, fecha=today).first()
-                
-                # --- LÓGICA MEJORADA PARA DECIDIR QUÉ MOSTRAR ---
-                can_mark_exit = False
-                if asistencia_curso and asistencia_curso.hora_entrada and not asistencia_curso.hora_salida:
-                    if asistencia_curso.hora_salida_permitida and timezone.now() >= asistencia_curso.hora_salida_permitida:
-                        can_mark_exit = True
-                # --- FIN DE LA LÓGICA MEJORADA ---
-
-                courses_data.append({
-                    'id': curso.id,
-                    'name': f'{curso.nombre} ({curso.horario_inicio.strftime("%H:%M")} - {curso.horario_fin.strftime("%H:%M")})',
-                    'entryMarked': asistencia_curso is not None and asistencia_curso.hora_entrada is not None,
-                    'exitMarked': asistencia_curso is not None and asistencia_curso.hora_salida is not None,
-                    'canMarkExit': can_mark_exit, # Nueva bandera para el frontend
-                })
-
             response_data = {
                 'status': 'success',
                 'name': f'{docente.first_name} {docente.last_name}',
@@ -481,43 +481,16 @@ def mark_attendance_kiosk(request):
             
             docente = Docente.objects.get(id_qr=qr_id)
             
-            # --- CORRECCIÓN DE ZONA HORARIA ---
-            # Ahora esta función también usa la hora local, igual que la otra.
-            today = timezone.localtime(timezone.now()).date()
+            # La fecha local de la marca se calcula en registrar_marca a partir de 'now'
             now = timezone.now()
-            # --- FIN DE LA CORRECCIÓN ---
 
             format, imgstr = photo_base64.split(';base64,')
             ext = format.split('/')[-1]
             photo_file = ContentFile(base64.b64decode(imgstr), name=f'{docente.username}_{now.timestamp()}.{ext}')
-            
-            if action_type == 'general_entry':
-                if not AsistenciaDiaria.objects.filter(docente=docente, fecha=today).exists():
-                    AsistenciaDiaria.objects.create(docente=docente, foto_verificacion=photo_file)
-
-            elif action_type in ['course_entry', 'course_exit']:
-                curso_id = data.get('courseId')
-                curso = Curso.objects.get(id=curso_id)
-                
-                # Esta función ahora encontrará el registro correcto porque la fecha coincide.
-                asistencia, created = Asistencia.objects.get_or_create(docente=docente, curso=curso, fecha=today)
-
-                if action_type == 'course_entry' and not asistencia.hora_entrada:
-                    asistencia.hora_entrada = now
-                    asistencia.foto_entrada = photo_file
-                    
-                    duracion_minima_minutos = (curso.duracion_bloques * 50) - 15 
-                    if duracion_minima_minutos < 15:
-                        duracion_minima_minutos = 15
-                    
-                    asistencia.hora_salida_permitida = now + timedelta(minutes=duracion_minima_minutos)
-                    asistencia.save()
-                
-                elif action_type == 'course_exit' and asistencia.hora_entrada and not asistencia.hora_salida:
-                    if asistencia.hora_salida_permitida and now >= asistencia.hora_salida_permitida:
-                        asistencia.hora_salida = now
-                        asistencia.foto_salida = photo_file
-                        asistencia.save()
+
+            asistencia, campo_foto = registrar_marca(docente, action_type, data.get('courseId'), photo_file, now=now)
+            if asistencia:
+                tareas.encolar(procesar_foto_verificacion, type(asistencia), asistencia.pk, campo_foto)
             
             return JsonResponse({'status': 'success', 'message': 'Asistencia registrada correctamente.'})
 
@@ -527,6 +500,195 @@ def mark_attendance_kiosk(request):
     return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
 
 
+def _foto_kiosco(request):
+    """
+    Lee los datos y la foto de una marca binaria del kiosco.
+
+    Devuelve ``(datos, foto, extension, None)`` o ``(None, None, None, respuesta_de_error)``.
+    """
+    content_type = request.content_type
+    if content_type == 'multipart/form-data':
+        datos = request.POST
+        foto = request.FILES.get('foto')
+        content_type = foto.content_type if foto else None
+    else:
+        datos = request.GET
+        foto = ContentFile(request.body) if request.body else None
+
+    if not foto:
+        return None, None, None, JsonResponse({'status': 'error', 'message': 'No se recibió la foto de verificación.'}, status=400)
+    if content_type not in FORMATOS_PERMITIDOS:
+        return None, None, None, JsonResponse({'status': 'error', 'message': 'Formato de imagen no permitido. Use JPEG o WebP.'}, status=415)
+    if foto.size > FOTO_MAX_BYTES:
+        return None, None, None, JsonResponse({'status': 'error', 'message': 'La foto excede el tamaño máximo permitido.'}, status=413)
+    try:
+        verificar_foto(foto, content_type)
+    except ValueError as e:
+        return None, None, None, JsonResponse({'status': 'error', 'message': str(e)}, status=415)
+    return datos, foto, FORMATOS_PERMITIDOS[content_type], None
+
+
+@csrf_exempt
+def mark_attendance_kiosk_foto(request):
+    """
+    Variante binaria de ``mark_attendance_kiosk``.
+
+    Acepta la foto como multipart (campo ``foto`` junto a ``qrId``, ``actionType``
+    y ``courseId``) o como cuerpo crudo ``image/jpeg``/``image/webp`` con esos
+    mismos datos en la query string. La marca se registra de inmediato y la
+    recompresión y la miniatura quedan en la cola de tareas.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    datos, foto, extension, error = _foto_kiosco(request)
+    if error:
+        return error
+
+    try:
+        docente = Docente.objects.get(id_qr=datos.get('qrId'))
+        now = timezone.now()
+        foto.name = f'{docente.username}_{now.timestamp()}.{extension}'
+
+        asistencia, campo_foto = registrar_marca(docente, datos.get('actionType'), datos.get('courseId'), foto, now=now)
+        if asistencia:
+            tareas.encolar(procesar_foto_verificacion, type(asistencia), asistencia.pk, campo_foto)
+
+        return JsonResponse({'status': 'success', 'message': 'Asistencia registrada correctamente.'})
+    except Docente.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'QR no válido o docente no encontrado.'}, status=404)
+    except Exception as e:
+        logger.exception("Error en mark_attendance_kiosk_foto")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+# --- Kiosco bajo ASGI ---
+# Mismas respuestas que las vistas anteriores, pero sin ocupar un hilo por
+# lectura: las consultas usan el ORM asíncrono y la foto se escribe en un hilo
+# aparte (ver aregistrar_marca). Se activan en el kiosco con KIOSCO_ASYNC.
+
+@csrf_exempt
+async def get_teacher_info_async(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    try:
+        data = json.loads(request.body)
+        contexto = await sync_to_async(contexto_del_dia)()
+
+        if contexto['es_fin_de_semana']:
+            return JsonResponse({'status': 'weekend_off', 'message': 'El kiosco de asistencia no está disponible los fines de semana.'})
+
+        docente, is_daily_marked, courses_data = await ainfo_docente_kiosco(data.get('qrId'), contexto)
+        photo_url = request.build_absolute_uri(docente.foto.url) if docente.foto and hasattr(docente.foto, 'url') else request.build_absolute_uri(static('placeholder.png'))
+
+        if not contexto['semestre_id']:
+            return JsonResponse({'status': 'error', 'message': 'No hay un semestre académico activo.'}, status=400)
+
+        return JsonResponse({
+            'status': 'success',
+            'name': f'{docente.first_name} {docente.last_name}',
+            'dni': docente.dni,
+            'photoUrl': photo_url,
+            'isDailyAttendanceMarked': is_daily_marked,
+            'courses': courses_data
+        })
+    except Docente.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'QR no válido o docente no encontrado.'}, status=404)
+    except Exception as e:
+        logger.exception("Error en get_teacher_info_async")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+async def _marcar_async(docente, action_type, curso_id, foto, now):
+    asistencia, campo_foto = await aregistrar_marca(docente, action_type, curso_id, foto, now=now)
+    if asistencia:
+        tareas.encolar(procesar_foto_verificacion, type(asistencia), asistencia.pk, campo_foto)
+    return JsonResponse({'status': 'success', 'message': 'Asistencia registrada correctamente.'})
+
+
+@csrf_exempt
+async def mark_attendance_kiosk_async(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    try:
+        data = json.loads(request.body)
+        docente = await Docente.objects.aget(id_qr=data.get('qrId'))
+        now = timezone.now()
+
+        format, imgstr = data.get('photoBase64').split(';base64,')
+        ext = format.split('/')[-1]
+        photo_file = ContentFile(base64.b64decode(imgstr), name=f'{docente.username}_{now.timestamp()}.{ext}')
+
+        return await _marcar_async(docente, data.get('actionType'), data.get('courseId'), photo_file, now)
+    except Exception as e:
+        logger.exception("Error en mark_attendance_kiosk_async")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@csrf_exempt
+async def mark_attendance_kiosk_foto_async(request):
+    """Versión asíncrona de ``mark_attendance_kiosk_foto``, con los mismos formatos de entrada."""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    # Leer el cuerpo y verificar la imagen con Pillow bloquea: se hace en un hilo aparte
+    datos, foto, extension, error = await sync_to_async(_foto_kiosco, thread_sensitive=False)(request)
+    if error:
+        return error
+
+    try:
+        docente = await Docente.objects.aget(id_qr=datos.get('qrId'))
+        now = timezone.now()
+        foto.name = f'{docente.username}_{now.timestamp()}.{extension}'
+        return await _marcar_async(docente, datos.get('actionType'), datos.get('courseId'), foto, now)
+    except Docente.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'QR no válido o docente no encontrado.'}, status=404)
+    except Exception as e:
+        logger.exception("Error en mark_attendance_kiosk_foto_async")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+def _kiosco_autorizado(request):
+    """El modo sin conexión expone el padrón de QRs: exige el token configurado del kiosco."""
+    token = getattr(settings, 'KIOSCO_TOKEN', '')
+    return bool(token) and constant_time_compare(request.headers.get('X-Kiosco-Token', ''), token)
+
+
+def api_kiosco_roster(request):
+    """Padrón diario que el kiosco guarda localmente para validar lecturas sin conexión."""
+    if not _kiosco_autorizado(request):
+        return JsonResponse({'status': 'error', 'message': 'Kiosco no autorizado para el modo sin conexión.'}, status=403)
+
+    contexto = contexto_del_dia()
+    return JsonResponse({
+        'status': 'success',
+        'fecha': contexto['fecha'].isoformat(),
+        'weekendOff': contexto['es_fin_de_semana'],
+        'hasActiveSemester': contexto['semestre_id'] is not None,
+        'docentes': roster_del_dia(contexto),
+    })
+
+
+@csrf_exempt
+def api_kiosco_sync(request):
+    """Recibe un lote de marcas hechas sin conexión y las aplica en una sola transacción."""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    if not _kiosco_autorizado(request):
+        return JsonResponse({'status': 'error', 'message': 'Kiosco no autorizado para el modo sin conexión.'}, status=403)
+
+    try:
+        marcas = json.loads(request.body).get('marks', [])
+        if not isinstance(marcas, list):
+            raise ValueError('El lote de marcas debe ser una lista.')
+        resultados, fotos = sincronizar_marcas(marcas)
+        for asistencia, campo in fotos:
+            tareas.encolar(procesar_foto_verificacion, type(asistencia), asistencia.pk, campo)
+        return JsonResponse({'status': 'success', 'results': resultados})
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
 # --- VISTAS PARA CREDENCIALES ---
 
 @staff_member_required
@@ -537,7 +699,7 @@ def lista_docentes_credenciales(request):
 @staff_member_required
 def generar_credencial_docente(request, docente_id):
     docente = PersonalDocente.objects.get(id=docente_id)
-    configuracion = ConfiguracionInstitucion.load()
+    configuracion = referencia.configuracion_institucion()
 
     # Preparamos la URL absoluta para la FOTO del docente
     foto_url_absoluta = ''
@@ -564,9 +726,49 @@ def generar_credencial_docente(request, docente_id):
     return render(request, 'credencial.html', context)
 
 
+def _estado_lote_credenciales(tarea):
+    data = {'status': 'success', 'tarea': tarea.como_dict(), 'url_estado': reverse('estado_credenciales_lote', args=[tarea.id])}
+    if tarea.estado == tareas.COMPLETADA:
+        data['url_descarga'] = reverse('descargar_credenciales_lote', args=[tarea.id])
+    return data
+
+
+@staff_member_required
+def credenciales_lote(request):
+    """Encola el PDF con las credenciales de los docentes seleccionados (varias por hoja)."""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    docente_ids = [i for i in request.POST.getlist('docentes') if i.isdigit()]
+    if not docente_ids:
+        return JsonResponse({'status': 'error', 'message': 'Seleccione al menos un docente.'}, status=400)
+
+    # Un lote ya generado con los mismos datos se reutiliza sin volver a dibujarlo
+    nombre = nombre_lote(docente_ids)
+    tarea = tareas.encolar(generar_lote_credenciales, nombre, docente_ids, clave=nombre)
+    return JsonResponse(_estado_lote_credenciales(tarea), status=202)
+
+
+@staff_member_required
+def estado_credenciales_lote(request, tarea_id):
+    tarea = tareas.obtener(tarea_id)
+    if not tarea:
+        return JsonResponse({'status': 'error', 'message': 'Tarea no encontrada.'}, status=404)
+    return JsonResponse(_estado_lote_credenciales(tarea))
+
+
+@staff_member_required
+def descargar_credenciales_lote(request, tarea_id):
+    tarea = tareas.obtener(tarea_id)
+    if not tarea or tarea.estado != tareas.COMPLETADA:
+        raise Http404("Las credenciales no están disponibles.")
+    return FileResponse(default_storage.open(tarea.resultado['archivo'], 'rb'), as_attachment=True,
+                        filename=tarea.resultado['descarga'], content_type='application/pdf')
+
 # --- VISTA PARA REPORTES ---
 
 @staff_member_required
+@lectura_en_replica
 def reporte_asistencia(request):
     # Manejo de Filtros
     fecha_inicio = request.GET.get('fecha_inicio')
@@ -580,52 +782,15 @@ def reporte_asistencia(request):
         fecha_inicio = today.strftime('%Y-%m-%d')
         fecha_fin = today.strftime('%Y-%m-%d')
 
-    # Obtener todos los docentes
-    docentes = Docente.objects.all().order_by('last_name', 'first_name')
-    
-    # Construir el queryset para las asistencias con el filtro de fechas
-    asistencias_qs = Asistencia.objects.filter(
-        fecha__range=[fecha_inicio, fecha_fin]
-    ).select_related('docente', 'curso')
-
-    # Aplicar filtro por estado
-    if estado == 'presente':
-        # Docentes que tienen al menos una asistencia general (sin curso)
-        docentes_presentes_ids = asistencias_qs.filter(curso__isnull=True).values_list('docente_id', flat=True).distinct()
-        docentes = docentes.filter(id__in=docentes_presentes_ids)
-    elif estado == 'ausente':
-        # Docentes que NO tienen asistencia general (sin curso)
-        docentes_presentes_ids = asistencias_qs.filter(curso__isnull=True).values_list('docente_id', flat=True).distinct()
-        docentes = docentes.exclude(id__in=docentes_presentes_ids)
-    
-    # Aplicar filtro por curso
-    if curso_id:
-        docentes_con_asistencia_en_curso_ids = asistencias_qs.filter(curso_id=curso_id).values_list('docente_id', flat=True).distinct()
-        docentes = docentes.filter(id__in=docentes_con_asistencia_en_curso_ids)
-
-    # Generar el reporte final con los datos filtrados
-    reporte_data = []
-    for docente in docentes:
-        asistencias_docente = asistencias_qs.filter(docente=docente)
-        asistencia_general = asistencias_docente.filter(curso__isnull=True).first()
-        asistencias_cursos = asistencias_docente.filter(curso__isnull=False)
-
-        reporte_data.append({
-            'docente': docente,
-            'asistencia_general': asistencia_general,
-            'asistencias_cursos': asistencias_cursos,
-        })
-
-    # Contadores para las cards
-    total_docentes = Docente.objects.count()
-    presentes_count = Asistencia.objects.filter(fecha__range=[fecha_inicio, fecha_fin], curso__isnull=True).values('docente').distinct().count()
-    ausentes_count = total_docentes - presentes_count
+    # El motor del reporte resuelve estado, cursos y contadores con consultas agregadas
+    reporte = ReporteAsistencia(fecha_inicio, fecha_fin, estado=estado, curso_id=curso_id)
+    contadores = reporte.contadores()
 
     # Obtener el día especial (si existe)
     dia_especial = DiaEspecial.objects.filter(fecha__range=[fecha_inicio, fecha_fin]).first()
     
-    # Implementación de Paginación
-    paginator = Paginator(reporte_data, 20)
+    # Paginación a nivel de base de datos: solo se construyen las filas de la página
+    paginator = Paginator(reporte, 20)
     page_number = request.GET.get('page')
     try:
         page_obj = paginator.get_page(page_number)
@@ -637,10 +802,13 @@ def reporte_asistencia(request):
     context = {
         'page_obj': page_obj,
         'reporte_data': page_obj.object_list,
-        'total_docentes': total_docentes,
-        'presentes_count': presentes_count,
-        'ausentes_count': ausentes_count,
+        'total_docentes': contadores['total_docentes'],
+        'presentes_count': contadores['presentes_count'],
+        'ausentes_count': contadores['ausentes_count'],
         'dia_especial': dia_especial,
+        'detallado': reporte.detallado,
+        'max_dias_detalle': MAX_DIAS_DETALLE,
+        'dias_laborables': reporte.dias_laborables,
         'cursos': Curso.objects.all(),
         'fecha_inicio': fecha_inicio,
         'fecha_fin': fecha_fin,
@@ -653,46 +821,43 @@ def reporte_asistencia(request):
 
 @staff_member_required
 def detalle_asistencia_docente_ajax(request, docente_id):
-    """Devuelve los detalles de asistencia de un docente en formato JSON."""
+    """
+    Historial de asistencia de un docente en JSON, por páginas.
+
+    Parámetros: ``fecha_inicio`` y ``fecha_fin`` (por defecto, los últimos 30
+    días), ``limite`` (filas de cada lista por página) y ``cursor`` (el
+    ``siguiente`` de la página anterior). La respuesta se envía por streaming.
+    """
+    docente = Docente.objects.filter(pk=docente_id).only('first_name', 'last_name', 'dni', 'foto').first()
+    if not docente:
+        return JsonResponse({'status': 'error', 'message': 'Docente no encontrado.'}, status=404)
     try:
-        docente = Docente.objects.get(pk=docente_id)
-        asistencias_generales = Asistencia.objects.filter(docente=docente, curso__isnull=True).order_by('-fecha')
-        asistencias_cursos = Asistencia.objects.filter(docente=docente, curso__isnull=False).order_by('-fecha')
-        
-        data = {
-            'docente': {
-                'nombre_completo': f'{docente.first_name} {docente.last_name}',
-                'dni': docente.dni,
-                'foto_url': docente.foto.url if docente.foto else None,
-            },
-            'asistencias_generales': [
-                {
-                    'fecha': asis.fecha,
-                    'hora_entrada': asis.hora_entrada.strftime('%H:%M') if asis.hora_entrada else None,
-                    'hora_salida': asis.hora_salida.strftime('%H:%M') if asis.hora_salida else None,
-                    'foto_entrada_url': asis.foto_entrada.url if asis.foto_entrada else None,
-                }
-                for asis in asistencias_generales
-            ],
-            'asistencias_cursos': [
-                {
-                    'curso': asis.curso.nombre,
-                    'fecha': asis.fecha,
-                    'hora_entrada': asis.hora_entrada.strftime('%H:%M') if asis.hora_entrada else None,
-                    'hora_salida': asis.hora_salida.strftime('%H:%M') if asis.hora_salida else None,
-                    'foto_entrada_url': asis.foto_entrada.url if asis.foto_entrada else None,
-                    'foto_salida_url': asis.foto_salida.url if asis.foto_salida else None,
-                }
-                for asis in asistencias_cursos
-            ]
-        }
-        return JsonResponse(data)
-    except Docente.DoesNotExist:
-        return JsonResponse({'error': 'Docente no encontrado'}, status=404)
-        
+        historial = HistorialAsistencia(
+            docente, request.GET.get('fecha_inicio'), request.GET.get('fecha_fin'),
+            limite=request.GET.get('limite'), cursor=request.GET.get('cursor'),
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return StreamingHttpResponse(historial.json(), content_type='application/json')
+
+
+@staff_member_required
+@lectura_en_replica
+def resumen_asistencia_semestre(request):
+    """Totales de asistencia por curso de un semestre (por defecto el activo), leídos de los resúmenes mensuales."""
+    semestre_id = request.GET.get('semestre')
+    semestre = Semestre.objects.filter(pk=semestre_id).first() if semestre_id else referencia.semestre_activo()
+    if not semestre:
+        return JsonResponse({'status': 'error', 'message': 'Semestre no encontrado.'}, status=404)
+    return JsonResponse({
+        'status': 'success',
+        'semestre': {'id': semestre.id, 'nombre': semestre.nombre},
+        'cursos': acumulados.resumen_semestre(semestre.id, request.GET.get('docente')),
+    })
+
 @staff_member_required
 def planificador_horarios(request):
-    semestre_activo = Semestre.objects.filter(estado='ACTIVO').first()
+    semestre_activo = referencia.semestre_activo()
     if not semestre_activo:
         messages.error(request, "No hay un semestre activo. Por favor, active un semestre en el panel de administración.")
         return render(request, 'planificador_vacio.html')
@@ -707,7 +872,7 @@ def planificador_horarios(request):
     context = {
         'semestre_activo': semestre_activo,
         'especialidades': Especialidad.objects.all(),
-        'franjas_horarias': FranjaHoraria.objects.all().order_by('hora_inicio'),
+        'franjas_horarias': referencia.franjas_horarias(),
         'dias_semana': ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes'],
         'semestres_validos': semestres_validos,
         # Pasamos los filtros seleccionados para que la plantilla los recuerde
@@ -723,35 +888,30 @@ def api_asignar_horario(request):
         data = json.loads(request.body)
         curso_id = data.get('curso_id'); franja_id_inicio = data.get('franja_id'); dia = data.get('dia')
         try:
-            curso = Curso.objects.get(pk=curso_id); franja_inicio = FranjaHoraria.objects.get(pk=franja_id_inicio)
-            docente = curso.docente; semestre = curso.semestre
-            
-            todas_las_franjas = list(FranjaHoraria.objects.order_by('hora_inicio'))
-            start_index = todas_las_franjas.index(franja_inicio)
-            franjas_a_ocupar = todas_las_franjas[start_index : start_index + curso.duracion_bloques]
-
-            # 1. Validar Disponibilidad y Cruce de DOCENTE
-            for franja in franjas_a_ocupar:
-                if (docente.disponibilidad == 'MANANA' and franja.turno != 'MANANA') or (docente.disponibilidad == 'TARDE' and franja.turno != 'TARDE'):
-                    return JsonResponse({'status': 'error', 'message': f'Conflicto de Disponibilidad del docente.'}, status=400)
-                conflicto_docente = Curso.objects.filter(docente=docente, semestre=semestre, dia=dia, horario_inicio=franja.hora_inicio).exclude(pk=curso.id).first()
-                if conflicto_docente:
-                    return JsonResponse({'status': 'error', 'message': f'Conflicto: El docente ya dicta "{conflicto_docente.nombre}" en este horario.'}, status=400)
-
-            # 2. Validar Cruce de GRUPO
-            grupo = curso.especialidad.grupo if curso.especialidad else None
-            if grupo:
-                q_conflicto = models.Q(especialidad__grupo=grupo, semestre_cursado=curso.semestre_cursado, dia=dia, horario_inicio__in=[f.hora_inicio for f in franjas_a_ocupar])
-                if curso.tipo_curso == 'ESPECIALIDAD':
-                    conflicto_grupo = Curso.objects.filter(q_conflicto, tipo_curso='GENERAL').first()
-                    if conflicto_grupo: return JsonResponse({'status': 'error', 'message': f'Conflicto de Grupo: El curso general "{conflicto_grupo.nombre}" ya está programado.'}, status=400)
-                else: # GENERAL
-                    conflicto_grupo = Curso.objects.filter(q_conflicto, tipo_curso='ESPECIALIDAD').first()
-                    if conflicto_grupo: return JsonResponse({'status': 'error', 'message': f'Conflicto de Grupo: El curso "{conflicto_grupo.nombre}" ({conflicto_grupo.especialidad.nombre}) ya está programado.'}, status=400)
-
-            # Si pasa todo, asignamos
-            curso.dia = dia; curso.horario_inicio = franja_inicio.hora_inicio; curso.horario_fin = franjas_a_ocupar[-1].hora_fin; curso.save()
-            return JsonResponse({'status': 'success', 'message': 'Curso asignado con éxito.'})
+            curso = Curso.objects.select_related('docente', 'especialidad').get(pk=curso_id)
+
+            with indice_semestre(curso.semestre_id) as ocupacion:
+                rejilla = ocupacion.rejilla
+                start_index = rejilla.indice_por_id.get(int(franja_id_inicio)) if franja_id_inicio else None
+                if start_index is None or dia not in rejilla.indice_dia:
+                    return JsonResponse({'status': 'error', 'message': 'Franja horaria o día no válido.'}, status=400)
+                franjas_a_ocupar = rejilla.franjas[start_index : start_index + curso.duracion_bloques]
+                conflicto = ocupacion.conflicto(curso, rejilla.bloque(dia, start_index, len(franjas_a_ocupar)))
+                if not conflicto:
+                    # Se guarda con el índice bloqueado; la señal post_save lo actualiza
+                    curso.dia = dia; curso.horario_inicio = franjas_a_ocupar[0].hora_inicio; curso.horario_fin = franjas_a_ocupar[-1].hora_fin
+                    with transaction.atomic():
+                        # Otro proceso pudo ocupar la celda después de que este leyera el índice
+                        en_bd = conflicto_en_bd([curso])
+                        if en_bd:
+                            conflicto = en_bd[1]
+                        else:
+                            curso.save()
+                    if not conflicto:
+                        return JsonResponse({'status': 'success', 'message': 'Curso asignado con éxito.', 'cambios': [planificador.datos_curso(curso)]})
+
+            # 1. Disponibilidad y cruce de DOCENTE / 2. Cruce de GRUPO
+            return JsonResponse({'status': 'error', 'message': describir_conflicto(*conflicto)}, status=400)
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
@@ -762,7 +922,7 @@ def api_desasignar_horario(request):
         try:
             data = json.loads(request.body)
             curso_id = data.get('curso_id')
-            curso = Curso.objects.get(pk=curso_id)
+            curso = Curso.objects.select_related('docente', 'especialidad').get(pk=curso_id)
 
             # Simplemente limpiamos los campos del horario
             curso.dia = None
@@ -770,13 +930,41 @@ def api_desasignar_horario(request):
             curso.horario_fin = None
             curso.save()
 
-            return JsonResponse({'status': 'success', 'message': 'Curso devuelto a la lista de pendientes.'})
+            return JsonResponse({'status': 'success', 'message': 'Curso devuelto a la lista de pendientes.', 'cambios': [planificador.datos_curso(curso)]})
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
     
     return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
 
 
+@staff_member_required
+@csrf_exempt
+def api_mover_horarios(request):
+    """
+    Aplica en bloque una lista de operaciones del planificador:
+    ``{"operaciones": [{"tipo": "mover", "curso_id", "dia", "franja_id"},
+    {"tipo": "desasignar", "curso_id"}, {"tipo": "intercambiar", "curso_a", "curso_b"}]}``.
+    Solo se valida el horario final y se guarda todo o nada (ver ``core.utils.movimientos``).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    semestre_activo = referencia.semestre_activo()
+    if not semestre_activo:
+        return JsonResponse({'status': 'error', 'message': 'No hay un semestre activo.'}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        cambiados = aplicar_movimientos(semestre_activo, data.get('operaciones') if isinstance(data, dict) else None)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'message': f'Se actualizó el horario de {len(cambiados)} curso(s).',
+        'cambios': [planificador.datos_curso(curso) for curso in cambiados],
+    })
+
+
 @staff_member_required
 def api_get_teacher_conflicts(request):
     curso_id = request.GET.get('curso_id')
@@ -784,57 +972,12 @@ def api_get_teacher_conflicts(request):
         return JsonResponse({'status': 'error', 'message': 'Falta el ID del curso.'}, status=400)
 
     try:
-        curso_a_asignar = Curso.objects.get(pk=curso_id)
-        docente = curso_a_asignar.docente
-        semestre = curso_a_asignar.semestre
-        grupo_del_curso = curso_a_asignar.especialidad.grupo if curso_a_asignar.especialidad else None
-        semestre_cursado_a_asignar = curso_a_asignar.semestre_cursado
-        
-        conflictos = []
-        todas_las_franjas = list(FranjaHoraria.objects.order_by('hora_inicio'))
-        cursos_asignados = Curso.objects.filter(semestre=semestre, dia__isnull=False).exclude(pk=curso_id)
-
-        # 1. Conflictos del DOCENTE
-        for curso in cursos_asignados.filter(docente=docente):
-            try:
-                franja_inicio_obj = next(f for f in todas_las_franjas if f.hora_inicio == curso.horario_inicio)
-                start_index = todas_las_franjas.index(franja_inicio_obj)
-                for i in range(curso.duracion_bloques):
-                    if (start_index + i) < len(todas_las_franjas):
-                        franja_ocupada = todas_las_franjas[start_index + i]
-                        conflictos.append({'dia': curso.dia, 'franja_id': franja_ocupada.id})
-            except (StopIteration, TypeError, AttributeError): continue
-
-        # 2. Conflictos de GRUPO
-        if grupo_del_curso:
-            if curso_a_asignar.tipo_curso == 'ESPECIALIDAD':
-                cursos_conflicto = cursos_asignados.filter(especialidad__grupo=grupo_del_curso, tipo_curso='GENERAL', semestre_cursado=semestre_cursado_a_asignar)
-            else: # Es GENERAL
-                cursos_conflicto = cursos_asignados.filter(especialidad__grupo=grupo_del_curso, tipo_curso='ESPECIALIDAD', semestre_cursado=semestre_cursado_a_asignar)
-            
-            for curso in cursos_conflicto:
-                try:
-                    franja_inicio_obj = next(f for f in todas_las_franjas if f.hora_inicio == curso.horario_inicio)
-                    start_index = todas_las_franjas.index(franja_inicio_obj)
-                    for i in range(curso.duracion_bloques):
-                        if (start_index + i) < len(todas_las_franjas):
-                            franja_ocupada = todas_las_franjas[start_index + i]
-                            conflictos.append({'dia': curso.dia, 'franja_id': franja_ocupada.id})
-                except (StopIteration, TypeError, AttributeError): continue
-
-        # 3. Conflictos de DISPONIBILIDAD del docente
-        if docente:
-            disponibilidad = docente.disponibilidad
-            franjas_no_disponibles = []
-            if disponibilidad == 'MANANA':
-                franjas_no_disponibles = FranjaHoraria.objects.filter(turno__in=['TARDE', 'NOCHE'])
-            elif disponibilidad == 'TARDE':
-                franjas_no_disponibles = FranjaHoraria.objects.filter(turno__in=['MANANA', 'NOCHE'])
-            
-            dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes']
-            for franja in franjas_no_disponibles:
-                for dia in dias_semana:
-                    conflictos.append({'dia': dia, 'franja_id': franja.id})
+        curso_a_asignar = Curso.objects.select_related('docente', 'especialidad').get(pk=curso_id)
+
+        # Conflictos de DOCENTE, de GRUPO y de DISPONIBILIDAD salen de una sola máscara
+        with indice_semestre(curso_a_asignar.semestre_id) as ocupacion:
+            bloqueadas = ocupacion.bloqueadas(curso_a_asignar)
+            conflictos = [{'dia': dia, 'franja_id': franja.id} for dia, franja in ocupacion.rejilla.celdas(bloqueadas)]
 
         return JsonResponse({'status': 'success', 'conflicts': conflictos})
 
@@ -845,59 +988,41 @@ def api_get_teacher_conflicts(request):
 @staff_member_required
 @csrf_exempt
 def api_auto_asignar(request):
-    # Esta API ahora devuelve el nuevo estado del horario para que se redibuje
+    # Devuelve solo los cursos que se ubicaron; el planificador los mueve en su parrilla
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
     
     try:
         data = json.loads(request.body)
         especialidad_id = data.get('especialidad_id')
-        semestre_activo = Semestre.objects.filter(estado='ACTIVO').first()
+        carrera_id = data.get('carrera_id')
+        semestre_cursado = data.get('semestre_cursado')
+        semestre_activo = referencia.semestre_activo()
         if not semestre_activo:
             return JsonResponse({'status': 'error', 'message': 'No hay un semestre activo.'}, status=400)
+        if not especialidad_id and not carrera_id:
+            return JsonResponse({'status': 'error', 'message': 'Indique una especialidad o una carrera.'}, status=400)
+
+        # Se puede planificar una especialidad o una carrera completa
+        filtro = Q(semestre=semestre_activo)
+        if especialidad_id:
+            filtro &= Q(especialidad_id=especialidad_id)
+        if carrera_id:
+            filtro &= Q(carrera_id=carrera_id)
+        if semestre_cursado:
+            filtro &= Q(semestre_cursado=semestre_cursado)
 
-        # ... (El algoritmo de auto-asignación que ya tenías va aquí, sin cambios)
-        cursos_por_asignar = list(Curso.objects.filter(semestre=semestre_activo, especialidad_id=especialidad_id, dia__isnull=True).order_by('-duracion_bloques'))
-        franjas_horarias = list(FranjaHoraria.objects.order_by('hora_inicio'))
-        dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes']
-        horarios_ocupados = {}
-        cursos_ya_asignados = Curso.objects.filter(semestre=semestre_activo, dia__isnull=False)
-        for curso in cursos_ya_asignados:
-            try:
-                franja_inicio_obj = next(f for f in franjas_horarias if f.hora_inicio == curso.horario_inicio)
-                start_index = franjas_horarias.index(franja_inicio_obj)
-                for i in range(curso.duracion_bloques):
-                    if (start_index + i) < len(franjas_horarias):
-                        franja = franjas_horarias[start_index + i]
-                        horarios_ocupados[(curso.dia, franja.hora_inicio)] = curso.docente
-            except StopIteration: continue
-        cursos_asignados_count = 0
-        for curso in cursos_por_asignar:
-            docente = curso.docente; asignado = False
-            for dia in dias_semana:
-                for i, franja_inicio in enumerate(franjas_horarias):
-                    if i + curso.duracion_bloques > len(franjas_horarias): continue
-                    bloque_valido = True
-                    franjas_del_curso = franjas_horarias[i : i + curso.duracion_bloques]
-                    for franja in franjas_del_curso:
-                        if (docente.disponibilidad == 'MANANA' and franja.turno != 'MANANA') or (docente.disponibilidad == 'TARDE' and franja.turno != 'TARDE'): bloque_valido = False; break
-                        if horarios_ocupados.get((dia, franja.hora_inicio)) == docente: bloque_valido = False; break
-                    if bloque_valido:
-                        curso.dia = dia; curso.horario_inicio = franja_inicio.hora_inicio; curso.horario_fin = franjas_del_curso[-1].hora_fin; curso.save()
-                        for franja in franjas_del_curso: horarios_ocupados[(dia, franja.hora_inicio)] = docente
-                        cursos_asignados_count += 1; asignado = True; break
-                if asignado: break
-        
-        # --- NUEVO: Devolvemos el estado actualizado del horario ---
-        cursos_no_asignados_json = list(Curso.objects.filter(semestre=semestre_activo, especialidad_id=especialidad_id, dia__isnull=True).select_related('docente').values('id', 'nombre', 'ciclo', 'docente__first_name', 'docente__last_name', 'duracion_bloques'))
-        cursos_asignados_json = list(Curso.objects.filter(semestre=semestre_activo, dia__isnull=False).select_related('docente', 'especialidad').values('id', 'nombre', 'docente__first_name', 'docente__last_name', 'especialidad__nombre', 'especialidad__id', 'dia', 'horario_inicio', 'duracion_bloques'))
-        
-        message = f"Proceso finalizado. Se asignaron {cursos_asignados_count} de {len(cursos_por_asignar)} cursos."
+        try:
+            asignados, total_por_asignar = auto_asignar(semestre_activo, Curso.objects.filter(filtro))
+        except ValueError as e:
+            # Otro proceso programó un curso que se cruza mientras se buscaba la solución
+            return JsonResponse({'status': 'error', 'message': f'{e} Vuelva a intentarlo.'}, status=409)
+
+        message = f"Proceso finalizado. Se asignaron {len(asignados)} de {total_por_asignar} cursos."
         return JsonResponse({
-            'status': 'success', 
+            'status': 'success',
             'message': message,
-            'cursos_no_asignados': cursos_no_asignados_json,
-            'cursos_asignados': cursos_asignados_json
+            'cambios': [planificador.datos_curso(curso) for curso in asignados],
         })
 
     except Exception as e:
@@ -905,13 +1030,14 @@ def api_auto_asignar(request):
     
 @staff_member_required
 def api_get_cursos_no_asignados(request):
-    try:
-        semestre_activo = Semestre.objects.get(estado='ACTIVO')
-    except Semestre.DoesNotExist:
+    semestre_activo = referencia.semestre_activo()
+    if not semestre_activo:
         return JsonResponse({'error': 'No hay un semestre activo configurado.'}, status=404)
 
     especialidad_id = request.GET.get('especialidad_id')
     semestre_cursado = request.GET.get('semestre_cursado')
+    # Antes de leer los cursos: un cambio publicado entre medio llega repetido por el stream, no se pierde
+    secuencia = planificador.secuencia(semestre_activo.id)
 
     cursos_asignados_json = []
     # --- INICIO DEL CAMBIO ---
@@ -927,15 +1053,11 @@ def api_get_cursos_no_asignados(request):
         
         # Cursos NO asignados
         q_no_asignados = q_cursos_base & Q(dia__isnull=True)
-        cursos_para_filtrar = Curso.objects.filter(q_no_asignados).select_related('docente')
+        cursos_para_filtrar = Curso.objects.filter(q_no_asignados).select_related('docente', 'especialidad')
         
         for curso in cursos_para_filtrar:
-            curso_data = {
-                'id': curso.id, 'nombre': curso.nombre, 'semestre_cursado': curso.semestre_cursado,
-                'tipo_curso': curso.tipo_curso, 'docente__first_name': curso.docente.first_name if curso.docente else '',
-                'docente__last_name': curso.docente.last_name if curso.docente else 'N/A', 'duracion_bloques': curso.duracion_bloques
-            }
-            if curso.tipo_curso == 'GENERAL' and curso.especialidad.grupo == grupo_obj:
+            curso_data = planificador.datos_curso(curso)
+            if curso.tipo_curso == 'GENERAL' and curso_data['grupo_id'] == especialidad_obj.grupo_id:
                 cursos_no_asignados_generales.append(curso_data)
             elif curso.especialidad_id == int(especialidad_id):
                 cursos_no_asignados_especialidad.append(curso_data)
@@ -944,19 +1066,8 @@ def api_get_cursos_no_asignados(request):
         q_cursos_asignados = q_cursos_base & Q(dia__isnull=False) & (
             Q(especialidad_id=especialidad_id) | Q(especialidad__grupo=grupo_obj, tipo_curso='GENERAL')
         )
-        cursos_asignados_qs = Curso.objects.filter(q_cursos_asignados).select_related('docente', 'especialidad', 'especialidad__grupo')
-        franjas_map = {franja.hora_inicio: franja.id for franja in FranjaHoraria.objects.all()}
-        for curso in cursos_asignados_qs:
-            cursos_asignados_json.append({
-                'id': curso.id, 'nombre': curso.nombre, 'docente__first_name': curso.docente.first_name if curso.docente else '',
-                'docente__last_name': curso.docente.last_name if curso.docente else 'N/A',
-                'especialidad__nombre': curso.especialidad.nombre if curso.especialidad else 'N/A',
-                'especialidad__id': curso.especialidad.id if curso.especialidad else None,
-                'grupo_id': curso.especialidad.grupo.id if curso.especialidad and curso.especialidad.grupo else None,
-                'dia': curso.dia, 'horario_inicio': curso.horario_inicio, 'duracion_bloques': curso.duracion_bloques,
-                'franja_id_inicio': franjas_map.get(curso.horario_inicio), 'tipo_curso': curso.tipo_curso,
-                'semestre_cursado': curso.semestre_cursado,
-            })
+        cursos_asignados_qs = Curso.objects.filter(q_cursos_asignados).select_related('docente', 'especialidad')
+        cursos_asignados_json = [planificador.datos_curso(curso) for curso in cursos_asignados_qs]
 
     return JsonResponse({
         # --- JSON MODIFICADO ---
@@ -965,67 +1076,65 @@ def api_get_cursos_no_asignados(request):
             'especialidad': cursos_no_asignados_especialidad,
         },
         # --- FIN DE JSON MODIFICADO ---
-        'cursos_asignados': cursos_asignados_json
+        'cursos_asignados': cursos_asignados_json,
+        # Número desde el que el navegador sigue los cambios en api_planificador_eventos
+        'secuencia': secuencia,
     })
 
 
+@staff_member_required
+def api_planificador_eventos(request):
+    """
+    Stream SSE con los cambios del planificador abierto en una especialidad y
+    semestre cursado, a partir de ``desde`` (o de la cabecera ``Last-Event-ID``
+    con la que el navegador se reconecta). Ver ``core.utils.planificador``.
+    """
+    semestre_activo = referencia.semestre_activo()
+    if not semestre_activo:
+        return JsonResponse({'status': 'error', 'message': 'No hay un semestre activo.'}, status=404)
+    try:
+        especialidad = Especialidad.objects.only('id', 'grupo_id').get(pk=request.GET.get('especialidad_id'))
+        semestre_cursado = int(request.GET.get('semestre_cursado'))
+        ultimo = int(request.headers.get('Last-Event-ID') or request.GET.get('desde') or 0)
+    except (Especialidad.DoesNotExist, TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Indique una especialidad, un semestre cursado y un número de cambio válidos.'}, status=400)
+
+    # Con ASGI el stream espera en el bucle de eventos; con WSGI ocupa uno de los MAX_FLUJOS hilos
+    flujo = planificador.aflujo_eventos if isinstance(request, ASGIRequest) else planificador.flujo_eventos
+    response = StreamingHttpResponse(
+        flujo(semestre_activo.id, especialidad.id, especialidad.grupo_id, semestre_cursado, ultimo),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Sin buffer en nginx, para que cada evento llegue al momento
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
+@lectura_en_replica
 def vista_publica_horarios(request):
-    semestre_activo = Semestre.objects.filter(estado='ACTIVO').first()
+    semestre_activo = referencia.semestre_activo()
     especialidades = Especialidad.objects.all()
     
     especialidad_seleccionada_id = request.GET.get('especialidad')
     especialidad_seleccionada = None
     
     horarios_por_semestre_cursado = {} 
+    franjas_horarias = []
 
     if especialidad_seleccionada_id:
         try:
             especialidad_seleccionada = Especialidad.objects.get(id=especialidad_seleccionada_id)
             
-            # --- INICIO DE LA LÓGICA CORREGIDA ---
-            
-            # Obtenemos el grupo de la especialidad seleccionada
-            grupo_seleccionado = especialidad_seleccionada.grupo
-            
-            # 1. Preparamos una consulta para los cursos propios de la especialidad
-            query_cursos_propios = Q(especialidad=especialidad_seleccionada)
-            
-            # 2. Preparamos otra para los cursos generales del mismo grupo
-            query_cursos_generales_del_grupo = Q(tipo_curso='GENERAL', especialidad__grupo=grupo_seleccionado)
-            
-            # 3. Unimos las consultas: tráeme los cursos que cumplan la condición 1 O la condición 2
-            cursos_asignados = Curso.objects.filter(
-                query_cursos_propios | query_cursos_generales_del_grupo,
-                semestre=semestre_activo,
-                dia__isnull=False
-            ).distinct().order_by('semestre_cursado')
-            
-            # --- FIN DE LA LÓGICA CORREGIDA ---
-
-            # El resto de la función que construye la parrilla no necesita cambios
-            semestres_cursados = sorted(list(cursos_asignados.values_list('semestre_cursado', flat=True).distinct()))
-            franjas_horarias = list(FranjaHoraria.objects.order_by('hora_inicio'))
-            dias_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes']
-            
-            for semestre_num in semestres_cursados:
-                grid = {}
-                for franja in franjas_horarias:
-                    grid[franja.id] = {dia: None for dia in dias_semana}
-
-                cursos_del_semestre = cursos_asignados.filter(semestre_cursado=semestre_num)
-                for curso in cursos_del_semestre:
-                    try:
-                        franja_inicio_obj = next(f for f in franjas_horarias if f.hora_inicio == curso.horario_inicio)
-                        start_index = franjas_horarias.index(franja_inicio_obj)
-                        grid[franja_inicio_obj.id][curso.dia] = curso
-                        for i in range(1, curso.duracion_bloques):
-                            if (start_index + i) < len(franjas_horarias):
-                                franja_ocupada = franjas_horarias[start_index + i]
-                                grid[franja_ocupada.id][curso.dia] = 'OCUPADO'
-                    except (StopIteration, TypeError, AttributeError):
-                        continue
-                horarios_por_semestre_cursado[semestre_num] = grid
+            # Cursos propios de la especialidad + generales de su grupo, ya armados por semestre cursado
+            horario = horario_especialidad(
+                semestre_activo.id if semestre_activo else None,
+                especialidad_seleccionada.id,
+                especialidad_seleccionada.grupo_id,
+            )
+            horarios_por_semestre_cursado = horario['por_semestre_cursado']
+            franjas_horarias = horario['franjas']
 
         except Especialidad.DoesNotExist:
             especialidad_seleccionada = None
@@ -1035,7 +1144,17 @@ def vista_publica_horarios(request):
         'especialidades': especialidades,
         'especialidad_seleccionada': especialidad_seleccionada,
         'horarios_por_semestre_cursado': horarios_por_semestre_cursado,
-        'franjas_horarias': FranjaHoraria.objects.all().order_by('hora_inicio'),
-        'dias_semana': ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes'],
+        'franjas_horarias': franjas_horarias,
+        'dias_semana': DIAS_SEMANA,
     }
-    return render(request, 'vista_publica_horarios.html', context)
\ No newline at end of file
+    return render(request, 'vista_publica_horarios.html', context)
+
+# --- MÉTRICAS DE RENDIMIENTO ---
+
+@staff_member_required
+def metricas_vistas(request):
+    """Percentiles de tiempo, consultas y tamaño por vista (del proceso que atiende). POST las reinicia."""
+    if request.method == 'POST':
+        metricas.reiniciar()
+        return JsonResponse({'status': 'success', 'message': 'Métricas reiniciadas.'})
+    return JsonResponse({'status': 'success', 'vistas': metricas.resumen()})
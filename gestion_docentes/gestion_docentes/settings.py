@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para que cuente también las consultas de sesión y autenticación
+    'core.middleware.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,12 +82,123 @@ WSGI_APPLICATION = 'gestion_docentes.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SIGEDO_DB elige el perfil de base de datos:
+#   sqlite      (por defecto) db.sqlite3 con la configuración de Django.
+#   sqlite-wal  SQLite para una sola máquina: en modo WAL las lecturas largas de
+#               los reportes no bloquean las marcas del kiosco, y las transacciones
+#               toman el candado de escritura al empezar en lugar de fallar a mitad.
+#   postgres    PostgreSQL con pool de conexiones (requiere psycopg[pool]). Con
+#               SIGEDO_DB_POOL=0 usa conexiones persistentes, p. ej. detrás de
+#               PgBouncer. Con SIGEDO_DB_REPLICA_HOST, las vistas de solo lectura
+#               usan la réplica (ver core/routers.py). Requiere SIGEDO_CACHE_URL
+#               (ver CACHES). docker-compose.postgres.yml levanta un primario, una
+#               réplica y un Redis locales.
+PERFIL_BD = os.environ.get('SIGEDO_DB', 'sqlite')
+
+if PERFIL_BD == 'postgres':
+    POOL_BD = os.environ.get('SIGEDO_DB_POOL', '1') != '0'
+
+    def _postgres(host, port):
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SIGEDO_DB_NAME', 'sigedo'),
+            'USER': os.environ.get('SIGEDO_DB_USER', 'sigedo'),
+            'PASSWORD': os.environ.get('SIGEDO_DB_PASSWORD', ''),
+            'HOST': host,
+            'PORT': port,
+            # El pool y CONN_MAX_AGE son excluyentes
+            'CONN_MAX_AGE': 0 if POOL_BD else 600,
+            'CONN_HEALTH_CHECKS': not POOL_BD,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('SIGEDO_DB_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('SIGEDO_DB_POOL_MAX', 10)),
+                    'timeout': 10,
+                },
+            } if POOL_BD else {},
+        }
+
+    DATABASES = {
+        'default': _postgres(os.environ.get('SIGEDO_DB_HOST', 'localhost'), os.environ.get('SIGEDO_DB_PORT', '5432')),
+    }
+    if os.environ.get('SIGEDO_DB_REPLICA_HOST'):
+        DATABASES['replica'] = _postgres(os.environ['SIGEDO_DB_REPLICA_HOST'], os.environ.get('SIGEDO_DB_REPLICA_PORT', '5432'))
+        DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+elif PERFIL_BD == 'sqlite-wal':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+    }
+
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Los sellos de versión de core.utils.versiones (índice de ocupación, parrillas
+# de horario, datos de referencia, contexto del kiosco), el registro de cambios
+# del planificador y el estado de las tareas en segundo plano (core.utils.tareas)
+# viven en la caché por defecto, así que con varios procesos (p. ej. gunicorn
+# con varios workers) la caché debe ser compartida: con LocMemCache una tarea
+# encolada en un worker no se encuentra (404) al consultarla desde otro.
+# SIGEDO_CACHE_URL la elige: redis://host:6379/0 (requiere el paquete redis) o
+# memcached://host:11211 (requiere pymemcache). Sin ella se usa LocMemCache,
+# válida solo para un único proceso, como runserver con SQLite; el perfil
+# postgres la exige.
+CACHE_URL = os.environ.get('SIGEDO_CACHE_URL', '')
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'sigedo',
+        }
+    }
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL.removeprefix('memcached://'),
+            'KEY_PREFIX': 'sigedo',
+        }
+    }
+elif CACHE_URL:
+    raise ImproperlyConfigured(f'SIGEDO_CACHE_URL debe empezar con redis://, rediss:// o memcached:// (se recibió "{CACHE_URL}").')
+elif PERFIL_BD == 'postgres':
+    raise ImproperlyConfigured(
+        'El perfil postgres requiere una caché compartida entre procesos: defina SIGEDO_CACHE_URL '
+        '(p. ej. redis://localhost:6379/0, ver docker-compose.postgres.yml).'
+    )
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 
 # Password validation
@@ -133,6 +249,46 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 LOGIN_REDIRECT_URL = 'dashboard'
 
+# Tareas en segundo plano (reportes PDF, procesamiento de imágenes). Cada proceso
+# las ejecuta en su propio pool de hilos; su estado se comparte por la caché (ver
+# CACHES). Si el proceso que ejecuta una tarea termina, la tarea queda sin
+# terminar hasta que su estado vence (una hora) y puede volver a encolarse.
+TAREAS_MAX_WORKERS = 2
+
+# Procesos para generar QR y dibujar las credenciales en lote
+CREDENCIALES_MAX_PROCESOS = 2
+
+# Subida de documentos por fragmentos: tamaño máximo del archivo y de cada fragmento
+DOCUMENTO_MAX_BYTES = 50 * 1024 * 1024
+DOCUMENTO_FRAGMENTO_BYTES = 1024 * 1024
+
+# Días que se conservan las fotos de verificación del kiosco (None = sin límite).
+# Se aplica con `manage.py compactar_fotos`, que además borra los archivos huérfanos.
+FOTOS_VERIFICACION_RETENCION_DIAS = None
+
+# Token que deben enviar los kioscos para usar el modo sin conexión
+# (cabecera X-Kiosco-Token). Vacío = modo sin conexión deshabilitado.
+KIOSCO_TOKEN = ''
+
+# Con el proyecto servido por ASGI (gestion_docentes/asgi.py), el kiosco usa las
+# vistas asíncronas de /api/async/. Bajo WSGI conviene dejarlo en False.
+KIOSCO_ASYNC = False
+
+# Métricas por vista (ver core/utils/metricas.py y /api/metricas/): muestras que se
+# conservan por vista y máximo de consultas SQL por nombre de URL. Al superarlo se
+# registra una advertencia, o falla la petición si METRICAS_PRESUPUESTO_ESTRICTO.
+METRICAS_MUESTRAS_POR_VISTA = 500
+METRICAS_PRESUPUESTOS = {
+    'dashboard': 5,
+    'perfil': 6,
+    'api_get_teacher_info': 3,
+    'api_mark_attendance': 6,
+    'api_get_teacher_info_async': 3,
+    'reporte_asistencia': 12,
+    'detalle_asistencia_docente_ajax': 5,
+}
+METRICAS_PRESUPUESTO_ESTRICTO = False
+
 
 
 
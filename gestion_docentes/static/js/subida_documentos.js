@@ -0,0 +1,91 @@
+// Subida de documentos por fragmentos.
+// El archivo se envía en trozos; si la conexión se corta, la sesión guardada en
+// localStorage permite retomar desde el último byte que recibió el servidor.
+(function () {
+    const REINTENTOS = 5;
+
+    function csrfToken() {
+        const campo = document.querySelector('[name=csrfmiddlewaretoken]');
+        return campo ? campo.value : '';
+    }
+
+    function claveSesion(archivo, destino) {
+        return `subida:${JSON.stringify(destino)}:${archivo.name}:${archivo.size}:${archivo.lastModified}`;
+    }
+
+    async function pedirJSON(url, opciones = {}) {
+        const response = await fetch(url, {
+            credentials: 'same-origin',
+            ...opciones,
+            headers: { 'X-CSRFToken': csrfToken(), ...(opciones.headers || {}) },
+        });
+        const data = await response.json().catch(() => ({}));
+        return { response, data };
+    }
+
+    function esperar(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function huellaSha256(archivo) {
+        // Permite al servidor descartar un archivo que llegó alterado; sin crypto.subtle (HTTP) se omite
+        if (!window.crypto || !crypto.subtle) return '';
+        const resumen = await crypto.subtle.digest('SHA-256', await archivo.arrayBuffer());
+        return Array.from(new Uint8Array(resumen), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function abrirSesion(url, archivo, destino) {
+        const clave = claveSesion(archivo, destino);
+        const guardada = localStorage.getItem(clave);
+        if (guardada) {
+            const { response, data } = await pedirJSON(`${url}${guardada}/`);
+            if (response.ok && data.subida.estado === 'EN_CURSO') return data.subida;
+            localStorage.removeItem(clave);
+        }
+        const { response, data } = await pedirJSON(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ nombre: archivo.name, tamano: archivo.size, sha256: await huellaSha256(archivo), ...destino }),
+        });
+        if (!response.ok) throw new Error(data.message || 'No se pudo iniciar la subida.');
+        localStorage.setItem(clave, data.subida.id);
+        return data.subida;
+    }
+
+    // destino: { tipo_documento, titulo } para un documento nuevo o { documento_id } para una versión
+    window.subirDocumentoPorFragmentos = async function (url, archivo, destino, alProgresar) {
+        const subida = await abrirSesion(url, archivo, destino);
+        const base = `${url}${subida.id}/`;
+        let recibido = subida.recibido;
+        let fallos = 0;
+
+        while (recibido < archivo.size) {
+            if (alProgresar) alProgresar(recibido / archivo.size);
+            try {
+                const { response, data } = await pedirJSON(`${base}fragmento/?offset=${recibido}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: archivo.slice(recibido, recibido + subida.tamano_fragmento),
+                });
+                if (response.status === 409) {
+                    recibido = data.recibido;
+                } else if (!response.ok) {
+                    throw new Error(data.message || 'El servidor rechazó el fragmento.');
+                } else {
+                    recibido = data.recibido;
+                    fallos = 0;
+                }
+            } catch (error) {
+                // Los errores de red se reintentan con espera creciente; los del servidor no
+                if (!(error instanceof TypeError) || ++fallos > REINTENTOS) throw error;
+                await esperar(1000 * 2 ** fallos);
+            }
+        }
+        if (alProgresar) alProgresar(1);
+
+        const { response, data } = await pedirJSON(`${base}completar/`, { method: 'POST' });
+        if (!response.ok) throw new Error(data.message || 'No se pudo completar la subida.');
+        localStorage.removeItem(claveSesion(archivo, destino));
+        return data;
+    };
+})();